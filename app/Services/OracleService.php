@@ -63,8 +63,19 @@ class OracleService
         return $result;
     }
 
+    /**
+     * Dernière réponse du service Python avec son ETag, pour la revalidation (If-None-Match → 304).
+     * TTL : ORACLE_DATA_ETAG_TTL (secondes), défaut 86400.
+     */
+    protected function pythonValidatorKey(string $path, array $params): string
+    {
+        return 'oracle_etag:'.$path.':'.hash('sha256', json_encode($this->normalizeParamsForCache($params), JSON_UNESCAPED_UNICODE));
+    }
+
     /**
      * GET JSON vers le service Python avec cache (réponses succès uniquement).
+     * À l'expiration du cache, la requête est conditionnelle : un 304 (aucun nouveau lot DASH)
+     * réutilise la réponse précédente sans la retélécharger.
      */
     public function getPythonGetCached(string $cacheName, string $path, array $params, ?string $logContext = null): array
     {
@@ -72,12 +83,32 @@ class OracleService
 
         return $this->rememberSuccessfulRead($cacheName, $params, function () use ($path, $params, $label) {
             try {
-                $response = $this->pythonHttp()->get("{$this->pythonServiceUrl}{$path}", $params);
+                $validatorKey = $this->pythonValidatorKey($path, $params);
+                $previous = Cache::get($validatorKey);
+                $http = $this->pythonHttp();
+                if (is_array($previous) && ! empty($previous['etag'])) {
+                    $http = $http->withHeaders(['If-None-Match' => $previous['etag']]);
+                }
+
+                $response = $http->get("{$this->pythonServiceUrl}{$path}", $params);
+
+                if ($response->status() === 304 && is_array($previous)) {
+                    return [
+                        'success' => true,
+                        'data' => $previous['data'],
+                    ];
+                }
 
                 if ($response->successful()) {
+                    $data = $response->json();
+                    $etag = $response->header('ETag');
+                    if ($etag !== '') {
+                        Cache::put($validatorKey, ['etag' => $etag, 'data' => $data], (int) env('ORACLE_DATA_ETAG_TTL', 86400));
+                    }
+
                     return [
                         'success' => true,
-                        'data' => $response->json(),
+                        'data' => $data,
                     ];
                 }
 
@@ -0,0 +1 @@
+"""Scripts de contrôle et bancs d'essai (hors application, lancés avec python -m benchmarks.<script>)"""
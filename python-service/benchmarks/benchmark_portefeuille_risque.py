@@ -0,0 +1,257 @@
+"""
+Banc d'essai de l'agrégation PAR (portefeuille à risque) : boucle ligne à ligne d'origine contre
+le chemin pandas de services.portefeuille_risque_service.
+
+Lignes DASH_PAR_GLOBAL synthétiques (M et M-1, une ligne par chargé d'affaires et code gestion),
+sans accès Oracle. Les deux implémentations doivent produire les mêmes lignes CAF, agrégats agence
+et métriques CAF ; le script s'arrête sinon.
+
+Usage (depuis python-service) :
+    python -m benchmarks.benchmark_portefeuille_risque [--rows 10000 100000] [--repeat 5]
+"""
+import argparse
+import math
+import random
+import time
+from typing import Callable, Dict, List, Tuple
+
+from services.portefeuille_risque_service import (
+    PAR_BUCKETS,
+    _caf_metrics,
+    _par_agency_rows,
+    _par_caf_rows,
+    _par_frame,
+)
+
+_AGENCIES = 60
+
+
+def synthetic_rows(count: int, seed: int) -> Tuple[List[Dict], List[Dict]]:
+    """(lignes M, lignes M-1) : montants déjà convertis comme par fetch_records (NULL → 0)."""
+    rng = random.Random(seed)
+    branches = [f"AGENCE {i:02d}" for i in range(_AGENCIES)] + ["  AGENCE 00 ", None]
+
+    def row(i: int) -> Dict:
+        encours = round(rng.uniform(1e5, 5e8), 2)
+        parts = [rng.random() for _ in PAR_BUCKETS]
+        scale = rng.uniform(0, 0.4) / sum(parts)
+        r = {
+            "BRANCH_NAME": branches[i % len(branches)] if i % 97 else None,
+            "CODE_GESTION_PRET": f"G{i:06d}",
+            "CHARGE_AFFAIRE": f"CAF {i % (count // 8 + 1):05d}" if i % 53 else None,
+            "ENCOURS_TOTAL": encours,
+            "ENCOURS_IMPAYE": round(encours * rng.uniform(0, 0.2), 2),
+            "NOMBRE_DOSSIER": float(rng.randint(0, 400)),
+            "RATIO_ENCOURS_IMPAYE": round(rng.uniform(0, 20), 2),
+            "RATIO_NOMBRE_IMPAYE": round(rng.uniform(0, 30), 2),
+            "PROVISION_TOTAL": round(encours * rng.uniform(0, 0.05), 2),
+        }
+        for b, part in zip(PAR_BUCKETS, parts):
+            r[f"ENCOURS_PAR_{b}"] = round(encours * part * scale, 2)
+            r[f"PAR_{b}"] = round(part * scale * 100, 2)
+        return r
+
+    rows_m = [row(i) for i in range(count)]
+    # M-1 : 90 % des lignes du mois M (montants différents) et quelques lignes disparues depuis
+    rows_m1 = [row(i) for i in range(count) if i % 10] + [row(count + i) for i in range(count // 20)]
+    return rows_m, rows_m1
+
+
+# --- Implémentation d'origine (boucle Python, avant vectorisation) ---
+
+def _safe_float(r, *keys) -> float:
+    for k in keys:
+        v = r.get(k)
+        if v is not None:
+            return v
+    return 0.0
+
+
+def legacy_rows(rows_m: List[Dict], rows_m1: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """(lignes CAF, lignes agence) de get_portefeuille_risque_data d'origine."""
+    key_m1 = {((r.get("BRANCH_NAME") or "").strip() or "-", (r.get("CODE_GESTION_PRET") or "").strip() or ""): r for r in rows_m1}
+
+    raw_data = []
+    for r in rows_m:
+        branch = (r.get("BRANCH_NAME") or "").strip() or "-"
+        code = (r.get("CODE_GESTION_PRET") or "").strip() or ""
+        r1 = key_m1.get((branch, code))
+        item = {
+            "AGENCE": branch,
+            "CODE_AGENCE": "",
+            "CHARGE_AFFAIRE": r.get("CHARGE_AFFAIRE") or "",
+            "CODE_GESTION_PRET": code,
+            "ENCOURS_TOTAL": _safe_float(r, "ENCOURS_TOTAL"),
+            "ENCOURS_IMPAYE": _safe_float(r, "ENCOURS_IMPAYE"),
+            "NOMBRE_DOSSIER": int(_safe_float(r, "NOMBRE_DOSSIER")),
+            "RATIO_ENCOURS_IMPAYE": _safe_float(r, "RATIO_ENCOURS_IMPAYE"),
+            "RATIO_NOMBRE_IMPAYE": _safe_float(r, "RATIO_NOMBRE_IMPAYE"),
+        }
+        for b in PAR_BUCKETS:
+            item[f"PAR_{b}_M_1"] = _safe_float(r1, f"ENCOURS_PAR_{b}") if r1 else 0
+            item[f"PAR_{b}_M"] = _safe_float(r, f"ENCOURS_PAR_{b}")
+        raw_data.append(item)
+
+    def aggregate(rows: List[Dict]) -> Dict[str, Dict]:
+        agg: Dict[str, Dict] = {}
+        for r in rows:
+            branch = (r.get("BRANCH_NAME") or "").strip() or "-"
+            if branch not in agg:
+                agg[branch] = {"ENCOURS_TOTAL": 0.0, "NOMBRE_DOSSIER": 0, "PROVISION_TOTAL": 0.0,
+                               **{f"ENCOURS_PAR_{b}": 0.0 for b in PAR_BUCKETS}}
+            agg[branch]["ENCOURS_TOTAL"] += _safe_float(r, "ENCOURS_TOTAL")
+            agg[branch]["NOMBRE_DOSSIER"] += int(_safe_float(r, "NOMBRE_DOSSIER"))
+            agg[branch]["PROVISION_TOTAL"] += _safe_float(r, "PROVISION_TOTAL")
+            for b in PAR_BUCKETS:
+                agg[branch][f"ENCOURS_PAR_{b}"] += _safe_float(r, f"ENCOURS_PAR_{b}")
+        return agg
+
+    agg_m, agg_m1 = aggregate(rows_m), aggregate(rows_m1)
+
+    def _pct(enc, num):
+        return round((num / enc * 100), 2) if enc else 0
+
+    agency_rows = []
+    for branch in set(agg_m.keys()) | set(agg_m1.keys()):
+        m, m1 = agg_m.get(branch) or {}, agg_m1.get(branch) or {}
+        enc_m, enc_m1 = m.get("ENCOURS_TOTAL") or 0, m1.get("ENCOURS_TOTAL") or 0
+        item = {
+            "AGENCE": branch,
+            "CODE_AGENCE": "",
+            "ENCOURS_M": enc_m,
+            "ENCOURS_M_1": enc_m1,
+            "PROVISIONS": m.get("PROVISION_TOTAL") or 0,
+            "NBRE_DOSSIERS": int(m.get("NOMBRE_DOSSIER") or 0),
+        }
+        for b in PAR_BUCKETS:
+            item[f"PAR_{b}_M_1"] = _pct(enc_m1, m1.get(f"ENCOURS_PAR_{b}") or 0)
+            item[f"PAR_{b}_M"] = _pct(enc_m, m.get(f"ENCOURS_PAR_{b}") or 0)
+        agency_rows.append(item)
+    return raw_data, agency_rows
+
+
+def legacy_caf(raw_data: List[Dict]) -> List[Dict]:
+    """Agrégation par (agence, CAF) de get_portefeuille_risque_caf_data d'origine (toutes agences)."""
+    def safe_float(v: object) -> float:
+        try:
+            return float(v or 0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def row_val(r: dict, *key_variants: str) -> float:
+        for k in key_variants:
+            if k in r and r[k] is not None:
+                return safe_float(r[k])
+        target = (key_variants[0] or "").upper()
+        for k in r:
+            if (k or "").upper() == target:
+                return safe_float(r[k])
+        return 0.0
+
+    caf_map: Dict = {}
+    for row in raw_data:
+        agence_name = str(row.get("AGENCE") or "").strip() or "-"
+        caf_name = str(row.get("CHARGE_AFFAIRE") or "-").strip() or "-"
+        key = (agence_name, caf_name)
+        if key not in caf_map:
+            caf_map[key] = {"nbre_dossiers": 0, "nombre_dossier_query": 0, "encours_credit": 0.0,
+                            "encours_impaye_sum": 0.0, "ratio_nombre_impaye_weighted": 0.0,
+                            **{f"par{b}_montant": 0.0 for b in PAR_BUCKETS}}
+        agg = caf_map[key]
+        agg["nbre_dossiers"] += 1
+        agg["nombre_dossier_query"] += int(row_val(row, "NOMBRE_DOSSIER", "nombre_dossier") or 0)
+        agg["encours_impaye_sum"] += row_val(row, "ENCOURS_IMPAYE", "encours_impaye")
+        par = {b: row_val(row, f"PAR_{b}_M", f"par_{b}_m") for b in PAR_BUCKETS}
+        encours_ligne = sum(par.values())
+        agg["encours_credit"] += encours_ligne
+        if encours_ligne > 0:
+            agg["ratio_nombre_impaye_weighted"] += row_val(row, "RATIO_NOMBRE_IMPAYE", "ratio_nombre_impaye") * encours_ligne
+        for b in PAR_BUCKETS:
+            agg[f"par{b}_montant"] += par[b]
+
+    caf_list: List[Dict] = []
+    for (agence, caf_name), agg in caf_map.items():
+        encours = agg["encours_credit"] or 0
+        item = {
+            "nom": caf_name,
+            "nbreDossiers": int(agg["nombre_dossier_query"] or agg["nbre_dossiers"]),
+            "encoursCredit": float(encours),
+        }
+        for b in PAR_BUCKETS:
+            item[f"encoursPar{b}"] = round(agg[f"par{b}_montant"], 2)
+        item["encoursImpayes"] = round(agg["encours_impaye_sum"], 2)
+        item["ratioEncoursImpayes"] = round(agg["encours_impaye_sum"] / encours * 100, 2) if encours > 0 else 0.0
+        item["ratioNbreImpayes"] = round(agg["ratio_nombre_impaye_weighted"] / encours, 2) if encours > 0 else None
+        for b in PAR_BUCKETS:
+            item[f"par{b}"] = round(agg[f"par{b}_montant"] / encours * 100, 2) if encours > 0 else 0.0
+        item["agence"] = agence
+        caf_list.append(item)
+    return caf_list
+
+
+# --- Chemin pandas (service actuel) ---
+
+def pandas_rows(rows_m: List[Dict], rows_m1: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    df_m = _par_frame(rows_m)
+    df_m1 = _par_frame(rows_m1)
+    return _par_caf_rows(df_m, df_m1), _par_agency_rows(df_m, df_m1)
+
+
+def pandas_caf(raw_data: List[Dict]) -> List[Dict]:
+    return _caf_metrics(raw_data, ["AGENCE_KEY", "CAF"])
+
+
+# --- Comparaison et mesure ---
+
+def _close(a, b) -> bool:
+    """Égalité à l'arrondi près (sommes flottantes dans un ordre différent)."""
+    if isinstance(a, float) or isinstance(b, float):
+        if a is None or b is None:
+            return a is b
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=0.011)
+    return a == b
+
+
+def _check(name: str, expected: List[Dict], actual: List[Dict], key: Callable[[Dict], object]) -> None:
+    expected = sorted(expected, key=key)
+    actual = sorted(actual, key=key)
+    if len(expected) != len(actual):
+        raise AssertionError(f"{name}: {len(expected)} lignes attendues, {len(actual)} obtenues")
+    for e, a in zip(expected, actual):
+        if e.keys() != a.keys() or not all(_close(e[k], a[k]) for k in e):
+            raise AssertionError(f"{name}: écart\n  origine: {e}\n  pandas:  {a}")
+
+
+def _best(fn: Callable, *args, repeat: int) -> Tuple[float, object]:
+    best, result = math.inf, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000], help="Lignes du mois M")
+    parser.add_argument("--repeat", type=int, default=5, help="Exécutions par mesure (meilleur temps retenu)")
+    args = parser.parse_args()
+
+    print(f"{'lignes':>8} | {'étape':<22} | {'origine (ms)':>12} | {'pandas (ms)':>11} | {'gain':>5}")
+    for count in args.rows:
+        rows_m, rows_m1 = synthetic_rows(count, seed=count)
+
+        t_old, (raw_old, agencies_old) = _best(legacy_rows, rows_m, rows_m1, repeat=args.repeat)
+        t_new, (raw_new, agencies_new) = _best(pandas_rows, rows_m, rows_m1, repeat=args.repeat)
+        _check("lignes CAF", raw_old, raw_new, key=lambda r: (r["AGENCE"], r["CODE_GESTION_PRET"]))
+        _check("agences", agencies_old, agencies_new, key=lambda r: r["AGENCE"])
+        print(f"{count:>8} | {'lignes CAF + agences':<22} | {t_old:>12.1f} | {t_new:>11.1f} | {t_old / t_new:>4.1f}x")
+
+        t_old, caf_old = _best(legacy_caf, raw_old, repeat=args.repeat)
+        t_new, caf_new = _best(pandas_caf, raw_new, repeat=args.repeat)
+        _check("métriques CAF", caf_old, caf_new, key=lambda r: (r["agence"], r["nom"]))
+        print(f"{count:>8} | {'métriques CAF':<22} | {t_old:>12.1f} | {t_new:>11.1f} | {t_old / t_new:>4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Banc d'essai de l'encodage des réponses : chemin FastAPI d'origine (jsonable_encoder puis JSONResponse)
+contre ``dumps`` (orjson, et repli json de la bibliothèque standard).
+
+Contenus aux formes réelles, produits par les fonctions des services sur des données synthétiques :
+- /data/portefeuille-risque : lignes CAF (_par_caf_rows) et hiérarchie territoires / agences
+  (organize_par_data) ;
+- /charts/multiseries : figure Plotly de séries mensuelles par agence (construite hors mesure) ; d'origine
+  la figure était encodée, relue (json.loads) puis réencodée, elle est désormais insérée telle quelle
+  (encoded_object).
+
+Chaque encodeur doit produire le même document JSON ; le script s'arrête sinon.
+
+Usage (depuis python-service) :
+    python -m benchmarks.benchmark_responses [--rows 10000] [--repeat 5]
+"""
+import argparse
+import json
+import math
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from plotly.utils import PlotlyJSONEncoder
+import plotly.graph_objects as go
+
+import routers.responses as responses
+from models.schemas import MultiSeriesData
+from benchmarks.benchmark_portefeuille_risque import synthetic_rows
+from services.chart_service import _figure_json
+from services.portefeuille_risque_service import (
+    _par_agency_rows,
+    _par_caf_rows,
+    _par_frame,
+    organize_par_data,
+)
+from services.utils import get_all_territories
+
+
+def _agency_names() -> List[str]:
+    return [agency for territory in get_all_territories().values() for agency in territory["agencies"]]
+
+
+def par_payload(rows: int) -> Dict[str, Any]:
+    """Contenu de /data/portefeuille-risque : {"data": lignes CAF, "hierarchicalData": ...}."""
+    rows_m, rows_m1 = synthetic_rows(rows, seed=rows)
+    agencies = _agency_names()
+    for i, row in enumerate(rows_m + rows_m1):
+        row["BRANCH_NAME"] = agencies[i % len(agencies)]
+    df_m, df_m1 = _par_frame(rows_m), _par_frame(rows_m1)
+    return {
+        "data": _par_caf_rows(df_m, df_m1),
+        "hierarchicalData": organize_par_data(_par_agency_rows(df_m, df_m1)),
+    }
+
+
+def multiseries_data(months: int = 36) -> MultiSeriesData:
+    """Séries mensuelles par agence (forme de /data/range/{source}), quelques mois sans lot."""
+    labels = [f"{1 + m % 12:02d}/{2024 + m // 12}" for m in range(months)]
+    series = {
+        agency: [None if (m + i) % 11 == 0 else round(1e6 * (1 + i) * (1 + m / 50), 2) for m in range(months)]
+        for i, agency in enumerate(_agency_names())
+    }
+    return MultiSeriesData(labels=labels, series=series, title="Encours par agence", ylabel="FCFA")
+
+
+def _legacy_route(payload: Any) -> bytes:
+    """Endpoint sans response_model d'origine : jsonable_encoder puis JSONResponse."""
+    return JSONResponse(content=jsonable_encoder(payload)).body
+
+
+def multiseries_figure(data: MultiSeriesData) -> go.Figure:
+    """Figure de generate_multiseries_chart (même contenu, construite une fois hors mesure)."""
+    fig = go.Figure()
+    for name, values in data.series.items():
+        fig.add_trace(go.Scatter(x=data.labels, y=values, mode="lines+markers", name=name, connectgaps=False))
+    fig.update_layout(title=data.title, xaxis_title="Période", yaxis_title=data.ylabel, template="plotly_white")
+    return fig
+
+
+def _legacy_chart(fig: go.Figure) -> bytes:
+    """Encodage d'origine : figure encodée puis relue (json.loads), réencodée par JSONResponse."""
+    chart = json.loads(json.dumps(fig, cls=PlotlyJSONEncoder))
+    return JSONResponse(content={"chart": chart}).body
+
+
+def _chart(fig: go.Figure) -> bytes:
+    """Encodage actuel : figure encodée une fois (_figure_json) puis insérée telle quelle."""
+    return responses.FastJSONResponse(responses.encoded_object(chart=_figure_json(fig))).body
+
+
+def _stdlib_dumps(payload: Any) -> bytes:
+    """``dumps`` sans orjson (repli json de la bibliothèque standard)."""
+    saved, responses.orjson = responses.orjson, None
+    try:
+        return responses.dumps(payload)
+    finally:
+        responses.orjson = saved
+
+
+def _best(fn: Callable, arg: Any, repeat: int) -> Tuple[float, bytes]:
+    best, body = math.inf, b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, body
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=10_000, help="Lignes DASH_PAR_GLOBAL du mois M")
+    parser.add_argument("--repeat", type=int, default=5, help="Exécutions par mesure (meilleur temps retenu)")
+    args = parser.parse_args()
+
+    payload = par_payload(args.rows)
+    chart = multiseries_figure(multiseries_data())
+    cases = [
+        ("portefeuille-risque", "origine (jsonable_encoder)", _legacy_route, payload),
+        ("portefeuille-risque", "dumps (json standard)", _stdlib_dumps, payload),
+        ("portefeuille-risque", "dumps (orjson)", responses.dumps, payload),
+        ("charts/multiseries", "origine (loads + réencodage)", _legacy_chart, chart),
+        ("charts/multiseries", "figure insérée (bytes)", _chart, chart),
+    ]
+    if responses.orjson is None:
+        cases = [case for case in cases if case[1] != "dumps (orjson)"]
+
+    print(f"{'contenu':<20} | {'encodage':<28} | {'ms':>8} | {'Ko':>7}")
+    reference: Dict[str, Any] = {}
+    for name, label, fn, arg in cases:
+        elapsed, body = _best(fn, arg, args.repeat)
+        # Même document JSON quel que soit l'encodeur
+        decoded = json.loads(body)
+        if reference.setdefault(name, decoded) != decoded:
+            raise AssertionError(f"{name}: contenu différent avec {label}")
+        print(f"{name:<20} | {label:<28} | {elapsed:>8.1f} | {len(body) / 1024:>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Contrôle du résolveur nom d'agence → territoire (services.utils._TerritoryResolver) contre un jeu de
+référence figé : benchmarks/territory_golden.json.
+
+Le fichier contient toutes les orthographes connues (clés d'AGENCY_TERRITORY_MAPPING, points de service,
+agences de get_all_territories) et des variantes (casse, espaces, préfixes, mots isolés, tronçons,
+noms inconnus), avec le territoire renvoyé par l'algorithme historique de get_territory_from_agency
+(parcours linéaire, recopié ci-dessous dans ``reference_territory``).
+
+Usage (depuis python-service) :
+    python -m benchmarks.check_territory_resolver               # vérifie, code retour 1 en cas d'écart
+    python -m benchmarks.check_territory_resolver --regenerate  # après une modification voulue du mapping
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+
+from services.utils import (
+    AGENCY_TERRITORY_MAPPING,
+    SERVICE_POINT_MAPPING,
+    get_all_territories,
+    get_territory_from_agency,
+)
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "territory_golden.json")
+
+# Noms hors mapping : aucun territoire, ou repli par mots-clés
+_UNKNOWN_NAMES = (
+    "", "   ", "AGENCE", "AGENCE INCONNUE", "DAKAR", "COFINA", "COFINA EXPRESS", "SIEGE SOCIAL",
+    "AB", "XYZ", "POINT", "E", "LA", "AGENCE DE TEST", "DIRECTION GENERALE", "CE", "C-E",
+)
+
+
+def reference_territory(agency_name: Optional[str]) -> Optional[str]:
+    """Algorithme historique de get_territory_from_agency (avant compilation du résolveur)."""
+    if not agency_name:
+        return None
+    normalized_name = " ".join(str(agency_name).upper().split())
+
+    # 1) Mapping explicite (prioritaire)
+    if normalized_name in AGENCY_TERRITORY_MAPPING:
+        return AGENCY_TERRITORY_MAPPING[normalized_name]
+
+    # 2) Correspondance partielle — clés les plus longues d'abord
+    for key in sorted(AGENCY_TERRITORY_MAPPING.keys(), key=len, reverse=True):
+        if key in normalized_name or normalized_name in key:
+            return AGENCY_TERRITORY_MAPPING[key]
+
+    # 3) Mots-clés (fallback)
+    for word in [w for w in normalized_name.split() if len(w) > 2]:
+        for key, territory in AGENCY_TERRITORY_MAPPING.items():
+            key_words = [w for w in key.split() if len(w) > 2]
+            if word in key_words or any(kw in normalized_name for kw in key_words):
+                return territory
+
+    # 4) Point de service sans entrée dans le mapping : toujours None
+    return None
+
+
+def known_spellings() -> List[str]:
+    """Orthographes connues et variantes dérivées (ordre stable, sans doublon)."""
+    bases = list(AGENCY_TERRITORY_MAPPING) + list(SERVICE_POINT_MAPPING) + list(SERVICE_POINT_MAPPING.values())
+    for territory in get_all_territories().values():
+        bases.extend(territory["agencies"])
+        for agency, points in territory["service_points"].items():
+            bases.append(agency)
+            bases.extend(points)
+
+    names: Dict[str, None] = {}
+    for base in bases:
+        words = base.split()
+        variants = [
+            base,
+            base.lower(),
+            base.title(),
+            f"  {base}  ",
+            "  ".join(words),
+            f"AGENCE {base}",
+            f"COFINA {base}",
+            f"{base} 2",
+            f"{base} SA",
+            base.replace("-", " "),
+            base.replace(" ", "-"),
+            base.replace(" ", ""),
+            base[:4],
+            base[:-1],
+            base[1:],
+            " ".join(reversed(words)),
+        ]
+        variants.extend(words)
+        if len(words) > 1:
+            variants.append(" ".join(words[1:]))
+            variants.append(" ".join(words[:-1]))
+        for variant in variants:
+            names.setdefault(variant, None)
+    for name in _UNKNOWN_NAMES:
+        names.setdefault(name, None)
+    return list(names)
+
+
+def regenerate() -> int:
+    golden = [{"name": name, "territory": reference_territory(name)} for name in known_spellings()]
+    with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+        json.dump(golden, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+    print(f"{len(golden)} noms écrits dans {GOLDEN_PATH}")
+    return 0
+
+
+def check() -> int:
+    with open(GOLDEN_PATH, encoding="utf-8") as f:
+        golden = json.load(f)
+    mismatches = []
+    for entry in golden:
+        name, expected = entry["name"], entry["territory"]
+        for label, actual in (("résolveur", get_territory_from_agency(name)), ("référence", reference_territory(name))):
+            if actual != expected:
+                mismatches.append(f"{name!r}: attendu {expected!r}, {label} {actual!r}")
+    for line in mismatches:
+        print(f"❌ {line}")
+    print(f"{len(golden)} noms contrôlés, {len(mismatches)} écart(s)")
+    return 1 if mismatches else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--regenerate", action="store_true", help="Réécrit le jeu de référence avec reference_territory")
+    args = parser.parse_args()
+    sys.exit(regenerate() if args.regenerate else check())
+
+
+if __name__ == "__main__":
+    main()
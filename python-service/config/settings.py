@@ -41,3 +41,34 @@ ORACLE_DOMICILIATION_ORA942_EMPTY = os.getenv(
     "ORACLE_DOMICILIATION_ORA942_EMPTY", "1"
 ).strip().lower() in ("1", "true", "yes", "on")
 
+
+# Rendu PNG matplotlib (/api/charts/image) : processus de rendu dédiés et mémo des images par contenu.
+# CHART_IMAGE_WORKERS=0 : rendu dans un thread du service (pas de pool de processus).
+CHART_IMAGE_WORKERS = max(0, int(os.getenv("CHART_IMAGE_WORKERS", "2")))
+CHART_IMAGE_MEMO_SIZE = max(0, int(os.getenv("CHART_IMAGE_MEMO_SIZE", "256")))
+
+# Requêtes conditionnelles (ETag / Last-Modified) : délai de relecture des MAX(MIGRATION_DATETIME) DASH, en secondes.
+SNAPSHOT_PROBE_TTL = max(0, int(os.getenv("SNAPSHOT_PROBE_TTL", "30")))
+
+# Notifications de nouveau lot DASH (/api/events/dash) : intervalle de relecture des snapshots tant qu'un client
+# est abonné, et intervalle des commentaires de maintien de connexion, en secondes (0 : pas de surveillance).
+SNAPSHOT_WATCH_INTERVAL = max(0, int(os.getenv("SNAPSHOT_WATCH_INTERVAL", "30")))
+EVENTS_HEARTBEAT_INTERVAL = max(1, int(os.getenv("EVENTS_HEARTBEAT_INTERVAL", "15")))
+
+# Compression des réponses : taille minimale (octets) et taille max du cache des variantes compressées (octets).
+COMPRESSION_MINIMUM_SIZE = max(0, int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024")))
+COMPRESSION_CACHE_BYTES = max(0, int(os.getenv("COMPRESSION_CACHE_BYTES", str(64 * 1024 * 1024))))
+
+# Réponses différentielles (since=<snapshot_id>) : nombre de requêtes (endpoint + paramètres) dont les contenus
+# des derniers lots DASH sont gardés en mémoire, nombre de lots gardés par requête et taille max du magasin
+# (octets, taille JSON des contenus).
+DELTA_STORE_KEYS = max(0, int(os.getenv("DELTA_STORE_KEYS", "64")))
+DELTA_SNAPSHOTS_PER_KEY = max(1, int(os.getenv("DELTA_SNAPSHOTS_PER_KEY", "3")))
+DELTA_STORE_BYTES = max(0, int(os.getenv("DELTA_STORE_BYTES", str(64 * 1024 * 1024))))
+
+# Jobs asynchrones (/api/jobs) : threads d'exécution, jobs en attente au plus (au-delà : 503), durée de conservation
+# des résultats (secondes) et nombre maximal de jobs terminés conservés.
+JOB_WORKERS = max(1, int(os.getenv("JOB_WORKERS", "2")))
+JOB_QUEUE_SIZE = max(1, int(os.getenv("JOB_QUEUE_SIZE", "16")))
+JOB_RESULT_TTL = max(0, int(os.getenv("JOB_RESULT_TTL", "3600")))
+JOB_MAX_RETAINED = max(1, int(os.getenv("JOB_MAX_RETAINED", "64")))
@@ -0,0 +1,123 @@
+"""
+Conversion des résultats Oracle en lots colonnes Apache Arrow (pyarrow, optionnel).
+
+Le schéma est déduit de ``cursor.description`` (type Oracle, précision, échelle) et des colonnes
+converties en float / int par ``prepare_records`` ; chaque lot de ``Record`` lu par fetchmany est
+transposé en colonnes et converti en ``RecordBatch`` sans passer par un dictionnaire par ligne.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import oracledb
+except ImportError:
+    import cx_Oracle as oracledb
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+def _db_types(*names: str) -> Tuple[Any, ...]:
+    return tuple(t for t in (getattr(oracledb, name, None) for name in names) if t is not None)
+
+
+_NUMBER = _db_types("DB_TYPE_NUMBER")
+_FLOAT = _db_types("DB_TYPE_BINARY_FLOAT", "DB_TYPE_BINARY_DOUBLE")
+_INTEGER = _db_types("DB_TYPE_BINARY_INTEGER")
+_BOOLEAN = _db_types("DB_TYPE_BOOLEAN")
+_STRING = _db_types(
+    "DB_TYPE_VARCHAR", "DB_TYPE_NVARCHAR", "DB_TYPE_CHAR", "DB_TYPE_NCHAR", "DB_TYPE_LONG", "DB_TYPE_LONG_NVARCHAR"
+)
+_TEXT_LOB = _db_types("DB_TYPE_CLOB", "DB_TYPE_NCLOB")
+_BINARY = _db_types("DB_TYPE_RAW", "DB_TYPE_LONG_RAW")
+_BINARY_LOB = _db_types("DB_TYPE_BLOB")
+_DATE = _db_types("DB_TYPE_DATE")
+_TIMESTAMP = _db_types("DB_TYPE_TIMESTAMP", "DB_TYPE_TIMESTAMP_LTZ", "DB_TYPE_TIMESTAMP_TZ")
+_INTERVAL = _db_types("DB_TYPE_INTERVAL_DS")
+
+# NUMBER(p, 0) lu en int par le driver et tenant dans un int64
+_INT64_MAX_PRECISION = 18
+
+Converter = Optional[Callable[[Any], Any]]
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def _read_lob(value: Any) -> Any:
+    return value.read() if value is not None else None
+
+
+def _as_text(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _column_type(
+    column: Sequence[Any],
+    float_columns: Dict[str, Any],
+    int_columns: Dict[str, Any],
+) -> Tuple[Any, Converter]:
+    """(type Arrow, conversion par valeur ou None) d'une entrée de cursor.description."""
+    name, type_code, precision, scale = column[0], column[1], column[4], column[5]
+    if name in float_columns:
+        return pa.float64(), None
+    if name in int_columns:
+        return pa.int64(), None
+    if type_code in _NUMBER:
+        # NUMBER sans précision (précision 0, échelle -127) : entier ou décimal selon la valeur
+        if scale == 0 and precision and precision <= _INT64_MAX_PRECISION:
+            return pa.int64(), None
+        return pa.float64(), None
+    if type_code in _FLOAT:
+        return pa.float64(), None
+    if type_code in _INTEGER:
+        return pa.int64(), None
+    if type_code in _BOOLEAN:
+        return pa.bool_(), None
+    if type_code in _STRING:
+        return pa.string(), None
+    if type_code in _TEXT_LOB:
+        return pa.large_string(), _read_lob
+    if type_code in _BINARY:
+        return pa.binary(), None
+    if type_code in _BINARY_LOB:
+        return pa.large_binary(), _read_lob
+    if type_code in _DATE:
+        return pa.timestamp("s"), None
+    if type_code in _TIMESTAMP:
+        return pa.timestamp("us"), None
+    if type_code in _INTERVAL:
+        return pa.duration("us"), None
+    return pa.string(), _as_text
+
+
+class ArrowBatchBuilder:
+    """Schéma Arrow d'une requête et conversion de ses lots de lignes en RecordBatch."""
+
+    def __init__(
+        self,
+        description: Sequence[Sequence[Any]],
+        float_columns: Optional[Dict[str, Any]] = None,
+        int_columns: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        if pa is None:
+            raise RuntimeError("pyarrow n'est pas installé (pip install pyarrow)")
+        float_columns = float_columns or {}
+        int_columns = int_columns or {}
+        types = [_column_type(column, float_columns, int_columns) for column in description]
+        self.schema = pa.schema([pa.field(column[0], arrow_type) for column, (arrow_type, _) in zip(description, types)])
+        self._converters: List[Converter] = [converter for _, converter in types]
+
+    def batch(self, rows: Sequence[Sequence[Any]]) -> "pa.RecordBatch":
+        """Lot de lignes (tuples / Record) → RecordBatch, colonne par colonne."""
+        if not rows:
+            return pa.RecordBatch.from_pylist([], schema=self.schema)
+        columns = zip(*rows)
+        arrays = []
+        for values, field, converter in zip(columns, self.schema, self._converters):
+            if converter is not None:
+                values = [converter(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
@@ -0,0 +1,87 @@
+"""
+Interruption des appels Oracle d'un traitement en arrière-plan (jobs, cf. services.job_service).
+
+Le thread qui exécute un traitement est lié à un ``CancelToken`` (``bind``) ; les connexions qu'il obtient
+(pool ou connexion directe) sont enregistrées sur le jeton tant qu'il les utilise. ``CancelToken.cancel``
+interrompt l'appel en cours sur ces connexions (connection.cancel(), ORA-01013 dans le thread du traitement).
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+_bound = threading.local()
+
+
+class Cancelled(Exception):
+    """Traitement annulé."""
+
+
+class CancelToken:
+    def __init__(self) -> None:
+        self._cancelled = threading.Event()
+        self._connections: Set[Any] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._cancelled.is_set():
+            raise Cancelled()
+
+    def track(self, conn: Any) -> None:
+        with self._lock:
+            self._connections.add(conn)
+        if self._cancelled.is_set():
+            self._interrupt(conn)
+
+    def untrack(self, conn: Any) -> None:
+        with self._lock:
+            self._connections.discard(conn)
+
+    def cancel(self) -> None:
+        """Marque le traitement annulé et interrompt ses appels Oracle en cours (non bloquant)."""
+        self._cancelled.set()
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            self._interrupt(conn)
+
+    @staticmethod
+    def _interrupt(conn: Any) -> None:
+        try:
+            conn.cancel()
+        except Exception as e:
+            logger.debug(f"Interruption de l'appel Oracle impossible: {e}")
+
+
+def current_token() -> Optional[CancelToken]:
+    return getattr(_bound, "token", None)
+
+
+@contextmanager
+def bind(token: CancelToken) -> Iterator[CancelToken]:
+    """Lie le jeton au thread courant pendant l'exécution du traitement."""
+    previous = current_token()
+    _bound.token = token
+    try:
+        yield token
+    finally:
+        _bound.token = previous
+
+
+def track_connection(conn: Any) -> None:
+    """Enregistre une connexion utilisée par le traitement du thread courant (sans effet hors traitement)."""
+    token = current_token()
+    if token is not None and conn is not None:
+        token.track(conn)
+
+
+def untrack_connection(conn: Any) -> None:
+    token = current_token()
+    if token is not None and conn is not None:
+        token.untrack(conn)
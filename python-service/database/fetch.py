@@ -0,0 +1,190 @@
+"""
+Lecture typée des résultats Oracle.
+
+Les colonnes numériques déclarées sont converties par le driver (outputtypehandler) en float / int,
+avec leur valeur par défaut pour NULL, et chaque ligne est construite directement en ``Record``
+(rowfactory) : plus de boucle Python par cellule (hasattr(__float__), Decimal → float) dans les services.
+"""
+import inspect
+import logging
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import oracledb
+except ImportError:
+    import cx_Oracle as oracledb
+
+logger = logging.getLogger(__name__)
+
+_DB_TYPE_NUMBER = getattr(oracledb, "DB_TYPE_NUMBER", getattr(oracledb, "NUMBER", None))
+
+try:
+    _SUPPORTS_CONVERT_NULLS = "convert_nulls" in inspect.signature(oracledb.Cursor.var).parameters
+except (TypeError, ValueError):
+    _SUPPORTS_CONVERT_NULLS = False
+
+
+class Record(tuple):
+    """
+    Ligne Oracle compacte : tuple des valeurs + accès par nom de colonne (lecture seule).
+
+    Se comporte comme un mapping pour le code existant (``row.get("AGENCE")``, ``row["DAT_M"]``,
+    ``dict(row)``) sans construire de dictionnaire par ligne.
+    """
+
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+    _index: Dict[str, int] = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def get(self, key: str, default: Any = None) -> Any:
+        i = self._index.get(key)
+        return default if i is None else tuple.__getitem__(self, i)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._fields
+
+    def values(self) -> Tuple[Any, ...]:
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(zip(self._fields, self))
+
+    def __repr__(self) -> str:
+        return f"Record({self.to_dict()!r})"
+
+
+@lru_cache(maxsize=256)
+def record_type(fields: Tuple[str, ...]) -> type:
+    """Type Record (mis en cache) pour une liste de colonnes."""
+    return type("Record", (Record,), {
+        "__slots__": (),
+        "_fields": fields,
+        "_index": {name: i for i, name in enumerate(fields)},
+    })
+
+
+def _output_type_handler(
+    float_columns: Dict[str, Optional[float]],
+    int_columns: Dict[str, Optional[int]],
+):
+    """Handler Oracle : NUMBER → float / int pour les colonnes déclarées, NULL → valeur par défaut."""
+
+    def handler(cursor, name, default_type, size, precision, scale):
+        if default_type != _DB_TYPE_NUMBER:
+            return None
+        if name in float_columns:
+            py_type, default = float, float_columns[name]
+        elif name in int_columns:
+            py_type, default = int, int_columns[name]
+        else:
+            return None
+        if default is not None and _SUPPORTS_CONVERT_NULLS:
+            return cursor.var(
+                py_type,
+                arraysize=cursor.arraysize,
+                outconverter=lambda value: default if value is None else value,
+                convert_nulls=True,
+            )
+        return cursor.var(py_type, arraysize=cursor.arraysize)
+
+    return handler
+
+
+def _row_factory(fields: Tuple[str, ...], defaults: Dict[str, Any]):
+    rec_type = record_type(fields)
+    if _SUPPORTS_CONVERT_NULLS or not defaults:
+        return lambda *values: rec_type(values)
+
+    # Driver sans convert_nulls (cx_Oracle) : défauts appliqués ici, uniquement sur les colonnes déclarées
+    positions = [(i, defaults[name]) for i, name in enumerate(fields) if name in defaults]
+
+    def factory(*values):
+        values = list(values)
+        for i, default in positions:
+            if values[i] is None:
+                values[i] = default
+        return rec_type(values)
+
+    return factory
+
+
+def prepare_records(
+    cursor,
+    sql: str,
+    binds: Optional[Dict[str, Any]] = None,
+    float_columns: Optional[Dict[str, Optional[float]]] = None,
+    int_columns: Optional[Dict[str, Optional[int]]] = None,
+    arraysize: int = 1000,
+) -> Tuple[str, ...]:
+    """
+    Exécute ``sql`` avec conversion typée et rowfactory ``Record`` ; les lignes restent à lire
+    (fetchall / fetchmany). Renvoie les noms de colonnes.
+    """
+    float_columns = float_columns or {}
+    int_columns = int_columns or {}
+    cursor.arraysize = arraysize
+    cursor.prefetchrows = arraysize
+    cursor.outputtypehandler = _output_type_handler(float_columns, int_columns)
+    cursor.execute(sql, binds or {})
+    fields = tuple(d[0] for d in cursor.description)
+    defaults = {
+        name: default
+        for columns in (float_columns, int_columns)
+        for name, default in columns.items()
+        if default is not None
+    }
+    cursor.rowfactory = _row_factory(fields, defaults)
+    return fields
+
+
+def fetch_records(
+    cursor,
+    sql: str,
+    binds: Optional[Dict[str, Any]] = None,
+    float_columns: Optional[Dict[str, Optional[float]]] = None,
+    int_columns: Optional[Dict[str, Optional[int]]] = None,
+    arraysize: int = 1000,
+) -> List[Record]:
+    """
+    Exécute ``sql`` et renvoie les lignes typées.
+
+    Args:
+        cursor: Curseur Oracle (son outputtypehandler / rowfactory sont positionnés pour cette requête)
+        sql: Requête
+        binds: Variables de liaison
+        float_columns: {COLONNE: valeur si NULL (None = laisser NULL)} — NUMBER lus en float
+        int_columns: {COLONNE: valeur si NULL (None = laisser NULL)} — NUMBER lus en int
+        arraysize: Taille des lots de fetch
+
+    Returns:
+        Liste de Record (accès par nom de colonne, compatible dict(row))
+    """
+    prepare_records(cursor, sql, binds, float_columns, int_columns, arraysize)
+    return cursor.fetchall()
+
+
+def iter_record_batches(cursor, arraysize: Optional[int] = None) -> Iterator[List[Record]]:
+    """Lots successifs de lignes (fetchmany) d'un curseur préparé par ``prepare_records``."""
+    size = arraysize or cursor.arraysize
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def float_defaults(columns: Iterable[str], default: Optional[float] = 0.0) -> Dict[str, Optional[float]]:
+    """Raccourci : même valeur par défaut pour une liste de colonnes float."""
+    return {name: default for name in columns}
@@ -5,6 +5,7 @@ from fastapi import HTTPException
 import socket
 import logging
 from config.settings import ORACLE_COFINA_CONFIG
+from database.cancellation import track_connection
 
 logger = logging.getLogger(__name__)
 
@@ -150,5 +151,8 @@ def get_oracle_connection_cofina():
         raise
     except Exception:
         pass
-    return _oracle_connect(cfg)
+    conn = _oracle_connect(cfg)
+    # Connexion directe ouverte par un job : interrompue si le job est annulé
+    track_connection(conn)
+    return conn
 
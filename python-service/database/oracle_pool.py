@@ -6,6 +6,7 @@ import threading
 from queue import Queue, Empty
 from typing import Optional
 from contextlib import contextmanager
+from database.cancellation import track_connection, untrack_connection
 from database.oracle import get_oracle_connection
 
 logger = logging.getLogger(__name__)
@@ -13,6 +14,8 @@ logger = logging.getLogger(__name__)
 # Configuration du pool
 POOL_SIZE = 5
 MAX_OVERFLOW = 10
+# Connexions pré-créées : get_connection(timeout=None) attend l'une d'elles, sans passer en overflow
+POOL_PREFILL = 3
 
 class OracleConnectionPool:
     """Pool de connexions Oracle thread-safe"""
@@ -31,7 +34,7 @@ class OracleConnectionPool:
     def _initialize_pool(self):
         """Initialise le pool avec quelques connexions"""
         try:
-            for _ in range(min(3, self.pool_size)):
+            for _ in range(min(POOL_PREFILL, self.pool_size)):
                 conn = get_oracle_connection()
                 self._pool.put(conn)
                 self._created += 1
@@ -128,9 +131,11 @@ class OracleConnectionPool:
         conn = None
         try:
             conn = self.get_connection(timeout)
+            track_connection(conn)
             yield conn
         finally:
             if conn:
+                untrack_connection(conn)
                 self.return_connection(conn)
     
     def close_all(self):
@@ -6,16 +6,23 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 
-from routers import charts, oracle, cache
+from routers import charts, oracle, cache, events, jobs
+from routers.compression import CompressionMiddleware
+from routers.conditional import ConditionalGetMiddleware
+from routers.responses import FastJSONResponse
 from database.oracle_pool import init_pool, close_pool
 from services.cache_service import enable_cache
+from services.chart_image_service import start_chart_image_pool, stop_chart_image_pool
+from services.job_service import shutdown_jobs
+from services.snapshot_service import stop_snapshot_watcher
+from services.utils import start_branch_code_mapping_refresher, stop_branch_code_mapping_refresher
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Création de l'application FastAPI
-app = FastAPI(title="COFIdash Charts API", version="1.0.0")
+app = FastAPI(title="COFIdash Charts API", version="1.0.0", default_response_class=FastJSONResponse)
 
 # Initialiser le pool de connexions Oracle au démarrage
 @app.on_event("startup")
@@ -24,6 +31,8 @@ async def startup_event():
     try:
         init_pool(pool_size=5, max_overflow=10)
         enable_cache()
+        start_branch_code_mapping_refresher()
+        start_chart_image_pool()
         logger.info("✅ Pool de connexions Oracle et cache initialisés")
     except Exception as e:
         logger.error(f"❌ Erreur lors de l'initialisation: {e}", exc_info=True)
@@ -32,11 +41,21 @@ async def startup_event():
 async def shutdown_event():
     """Nettoie les ressources à l'arrêt de l'application"""
     try:
+        stop_branch_code_mapping_refresher()
+        stop_snapshot_watcher()
+        shutdown_jobs()
+        stop_chart_image_pool()
         close_pool()
         logger.info("✅ Pool de connexions Oracle fermé")
     except Exception as e:
         logger.error(f"❌ Erreur lors de la fermeture: {e}", exc_info=True)
 
+# ETag / Last-Modified (snapshots DASH) et réponses 304 sur /api/oracle/data/*
+app.add_middleware(ConditionalGetMiddleware)
+
+# Compression brotli / gzip (niveau par route, variantes compressées mises en cache par ETag)
+app.add_middleware(CompressionMiddleware)
+
 # Configuration CORS pour permettre les requêtes depuis Laravel/Vue.js
 app.add_middleware(
     CORSMiddleware,
@@ -50,6 +69,8 @@ app.add_middleware(
 app.include_router(charts.router)
 app.include_router(oracle.router)
 app.include_router(cache.router)
+app.include_router(events.router)
+app.include_router(jobs.router)
 
 
 @app.get("/")
@@ -2,7 +2,7 @@
 Modèles Pydantic pour les requêtes API
 """
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 
 
 class TimeSeriesData(BaseModel):
@@ -14,7 +14,8 @@ class TimeSeriesData(BaseModel):
 
 class MultiSeriesData(BaseModel):
     labels: List[str]
-    series: Dict[str, List[float]]
+    # None : point manquant (ex. mois sans lot DASH), laissé en trou sur la courbe
+    series: Dict[str, List[Optional[float]]]
     title: Optional[str] = "Graphique multi-séries"
     ylabel: Optional[str] = "Valeur"
 
@@ -42,3 +43,8 @@ class PieChartData(BaseModel):
     title: Optional[str] = "Graphique circulaire"
     colors: Optional[List[str]] = None
 
+
+
+class JobRequest(BaseModel):
+    report: str
+    params: Optional[Dict[str, Any]] = None
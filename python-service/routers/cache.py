@@ -2,12 +2,14 @@
 Endpoints pour gérer le cache
 """
 from fastapi import APIRouter
+from routers.responses import FastJSONRoute
 from services.cache_service import (
     clear_cache, get_cache_stats, enable_cache, 
     disable_cache, set_default_ttl
 )
+from services.utils import get_branch_code_mapping_info, get_branch_code_territory_mapping
 
-router = APIRouter(prefix="/api/cache", tags=["cache"])
+router = APIRouter(prefix="/api/cache", tags=["cache"], route_class=FastJSONRoute)
 
 
 @router.get("/stats")
@@ -42,3 +44,17 @@ async def set_ttl_endpoint(ttl: int):
     """Définit le TTL par défaut du cache en secondes"""
     set_default_ttl(ttl)
     return {"message": f"TTL par défaut défini à {ttl} secondes"}
+
+
+@router.get("/branch-mapping")
+async def get_branch_mapping_info_endpoint():
+    """Version, âge et taille du mapping code agence → territoire (rafraîchi en arrière-plan)"""
+    return get_branch_code_mapping_info()
+
+
+@router.post("/branch-mapping/refresh")
+def refresh_branch_mapping_endpoint():
+    """Régénère immédiatement le mapping code agence → territoire depuis Oracle"""
+    mapping = get_branch_code_territory_mapping(force_regenerate=True)
+    info = get_branch_code_mapping_info()
+    return {"message": f"Mapping des codes agence v{info['version']} publié", "count": len(mapping)}
@@ -2,18 +2,18 @@
 Router pour les endpoints de génération de graphiques
 """
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from routers.responses import FastJSONResponse, FastJSONRoute, encoded_object
 from models.schemas import TimeSeriesData, MultiSeriesData, BarChartData, EvolutionData, PieChartData
 from services.chart_service import (
     generate_timeseries_chart,
     generate_multiseries_chart,
     generate_bar_chart,
     generate_evolution_chart,
-    generate_pie_chart,
-    generate_chart_image
+    generate_pie_chart
 )
+from services.chart_image_service import render_chart_image
 
-router = APIRouter(prefix="/api/charts", tags=["charts"])
+router = APIRouter(prefix="/api/charts", tags=["charts"], route_class=FastJSONRoute)
 
 
 @router.post("/timeseries")
@@ -23,7 +23,7 @@ async def create_timeseries_chart(data: TimeSeriesData):
     """
     try:
         chart = generate_timeseries_chart(data)
-        return JSONResponse(content={"chart": chart})
+        return FastJSONResponse(encoded_object(chart=chart))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération du graphique: {str(e)}")
 
@@ -35,7 +35,7 @@ async def create_multiseries_chart(data: MultiSeriesData):
     """
     try:
         chart = generate_multiseries_chart(data)
-        return JSONResponse(content={"chart": chart})
+        return FastJSONResponse(encoded_object(chart=chart))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération du graphique: {str(e)}")
 
@@ -47,7 +47,7 @@ async def create_bar_chart(data: BarChartData):
     """
     try:
         chart = generate_bar_chart(data)
-        return JSONResponse(content={"chart": chart})
+        return FastJSONResponse(encoded_object(chart=chart))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération du graphique: {str(e)}")
 
@@ -59,7 +59,7 @@ async def create_evolution_chart(data: EvolutionData):
     """
     try:
         chart = generate_evolution_chart(data)
-        return JSONResponse(content={"chart": chart})
+        return FastJSONResponse(encoded_object(chart=chart))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération du graphique: {str(e)}")
 
@@ -71,7 +71,7 @@ async def create_pie_chart(data: PieChartData):
     """
     try:
         chart = generate_pie_chart(data)
-        return JSONResponse(content={"chart": chart})
+        return FastJSONResponse(encoded_object(chart=chart))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération du graphique circulaire: {str(e)}")
 
@@ -80,11 +80,11 @@ async def create_pie_chart(data: PieChartData):
 async def create_chart_image(data: TimeSeriesData):
     """
     Génère un graphique matplotlib et le retourne comme image PNG encodée en base64
-    Alternative pour ceux qui préfèrent matplotlib
+    Alternative pour ceux qui préfèrent matplotlib (rendu dans le pool de processus, mémorisé par contenu)
     """
     try:
-        image = generate_chart_image(data)
-        return JSONResponse(content={"image": image})
+        image = await render_chart_image(data)
+        return FastJSONResponse({"image": image})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération de l'image: {str(e)}")
 
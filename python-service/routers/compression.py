@@ -0,0 +1,258 @@
+"""
+Compression des réponses (brotli si installé, sinon gzip).
+
+Les gros contenus JSON (données brutes PAR, entrées PAR, lignes CAF, résultats de /query) répètent
+les mêmes clés à chaque ligne et se compressent d'un facteur 5 ou plus. Le niveau est choisi par route :
+élevé pour les réponses DASH (elles portent un ETag de snapshot et leur version compressée est mise en
+cache), modéré pour les réponses calculées à chaque appel.
+
+L'endpoint s'exécute à chaque requête (hors 304, cf. routers.conditional ; ses données viennent du cache
+des services) : seule la compression est épargnée. La variante en cache est indexée par l'ETag et par
+l'empreinte du corps produit, car l'ETag de snapshot ne couvre pas tout le contenu (section du dashboard
+en erreur puis rétablie, mapping des territoires rafraîchi) : un corps différent n'est jamais remplacé
+par une ancienne variante. Tant que le contenu ne change pas, la compression est payée une fois par snapshot.
+"""
+import gzip
+import hashlib
+import logging
+import threading
+import zlib
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config.settings import COMPRESSION_CACHE_BYTES, COMPRESSION_MINIMUM_SIZE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# (préfixe de chemin, niveau gzip 1-9, qualité brotli 0-11) — premier préfixe correspondant retenu
+_ROUTE_LEVELS: Tuple[Tuple[str, int, int], ...] = (
+    ("/api/oracle/query", 5, 4),
+    ("/api/oracle/data/dashboard", 6, 5),
+    ("/api/oracle/data/", 9, 9),
+    ("/api/charts/", 6, 5),
+)
+_DEFAULT_LEVELS = (6, 5)
+
+_COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/vnd.apache.arrow.stream",
+    "text/",
+    "application/javascript",
+)
+# Flux envoyés au fil de l'eau (SSE) : jamais compressés, un compresseur retiendrait les événements
+_STREAMING_TYPES = ("text/event-stream",)
+
+
+def _route_levels(path: str) -> Tuple[int, int]:
+    for prefix, gzip_level, brotli_quality in _ROUTE_LEVELS:
+        if path.startswith(prefix):
+            return gzip_level, brotli_quality
+    return _DEFAULT_LEVELS
+
+
+def _accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """"br" ou "gzip" selon Accept-Encoding (q=0 exclu), brotli préféré s'il est installé."""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip())
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(body: bytes, encoding: str, levels: Tuple[int, int]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=levels[1])
+    return gzip.compress(body, compresslevel=levels[0], mtime=0)
+
+
+class _StreamCompressor:
+    """Compression incrémentale : chaque morceau est vidé aussitôt (les lignes NDJSON arrivent au fil de l'eau)."""
+
+    def __init__(self, encoding: str, levels: Tuple[int, int]) -> None:
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=levels[1])
+        else:
+            self._zlib = zlib.compressobj(levels[0], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+class _CompressedCache:
+    """Variantes compressées par (ETag, empreinte du corps, encodage, niveaux), LRU borné en octets."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key: Tuple, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI de compression brotli / gzip.
+
+    Seuil COMPRESSION_MINIMUM_SIZE octets ; réponses déjà encodées, non textuelles ou sans corps inchangées.
+    Une réponse portant un ETag (cf. routers.conditional) est compressée une fois : la variante est
+    servie depuis le cache tant que l'ETag (snapshot DASH et paramètres) et le corps produit ne changent pas.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+        cache_bytes: int = COMPRESSION_CACHE_BYTES,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = _CompressedCache(cache_bytes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressedResponder(self, scope, encoding, _route_levels(scope["path"]))(receive, send)
+
+
+class _CompressedResponder:
+    def __init__(self, middleware: CompressionMiddleware, scope: Scope, encoding: str, levels: Tuple[int, int]) -> None:
+        self.middleware = middleware
+        self.scope = scope
+        self.encoding = encoding
+        self.levels = levels
+        self.send: Send = None
+        self.start: Optional[Message] = None
+        self.chunks: List[bytes] = []
+        self.passthrough = False
+        self.stream: Optional[_StreamCompressor] = None
+
+    async def __call__(self, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.middleware.app(self.scope, receive, self.on_message)
+
+    def _compressible(self, headers: Headers) -> bool:
+        if "content-encoding" in headers or self.start["status"] in (204, 304):
+            return False
+        content_type = headers.get("content-type", "")
+        return content_type.startswith(_COMPRESSIBLE_TYPES) and not content_type.startswith(_STREAMING_TYPES)
+
+    async def on_message(self, message: Message) -> None:
+        if self.passthrough:
+            await self.send(message)
+            return
+        if message["type"] == "http.response.start":
+            self.start = message
+            if not self._compressible(Headers(raw=message["headers"])):
+                self.passthrough = True
+                await self.send(message)
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.stream is not None:
+            data = self.stream.chunk(body) if more_body else self.stream.chunk(body) + self.stream.finish()
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+            return
+
+        self.chunks.append(body)
+        if more_body:
+            await self._start_stream()
+            return
+        await self._send_whole(b"".join(self.chunks))
+
+    def _headers(self, length: Optional[int]) -> MutableHeaders:
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(length)
+        return headers
+
+    async def _start_stream(self) -> None:
+        """Réponse en flux (StreamingResponse) : compression incrémentale, sans Content-Length."""
+        self.stream = _StreamCompressor(self.encoding, self.levels)
+        self.start["headers"] = self._headers(None).raw
+        await self.send(self.start)
+        data = self.stream.chunk(b"".join(self.chunks))
+        self.chunks = []
+        await self.send({"type": "http.response.body", "body": data, "more_body": True})
+
+    async def _send_whole(self, body: bytes) -> None:
+        if len(body) < self.middleware.minimum_size:
+            await self.send(self.start)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+
+        etag = Headers(raw=self.start["headers"]).get("etag")
+        key = None
+        if etag and self.start["status"] == 200:
+            # Empreinte du corps : bien moins coûteuse que la compression, évite de servir une variante périmée
+            key = (etag, hashlib.blake2b(body, digest_size=16).digest(), self.encoding, self.levels)
+        compressed = self.middleware.cache.get(key) if key else None
+        if compressed is None:
+            compressed = _compress(body, self.encoding, self.levels)
+            if key:
+                self.middleware.cache.put(key, compressed)
+            logger.debug(
+                f"🗜️ {self.scope['path']}: {len(body)} → {len(compressed)} octets ({self.encoding}, niveaux {self.levels})"
+            )
+        self.start["headers"] = self._headers(len(compressed)).raw
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": compressed})
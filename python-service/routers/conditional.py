@@ -0,0 +1,205 @@
+"""
+Requêtes conditionnelles (ETag / Last-Modified) sur /api/oracle/data/*.
+
+Pour un endpoint adossé à des tables DASH, l'ETag est calculé avant l'appel du service à partir du chemin,
+des paramètres, du jour courant, de la version du mapping code agence → territoire (rafraîchi en
+arrière-plan) et des snapshots (MAX(MIGRATION_DATETIME)) des tables lues ;
+Last-Modified est le plus récent de ces snapshots. If-None-Match / If-Modified-Since sont alors
+satisfaits par un 304 sans exécuter le service. Pour les endpoints lus en direct (hors DASH),
+l'ETag est l'empreinte du corps de la réponse : le 304 évite seulement le transfert.
+
+Une réponse marquée ``Cache-Control: no-store`` (résultat partiel, ex. section du dashboard en erreur,
+cf. routers.responses) ne reçoit pas de validateurs : le client ne peut ni la garder ni la revalider.
+
+L'identifiant des snapshots lus (X-Snapshot-Id, aussi posé dans scope["state"]["snapshot_id"]) sert
+de référence aux réponses différentielles ``since=`` (cf. routers.delta).
+"""
+import asyncio
+import hashlib
+import logging
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from services.snapshot_service import cached_snapshot_ids, endpoint_tables, get_snapshot_ids, snapshot_id
+from services.utils import get_branch_code_mapping_version
+
+logger = logging.getLogger(__name__)
+
+DATA_PREFIX = "/api/oracle/data/"
+
+# À changer si le format des réponses évolue (invalide les ETag déjà distribués)
+_ETAG_VERSION = "v1"
+
+
+def _query_params(scope: Scope) -> Dict[str, str]:
+    """Paramètres de la requête ; une clé répétée (ex. sections) est jointe par des virgules."""
+    grouped: Dict[str, List[str]] = {}
+    for key, value in parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True):
+        grouped.setdefault(key, []).append(value)
+    return {key: ",".join(values) for key, values in grouped.items()}
+
+
+def _etag(*parts: str) -> str:
+    return 'W/"' + hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest() + '"'
+
+
+def _snapshot_validators(
+    path: str, params: Dict[str, str], snapshots: Dict[str, Optional[datetime]]
+) -> Tuple[str, Optional[datetime], str]:
+    """
+    (ETag, Last-Modified, identifiant de snapshot) d'une réponse DASH :
+    paramètres + jour courant (fenêtres « à date ») + version du mapping des territoires + snapshots.
+    """
+    etag = _etag(
+        _ETAG_VERSION,
+        path,
+        "&".join(f"{k}={params[k]}" for k in sorted(params)),
+        date.today().isoformat(),
+        f"branch-mapping={get_branch_code_mapping_version()}",
+        *(f"{table}={snapshot.isoformat() if snapshot else '-'}" for table, snapshot in sorted(snapshots.items())),
+    )
+    known = [s for s in snapshots.values() if s is not None]
+    return etag, max(known) if known else None, snapshot_id(snapshots)
+
+
+def _http_date(value: datetime) -> str:
+    """Date HTTP (GMT) ; les MIGRATION_DATETIME Oracle sans fuseau sont en heure locale du serveur."""
+    if value.tzinfo is None:
+        value = value.astimezone()
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Comparaison faible (RFC 9110) : « * » ou l'une des valeurs, préfixe W/ ignoré."""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any(
+        (tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()) == opaque
+        for tag in if_none_match.split(",")
+    )
+
+
+def _not_modified(headers: Headers, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified.timestamp()) <= int(since.timestamp())
+    return False
+
+
+def _no_store(headers: Headers) -> bool:
+    return "no-store" in headers.get("cache-control", "").lower()
+
+
+def _validator_headers(etag: str, last_modified: Optional[datetime], snapshot: str) -> Dict[str, str]:
+    headers = {"ETag": etag, "X-Snapshot-Id": snapshot}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+
+class ConditionalGetMiddleware:
+    """Middleware ASGI : ETag / Last-Modified et réponses 304 pour les GET /api/oracle/data/*."""
+
+    def __init__(self, app: ASGIApp, prefix: str = DATA_PREFIX) -> None:
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"][len(self.prefix):]
+        params = _query_params(scope)
+        validators = await self._snapshot_validators(path, params)
+        if validators is None:
+            await self._body_etag(scope, receive, send)
+            return
+
+        etag, last_modified, snapshot = validators
+        headers = _validator_headers(etag, last_modified, snapshot)
+        scope.setdefault("state", {})["snapshot_id"] = snapshot
+        if _not_modified(Headers(scope=scope), etag, last_modified):
+            logger.debug(f"♻️ 304 {scope['path']} ({etag})")
+            await Response(status_code=304, headers=headers)(scope, receive, send)
+            return
+
+        async def send_with_validators(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                response_headers = MutableHeaders(scope=message)
+                if _no_store(response_headers):
+                    await send(message)
+                    return
+                for name, value in headers.items():
+                    response_headers[name] = value
+            await send(message)
+
+        await self.app(scope, receive, send_with_validators)
+
+    async def _snapshot_validators(
+        self, path: str, params: Dict[str, str]
+    ) -> Optional[Tuple[str, Optional[datetime], str]]:
+        tables = endpoint_tables(path, params)
+        if not tables:
+            return None
+        try:
+            snapshots = cached_snapshot_ids(tables)
+            if snapshots is None:
+                snapshots = await asyncio.to_thread(get_snapshot_ids, tables)
+        except Exception as e:
+            logger.warning(f"⚠️ Snapshots DASH indisponibles pour {path}, ETag calculé sur le corps: {e}")
+            return None
+        return _snapshot_validators(path, params, snapshots)
+
+    async def _body_etag(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """ETag = empreinte du corps (réponses 200 en un seul bloc ; les flux passent tels quels)."""
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+        streaming = False
+
+        async def buffered_send(message: Message) -> None:
+            nonlocal start, streaming
+            if streaming:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                streaming = True
+                await send(start)
+                await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+                return
+
+            body = b"".join(chunks)
+            if start["status"] != 200 or _no_store(Headers(raw=start["headers"])):
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+                return
+            etag = _etag(_ETAG_VERSION, hashlib.sha1(body).hexdigest())
+            if _not_modified(Headers(scope=scope), etag, None):
+                await Response(status_code=304, headers={"ETag": etag})(scope, receive, send)
+                return
+            MutableHeaders(scope=start)["ETag"] = etag
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, buffered_send)
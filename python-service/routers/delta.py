@@ -0,0 +1,285 @@
+"""
+Réponses différentielles ``since=<snapshot_id>`` sur les endpoints adossés aux tables DASH.
+
+Chaque contenu renvoyé par un endpoint DASH est gardé en mémoire avec l'identifiant des snapshots lus
+(X-Snapshot-Id, cf. routers.conditional) pour la requête (endpoint + paramètres). Avec ``since=``, le
+contenu courant est comparé à celui du snapshot indiqué et seules les différences sont renvoyées :
+
+- dans les listes (agences, lignes CAF, lignes de prêts), les éléments nouveaux ou modifiés, repérés par
+  leur clé (NO_PRET, AGENCE + CODE_GESTION_PRET, name...) ; les clés disparues sont listées dans
+  ``delta.removed`` par chemin ;
+- dans les objets, les entrées modifiées, avec les valeurs simples de l'objet (name...) pour le situer ;
+  un objet de valeurs simples modifié (totals recalculés) est renvoyé entier.
+
+``delta`` : {since, snapshot, full, changed, removed}. Snapshot inconnu (trop ancien, service redémarré)
+ou endpoint hors DASH : contenu complet avec ``full: true``.
+
+Le magasin est borné en requêtes, en lots par requête et en octets (DELTA_STORE_BYTES, taille JSON des
+contenus). Les pages (contenu avec ``page`` : chaque curseur serait une requête distincte) et les contenus
+partiels (``errors`` non vide) ne sont pas gardés ; avec ``since=``, ils sont renvoyés complets.
+"""
+import logging
+import math
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Query, Request
+
+from config.settings import DELTA_SNAPSHOTS_PER_KEY, DELTA_STORE_BYTES, DELTA_STORE_KEYS
+
+logger = logging.getLogger(__name__)
+
+# Clés d'identification des éléments de liste, par ordre de préférence (première clé unique retenue)
+_IDENTITY_FIELDS: Tuple[Tuple[str, ...], ...] = (
+    ("NO_PRET",),
+    ("AGENCE", "CODE_GESTION_PRET"),
+    ("BRANCH_CODE", "CODE_GESTION_PRET"),
+    ("AGENCE", "CHARGE_AFFAIRE"),
+    ("CHARGE_AFFAIRE",),
+    ("name",),
+    ("AGENCE",),
+    ("BRANCH_CODE",),
+    ("CODE_AGENCE",),
+)
+_METADATA_KEYS = frozenset({"page", "meta", "window", "errors", "timings", "delta"})
+# Paramètres sans effet sur le contenu complet (clé de la requête dans le magasin des contenus)
+_NON_CONTENT_PARAMS = frozenset({"since", "fields", "include"})
+
+_UNCHANGED = object()
+
+
+@dataclass(frozen=True)
+class DeltaRequest:
+    key: str
+    snapshot: Optional[str]
+    since: Optional[str]
+
+
+_delta: ContextVar[Optional[DeltaRequest]] = ContextVar("delta", default=None)
+
+
+class _PayloadStore:
+    """Contenus complets par requête puis par snapshot (LRU borné en requêtes, en lots par requête et en octets)."""
+
+    def __init__(self, max_keys: int, per_key: int, max_bytes: int) -> None:
+        self.max_keys = max_keys
+        self.per_key = per_key
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, OrderedDict[str, Tuple[Any, int]]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, snapshot: str) -> Any:
+        with self._lock:
+            snapshots = self._entries.get(key)
+            entry = snapshots.get(snapshot) if snapshots is not None else None
+            return entry[0] if entry is not None else None
+
+    def put(self, key: str, snapshot: str, payload: Any, size: int) -> None:
+        if self.max_keys == 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            snapshots = self._entries.get(key)
+            if snapshots is None:
+                snapshots = self._entries[key] = OrderedDict()
+            self._entries.move_to_end(key)
+            previous = snapshots.pop(snapshot, None)
+            if previous is not None:
+                self._size -= previous[1]
+            snapshots[snapshot] = (payload, size)
+            self._size += size
+            while len(snapshots) > self.per_key:
+                self._size -= snapshots.popitem(last=False)[1][1]
+            while len(self._entries) > self.max_keys or self._size > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                if oldest_key == key:
+                    # Seule requête restante : ses lots les plus anciens d'abord (le contenu ajouté tient seul)
+                    self._size -= snapshots.popitem(last=False)[1][1]
+                    continue
+                evicted = self._entries.pop(oldest_key)
+                self._size -= sum(entry_size for _, entry_size in evicted.values())
+
+
+_store = _PayloadStore(DELTA_STORE_KEYS, DELTA_SNAPSHOTS_PER_KEY, DELTA_STORE_BYTES)
+
+
+def _is_container(value: Any) -> bool:
+    return isinstance(value, (dict, list))
+
+
+def _same(a: Any, b: Any) -> bool:
+    """Égalité profonde, NaN égal à NaN (les montants pandas manquants ne sont pas des changements)."""
+    if a is b:
+        return True
+    if isinstance(a, float) and isinstance(b, float):
+        return a == b or (math.isnan(a) and math.isnan(b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_same(v, b[k]) for k, v in a.items())
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def _identity(old: List[Any], new: List[Any]) -> Optional[Tuple[str, ...]]:
+    """Première clé d'identification présente et unique dans les deux listes (éléments objets)."""
+    if not all(isinstance(item, dict) for item in old) or not all(isinstance(item, dict) for item in new):
+        return None
+    sample = new[0] if new else (old[0] if old else None)
+    if sample is None:
+        return None
+    for fields in _IDENTITY_FIELDS:
+        if not all(f in sample for f in fields):
+            continue
+        if all(len({tuple(item.get(f) for f in fields) for item in items}) == len(items) for items in (old, new)):
+            return fields
+    return None
+
+
+class _Differ:
+    def __init__(self) -> None:
+        self.changed = 0
+        self.removed: Dict[str, List[Any]] = {}
+
+    def diff(self, old: Any, new: Any, path: str) -> Any:
+        """Différence de ``new`` par rapport à ``old`` ; _UNCHANGED si identiques."""
+        if isinstance(old, dict) and isinstance(new, dict):
+            return self._diff_dict(old, new, path)
+        if isinstance(old, list) and isinstance(new, list):
+            return self._diff_list(old, new, path)
+        if _same(old, new):
+            return _UNCHANGED
+        self.changed += 1
+        return new
+
+    def _diff_dict(self, old: Dict, new: Dict, path: str) -> Any:
+        if old is new or old == new:
+            return _UNCHANGED
+        out: Dict[str, Any] = {}
+        for key, value in new.items():
+            if key not in old:
+                self.changed += 1
+                out[key] = value
+                continue
+            if _is_container(value):
+                sub = self.diff(old[key], value, f"{path}.{key}" if path else str(key))
+                if sub is not _UNCHANGED:
+                    out[key] = sub
+            elif not _same(old[key], value):
+                out[key] = value
+        removed = [key for key in old if key not in new]
+        if removed:
+            self.removed.setdefault(path, []).extend(removed)
+        if not out and not removed:
+            return _UNCHANGED
+        if not any(_is_container(v) for v in new.values()):
+            # Objet de valeurs simples (totals...) : renvoyé entier
+            self.changed += 1
+            return new
+        # Valeurs simples de l'objet (name, code...) pour situer les éléments modifiés
+        for key, value in new.items():
+            if key not in out and not _is_container(value):
+                out[key] = value
+        return out
+
+    def _diff_list(self, old: List, new: List, path: str) -> Any:
+        if old is new or old == new:
+            return _UNCHANGED
+        fields = _identity(old, new)
+        if fields is None:
+            if _same(old, new):
+                return _UNCHANGED
+            self.changed += 1
+            return new
+
+        def ident(item: Dict) -> Any:
+            values = tuple(item.get(f) for f in fields)
+            return values[0] if len(values) == 1 else values
+
+        previous = {ident(item): item for item in old}
+        out = []
+        for item in new:
+            before = previous.pop(ident(item), None)
+            if before is None or not _same(before, item):
+                out.append(item)
+        self.changed += len(out)
+        if previous:
+            self.removed.setdefault(path, []).extend(
+                list(k) if isinstance(k, tuple) else k for k in previous
+            )
+        # Suppressions seules : signalées dans delta.removed
+        return out if out else _UNCHANGED
+
+
+def diff_payload(previous: Dict[str, Any], current: Dict[str, Any]) -> Tuple[Dict[str, Any], int, Dict[str, List]]:
+    """(contenu différentiel, nombre d'éléments modifiés, clés supprimées par chemin)."""
+    differ = _Differ()
+    out: Dict[str, Any] = {}
+    for key, value in current.items():
+        if key in _METADATA_KEYS or not _is_container(value):
+            out[key] = value
+        elif key not in previous:
+            differ.changed += 1
+            out[key] = value
+        else:
+            sub = differ.diff(previous[key], value, str(key))
+            if sub is not _UNCHANGED:
+                out[key] = sub
+    for key in previous:
+        if key not in current and key not in _METADATA_KEYS:
+            differ.removed.setdefault("", []).append(key)
+    return out, differ.changed, differ.removed
+
+
+def _storable(payload: Dict[str, Any]) -> bool:
+    """Contenu complet d'une requête : ni page (clé différente par curseur), ni contenu partiel en erreur."""
+    return "page" not in payload and not payload.get("errors")
+
+
+def _payload_size(payload: Dict[str, Any]) -> int:
+    from routers.responses import dumps
+    return len(dumps(payload))
+
+
+def apply_delta(payload: Any, request: Optional[DeltaRequest]) -> Any:
+    """
+    Garde le contenu complet du snapshot courant et, si ``since`` est demandé, renvoie la différence
+    avec le contenu de ce snapshot.
+    """
+    if request is None or not isinstance(payload, dict):
+        return payload
+    storable = request.snapshot is not None and _storable(payload)
+    if storable:
+        _store.put(request.key, request.snapshot, payload, _payload_size(payload))
+    if request.since is None:
+        return payload
+
+    meta: Dict[str, Any] = {"since": request.since, "snapshot": request.snapshot, "full": True}
+    previous = _store.get(request.key, request.since) if storable else None
+    if previous is None:
+        logger.info(f"🔁 since={request.since} inconnu pour {request.key} : contenu complet")
+        return {**payload, "delta": meta}
+    out, changed, removed = diff_payload(previous, payload)
+    meta.update(full=False, changed=changed, removed=removed)
+    out["delta"] = meta
+    return out
+
+
+def current_delta() -> Optional[DeltaRequest]:
+    """Requête différentielle en cours (posée par ``delta_params``)."""
+    return _delta.get()
+
+
+async def delta_params(
+    request: Request,
+    since: Optional[str] = Query(
+        None, description="X-Snapshot-Id d'une réponse précédente : ne renvoyer que ce qui a changé depuis"
+    ),
+) -> None:
+    """Dépendance de router : clé de la requête et snapshot courant, pour FastJSONRoute (cf. apply_delta)."""
+    params = sorted((k, v) for k, v in request.query_params.multi_items() if k not in _NON_CONTENT_PARAMS)
+    key = request.url.path + "?" + "&".join(f"{k}={v}" for k, v in params)
+    snapshot = request.scope.get("state", {}).get("snapshot_id")
+    _delta.set(DeltaRequest(key=key, snapshot=snapshot, since=since.strip() if since else None))
@@ -0,0 +1,104 @@
+"""
+Notifications serveur (Server-Sent Events) des nouveaux lots DASH.
+
+``GET /api/events/dash`` garde la connexion ouverte et envoie :
+- ``snapshots`` à la connexion : dernier MIGRATION_DATETIME connu de chaque table surveillée ;
+- ``batch`` pour chaque table dont un nouveau MIGRATION_DATETIME est détecté (cf. snapshot_service) :
+  table, snapshot, dates d'arrêté et mois chargés, endpoints /api/oracle/data concernés ;
+- un commentaire toutes les EVENTS_HEARTBEAT_INTERVAL secondes (proxys, détection de déconnexion).
+
+Les clients rafraîchissent leurs données à réception d'un événement au lieu d'interroger périodiquement.
+"""
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, FrozenSet, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from config.settings import EVENTS_HEARTBEAT_INTERVAL
+from routers.responses import FastJSONRoute, dumps
+from services.snapshot_service import (
+    add_snapshot_listener,
+    get_snapshot_ids,
+    remove_snapshot_listener,
+    watched_tables,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/events", tags=["events"], route_class=FastJSONRoute)
+
+# Événements en attente par client (client trop lent : événements les plus anciens abandonnés)
+_QUEUE_SIZE = 256
+
+
+def _sse(event: str, data: Any, event_id: Optional[str] = None) -> bytes:
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {dumps(data).decode('utf-8')}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+def _table_filter(tables: Optional[str]) -> Optional[FrozenSet[str]]:
+    names = frozenset(t.strip().upper() for t in (tables or "").split(",") if t.strip())
+    if not names:
+        return None
+    unknown = names - set(watched_tables())
+    if unknown:
+        raise ValueError(f"Table(s) non surveillée(s): {', '.join(sorted(unknown))}")
+    return names
+
+
+async def _dash_events(request: Request, tables: Optional[FrozenSet[str]]) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=_QUEUE_SIZE)
+
+    def enqueue(event: Dict[str, Any]) -> None:
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def listener(events: List[Dict[str, Any]]) -> None:
+        # Appelé depuis le thread de surveillance : remise dans la boucle de la connexion
+        for event in events:
+            if tables is None or event["table"] in tables:
+                loop.call_soon_threadsafe(enqueue, event)
+
+    add_snapshot_listener(listener)
+    try:
+        snapshots = await run_in_threadpool(get_snapshot_ids, sorted(tables) if tables else watched_tables())
+        yield b"retry: 10000\n\n"
+        yield _sse("snapshots", {t: s.isoformat() if s else None for t, s in snapshots.items()})
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=EVENTS_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield b": keep-alive\n\n"
+                continue
+            yield _sse("batch", event, event_id=f"{event['table']}:{event['snapshotId']}")
+    finally:
+        remove_snapshot_listener(listener)
+        logger.info("🔌 Client des notifications DASH déconnecté")
+
+
+@router.get("/dash")
+async def dash_events(
+    request: Request,
+    tables: Optional[str] = Query(None, description="Tables DASH suivies, séparées par des virgules (défaut : toutes)"),
+):
+    """Flux SSE des nouveaux lots DASH (un événement ``batch`` par table)"""
+    try:
+        table_filter = _table_filter(tables)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"📡 Abonnement aux nouveaux lots DASH ({', '.join(sorted(table_filter)) if table_filter else 'toutes les tables'})")
+    return StreamingResponse(
+        _dash_events(request, table_filter),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
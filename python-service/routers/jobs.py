@@ -0,0 +1,92 @@
+"""
+Jobs asynchrones pour les rapports longs : soumission, suivi, résultat, annulation (cf. services.job_service).
+
+- POST /api/jobs {"report": "stock-provision", "params": {"month": 9, "year": 2026}} : 202 + Location ;
+- GET /api/jobs/{id} : état, progression estimée, position dans la file ;
+- GET /api/jobs/{id}/result : résultat (202 tant que le job n'est pas terminé) ;
+- DELETE /api/jobs/{id} : annulation (ou suppression du résultat d'un job terminé).
+"""
+import logging
+
+from fastapi import APIRouter, HTTPException
+
+from models.schemas import JobRequest
+from routers.responses import FastJSONResponse, FastJSONRoute
+from services.job_service import (
+    CANCELLED,
+    FAILED,
+    SUCCEEDED,
+    JobQueueFull,
+    cancel_job,
+    get_job,
+    job_status,
+    list_jobs,
+    submit_job,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"], route_class=FastJSONRoute)
+
+# Délai de nouvelle tentative suggéré (secondes) : file pleine, résultat pas encore prêt
+_RETRY_AFTER = "5"
+
+
+def _get_or_404(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job inconnu ou expiré: {job_id}")
+    return job
+
+
+@router.post("")
+async def submit_job_endpoint(request: JobRequest):
+    """Soumet un rapport (stock-provision, prepaid-card-sales, encours) ; un job identique en cours est réutilisé"""
+    try:
+        job, deduplicated = submit_job(request.report, request.params)
+        return FastJSONResponse(
+            {**job_status(job), "deduplicated": deduplicated},
+            status_code=202,
+            headers={"Location": f"/api/jobs/{job.id}"},
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"File des jobs pleine: {e}", headers={"Retry-After": _RETRY_AFTER})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erreur lors de la soumission du job: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la soumission du job: {e}")
+
+
+@router.get("")
+async def list_jobs_endpoint():
+    """Jobs en attente, en cours et terminés encore conservés"""
+    return {"jobs": [job_status(job) for job in list_jobs()]}
+
+
+@router.get("/{job_id}")
+async def get_job_endpoint(job_id: str):
+    """État et progression estimée d'un job"""
+    return job_status(_get_or_404(job_id))
+
+
+@router.get("/{job_id}/result")
+async def get_job_result_endpoint(job_id: str):
+    """Résultat d'un job terminé (même contenu que l'endpoint synchrone du rapport)"""
+    job = _get_or_404(job_id)
+    if job.status == SUCCEEDED:
+        return job.result
+    if job.status in (FAILED, CANCELLED):
+        raise HTTPException(status_code=409, detail=f"Job {job.status}: {job.error or 'pas de résultat'}")
+    return FastJSONResponse(job_status(job), status_code=202, headers={"Retry-After": _RETRY_AFTER})
+
+
+@router.delete("/{job_id}")
+async def cancel_job_endpoint(job_id: str):
+    """Annule un job en attente ou en cours ; supprime le résultat d'un job terminé"""
+    job = cancel_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job inconnu ou expiré: {job_id}")
+    return job_status(job)
@@ -1,16 +1,21 @@
 """
 Router pour les endpoints Oracle
 """
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from typing import Optional, List
 import logging
 from datetime import datetime
 from database.oracle import get_oracle_connection
+from routers.delta import delta_params
+from routers.projection import projection_params
+from routers.responses import FastJSONRoute, dumps
 from services.clients_service import get_clients_data
 from services.production_service import get_production_nombre_data, get_production_volume_data, get_encours_credit_data
 from services.collection_service import get_collection_data
 from services.transfer_service import get_transfer_data
 from services.performance_service import get_agency_performance
+from services.ranking_service import get_agency_ranking
 from services.volume_dat_service import get_volume_dat_data
 from services.encours_service import get_encours_data
 from services.depot_garantie_service import get_depot_garantie_data
@@ -20,14 +25,58 @@ from services.portefeuille_risque_service import (
     get_portefeuille_risque_data,
     get_portefeuille_risque_caf_data,
 )
-from services.entrees_par_service import get_entrees_par_data
+from services.entrees_par_service import get_entrees_par_all_buckets, get_entrees_par_data
 from services.reference_compte_service import get_gl_by_code, search_gl
 from services.cr_par_agence_service import get_cr_data_by_parent_gl
 from services.agencies_from_dash_service import fetch_agencies_from_dash_relation
+from services.dash_range_service import get_dash_range_series
+from services.dashboard_service import (
+    DashboardRequest,
+    get_dashboard_data,
+    iter_dashboard_sections,
+    resolve_sections,
+    window_meta,
+)
+from services.period_window import period_window
+from services.pagination_service import (
+    DOMICILIATION_ROWS,
+    ENTREES_PAR_ROWS,
+    MAX_PAGE_LIMIT,
+    PAR_CAF_ROWS,
+    paginate_rows,
+    parse_row_query,
+)
+from services.export_service import (
+    entrees_par_export,
+    export_body,
+    export_encoder,
+    open_export,
+    portefeuille_risque_export,
+    sql_export,
+)
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/oracle", tags=["oracle"])
+router = APIRouter(
+    prefix="/api/oracle",
+    tags=["oracle"],
+    route_class=FastJSONRoute,
+    dependencies=[Depends(projection_params), Depends(delta_params)],
+)
+
+
+async def _export_response(query_factory, fmt: Optional[str]) -> StreamingResponse:
+    """Export en flux (NDJSON / CSV / Arrow / Parquet) : requête exécutée avant la réponse, lignes envoyées par lots."""
+    encoder = export_encoder(fmt)
+    query = query_factory()
+    stream = await open_export(query)
+    headers = {"Content-Disposition": f'{encoder.disposition}; filename="{query.name}.{encoder.extension}"'}
+    return StreamingResponse(export_body(stream, encoder), media_type=encoder.media_type, headers=headers)
+
+
+def _default_month_year(month: Optional[int], year: Optional[int]):
+    now = datetime.now()
+    return month or now.month, year or now.year
 
 
 @router.get("/test")
@@ -132,6 +181,25 @@ async def execute_oracle_query(query: dict):
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'exécution de la requête: {str(e)}")
 
 
+@router.post("/query/stream")
+async def stream_oracle_query(
+    query: dict,
+    format: str = Query("ndjson", description="ndjson, csv, arrow (flux Arrow IPC) ou parquet"),
+):
+    """
+    Exécute une requête SQL personnalisée et renvoie les lignes en flux (lots fetchmany).
+    Mémoire constante quel que soit le nombre de lignes ; déconnexion du client = requête Oracle annulée.
+    """
+    try:
+        return await _export_response(lambda: sql_export(query.get('sql', '')), format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors de l'exécution de la requête: {str(e)}")
+
+
 @router.get("/data/clients")
 async def get_clients_data_endpoint(
     period: Optional[str] = "month", 
@@ -564,12 +632,20 @@ async def get_domiciliation_flux_data_endpoint(
     month: Optional[int] = None,
     year: Optional[int] = None,
     date: Optional[str] = None,
+    limit: Optional[int] = Query(None, description=f"Pagination : lignes par page (1-{MAX_PAGE_LIMIT})"),
+    cursor: Optional[str] = Query(None, description="Pagination : nextCursor de la page précédente"),
+    sort: Optional[str] = Query(None, description="Tri, ex. -ENCOURS_TOTAL,AGENCE (« - » : décroissant)"),
+    agency: Optional[str] = Query(None, description="Filtre agence(s) : nom ou code, séparés par des virgules"),
+    caf: Optional[str] = Query(None, description="Filtre chargé(s) d'affaires, séparés par des virgules"),
+    territory: Optional[str] = Query(None, description="Filtre territoire(s) : clé ou nom"),
 ):
     """
     Domiciliation de flux (DASH_ETAT_CPT + DASH_TOMBE_MOIS J−1, DASH_EXIGIBLE M−1) — collecte net.
     Périodes : semaine, mois, année (même logique que Volume DAT).
+    limit / cursor / sort / agency / caf / territory : page des lignes CAF triée et filtrée en mémoire ("page").
     """
     try:
+        row_query = parse_row_query(limit, cursor, sort, agency, caf, territory)
         logger.info(
             "📅 domiciliation-flux: period=%s zone=%s month=%s year=%s date=%s",
             period,
@@ -585,7 +661,14 @@ async def get_domiciliation_flux_data_endpoint(
             year=year,
             date=date,
         )
+        if row_query is not None:
+            data, page = paginate_rows(result.get("data", []), DOMICILIATION_ROWS, row_query)
+            return {**result, "data": data, "page": page}
         return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         error_message = str(e) if str(e) else repr(e)
         logger.error(
@@ -618,7 +701,8 @@ async def get_transfer_data_endpoint(
         month: Mois à analyser (1-12). Si non fourni, utilise le mois courant.
         year: Année à analyser. Si non fourni, utilise l'année courante.
         date: Date au format YYYY-MM-DD - pour period="week"
-        service: Service de transfert ("om", "wave", "ria", "wu", "moneygram", "wizzal", "free_money"). Par défaut "om" (Orange Money)
+        service: Service de transfert ("om", "wave", "ria", "wu", "moneygram", "wizzal", "free_money"). Par défaut "om" (Orange Money).
+            "all" : tous les fournisseurs en une réponse (volumes par agence et par fournisseur + totaux)
     
     Returns:
         Données de transferts d'argent par agence et par service avec:
@@ -690,7 +774,8 @@ async def get_agency_performance_endpoint(
     period: Optional[str] = "month",
     month: Optional[int] = None,
     year: Optional[int] = None,
-    collection_tab: Optional[str] = None
+    collection_tab: Optional[str] = None,
+    limit: int = Query(5, ge=1, description="Nombre d'agences par liste")
 ):
     """
     Récupère les performances des agences (Top 5 et Flop 5) selon le type de données
@@ -701,6 +786,7 @@ async def get_agency_performance_endpoint(
         month: Mois à analyser (1-12)
         year: Année à analyser
         collection_tab: Pour data_type='collection', spécifie l'onglet ('collecte' ou 'solde')
+        limit: Nombre d'agences par liste (défaut: 5)
     
     Returns:
         {
@@ -722,7 +808,8 @@ async def get_agency_performance_endpoint(
             period=period,
             month=month,
             year=year,
-            collection_tab=collection_tab
+            collection_tab=collection_tab,
+            limit=limit
         )
         
         return result
@@ -737,12 +824,133 @@ async def get_agency_performance_endpoint(
         )
 
 
+@router.get("/data/agency-ranking")
+async def get_agency_ranking_endpoint(
+    data_type: str = "client",
+    metric: Optional[str] = None,
+    n: int = Query(5, ge=1, description="Nombre d'agences en top et en flop"),
+    agency: Optional[str] = None,
+    period: Optional[str] = "month",
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+):
+    """
+    Classement des agences sur une métrique : top / flop N, et rang d'une agence.
+
+    Args:
+        data_type: 'client' (nombre, frais), 'collection' (collecte, echeance, solde) ou 'credit' (nombre, volume)
+        metric: Métrique du type de données (défaut: la première)
+        n: Nombre d'agences en top et en flop
+        agency: Nom d'agence dont on veut le rang (optionnel)
+        period: Période d'analyse ("week", "month", "year")
+        month: Mois à analyser (1-12)
+        year: Année à analyser
+
+    Returns:
+        {"dataType", "metric", "metrics", "count", "top": [...], "flop": [...], "agency": {...} | None} —
+        chaque agence : name, value, rank, percentile, previousRank, rankChange (places gagnées vs M-1).
+    """
+    try:
+        return get_agency_ranking(
+            data_type=data_type,
+            metric=metric,
+            n=n,
+            agency=agency,
+            period=period or "month",
+            month=month,
+            year=year,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_message = str(e) if str(e) else repr(e)
+        logger.error(f"❌ Erreur classement {data_type}/{metric}: {error_message}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erreur lors du calcul du classement: {error_message}")
+
+
+@router.get("/data/dashboard")
+async def get_dashboard_endpoint(
+    sections: Optional[List[str]] = Query(None, description="Sections (répétées ou séparées par des virgules) ; toutes par défaut"),
+    period: Optional[str] = "month",
+    zone: Optional[str] = None,
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    date: Optional[str] = None,
+    type: Optional[str] = "compte-courant",
+    service: Optional[str] = "om",
+    stream: bool = Query(False, description="NDJSON : une ligne par section, dès qu'elle est prête"),
+):
+    """
+    Tableau de bord composite : plusieurs sections calculées en parallèle pour une même période.
+
+    Args:
+        sections: clients, encours, collection, volume-dat, depot-garantie, domiciliation-flux, transfers,
+            prepaid-card-sales, production-nombre, production-volume, portefeuille-risque
+        period, zone, month, year, date: filtre commun (comme les endpoints /data/<section>)
+        type: type d'encours pour la section encours
+        service: fournisseur pour la section transfers
+        stream: si vrai, réponse application/x-ndjson : {"window": ...}, puis une ligne par section
+            dans l'ordre de fin, puis {"done": true, ...}
+
+    Structure retournée (stream=false):
+    {
+        "window": {"period", "month", "year", "snapshot", "dashMode", "key"},
+        "sections": {"clients": <réponse de /data/clients>, ...},
+        "errors": {"encours": {"status": 500, "detail": "..."}},
+        "timings": {"clients": 812.4, ...}
+    }
+    Une section en erreur n'empêche pas le retour des autres.
+    """
+    try:
+        names = resolve_sections(sections)
+        request = DashboardRequest(
+            period=period or "month",
+            zone=zone,
+            month=month,
+            year=year,
+            date=date,
+            encours_type=type or "compte-courant",
+            service=service or "om",
+        )
+        logger.info(f"📅 Paramètres reçus pour le tableau de bord: sections={names}, {request}")
+        if not stream:
+            return await get_dashboard_data(names, request)
+
+        window = period_window(request.period, request.month, request.year, request.date)
+
+        async def lines():
+            yield dumps({"window": window_meta(window), "sections": names}) + b"\n"
+            failed = 0
+            async for outcome in iter_dashboard_sections(names, request):
+                failed += "error" in outcome
+                yield dumps(outcome) + b"\n"
+            yield dumps({"done": True, "sections": len(names), "errors": failed}) + b"\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_message = str(e) if str(e) else repr(e)
+        logger.error(f"❌ Erreur tableau de bord: {error_message}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération du tableau de bord: {error_message}")
+
+
 @router.get("/data/portefeuille-risque")
 async def get_portefeuille_risque_data_endpoint(
     month: Optional[int] = None,
     year: Optional[int] = None,
     month_ref: Optional[int] = None,
-    year_ref: Optional[int] = None
+    year_ref: Optional[int] = None,
+    limit: Optional[int] = Query(None, description=f"Pagination : lignes par page (1-{MAX_PAGE_LIMIT})"),
+    cursor: Optional[str] = Query(None, description="Pagination : nextCursor de la page précédente"),
+    sort: Optional[str] = Query(None, description="Tri, ex. -ENCOURS_TOTAL,AGENCE (« - » : décroissant)"),
+    agency: Optional[str] = Query(None, description="Filtre agence(s) : nom ou code, séparés par des virgules"),
+    caf: Optional[str] = Query(None, description="Filtre chargé(s) d'affaires, séparés par des virgules"),
+    territory: Optional[str] = Query(None, description="Filtre territoire(s) : clé ou nom"),
 ):
     """
     Récupère les données de portefeuille à risque (PAR) depuis Oracle
@@ -752,6 +960,8 @@ async def get_portefeuille_risque_data_endpoint(
         year: Année du mois en cours. Si non fourni, utilise l'année courante.
         month_ref: Mois de référence (1-12). Si non fourni, mois précédent du mois en cours.
         year_ref: Année du mois de référence. Si non fourni, déduite du mois en cours.
+        limit, cursor, sort, agency, caf, territory: page des lignes CAF ("data") triée et filtrée
+            en mémoire, avec "page" ; hierarchicalData n'est renvoyé qu'avec la première page.
     
     Structure retournée:
     {
@@ -771,7 +981,14 @@ async def get_portefeuille_risque_data_endpoint(
     """
     try:
         logger.info(f"📅 Paramètres reçus pour get_portefeuille_risque_data: month={month}, year={year}, month_ref={month_ref}, year_ref={year_ref}")
+        row_query = parse_row_query(limit, cursor, sort, agency, caf, territory)
         result = get_portefeuille_risque_data(month=month, year=year, month_ref=month_ref, year_ref=year_ref)
+        if row_query is not None:
+            data, page = paginate_rows(result.get("data", []), PAR_CAF_ROWS, row_query)
+            response = {"data": data, "page": page}
+            if not row_query.cursor:
+                response["hierarchicalData"] = result.get("hierarchicalData", {"TERRITOIRE": {}, "POINT SERVICES": {}})
+            return response
         
         # Retourner les données dans le format attendu par le frontend
         return {
@@ -781,6 +998,8 @@ async def get_portefeuille_risque_data_endpoint(
                 "POINT SERVICES": {}
             })
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -794,6 +1013,29 @@ async def get_portefeuille_risque_data_endpoint(
         )
 
 
+
+@router.get("/data/portefeuille-risque/export")
+async def export_portefeuille_risque_endpoint(
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    format: str = Query("ndjson", description="ndjson, csv, arrow (flux Arrow IPC) ou parquet"),
+):
+    """
+    Lignes brutes DASH_PAR_GLOBAL du dernier lot du mois en flux (NDJSON, CSV, Arrow IPC ou Parquet).
+    Les données PAR agrégées (M vs M-1, par CAF) restent servies par /data/portefeuille-risque.
+    """
+    try:
+        month, year = _default_month_year(month, year)
+        return await _export_response(lambda: portefeuille_risque_export(month, year), format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_message = str(e) if str(e) else repr(e)
+        logger.error(f"❌ Export portefeuille à risque: {error_message}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Export portefeuille à risque: {error_message}")
+
 @router.get("/data/stock-provision")
 async def get_stock_provision_data_endpoint(
     month: Optional[int] = None,
@@ -887,17 +1129,43 @@ async def get_portefeuille_risque_caf_endpoint(
 async def get_entrees_par_endpoint(
     month: Optional[int] = None,
     year: Optional[int] = None,
-    par: int = 0,
+    par: str = "0",
+    limit: Optional[int] = Query(None, description=f"Pagination : lignes par page (1-{MAX_PAGE_LIMIT})"),
+    cursor: Optional[str] = Query(None, description="Pagination : nextCursor de la page précédente"),
+    sort: Optional[str] = Query(None, description="Tri, ex. -ENCOURS_TOTAL,AGENCE (« - » : décroissant)"),
+    agency: Optional[str] = Query(None, description="Filtre agence(s) : nom ou code, séparés par des virgules"),
+    caf: Optional[str] = Query(None, description="Filtre chargé(s) d'affaires, séparés par des virgules"),
+    territory: Optional[str] = Query(None, description="Filtre territoire(s) : clé ou nom"),
 ):
     """
     Récupère les entrées PAR et provisions pour un palier donné (0, 30, 90, 180, 360).
+    par=all : les cinq paliers en une réponse ({"0": [...], "30": [...], ...}), issus d'une seule lecture.
     Date = dernier jour du mois (month/year).
+
+    limit / cursor / sort / agency / caf / territory : page de lignes du palier, triée et filtrée en mémoire
+    sur le snapshot en cache ("page": {limit, count, total, sort, nextCursor}).
     """
     try:
-        if par not in (0, 30, 90, 180, 360):
-            raise HTTPException(status_code=400, detail="par doit être 0, 30, 90, 180 ou 360")
-        data = get_entrees_par_data(month=month, year=year, par_bucket=par)
-        return {"data": data, "par": par, "month": month, "year": year}
+        row_query = parse_row_query(limit, cursor, sort, agency, caf, territory)
+        if str(par).strip().lower() == "all":
+            if row_query is not None:
+                raise ValueError("Pagination, tri et filtres : choisir un palier (par=0, 30, 90, 180 ou 360)")
+            buckets = get_entrees_par_all_buckets(month=month, year=year)
+            data = {str(bucket): rows for bucket, rows in buckets.items()}
+            return {"data": data, "par": "all", "month": month, "year": year}
+        try:
+            par_bucket = int(par)
+        except (TypeError, ValueError):
+            par_bucket = None
+        if par_bucket not in (0, 30, 90, 180, 360):
+            raise HTTPException(status_code=400, detail="par doit être 0, 30, 90, 180, 360 ou all")
+        data = get_entrees_par_data(month=month, year=year, par_bucket=par_bucket)
+        if row_query is not None:
+            data, page = paginate_rows(data, ENTREES_PAR_ROWS, row_query)
+            return {"data": data, "par": par_bucket, "month": month, "year": year, "page": page}
+        return {"data": data, "par": par_bucket, "month": month, "year": year}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -908,6 +1176,58 @@ async def get_entrees_par_endpoint(
         raise HTTPException(status_code=500, detail=f"Entrées PAR: {error_message}")
 
 
+
+@router.get("/data/entrees-par/export")
+async def export_entrees_par_endpoint(
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    par: str = "all",
+    format: str = Query("ndjson", description="ndjson, csv, arrow (flux Arrow IPC) ou parquet"),
+):
+    """
+    Entrées PAR du snapshot du mois en flux (NDJSON, CSV, Arrow IPC ou Parquet), un palier (0, 30, 90, 180, 360) ou tous.
+    Mêmes colonnes que /data/entrees-par, lues par lots sans tout charger en mémoire.
+    """
+    try:
+        month, year = _default_month_year(month, year)
+        return await _export_response(lambda: entrees_par_export(month, year, par), format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_message = str(e) if str(e) else repr(e)
+        logger.error("❌ Export entrées PAR: %s", error_message, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Export entrées PAR: {error_message}")
+
+@router.get("/data/range/{source}")
+async def get_dash_range_endpoint(
+    source: str,
+    date_from: str = Query(..., alias="from", description="Premier mois (MM/YYYY)"),
+    date_to: str = Query(..., alias="to", description="Dernier mois inclus (MM/YYYY)"),
+    metric: Optional[str] = None,
+):
+    """
+    Série mensuelle par agence (tendance) pour clients, volume_dat, par ou production.
+    Dernier lot DASH de chaque mois, lu en une seule requête.
+
+    Returns:
+        {"source", "metric", "labels", "series", "agencies"} — labels / series acceptés par
+        /api/charts/multiseries (None pour un mois sans lot : trou sur la courbe ; séries par libellé unique).
+    """
+    try:
+        logger.info(f"📈 Série {source} de {date_from} à {date_to} (metric={metric})")
+        return get_dash_range_series(source, date_from, date_to, metric)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_message = str(e) if str(e) else repr(e)
+        logger.error(f"❌ Erreur série {source}: {error_message}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération de la série {source}: {error_message}")
+
+
 @router.get("/data/gl-lookup")
 async def get_gl_lookup_endpoint(gl_code: Optional[str] = None, gl_desc: Optional[str] = None):
     """
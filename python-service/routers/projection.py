@@ -0,0 +1,155 @@
+"""
+Projection des réponses JSON : ``include=`` (sections) et ``fields=`` (champs), appliquée avant l'encodage.
+
+Les contenus des dashboards portent plusieurs vues des mêmes données (lignes brutes ``data`` et arbre
+``hierarchicalData``, détails CAF en double, champs en double majuscules / camelCase, colonnes M_ENCOURS_*
+à zéro). Un consommateur demande seulement ce qu'il affiche :
+
+- ``include=hierarchy`` : sections gardées (clés de premier niveau, de ``data`` ou de chaque section de
+  ``/data/dashboard``) ; les valeurs simples de l'enveloppe (par, month, snapshot...) et les métadonnées
+  (page, meta, window, errors, timings, delta) sont toujours renvoyées ;
+- ``fields=AGENCE,name,ENCOURS_TOTAL_*`` : valeurs simples gardées dans les objets (motifs « * » admis) ;
+  les objets et listes (territoires, agences, totals...) sont conservés et projetés à leur tour.
+
+Les paramètres font partie de l'ETag (cf. routers.conditional) : chaque projection a sa propre entrée
+dans le cache des variantes compressées et ses réponses 304.
+"""
+from contextvars import ContextVar
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+from fastapi import Query
+
+# Noms courts acceptés par include= -> clé de la réponse (en minuscules)
+_SECTION_ALIASES = {
+    "hierarchy": "hierarchicaldata",
+    "rows": "data",
+    "global": "globalresult",
+    "caf": "chargeaffairedetails",
+}
+_METADATA_KEYS = frozenset({"page", "meta", "window", "errors", "timings", "delta"})
+
+_projection: ContextVar[Optional["Projection"]] = ContextVar("projection", default=None)
+
+
+def _split(value: Optional[str]) -> Tuple[str, ...]:
+    return tuple(dict.fromkeys(item.strip() for item in (value or "").split(",") if item.strip()))
+
+
+@dataclass(frozen=True)
+class Projection:
+    """Sections (noms en minuscules) et champs (noms exacts, motifs) à conserver ; vide = pas de filtre."""
+
+    include: FrozenSet[str] = frozenset()
+    fields: FrozenSet[str] = frozenset()
+    patterns: Tuple[str, ...] = ()
+
+    def keeps_field(self, name: str) -> bool:
+        return name in self.fields or any(fnmatchcase(name, pattern) for pattern in self.patterns)
+
+
+def parse_projection(fields: Optional[str], include: Optional[str]) -> Optional[Projection]:
+    """Projection demandée, None si ni fields ni include."""
+    sections = frozenset(_SECTION_ALIASES.get(name.lower(), name.lower()) for name in _split(include))
+    names = _split(fields)
+    if not sections and not names:
+        return None
+    return Projection(
+        include=sections,
+        fields=frozenset(n for n in names if "*" not in n and "?" not in n),
+        patterns=tuple(n for n in names if "*" in n or "?" in n),
+    )
+
+
+def _include(node: Dict[str, Any], sections: FrozenSet[str]) -> Dict[str, Any]:
+    out = {}
+    for key, value in node.items():
+        if not isinstance(value, (dict, list)) or key in _METADATA_KEYS or str(key).lower() in sections:
+            out[key] = value
+        elif key == "data" and isinstance(value, dict):
+            out[key] = _include(value, sections)
+        elif key == "sections" and isinstance(value, dict):
+            out[key] = {
+                name: _include(section, sections) if isinstance(section, dict) else section
+                for name, section in value.items()
+            }
+    return out
+
+
+class _FieldFilter:
+    """Filtre des valeurs simples ; décision mémorisée par nom de champ (mêmes clés dans chaque ligne)."""
+
+    def __init__(self, projection: Projection) -> None:
+        self.projection = projection
+        self.decisions: Dict[Any, bool] = {}
+
+    def keeps(self, key: Any) -> bool:
+        decision = self.decisions.get(key)
+        if decision is None:
+            decision = self.decisions[key] = self.projection.keeps_field(str(key))
+        return decision
+
+    def project(self, node: Any) -> Any:
+        if isinstance(node, dict):
+            return {
+                key: self.project(value) if isinstance(value, (dict, list)) else value
+                for key, value in node.items()
+                if isinstance(value, (dict, list)) or self.keeps(key)
+            }
+        if isinstance(node, list):
+            return [self.project(item) if isinstance(item, (dict, list)) else item for item in node]
+        return node
+
+
+def _project_fields(payload: Dict[str, Any], field_filter: _FieldFilter) -> Dict[str, Any]:
+    """Champs de chaque section ; l'enveloppe (valeurs de premier niveau) et les métadonnées restent entières."""
+    out = {}
+    for key, value in payload.items():
+        if key in _METADATA_KEYS or not isinstance(value, (dict, list)):
+            out[key] = value
+        elif key == "sections" and isinstance(value, dict):
+            # /data/dashboard : chaque section est un contenu d'endpoint (enveloppe comprise)
+            out[key] = {
+                name: _project_fields(section, field_filter) if isinstance(section, dict) else section
+                for name, section in value.items()
+            }
+        elif key == "data" and isinstance(value, dict):
+            out[key] = {
+                name: field_filter.project(section) if isinstance(section, (dict, list)) else section
+                for name, section in value.items()
+            }
+        else:
+            out[key] = field_filter.project(value)
+    return out
+
+
+def project(payload: Any, projection: Optional[Projection]) -> Any:
+    """Applique la projection à un contenu JSON (dict) ; autres contenus inchangés."""
+    if projection is None or not isinstance(payload, dict):
+        return payload
+    if projection.include:
+        payload = _include(payload, projection.include)
+    if projection.fields or projection.patterns:
+        payload = _project_fields(payload, _FieldFilter(projection))
+    return payload
+
+
+def current_projection() -> Optional[Projection]:
+    """Projection de la requête en cours (posée par ``projection_params``)."""
+    return _projection.get()
+
+
+async def projection_params(
+    fields: Optional[str] = Query(
+        None, description="Champs gardés dans les objets, séparés par des virgules (motifs * admis)"
+    ),
+    include: Optional[str] = Query(
+        None, description="Sections gardées, ex. hierarchy, rows, global, caf (ou nom de clé)"
+    ),
+) -> None:
+    """
+    Dépendance de router : projection de la requête, appliquée par FastJSONRoute au résultat de l'endpoint.
+    Asynchrone pour s'exécuter dans le contexte de la requête (endpoints synchrones compris).
+    """
+    _projection.set(parse_projection(fields, include))
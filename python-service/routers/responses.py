@@ -0,0 +1,129 @@
+"""
+Encodage JSON des réponses API.
+
+orjson (si installé) encode directement les arbres dict / float des dashboards, datetime, Decimal et
+valeurs numpy compris ; à défaut, json de la bibliothèque standard avec le même convertisseur. Dans les
+deux cas NaN / ±Inf (montants pandas manquants) sont écrits null.
+``FastJSONRoute`` encode le résultat des endpoints sans passer par ``jsonable_encoder`` de FastAPI,
+après différence éventuelle avec un snapshot précédent (``since=``, cf. routers.delta) puis projection
+(``fields=`` / ``include=``, cf. routers.projection).
+"""
+import asyncio
+import datetime
+import functools
+import json
+import math
+from decimal import Decimal
+from typing import Any, Callable, Optional
+
+import numpy as np
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from starlette.responses import Response
+
+from routers.delta import apply_delta, current_delta
+from routers.projection import current_projection, project
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+def _default(obj: Any) -> Any:
+    """Types non natifs : Decimal, sous-classes datetime (pandas.Timestamp), numpy, Record, modèles pydantic."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Type non sérialisable en JSON: {type(obj).__name__}")
+
+
+def _finite(obj: Any) -> Any:
+    """NaN / ±Inf → None dans l'arbre (comme orjson, qui les écrit null) pour l'encodeur json standard."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
+
+
+def _finite_default(obj: Any) -> Any:
+    return _finite(_default(obj))
+
+
+def dumps(content: Any) -> bytes:
+    """Encode ``content`` en JSON UTF-8 compact ; NaN / ±Inf sont écrits null."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(
+        _finite(content), default=_finite_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def encoded_object(**members: bytes) -> bytes:
+    """Objet JSON assemblé à partir de valeurs déjà encodées (ex. {"chart": <figure Plotly>})."""
+    return b"{" + b",".join(dumps(name) + b":" + value for name, value in members.items()) + b"}"
+
+
+class FastJSONResponse(JSONResponse):
+    """Réponse JSON encodée par ``dumps`` ; un contenu ``bytes`` est considéré comme déjà encodé."""
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray)):
+            return bytes(content)
+        return dumps(content)
+
+
+# Résultat partiel (ex. sections du dashboard en erreur) : ni ETag ni mise en cache côté client
+_NO_STORE_HEADERS = {"Cache-Control": "no-store"}
+
+
+def _partial(result: Any) -> bool:
+    return isinstance(result, dict) and isinstance(result.get("errors"), dict) and bool(result["errors"])
+
+
+def _encode_result(call: Callable, status_code: Optional[int]) -> Callable:
+    def as_response(result: Any) -> Any:
+        if isinstance(result, Response):
+            return result
+        headers = _NO_STORE_HEADERS if _partial(result) else None
+        payload = project(apply_delta(result, current_delta()), current_projection())
+        return FastJSONResponse(payload, status_code=status_code or 200, headers=headers)
+
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def endpoint(*args, **kwargs):
+            return as_response(await call(*args, **kwargs))
+    else:
+        @functools.wraps(call)
+        def endpoint(*args, **kwargs):
+            return as_response(call(*args, **kwargs))
+    return endpoint
+
+
+class FastJSONRoute(APIRoute):
+    """
+    Route FastAPI : sans response_model, le résultat de l'endpoint est encodé par ``dumps``
+    (pas de passe jsonable_encoder sur l'arbre de données). Les Response renvoyées passent telles quelles.
+    Un contenu signalant des erreurs (``errors`` non vide) est servi avec ``Cache-Control: no-store``.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs: Any) -> None:
+        super().__init__(path, endpoint, **kwargs)
+        if self.response_field is None and self.dependant.call is not None:
+            self.dependant.call = _encode_result(self.dependant.call, self.status_code)
@@ -0,0 +1,201 @@
+"""
+Rendu des graphiques matplotlib en PNG (endpoint /api/charts/image).
+
+Le rendu utilise l'API objet (Figure + FigureCanvasAgg), sans l'état global de pyplot, et s'exécute
+dans un pool de processus dédié : un rendu (CPU, sous le GIL) ne bloque ni la boucle asyncio ni les
+autres requêtes. Chaque processus charge matplotlib, le cache des polices et un premier rendu au
+démarrage. Les images sont mémorisées par empreinte du contenu : un même TimeSeriesData renvoie le PNG
+déjà calculé, et des requêtes identiques simultanées partagent un seul rendu.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Sequence
+
+from config.settings import CHART_IMAGE_MEMO_SIZE, CHART_IMAGE_WORKERS
+from models.schemas import TimeSeriesData
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+_memo: "OrderedDict[str, str]" = OrderedDict()
+_memo_lock = threading.Lock()
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+def _init_worker() -> None:
+    """Initialisation d'un processus de rendu : backend Agg, polices et premier rendu chargés une fois."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import font_manager
+    font_manager.findfont(font_manager.FontProperties(weight="bold"))
+    render_chart_png(("a", "b"), (0.0, 1.0), "warmup", "warmup")
+
+
+def _ping() -> bool:
+    return True
+
+
+def render_chart_png(labels: Sequence[str], values: Sequence[float], title: str, ylabel: str) -> bytes:
+    """PNG d'une courbe (même rendu que l'ancienne version pyplot), sans état global matplotlib."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot(list(labels), list(values), marker='o', linewidth=2, color='#1A4D3A')
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.set_xlabel("Période", fontsize=12)
+    ax.set_ylabel(ylabel, fontsize=12)
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def _chart_args(data: TimeSeriesData) -> tuple:
+    return tuple(data.labels), tuple(float(v) for v in data.values), data.title, data.ylabel
+
+
+def _content_key(args: tuple) -> str:
+    """Empreinte SHA-256 du contenu du graphique (labels, valeurs, titre, libellé Y)."""
+    payload = json.dumps(args, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _data_uri(png: bytes) -> str:
+    return f"data:image/png;base64,{base64.b64encode(png).decode()}"
+
+
+def _memo_get(key: str) -> Optional[str]:
+    with _memo_lock:
+        image = _memo.get(key)
+        if image is not None:
+            _memo.move_to_end(key)
+        return image
+
+
+def _memo_set(key: str, image: str) -> None:
+    if CHART_IMAGE_MEMO_SIZE <= 0:
+        return
+    with _memo_lock:
+        _memo[key] = image
+        _memo.move_to_end(key)
+        while len(_memo) > CHART_IMAGE_MEMO_SIZE:
+            _memo.popitem(last=False)
+
+
+def _get_pool() -> Optional[Executor]:
+    """Pool de processus de rendu (créé à la demande) ; None si CHART_IMAGE_WORKERS=0."""
+    global _pool
+    if CHART_IMAGE_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=CHART_IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def _discard_pool(broken: Executor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def start_chart_image_pool() -> None:
+    """Démarre et préchauffe les processus de rendu (démarrage de l'application)."""
+    pool = _get_pool()
+    if pool is None:
+        logger.info("🖼️ Rendu des images de graphiques dans le processus du service (CHART_IMAGE_WORKERS=0)")
+        return
+    for _ in range(CHART_IMAGE_WORKERS):
+        pool.submit(_ping)
+    logger.info(f"🖼️ Pool de rendu des images de graphiques démarré ({CHART_IMAGE_WORKERS} processus)")
+
+
+def stop_chart_image_pool() -> None:
+    """Arrête les processus de rendu (arrêt de l'application)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _render(args: tuple) -> bytes:
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    if pool is not None:
+        try:
+            return await loop.run_in_executor(pool, render_chart_png, *args)
+        except BrokenProcessPool:
+            logger.warning("⚠️ Pool de rendu des graphiques interrompu, recréation au prochain appel")
+            _discard_pool(pool)
+    return await asyncio.to_thread(render_chart_png, *args)
+
+
+async def _render_image(key: str, args: tuple) -> str:
+    """Rendu partagé d'une empreinte : mémorisé puis retiré des rendus en cours."""
+    try:
+        image = _data_uri(await _render(args))
+        _memo_set(key, image)
+        return image
+    finally:
+        _inflight.pop(key, None)
+
+
+def _retrieve_exception(task: "asyncio.Future") -> None:
+    if not task.cancelled():
+        task.exception()  # évite « exception never retrieved » sans attente concurrente
+
+
+async def render_chart_image(data: TimeSeriesData) -> str:
+    """
+    Image PNG (data URI base64) d'un TimeSeriesData, rendue hors de la boucle asyncio.
+
+    Mémorisée par empreinte du contenu ; les requêtes identiques en cours attendent le même rendu. Le
+    rendu est une tâche indépendante des requêtes : la déconnexion de l'une d'elles (y compris la
+    première) ne l'annule pas pour les autres.
+    """
+    args = _chart_args(data)
+    key = _content_key(args)
+    image = _memo_get(key)
+    if image is not None:
+        return image
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_render_image(key, args))
+        task.add_done_callback(_retrieve_exception)
+        _inflight[key] = task
+    return await asyncio.shield(task)
+
+
+def generate_chart_image(data: TimeSeriesData) -> str:
+    """Version synchrone (rendu dans le thread appelant), partageant le mémo des images."""
+    args = _chart_args(data)
+    key = _content_key(args)
+    image = _memo_get(key)
+    if image is None:
+        image = _data_uri(render_chart_png(*args))
+        _memo_set(key, image)
+    return image
@@ -1,19 +1,19 @@
 """
 Services pour la génération de graphiques
 """
-import matplotlib
-matplotlib.use('Agg')  # Backend non-interactif pour la production
-import matplotlib.pyplot as plt
 import plotly.graph_objects as go
-from plotly.utils import PlotlyJSONEncoder
-import json
-import io
-import base64
+import plotly.io as pio
+from services import chart_image_service
 from models.schemas import TimeSeriesData, MultiSeriesData, BarChartData, EvolutionData, PieChartData
 
 
+def _figure_json(fig: go.Figure) -> bytes:
+    """Figure Plotly encodée une seule fois (moteur orjson de Plotly si disponible), sans aller-retour dict."""
+    return pio.to_json(fig, validate=False).encode("utf-8")
+
+
 def generate_timeseries_chart(data: TimeSeriesData):
-    """Génère un graphique en ligne (time series) au format Plotly JSON"""
+    """Génère un graphique en ligne (time series) au format Plotly JSON (bytes)"""
     fig = go.Figure()
     
     fig.add_trace(go.Scatter(
@@ -36,12 +36,11 @@ def generate_timeseries_chart(data: TimeSeriesData):
         paper_bgcolor='white'
     )
     
-    graph_json = json.dumps(fig, cls=PlotlyJSONEncoder)
-    return json.loads(graph_json)
+    return _figure_json(fig)
 
 
 def generate_multiseries_chart(data: MultiSeriesData):
-    """Génère un graphique multi-séries au format Plotly JSON"""
+    """Génère un graphique multi-séries au format Plotly JSON (bytes)"""
     fig = go.Figure()
     
     colors = ['#1A4D3A', '#8B0000', '#0066CC', '#FF6600', '#9932CC']
@@ -54,7 +53,8 @@ def generate_multiseries_chart(data: MultiSeriesData):
             mode='lines+markers',
             name=series_name,
             line=dict(color=colors[color_idx % len(colors)], width=2.5),
-            marker=dict(size=7)
+            marker=dict(size=7),
+            connectgaps=False
         ))
         color_idx += 1
     
@@ -70,12 +70,11 @@ def generate_multiseries_chart(data: MultiSeriesData):
         paper_bgcolor='white'
     )
     
-    graph_json = json.dumps(fig, cls=PlotlyJSONEncoder)
-    return json.loads(graph_json)
+    return _figure_json(fig)
 
 
 def generate_bar_chart(data: BarChartData):
-    """Génère un graphique en barres au format Plotly JSON"""
+    """Génère un graphique en barres au format Plotly JSON (bytes)"""
     colors = data.colors if data.colors else ['#1A4D3A'] * len(data.values)
     
     fig = go.Figure(data=[
@@ -99,12 +98,11 @@ def generate_bar_chart(data: BarChartData):
         paper_bgcolor='white'
     )
     
-    graph_json = json.dumps(fig, cls=PlotlyJSONEncoder)
-    return json.loads(graph_json)
+    return _figure_json(fig)
 
 
 def generate_evolution_chart(data: EvolutionData):
-    """Génère un graphique d'évolution comparant période actuelle et précédente"""
+    """Génère un graphique d'évolution comparant période actuelle et précédente (Plotly JSON, bytes)"""
     fig = go.Figure()
     
     fig.add_trace(go.Scatter(
@@ -138,12 +136,11 @@ def generate_evolution_chart(data: EvolutionData):
         paper_bgcolor='white'
     )
     
-    graph_json = json.dumps(fig, cls=PlotlyJSONEncoder)
-    return json.loads(graph_json)
+    return _figure_json(fig)
 
 
 def generate_pie_chart(data: PieChartData):
-    """Génère un graphique circulaire (camembert) au format Plotly JSON"""
+    """Génère un graphique circulaire (camembert) au format Plotly JSON (bytes)"""
     # Couleurs par défaut si non fournies
     colors = data.colors if data.colors else [
         '#1A4D3A', '#DC2626', '#2563EB', '#10B981', '#F59E0B',
@@ -177,29 +174,13 @@ def generate_pie_chart(data: PieChartData):
         legend=dict(orientation="v", yanchor="middle", y=0.5, xanchor="left", x=1.1)
     )
     
-    graph_json = json.dumps(fig, cls=PlotlyJSONEncoder)
-    return json.loads(graph_json)
+    return _figure_json(fig)
 
 
 def generate_chart_image(data: TimeSeriesData):
     """
     Génère un graphique matplotlib et le retourne comme image PNG encodée en base64
-    Alternative pour ceux qui préfèrent matplotlib
+    Alternative pour ceux qui préfèrent matplotlib (rendu synchrone ; l'API utilise
+    chart_image_service.render_chart_image, exécuté dans le pool de processus de rendu)
     """
-    plt.figure(figsize=(10, 6))
-    plt.plot(data.labels, data.values, marker='o', linewidth=2, color='#1A4D3A')
-    plt.title(data.title, fontsize=14, fontweight='bold')
-    plt.xlabel("Période", fontsize=12)
-    plt.ylabel(data.ylabel, fontsize=12)
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    
-    # Convertir en image base64
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.read()).decode()
-    plt.close()
-    
-    return f"data:image/png;base64,{image_base64}"
-
+    return chart_image_service.generate_chart_image(data)
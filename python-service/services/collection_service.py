@@ -3,10 +3,9 @@ Collecte / domiciliation de flux — données issues des tables DASH
 (DASH_ETAT_CPT, DASH_TOMBE_MOIS, DASH_EXIGIBLE) via domiciliation_flux_service.
 """
 import logging
-from collections import defaultdict
 from typing import Any, Dict, List, Optional
 
-from services.utils import get_territory_from_agency, get_territory_from_branch_code, get_territory_key
+from services.rollup_service import RollupSpec, alias, distinct, first_of, rollup, total
 from services.domiciliation_flux_service import get_domiciliation_flux_data
 
 logger = logging.getLogger(__name__)
@@ -95,181 +94,115 @@ def _base_agency_shell(
     }
 
 
-def _build_from_domiciliation_rows(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Agrège les lignes prêt (DASH) en agences + territoires + détails chargé d'affaire."""
-    agencies_data: Dict[str, Dict[str, Any]] = {}
-    charge_affaire_data: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
-    grand_compte: Optional[Dict[str, Any]] = None
-
-    for row in rows:
-        agency_name = (row.get("AGENCE") or row.get("agence") or "INCONNU").strip()
-        branch_code = str(row.get("BRANCH_CODE") or row.get("branch_code") or "").strip()
-        code_gestion = (row.get("CODE_GESTION_PRET") or "").strip()
-        if code_gestion in ("", "-"):
-            code_gestion = ""
-        charge_affaire = (row.get("CHARGE_AFFAIRE") or "").strip()
-        exig = _f(row, "EXIGIBLE_M_1", "exigible_m_1")
-        mt_ech = _f(row, "MONTANT_ECHEANCE_M", "montant_echeance_m")
-        etat = _f(row, "ETAT_CPT", "etat_cpt")
-        coll = _f(row, "COLLECTE_NET", "collecte_net")
+def _collection_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Ligne prêt (DASH) nettoyée : libellés trimés, montants en float."""
+    agency_name = (row.get("AGENCE") or row.get("agence") or "INCONNU").strip()
+    code_gestion = (row.get("CODE_GESTION_PRET") or "").strip()
+    return {
+        "AGENCE": agency_name,
+        "BRANCH_CODE": str(row.get("BRANCH_CODE") or row.get("branch_code") or "").strip(),
+        "CODE_GESTION": "" if code_gestion == "-" else code_gestion,
+        "CHARGE_AFFAIRE": (row.get("CHARGE_AFFAIRE") or "").strip(),
+        "EXIGIBLE_M1": _f(row, "EXIGIBLE_M_1", "exigible_m_1"),
+        "MT_ECHEANCE": _f(row, "MONTANT_ECHEANCE_M", "montant_echeance_m"),
+        "M": _f(row, "ETAT_CPT", "etat_cpt"),
+        "COLLECTE_M": _f(row, "COLLECTE_NET", "collecte_net"),
+        "IS_GC": agency_name.upper() in _GRAND_COMPTE_NAMES or "GRAND COMPTE" in agency_name.upper(),
+    }
 
-        is_gc = agency_name.upper() in _GRAND_COMPTE_NAMES or "GRAND COMPTE" in agency_name.upper()
 
-        if is_gc:
-            if grand_compte is None:
-                grand_compte = _base_agency_shell(agency_name, branch_code or "526", "", charge_affaire)
-                grand_compte["BRANCH_CODE"] = branch_code or "526"
-                grand_compte["branch_code"] = branch_code or "526"
-            grand_compte["exigibleM1"] += exig
-            grand_compte["EXIGIBLE_M1"] += exig
-            grand_compte["MT_ECHEANCE"] += mt_ech
-            grand_compte["mtEcheance"] += mt_ech
-            grand_compte["M"] += etat
-            grand_compte["COLLECTE_M"] += coll
-            grand_compte["collecteM"] += coll
-            continue
+def _collection_agency_key(row: Dict[str, Any]) -> str:
+    # Grand compte : une seule agence, quel que soit le code
+    if row["IS_GC"]:
+        return "GRAND_COMPTE"
+    return row["BRANCH_CODE"] or f"NO_CODE_{row['AGENCE']}"
 
-        agency_key = branch_code if branch_code else f"NO_CODE_{agency_name}"
 
-        if agency_key not in agencies_data:
-            agencies_data[agency_key] = _base_agency_shell(agency_name, branch_code, code_gestion, charge_affaire)
+def _collection_agency_node(row: Dict[str, Any]) -> Dict[str, Any]:
+    branch_code = row["BRANCH_CODE"] or ("526" if row["IS_GC"] else "")
+    return _base_agency_shell(row["AGENCE"], branch_code, row["CODE_GESTION"], row["CHARGE_AFFAIRE"])
 
-        ag = agencies_data[agency_key]
-        ag["exigibleM1"] += exig
-        ag["EXIGIBLE_M1"] += exig
-        ag["MT_ECHEANCE"] += mt_ech
-        ag["mtEcheance"] += mt_ech
-        ag["M"] += etat
-        ag["COLLECTE_M"] += coll
-        ag["collecteM"] += coll
 
-        if code_gestion and code_gestion not in (ag.get("codeGestionList") or []):
-            ag.setdefault("codeGestionList", []).append(code_gestion)
-            ag.setdefault("CODE_GESTION_LIST", []).append(code_gestion)
-        if not ag.get("codeGestion") and code_gestion:
-            ag["codeGestion"] = code_gestion
-            ag["CODE_GESTION"] = code_gestion
+def _collection_caf_key(row: Dict[str, Any], agency_key: str) -> str:
+    if row["CODE_GESTION"] or row["CHARGE_AFFAIRE"]:
+        return f"{row['CODE_GESTION']}_{row['CHARGE_AFFAIRE']}"
+    return f"NO_CHARGE_{agency_key}"
 
-        if charge_affaire and charge_affaire not in (ag.get("chargeAffaireList") or []):
-            ag.setdefault("chargeAffaireList", []).append(charge_affaire)
-            ag.setdefault("CHARGE_AFFAIRE_LIST", []).append(charge_affaire)
-        if not ag.get("chargeAffaire") and charge_affaire:
-            ag["chargeAffaire"] = charge_affaire
-            ag["CHARGE_AFFAIRE"] = charge_affaire
 
-        caf_key = f"{code_gestion}_{charge_affaire}" if code_gestion or charge_affaire else f"NO_CHARGE_{agency_key}"
-        if caf_key not in charge_affaire_data[agency_key]:
-            charge_affaire_data[agency_key][caf_key] = _base_agency_shell(
-                agency_name, branch_code, code_gestion, charge_affaire or "-"
-            )
-        cfd = charge_affaire_data[agency_key][caf_key]
-        cfd["exigibleM1"] += exig
-        cfd["EXIGIBLE_M1"] += exig
-        cfd["MT_ECHEANCE"] += mt_ech
-        cfd["mtEcheance"] += mt_ech
-        cfd["M"] += etat
-        cfd["COLLECTE_M"] += coll
-        cfd["collecteM"] += coll
+_COLLECTION_AMOUNTS = (
+    total("exigibleM1", "EXIGIBLE_M1"),
+    alias("EXIGIBLE_M1", "exigibleM1"),
+    total("MT_ECHEANCE"),
+    alias("mtEcheance", "MT_ECHEANCE"),
+    total("M"),
+    total("COLLECTE_M"),
+    alias("collecteM", "COLLECTE_M"),
+)
 
-    agencies_by_territory = {
-        "territoire_dakar_ville": [],
-        "territoire_dakar_banlieue": [],
-        "territoire_province_centre_sud": [],
-        "territoire_province_nord": [],
-    }
 
-    for agency_key, ag in agencies_data.items():
-        bc = ag.get("BRANCH_CODE") or ""
-        an = ag.get("AGENCE") or ""
-        territory_name = get_territory_from_branch_code(bc) if bc else None
-        if not territory_name:
-            territory_name = get_territory_from_agency(an)
-        tk = get_territory_key(territory_name) if territory_name else "territoire_dakar_ville"
-        if tk not in agencies_by_territory:
-            tk = "territoire_dakar_ville"
-        agencies_by_territory[tk].append(ag)
+def _collection_territory_totals() -> tuple:
+    measures = [
+        total("exigibleM1"), alias("EXIGIBLE_M1", "exigibleM1"),
+        total("mtEcheance"), alias("MT_ECHEANCE", "mtEcheance"),
+        total("collecteM", "collecteM", "COLLECTE_M"), alias("COLLECTE_M", "collecteM"),
+        total("sldM", "sldM", "SLD_M"), total("SLD_M"),
+    ]
+    for week in range(1, 5):
+        measures += [
+            total(f"sldS{week}", f"sldS{week}", f"SLD_S{week}"), alias(f"SLD_S{week}", f"sldS{week}"),
+            total(f"collecteS{week}", f"collecteS{week}", f"COLLECTE_S{week}"),
+            alias(f"COLLECTE_S{week}", f"collecteS{week}"),
+        ]
+    return tuple(measures)
+
+
+_COLLECTION_ROLLUP = RollupSpec(
+    "collection",
+    layout=(
+        ("territoire_dakar_ville", "dakar_centre_ville", "DAKAR CENTRE VILLE"),
+        ("territoire_dakar_banlieue", "dakar_banlieue", "DAKAR BANLIEUE"),
+        ("territoire_province_centre_sud", "province_centre_sud", "PROVINCE CENTRE SUD"),
+        ("territoire_province_nord", "province_nord", "PROVINCE NORD"),
+    ),
+    agency_key=_collection_agency_key,
+    agency_node=_collection_agency_node,
+    agency_measures=_COLLECTION_AMOUNTS + (
+        first_of("codeGestion", "CODE_GESTION"),
+        alias("CODE_GESTION", "codeGestion"),
+        distinct("codeGestionList", "CODE_GESTION"),
+        alias("CODE_GESTION_LIST", "codeGestionList"),
+        first_of("chargeAffaire", "CHARGE_AFFAIRE"),
+        alias("CHARGE_AFFAIRE", "chargeAffaire"),
+        distinct("chargeAffaireList", "CHARGE_AFFAIRE"),
+        alias("CHARGE_AFFAIRE_LIST", "chargeAffaireList"),
+    ),
+    caf_key=_collection_caf_key,
+    caf_node=lambda row: _base_agency_shell(
+        row["AGENCE"], row["BRANCH_CODE"], row["CODE_GESTION"], row["CHARGE_AFFAIRE"] or "-"
+    ),
+    caf_measures=_COLLECTION_AMOUNTS,
+    totals=_collection_territory_totals(),
+    emit="all",
+    grand_compte="separate",
+)
 
-    def calculate_territory_totals(agencies_list: List[Dict[str, Any]]) -> Dict[str, float]:
-        totals = {
-            "exigibleM1": 0.0,
-            "EXIGIBLE_M1": 0.0,
-            "mtEcheance": 0.0,
-            "MT_ECHEANCE": 0.0,
-            "collecteM": 0.0,
-            "COLLECTE_M": 0.0,
-            "sldM": 0.0,
-            "SLD_M": 0.0,
-            "sldS1": 0.0,
-            "SLD_S1": 0.0,
-            "sldS2": 0.0,
-            "SLD_S2": 0.0,
-            "sldS3": 0.0,
-            "SLD_S3": 0.0,
-            "sldS4": 0.0,
-            "SLD_S4": 0.0,
-            "collecteS1": 0.0,
-            "COLLECTE_S1": 0.0,
-            "collecteS2": 0.0,
-            "COLLECTE_S2": 0.0,
-            "collecteS3": 0.0,
-            "COLLECTE_S3": 0.0,
-            "collecteS4": 0.0,
-            "COLLECTE_S4": 0.0,
-        }
-        for a in agencies_list:
-            totals["exigibleM1"] += float(a.get("exigibleM1") or 0)
-            totals["EXIGIBLE_M1"] += float(a.get("EXIGIBLE_M1") or 0)
-            totals["mtEcheance"] += float(a.get("mtEcheance") or 0)
-            totals["MT_ECHEANCE"] += float(a.get("MT_ECHEANCE") or 0)
-            totals["collecteM"] += float(a.get("collecteM") or a.get("COLLECTE_M") or 0)
-            totals["COLLECTE_M"] += float(a.get("COLLECTE_M") or 0)
-            totals["sldM"] += float(a.get("sldM") or a.get("SLD_M") or 0)
-            totals["SLD_M"] += float(a.get("SLD_M") or 0)
-            totals["sldS1"] += float(a.get("sldS1") or a.get("SLD_S1") or 0)
-            totals["collecteS1"] += float(a.get("collecteS1") or a.get("COLLECTE_S1") or 0)
-        return totals
 
-    total_exigible = sum(float(a.get("exigibleM1") or 0) for a in agencies_data.values())
+def _build_from_domiciliation_rows(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Agrège les lignes prêt (DASH) en agences + territoires + détails chargé d'affaire."""
+    tree = rollup([_collection_row(row) for row in rows], _COLLECTION_ROLLUP)
+    territories = tree["hierarchy"]["TERRITOIRE"]
+    total_exigible = sum(t["totals"]["exigibleM1"] for t in territories.values())
 
     response_data: Dict[str, Any] = {
         "globalResult": {
             "exigibleJ1": total_exigible,
             "montantARecouvrer": total_exigible,
         },
-        "hierarchicalData": {
-            "TERRITOIRE": {
-                "dakar_centre_ville": {
-                    "name": "DAKAR CENTRE VILLE",
-                    "agencies": agencies_by_territory["territoire_dakar_ville"],
-                    "totals": calculate_territory_totals(agencies_by_territory["territoire_dakar_ville"]),
-                },
-                "dakar_banlieue": {
-                    "name": "DAKAR BANLIEUE",
-                    "agencies": agencies_by_territory["territoire_dakar_banlieue"],
-                    "totals": calculate_territory_totals(agencies_by_territory["territoire_dakar_banlieue"]),
-                },
-                "province_centre_sud": {
-                    "name": "PROVINCE CENTRE SUD",
-                    "agencies": agencies_by_territory["territoire_province_centre_sud"],
-                    "totals": calculate_territory_totals(agencies_by_territory["territoire_province_centre_sud"]),
-                },
-                "province_nord": {
-                    "name": "PROVINCE NORD",
-                    "agencies": agencies_by_territory["territoire_province_nord"],
-                    "totals": calculate_territory_totals(agencies_by_territory["territoire_province_nord"]),
-                },
-            }
-        },
+        "hierarchicalData": {"TERRITOIRE": territories},
     }
-
-    if grand_compte:
-        response_data["grandCompte"] = grand_compte
-
-    charge_affaire_by_agency: Dict[str, List[Dict[str, Any]]] = {}
-    for ak, dct in charge_affaire_data.items():
-        charge_affaire_by_agency[ak] = list(dct.values())
-    response_data["chargeAffaireDetails"] = charge_affaire_by_agency
-
+    if tree["grand_compte"]:
+        response_data["grandCompte"] = tree["grand_compte"][0]
+    response_data["chargeAffaireDetails"] = tree["cafs"]
     return response_data
 
 
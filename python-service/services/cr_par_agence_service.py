@@ -2,56 +2,81 @@
 Service CR par Agence — données pré-agrégées DASH (DASH_CR_PAR_AGENCE).
 """
 import logging
+import threading
+import weakref
 from datetime import datetime
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List
 
-from database.oracle import get_oracle_connection_cofina
+from database.oracle_pool import get_pool
 
 logger = logging.getLogger(__name__)
 
-# Filtre lot : aligné sur la requête métier (comparaison jour comme chaîne DD/MM/YYYY).
-# PARENT_GL : comparaison via TO_CHAR pour gérer NUMBER / VARCHAR et espaces.
+# Une seule requête : lot du jour ``date_to`` (J-1 DASH) s'il contient des lignes pour les GL
+# demandés, sinon dernier lot du mois calendaire de ``date_to`` (PRIORITE 1 puis 2).
+# PARENT_GL : liste liée en une collection SYS.ODCIVARCHAR2LIST (texte SQL identique quel que soit
+# le nombre de GL), comparée directement à la colonne sans TO_CHAR / TRIM.
 _SQL_CR_DASH = """
-SELECT
-    d.AC_BRANCH,
-    d.BRANCH_NAME,
-    d.PARENT_GL,
-    d.SOLDE_OUVERTURE,
-    d.SOLDE_MOIS,
-    d.MONTANT,
-    d.MIGRATION_DATE,
-    d.MIGRATION_DATETIME,
-    d.MIGRATION_DATE_MINUS1
-FROM DASH_CR_PAR_AGENCE d
-WHERE d.MIGRATION_DATETIME = (
-    SELECT MAX(t.MIGRATION_DATETIME)
+WITH LOTS AS (
+    SELECT
+        MAX(CASE
+                WHEN t.MIGRATION_DATE_MINUS1 >= TO_DATE(:date_to, 'DD/MM/YYYY')
+                 AND t.MIGRATION_DATE_MINUS1 < TO_DATE(:date_to, 'DD/MM/YYYY') + 1
+                THEN t.MIGRATION_DATETIME
+            END) AS LOT_JOUR,
+        MAX(t.MIGRATION_DATETIME) AS LOT_MOIS
     FROM DASH_CR_PAR_AGENCE t
-    WHERE TO_CHAR(t.MIGRATION_DATE_MINUS1, 'DD/MM/YYYY') = :migration_date_minus1
+    WHERE t.MIGRATION_DATE_MINUS1 >= TRUNC(TO_DATE(:date_to, 'DD/MM/YYYY'), 'MM')
+      AND t.MIGRATION_DATE_MINUS1 < ADD_MONTHS(TRUNC(TO_DATE(:date_to, 'DD/MM/YYYY'), 'MM'), 1)
+),
+LIGNES AS (
+    SELECT
+        d.AC_BRANCH,
+        d.BRANCH_NAME,
+        d.PARENT_GL,
+        d.SOLDE_OUVERTURE,
+        d.SOLDE_MOIS,
+        d.MONTANT,
+        d.MIGRATION_DATE,
+        d.MIGRATION_DATETIME,
+        d.MIGRATION_DATE_MINUS1,
+        CASE WHEN d.MIGRATION_DATETIME = l.LOT_JOUR THEN 1 ELSE 2 END AS PRIORITE
+    FROM DASH_CR_PAR_AGENCE d
+    CROSS JOIN LOTS l
+    WHERE d.MIGRATION_DATETIME IN (l.LOT_JOUR, l.LOT_MOIS)
+      AND d.PARENT_GL IN (SELECT COLUMN_VALUE FROM TABLE(:parent_gls))
 )
-AND TRIM(TO_CHAR(d.PARENT_GL)) IN ({parent_placeholders})
-"""
-
-# Si aucune ligne pour la date exacte (pas encore de snapshot ce jour-là) : dernier lot du mois.
-_SQL_CR_DASH_BY_MONTH = """
 SELECT
-    d.AC_BRANCH,
-    d.BRANCH_NAME,
-    d.PARENT_GL,
-    d.SOLDE_OUVERTURE,
-    d.SOLDE_MOIS,
-    d.MONTANT,
-    d.MIGRATION_DATE,
-    d.MIGRATION_DATETIME,
-    d.MIGRATION_DATE_MINUS1
-FROM DASH_CR_PAR_AGENCE d
-WHERE d.MIGRATION_DATETIME = (
-    SELECT MAX(t.MIGRATION_DATETIME)
-    FROM DASH_CR_PAR_AGENCE t
-    WHERE TO_CHAR(t.MIGRATION_DATE_MINUS1, 'MM/YYYY') = :month_year
-)
-AND TRIM(TO_CHAR(d.PARENT_GL)) IN ({parent_placeholders})
+    AC_BRANCH,
+    BRANCH_NAME,
+    PARENT_GL,
+    SOLDE_OUVERTURE,
+    SOLDE_MOIS,
+    MONTANT,
+    MIGRATION_DATE,
+    MIGRATION_DATETIME,
+    MIGRATION_DATE_MINUS1,
+    PRIORITE
+FROM LIGNES
+WHERE PRIORITE = (SELECT MIN(PRIORITE) FROM LIGNES)
 """
 
+_PARENT_GL_COLLECTION_TYPE = "SYS.ODCIVARCHAR2LIST"
+
+# Type de la collection par connexion du pool : gettype (un aller-retour) une fois par connexion
+_collection_types: "weakref.WeakKeyDictionary[Any, Any]" = weakref.WeakKeyDictionary()
+_collection_types_lock = threading.Lock()
+
+
+def _parent_gl_collection(conn, codes: List[str]):
+    """Collection PARENT_GL à lier ; le type Oracle est lu une fois par connexion puis réutilisé."""
+    with _collection_types_lock:
+        collection_type = _collection_types.get(conn)
+    if collection_type is None:
+        collection_type = conn.gettype(_PARENT_GL_COLLECTION_TYPE)
+        with _collection_types_lock:
+            _collection_types[conn] = collection_type
+    return collection_type.newobject(codes)
+
 
 def _month_year_from_dd_mm_yyyy(date_to: str) -> str:
     """'31/03/2026' -> '03/2026'."""
@@ -86,21 +111,6 @@ def _row_to_dict(columns: List[str], row: tuple) -> Dict[str, Any]:
     return out
 
 
-def _execute_cr_query(
-    conn,
-    query_template: str,
-    parent_placeholders: str,
-    params: Dict[str, Any],
-) -> Tuple[List[str], List[tuple]]:
-    cursor = conn.cursor()
-    query = query_template.format(parent_placeholders=parent_placeholders)
-    cursor.execute(query, params)
-    columns = [d[0] for d in cursor.description]
-    rows = cursor.fetchall()
-    cursor.close()
-    return columns, rows
-
-
 def get_cr_data_by_parent_gl(
     date_from: str,
     date_to: str,
@@ -110,10 +120,10 @@ def get_cr_data_by_parent_gl(
     Récupère les montants CR par agence depuis DASH_CR_PAR_AGENCE.
 
     Lot : MAX(MIGRATION_DATETIME) parmi les lignes dont la date (J-1 DASH) correspond à
-    ``date_to`` (DD/MM/YYYY), via TO_CHAR comme en SQL métier.
+    ``date_to`` (DD/MM/YYYY).
 
     Si aucune ligne pour cette date, repli : dernier lot du mois calendaire de ``date_to``
-    (MM/YYYY), comme pour les autres écrans DASH.
+    (MM/YYYY), comme pour les autres écrans DASH — résolu dans la même requête (un aller-retour).
 
     Args:
         date_from: compatibilité API — non utilisé pour le filtre DASH.
@@ -133,40 +143,42 @@ def get_cr_data_by_parent_gl(
 
     migration_key = (date_to or "").strip()
     month_year = _month_year_from_dd_mm_yyyy(migration_key)
+    if not month_year:
+        logger.warning("CR par Agence DASH — date invalide: %s", migration_key)
+        return []
 
-    conn = get_oracle_connection_cofina()
-    try:
-        parent_placeholders = ", ".join([f":p{i}" for i in range(len(codes))])
-        base_params: Dict[str, Any] = {"migration_date_minus1": migration_key}
-        for i, c in enumerate(codes):
-            base_params[f"p{i}"] = c
-
-        logger.info(
-            "CR par Agence DASH — date=%s, %s parent GL",
-            migration_key,
-            len(codes),
-        )
-
-        columns, rows = _execute_cr_query(conn, _SQL_CR_DASH, parent_placeholders, base_params)
-        out = [_row_to_dict(columns, row) for row in rows]
+    with get_pool().get_connection_context() as conn:
+        cursor = conn.cursor()
+        try:
+            parent_gls = _parent_gl_collection(conn, codes)
 
-        if not out and month_year:
-            logger.warning(
-                "CR par Agence DASH — 0 ligne pour la date %s, repli mois %s",
+            logger.info(
+                "CR par Agence DASH — date=%s (repli mois %s), %s parent GL",
                 migration_key,
                 month_year,
+                len(codes),
             )
-            params_m = {f"p{i}": codes[i] for i in range(len(codes))}
-            params_m["month_year"] = month_year
-            columns, rows = _execute_cr_query(
-                conn, _SQL_CR_DASH_BY_MONTH, parent_placeholders, params_m
-            )
-            out = [_row_to_dict(columns, row) for row in rows]
 
-        logger.info("CR par Agence DASH — %s lignes", len(out))
-        return out
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+            cursor.execute(_SQL_CR_DASH, {"date_to": migration_key, "parent_gls": parent_gls})
+            columns = [d[0] for d in cursor.description]
+            out = []
+            fallback = False
+            for row in cursor.fetchall():
+                row_dict = _row_to_dict(columns, row)
+                fallback = row_dict.pop("PRIORITE", 1) == 2
+                out.append(row_dict)
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+    if fallback:
+        logger.warning(
+            "CR par Agence DASH — 0 ligne pour la date %s, repli mois %s",
+            migration_key,
+            month_year,
+        )
+
+    logger.info("CR par Agence DASH — %s lignes", len(out))
+    return out
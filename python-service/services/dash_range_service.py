@@ -0,0 +1,192 @@
+"""
+Séries mensuelles multi-mois sur les tables DASH_* (vues tendance 12 / 24 mois).
+
+Une seule requête par série : les lots (MIGRATION_DATETIME) sont classés par mois de
+MIGRATION_DATE_MINUS1 et seul le dernier lot de chaque mois est conservé (ROW_NUMBER),
+au lieu d'un MAX(MIGRATION_DATETIME) par mois et par appel.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from database.oracle_pool import get_pool
+from services.cache_service import get_cache, set_cache
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal de mois par série (évite les balayages de table involontaires).
+MAX_RANGE_MONTHS = 36
+
+
+def _par_ratio(bucket: int) -> str:
+    return (
+        f"ROUND(SUM(NVL(t.ENCOURS_PAR_{bucket}, 0)) * 100 / "
+        f"NULLIF(SUM(NVL(t.ENCOURS_TOTAL, 0)), 0), 2)"
+    )
+
+
+# source -> (métrique par défaut, {métrique: (table, colonne code agence, colonne libellé, agrégat SQL)})
+# Volume DAT : MAX car la table peut dupliquer une agence dans un même lot (cf. _dedupe_dash_encours_rows).
+_RANGE_SOURCES: Dict[str, Tuple[str, Dict[str, Tuple[str, str, str, str]]]] = {
+    "clients": ("nombre", {
+        "nombre": ("DASH_RELATION", "CODE_BUREAU", "AGENCE", "SUM(NVL(t.NBRE_CLIENT_M, 0))"),
+        "frais": ("DASH_RELATION", "CODE_BUREAU", "AGENCE", "SUM(NVL(t.FRAIS_OUV_CPT_M, 0))"),
+    }),
+    "volume_dat": ("volume", {
+        "volume": ("DASH_ENCOURS_DAT", "BRANCH_CODE", "AGENCE", "MAX(NVL(t.DAT_M, 0))"),
+    }),
+    "par": ("par30", {
+        "encours": ("DASH_PAR_GLOBAL", "BRANCH_NAME", "BRANCH_NAME", "SUM(NVL(t.ENCOURS_TOTAL, 0))"),
+        "par0": ("DASH_PAR_GLOBAL", "BRANCH_NAME", "BRANCH_NAME", _par_ratio(0)),
+        "par30": ("DASH_PAR_GLOBAL", "BRANCH_NAME", "BRANCH_NAME", _par_ratio(30)),
+        "par90": ("DASH_PAR_GLOBAL", "BRANCH_NAME", "BRANCH_NAME", _par_ratio(90)),
+        "par180": ("DASH_PAR_GLOBAL", "BRANCH_NAME", "BRANCH_NAME", _par_ratio(180)),
+        "par360": ("DASH_PAR_GLOBAL", "BRANCH_NAME", "BRANCH_NAME", _par_ratio(360)),
+    }),
+    "production": ("volume", {
+        "volume": ("DASH_PRODUCTION_VOLUME", "CODE_AGENCE", "AGENCE", "SUM(NVL(t.VOLUME_DEBLOQUE_M, 0))"),
+        "nombre": ("DASH_PRODUCTION_NOMBRE", "CODE_AGENCE", "AGENCE", "SUM(NVL(t.NB_CRED_DECAISSES_M, 0))"),
+    }),
+}
+
+_SQL_RANGE_TEMPLATE = """
+WITH LOTS AS (
+    SELECT
+        TRUNC(d.MIGRATION_DATE_MINUS1, 'MM') AS DEBUT_MOIS,
+        d.MIGRATION_DATETIME,
+        ROW_NUMBER() OVER (
+            PARTITION BY TRUNC(d.MIGRATION_DATE_MINUS1, 'MM')
+            ORDER BY d.MIGRATION_DATETIME DESC
+        ) AS RG
+    FROM {table} d
+    WHERE d.MIGRATION_DATE_MINUS1 >= TO_DATE(:date_from, 'DD/MM/YYYY')
+      AND d.MIGRATION_DATE_MINUS1 < ADD_MONTHS(TO_DATE(:date_to, 'DD/MM/YYYY'), 1)
+    GROUP BY TRUNC(d.MIGRATION_DATE_MINUS1, 'MM'), d.MIGRATION_DATETIME
+)
+SELECT
+    TO_CHAR(l.DEBUT_MOIS, 'MM/YYYY') AS MOIS,
+    TRIM(TO_CHAR(t.{code_col})) AS CODE_AGENCE,
+    MAX(t.{label_col}) AS AGENCE,
+    {aggregate} AS VALEUR
+FROM {table} t
+JOIN LOTS l ON l.MIGRATION_DATETIME = t.MIGRATION_DATETIME AND l.RG = 1
+GROUP BY l.DEBUT_MOIS, TRIM(TO_CHAR(t.{code_col}))
+ORDER BY l.DEBUT_MOIS, CODE_AGENCE
+"""
+
+
+def _parse_month_year(value: str, name: str) -> Tuple[int, int]:
+    try:
+        parsed = datetime.strptime((value or "").strip(), "%m/%Y")
+    except ValueError:
+        raise ValueError(f"{name} doit être au format MM/YYYY (reçu: {value!r})")
+    return parsed.month, parsed.year
+
+
+def _month_labels(from_m: int, from_y: int, to_m: int, to_y: int) -> List[str]:
+    """Libellés MM/YYYY de from à to inclus."""
+    labels = []
+    m, y = from_m, from_y
+    while (y, m) <= (to_y, to_m):
+        labels.append(f"{m:02d}/{y}")
+        m += 1
+        if m > 12:
+            m, y = 1, y + 1
+    return labels
+
+
+def get_dash_range_series(
+    source: str,
+    date_from: str,
+    date_to: str,
+    metric: Optional[str] = None,
+) -> Dict:
+    """
+    Série mensuelle par agence entre deux mois (dernier lot DASH de chaque mois).
+
+    Args:
+        source: "clients", "volume_dat", "par" ou "production"
+        date_from: premier mois, format MM/YYYY
+        date_to: dernier mois (inclus), format MM/YYYY
+        metric: mesure de la source (défaut selon la source, ex. par30 pour le PAR)
+
+    Returns:
+        {"source", "metric", "labels": [MM/YYYY...], "series": {libellé: [valeurs]},
+         "agencies": [{"code_agence", "agence", "label", "values"}]} — valeur None pour un mois sans lot
+        (trou sur la courbe de /api/charts/multiseries). Libellé : nom de l'agence, suivi du code agence
+        entre parenthèses si plusieurs codes portent le même nom.
+    """
+    if source not in _RANGE_SOURCES:
+        raise ValueError(f"source doit être l'une de: {', '.join(_RANGE_SOURCES)}")
+    default_metric, metrics = _RANGE_SOURCES[source]
+    metric = metric or default_metric
+    if metric not in metrics:
+        raise ValueError(f"metric pour {source} doit être l'une de: {', '.join(metrics)}")
+
+    from_m, from_y = _parse_month_year(date_from, "from")
+    to_m, to_y = _parse_month_year(date_to, "to")
+    labels = _month_labels(from_m, from_y, to_m, to_y)
+    if not labels:
+        raise ValueError("from doit être antérieur ou égal à to")
+    if len(labels) > MAX_RANGE_MONTHS:
+        raise ValueError(f"Intervalle limité à {MAX_RANGE_MONTHS} mois")
+
+    cache_key = f"dash_range:{source}:{metric}:{labels[0]}:{labels[-1]}:v2"
+    cached = get_cache(cache_key)
+    if cached is not None:
+        logger.info(f"✅ Série {source}/{metric} {labels[0]} → {labels[-1]} récupérée depuis le cache")
+        return cached
+
+    table, code_col, label_col, aggregate = metrics[metric]
+    sql = _SQL_RANGE_TEMPLATE.format(
+        table=table, code_col=code_col, label_col=label_col, aggregate=aggregate
+    )
+    binds = {
+        "date_from": f"01/{from_m:02d}/{from_y}",
+        "date_to": f"01/{to_m:02d}/{to_y}",
+    }
+
+    pool = get_pool()
+    with pool.get_connection_context() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.arraysize = 1000
+            cursor.prefetchrows = 1000
+            cursor.execute(sql, binds)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+    index_by_label = {label: i for i, label in enumerate(labels)}
+    agencies: Dict[str, Dict] = {}
+    for mois, code_agence, agence, valeur in rows:
+        i = index_by_label.get(mois)
+        if i is None or not code_agence:
+            continue
+        entry = agencies.setdefault(
+            code_agence,
+            {"code_agence": code_agence, "agence": agence or code_agence, "values": [None] * len(labels)},
+        )
+        entry["values"][i] = float(valeur) if valeur is not None else None
+        if agence:
+            entry["agence"] = agence
+
+    agency_list = sorted(agencies.values(), key=lambda a: (a["agence"], a["code_agence"]))
+    name_counts: Dict[str, int] = {}
+    for a in agency_list:
+        name_counts[a["agence"]] = name_counts.get(a["agence"], 0) + 1
+    for a in agency_list:
+        # Homonymes (plusieurs codes agence) : libellé rendu unique pour ne pas écraser une série
+        a["label"] = a["agence"] if name_counts[a["agence"]] == 1 else f"{a['agence']} ({a['code_agence']})"
+    result = {
+        "source": source,
+        "metric": metric,
+        "labels": labels,
+        "series": {a["label"]: a["values"] for a in agency_list},
+        "agencies": agency_list,
+    }
+    logger.info(
+        f"📊 Série {source}/{metric}: {len(agency_list)} agences sur {len(labels)} mois ({len(rows)} lignes)"
+    )
+    set_cache(cache_key, result, ttl=300)
+    return result
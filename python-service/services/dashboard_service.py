@@ -0,0 +1,239 @@
+"""
+Tableau de bord composite : plusieurs sections (clients, encours, collection, PAR, ...) en un appel.
+
+Les sections s'exécutent en parallèle dans POOL_PREFILL threads, le nombre de connexions pré-créées du
+pool Oracle : get_connection() sans délai attend l'une d'elles et ne crée pas de connexion d'overflow,
+des threads supplémentaires resteraient bloqués. Seules clients, encours, transfers et prepaid-card-sales
+empruntent le pool ; les autres sections ouvrent leur propre connexion directe, le nombre de threads
+borne donc aussi les sessions Oracle ouvertes par un tableau de bord.
+
+Rien d'autre n'est partagé entre les sections que la fenêtre de période (PeriodWindow mémorisé) :
+chaque service résout lui-même son lot DASH dans sa requête, et les identifiants de snapshot
+(X-Snapshot-Id / ETag) sont lus par routers.conditional. Une section en erreur n'affecte pas les autres :
+son erreur est renvoyée à la place de ses données. Chaque section produit le même contenu que
+l'endpoint /api/oracle/data/<section> correspondant.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from database.oracle_pool import POOL_PREFILL
+from services.clients_service import get_clients_data
+from services.collection_service import get_collection_data
+from services.depot_garantie_service import get_depot_garantie_data
+from services.domiciliation_flux_service import get_domiciliation_flux_data
+from services.encours_service import get_encours_data
+from services.period_window import PeriodWindow, period_window
+from services.portefeuille_risque_service import get_portefeuille_risque_data
+from services.prepaid_card_service import get_prepaid_card_sales_data
+from services.production_service import get_production_nombre_data, get_production_volume_data
+from services.transfer_service import get_transfer_data
+from services.volume_dat_service import get_volume_dat_data
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DashboardRequest:
+    """Filtre commun à toutes les sections (paramètres de l'UI, tels que reçus)."""
+
+    period: str = "month"
+    zone: Optional[str] = None
+    month: Optional[int] = None
+    year: Optional[int] = None
+    date: Optional[str] = None
+    encours_type: str = "compte-courant"
+    service: str = "om"
+
+
+def _clients(r: DashboardRequest) -> Dict:
+    return {"data": get_clients_data(r.period, r.zone, r.month, r.year, r.date)}
+
+
+def _encours(r: DashboardRequest) -> Dict:
+    result = get_encours_data(
+        period=r.period, zone=r.zone, month=r.month, year=r.year, date=r.date, encours_type=r.encours_type
+    )
+    return {"data": {"hierarchicalData": result.get("hierarchicalData", {})}}
+
+
+def _collection(r: DashboardRequest) -> Dict:
+    result = get_collection_data(period=r.period, zone=r.zone, month=r.month, year=r.year, date=r.date)
+    payload = {
+        "data": {
+            "hierarchicalData": result.get("hierarchicalData", {}),
+            "globalResult": result.get("globalResult", {}),
+            "grandCompte": result.get("grandCompte", {}),
+            "chargeAffaireDetails": result.get("chargeAffaireDetails", {}),
+        },
+        "chargeAffaireDetails": result.get("chargeAffaireDetails", {}),
+    }
+    if result.get("domiciliation_meta"):
+        payload["meta"] = {"domiciliation": result["domiciliation_meta"]}
+    return payload
+
+
+def _volume_dat(r: DashboardRequest) -> Dict:
+    result = get_volume_dat_data(period=r.period, zone=r.zone, month=r.month, year=r.year, date=r.date)
+    return {"data": {"hierarchicalData": result.get("hierarchicalData", {}), "snapshot": result.get("snapshot")}}
+
+
+def _depot_garantie(r: DashboardRequest) -> Dict:
+    result = get_depot_garantie_data(period=r.period, zone=r.zone, month=r.month, year=r.year, date=r.date)
+    return {"data": {"hierarchicalData": result.get("hierarchicalData", {})}}
+
+
+def _domiciliation_flux(r: DashboardRequest) -> Dict:
+    return get_domiciliation_flux_data(period=r.period, zone=r.zone, month=r.month, year=r.year, date=r.date)
+
+
+def _transfers(r: DashboardRequest) -> Dict:
+    return {"data": get_transfer_data(period=r.period, month=r.month, year=r.year, date=r.date, service=r.service)}
+
+
+def _prepaid_card_sales(r: DashboardRequest) -> Dict:
+    return get_prepaid_card_sales_data(period=r.period, zone=r.zone, month=r.month, year=r.year, date=r.date)
+
+
+def _production_nombre(r: DashboardRequest) -> Dict:
+    return get_production_nombre_data(None, None, r.month, r.year, period=r.period, ref_date=r.date)
+
+
+def _production_volume(r: DashboardRequest) -> Dict:
+    return get_production_volume_data(None, None, r.month, r.year, period=r.period, ref_date=r.date)
+
+
+def _portefeuille_risque(r: DashboardRequest) -> Dict:
+    result = get_portefeuille_risque_data(month=r.month, year=r.year)
+    return {
+        "data": result.get("data", []),
+        "hierarchicalData": result.get("hierarchicalData", {"TERRITOIRE": {}, "POINT SERVICES": {}}),
+    }
+
+
+# Nom de section (= suffixe de l'endpoint /api/oracle/data/<section>) -> calcul de la section
+DASHBOARD_SECTIONS: Dict[str, Callable[[DashboardRequest], Any]] = {
+    "clients": _clients,
+    "encours": _encours,
+    "collection": _collection,
+    "volume-dat": _volume_dat,
+    "depot-garantie": _depot_garantie,
+    "domiciliation-flux": _domiciliation_flux,
+    "transfers": _transfers,
+    "prepaid-card-sales": _prepaid_card_sales,
+    "production-nombre": _production_nombre,
+    "production-volume": _production_volume,
+    "portefeuille-risque": _portefeuille_risque,
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Threads des sections : autant que de connexions pré-créées du pool Oracle (cf. docstring du module)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=POOL_PREFILL, thread_name_prefix="dashboard")
+        return _executor
+
+
+def resolve_sections(sections: Optional[List[str]]) -> List[str]:
+    """
+    Sections demandées (liste ou valeurs séparées par des virgules), dédoublonnées dans l'ordre.
+    Aucune section : toutes. Section inconnue : ValueError.
+    """
+    names = [s.strip().lower() for item in (sections or []) for s in str(item).split(",") if s.strip()]
+    if not names:
+        return list(DASHBOARD_SECTIONS)
+    unknown = [s for s in names if s not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise ValueError(
+            f"Section(s) inconnue(s): {', '.join(unknown)}. Sections disponibles: {', '.join(DASHBOARD_SECTIONS)}"
+        )
+    return list(dict.fromkeys(names))
+
+
+def window_meta(window: PeriodWindow) -> Dict:
+    """Fenêtre partagée par les sections, renvoyée avec le tableau de bord."""
+    return {
+        "period": window.period,
+        "month": window.month,
+        "year": window.year,
+        "snapshot": window.snapshot_month_year,
+        "dashMode": window.dash_mode,
+        "key": window.cache_key,
+    }
+
+
+def _section_error(e: Exception) -> Dict:
+    """Erreur d'une section, au format {status, detail} des HTTPException des endpoints."""
+    if isinstance(e, HTTPException):
+        return {"status": e.status_code, "detail": e.detail}
+    if isinstance(e, ValueError):
+        return {"status": 400, "detail": str(e)}
+    return {"status": 500, "detail": str(e) if str(e) else repr(e)}
+
+
+def _run_section(name: str, request: DashboardRequest) -> Dict:
+    started = time.perf_counter()
+    try:
+        data = DASHBOARD_SECTIONS[name](request)
+        outcome = {"section": name, "data": data}
+    except Exception as e:
+        logger.error(f"❌ Section {name} du tableau de bord en erreur: {e}", exc_info=True)
+        outcome = {"section": name, "error": _section_error(e)}
+    outcome["elapsedMs"] = round((time.perf_counter() - started) * 1000, 1)
+    return outcome
+
+
+async def iter_dashboard_sections(sections: List[str], request: DashboardRequest) -> AsyncIterator[Dict]:
+    """
+    Résultats des sections dans l'ordre où elles se terminent :
+    {"section", "data" | "error": {status, detail}, "elapsedMs"}.
+    """
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    tasks = [loop.run_in_executor(executor, _run_section, name, request) for name in sections]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def get_dashboard_data(sections: List[str], request: DashboardRequest) -> Dict:
+    """
+    Toutes les sections demandées en un seul contenu :
+    {"window": {...}, "sections": {section: données}, "errors": {section: {status, detail}}, "timings": {...}}
+    """
+    window = period_window(request.period, request.month, request.year, request.date)
+    started = time.perf_counter()
+    data: Dict[str, Any] = {}
+    errors: Dict[str, Dict] = {}
+    timings: Dict[str, float] = {}
+    async for outcome in iter_dashboard_sections(sections, request):
+        name = outcome["section"]
+        timings[name] = outcome["elapsedMs"]
+        if "error" in outcome:
+            errors[name] = outcome["error"]
+        else:
+            data[name] = outcome["data"]
+    logger.info(
+        f"📊 Tableau de bord {window.cache_key}: {len(data)}/{len(sections)} section(s) en "
+        f"{(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+    return {
+        "window": window_meta(window),
+        "sections": {name: data[name] for name in sections if name in data},
+        "errors": errors,
+        "timings": timings,
+    }
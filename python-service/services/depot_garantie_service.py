@@ -7,7 +7,7 @@ from datetime import timedelta
 from typing import Optional
 
 from database.oracle import get_oracle_connection_cofina
-from services.utils import get_territory_from_agency, get_territory_from_branch_code, get_territory_key
+from services.rollup_service import RollupSpec, rollup, total
 from services.volume_dat_service import (
     _dedupe_dash_encours_rows,
     _ref_month_year,
@@ -17,6 +17,35 @@ from services.volume_dat_service import (
 
 logger = logging.getLogger(__name__)
 
+_DEPOT_GARANTIE_ROLLUP = RollupSpec(
+    "depot_garantie",
+    name_field="BRANCH_NAME",
+    totals=(
+        total("m1EncoursDepotGarantie", "M1_ENCOURS_DEPOT_GARANTIE"),
+        total("mEncoursDepotGarantie", "M_ENCOURS_DEPOT_GARANTIE"),
+        total("encoursTotalM", "ENCOURS_TOTAL_M"),
+    ),
+)
+
+
+def _depot_garantie_agency(row: dict) -> dict:
+    """Ligne DASH_DEPOT_GARANTIE → agence."""
+    agency_name = (
+        row.get('BRANCH_NAME')
+        or row.get('branch_name')
+        or row.get('AGENCE')
+        or row.get('agence')
+        or ''
+    )
+    return {
+        'BRANCH_CODE': row.get('BRANCH_CODE') or row.get('branch_code'),
+        'BRANCH_NAME': agency_name,
+        'name': agency_name,
+        'M1_ENCOURS_DEPOT_GARANTIE': float(row.get('M1_ENCOURS_DEPOT_GARANTIE') or 0),
+        'M_ENCOURS_DEPOT_GARANTIE': float(row.get('M_ENCOURS_DEPOT_GARANTIE') or 0),
+        'ENCOURS_TOTAL_M': float(row.get('ENCOURS_TOTAL_M') or 0)
+    }
+
 _SQL_DEPOT_GARANTIE_BY_DAY = """
 SELECT
     BRANCH_CODE,
@@ -205,103 +234,8 @@ def get_depot_garantie_data(period: str = "month", zone: Optional[str] = None,
                     "snapshot": None,
                 }
 
-            agencies_by_territory = {
-                'territoire_dakar_ville': [],
-                'territoire_dakar_banlieue': [],
-                'territoire_province_centre_sud': [],
-                'territoire_province_nord': []
-            }
-
-            grand_compte = None
-
-            for row in data:
-                branch_code = row.get('BRANCH_CODE') or row.get('branch_code')
-                agency_name = (
-                    row.get('BRANCH_NAME')
-                    or row.get('branch_name')
-                    or row.get('AGENCE')
-                    or row.get('agence')
-                    or ''
-                )
-
-                agency = {
-                    'BRANCH_CODE': branch_code,
-                    'BRANCH_NAME': agency_name,
-                    'name': agency_name,
-                    'M1_ENCOURS_DEPOT_GARANTIE': float(row.get('M1_ENCOURS_DEPOT_GARANTIE') or 0),
-                    'M_ENCOURS_DEPOT_GARANTIE': float(row.get('M_ENCOURS_DEPOT_GARANTIE') or 0),
-                    'ENCOURS_TOTAL_M': float(row.get('ENCOURS_TOTAL_M') or 0)
-                }
-
-                territory = get_territory_from_branch_code(branch_code)
-                if territory is None:
-                    territory = get_territory_from_agency(agency_name)
-
-                if agency_name and 'GRAND COMPTE' in agency_name.upper():
-                    grand_compte = agency
-                    continue
-
-                if territory is None or territory == 'POINT SERVICES':
-                    territory_key = 'territoire_dakar_ville'
-                else:
-                    territory_key = get_territory_key(territory)
-
-                if territory_key in agencies_by_territory:
-                    agencies_by_territory[territory_key].append(agency)
-
-            def calculate_territory_totals(agencies_list):
-                totals = {
-                    'm1EncoursDepotGarantie': 0,
-                    'mEncoursDepotGarantie': 0,
-                    'encoursTotalM': 0
-                }
-                for agency in agencies_list:
-                    totals['m1EncoursDepotGarantie'] += float(agency.get('M1_ENCOURS_DEPOT_GARANTIE', 0) or 0)
-                    totals['mEncoursDepotGarantie'] += float(agency.get('M_ENCOURS_DEPOT_GARANTIE', 0) or 0)
-                    totals['encoursTotalM'] += float(agency.get('ENCOURS_TOTAL_M', 0) or 0)
-                return totals
-
-            response_data = {
-                "hierarchicalData": {
-                    "TERRITOIRE": {},
-                    "POINT SERVICES": {}
-                }
-            }
-
-            if any(agencies_by_territory.values()):
-                response_data["hierarchicalData"]["TERRITOIRE"] = {
-                    "territoire_dakar_ville": {
-                        "name": "DAKAR CENTRE VILLE",
-                        "agencies": agencies_by_territory['territoire_dakar_ville'],
-                        "totals": calculate_territory_totals(agencies_by_territory['territoire_dakar_ville'])
-                    },
-                    "territoire_dakar_banlieue": {
-                        "name": "DAKAR BANLIEUE",
-                        "agencies": agencies_by_territory['territoire_dakar_banlieue'],
-                        "totals": calculate_territory_totals(agencies_by_territory['territoire_dakar_banlieue'])
-                    },
-                    "province_centre_sud": {
-                        "name": "PROVINCE CENTRE SUD",
-                        "agencies": agencies_by_territory['territoire_province_centre_sud'],
-                        "totals": calculate_territory_totals(agencies_by_territory['territoire_province_centre_sud'])
-                    },
-                    "province_nord": {
-                        "name": "PROVINCE NORD",
-                        "agencies": agencies_by_territory['territoire_province_nord'],
-                        "totals": calculate_territory_totals(agencies_by_territory['territoire_province_nord'])
-                    }
-                }
-
-                if grand_compte:
-                    response_data["hierarchicalData"]["TERRITOIRE"]["grand_compte"] = {
-                        "name": "GRAND COMPTE",
-                        "agencies": [grand_compte],
-                        "totals": {
-                            'm1EncoursDepotGarantie': grand_compte.get('M1_ENCOURS_DEPOT_GARANTIE', 0),
-                            'mEncoursDepotGarantie': grand_compte.get('M_ENCOURS_DEPOT_GARANTIE', 0),
-                            'encoursTotalM': grand_compte.get('ENCOURS_TOTAL_M', 0)
-                        }
-                    }
+            tree = rollup([_depot_garantie_agency(row) for row in data], _DEPOT_GARANTIE_ROLLUP)
+            response_data = {"hierarchicalData": tree["hierarchy"]}
 
             response_data["snapshot"] = _snapshot_from_row(data[0])
 
@@ -3,20 +3,98 @@ Service pour la gestion des données Encours
 """
 import logging
 from typing import Optional, Dict, Any
-from datetime import datetime
-import calendar
-from services.utils import get_territory_from_agency, get_territory_from_branch_code, get_territory_key, get_all_territories
+from database.fetch import fetch_records, float_defaults
+from services.period_window import period_window
+from services.rollup_service import RollupSpec, combined, rollup, total
 
 logger = logging.getLogger(__name__)
 
 
-def _dash_float(row: dict, *names: str) -> float:
-    """Lit un nombre dans une ligne Oracle (clés en majuscules variables)."""
-    upper_names = {n.upper() for n in names if n}
-    for k, v in row.items():
-        if k is not None and str(k).upper() in upper_names:
+# Montants DASH_ENCOURS_EPARGNE lus en float par le driver, NULL → 0
+_ENCOURS_EPARGNE_FLOAT_COLUMNS = float_defaults((
+    "ENCOURS_TOTAL_M",
+    "M_ENCOURS_EPARGNE_SIMPLE",
+    "M1_ENCOURS_EPARGNE_SIMPLE",
+    "M_ENCOURS_CPT_EPARGNE_PROJET",
+    "M1_ENCOURS_CPT_EPARGNE_PROJET",
+    "DETES_RATT_EPARGNE_SIMPLE_M",
+    "DETES_RATT_EPARGNE_SIMPLE_M1",
+    "DETES_RATT_EPARGNE_SPROJET_M",
+    "DETES_RATT_EPARGNE_SPROJET_M1",
+))
+
+
+# Colonnes numériques de l'agence par type d'encours (la dette rattachée est ajoutée pour l'épargne)
+_ENCOURS_AGENCY_FIELDS = {
+    "epargne-simple": (
+        "M1_ENCOURS_COMPTE_EPARGNE", "M_ENCOURS_COMPTE_EPARGNE",
+        "ENCOURS_TOTAL_M", "ENCOURS_TOTAL_M_1", "DETTE_RATTACHEE",
+    ),
+    "epargne-pep-simple": (
+        "M_ENCOURS_COMPTE_COURANT", "M_ENCOURS_COMPTE_EPARGNE", "M_ENCOURS_COMPTE_EPARGNE_PROJET",
+        "M_ENCOURS_DAT", "M_ENCOURS_DEPOT_GARANTIE",
+        "M1_ENCOURS_COMPTE_COURANT", "M1_ENCOURS_COMPTE_EPARGNE", "M1_ENCOURS_COMPTE_EPARGNE_PROJET",
+        "M1_ENCOURS_DAT", "M1_ENCOURS_DEPOT_GARANTIE",
+        "ENCOURS_TOTAL_M", "ENCOURS_TOTAL_M_1", "DETTE_RATTACHEE",
+    ),
+    "epargne-projet": (
+        "M_ENCOURS_COMPTE_EPARGNE_PROJET", "M1_ENCOURS_COMPTE_EPARGNE_PROJET",
+        "ENCOURS_TOTAL_M", "ENCOURS_TOTAL_M_1", "DETTE_RATTACHEE",
+    ),
+    "compte-courant": (
+        "M1_ENCOURS_COMPTE_COURANT", "M_ENCOURS_COMPTE_COURANT",
+        "ENCOURS_TOTAL_M", "ENCOURS_TOTAL_M_1",
+    ),
+}
+
+
+def _encours_rollup(m1_fields, m_fields) -> RollupSpec:
+    return RollupSpec(
+        "encours",
+        name_field="BRANCH_NAME",
+        totals=(
+            combined("m1Enours", *m1_fields),
+            combined("mEnours", *m_fields),
+            total("encoursTotalM", "ENCOURS_TOTAL_M"),
+            total("encoursTotalM1", "ENCOURS_TOTAL_M_1"),
+        ),
+    )
+
+
+# Totaux territoire : épargne PEP + simple = épargne + épargne projet
+_ENCOURS_ROLLUPS = {
+    "epargne-simple": _encours_rollup(("M1_ENCOURS_COMPTE_EPARGNE",), ("M_ENCOURS_COMPTE_EPARGNE",)),
+    "epargne-pep-simple": _encours_rollup(
+        ("M1_ENCOURS_COMPTE_EPARGNE", "M1_ENCOURS_COMPTE_EPARGNE_PROJET"),
+        ("M_ENCOURS_COMPTE_EPARGNE", "M_ENCOURS_COMPTE_EPARGNE_PROJET"),
+    ),
+    "epargne-projet": _encours_rollup(("M1_ENCOURS_COMPTE_EPARGNE_PROJET",), ("M_ENCOURS_COMPTE_EPARGNE_PROJET",)),
+    "compte-courant": _encours_rollup(("M1_ENCOURS_COMPTE_COURANT",), ("M_ENCOURS_COMPTE_COURANT",)),
+}
+
+
+def _encours_agency(row, fields) -> Dict[str, Any]:
+    """Ligne encours → agence (colonnes du type demandé, NULL → 0)."""
+    agency_name = row.get('BRANCH_NAME') or row.get('branch_name') or ''
+    agency = {
+        'BRANCH_CODE': row.get('BRANCH_CODE') or row.get('branch_code'),
+        'BRANCH_NAME': agency_name,
+        'name': agency_name,
+    }
+    for field in fields:
+        agency[field] = float(row.get(field) or 0)
+    if 'DETTE_RATTACHEE' in agency:
+        agency['detteRattachee'] = agency['DETTE_RATTACHEE']
+    return agency
+
+
+def _dash_float(row, *names: str) -> float:
+    """Lit un nombre dans une ligne DASH (premier nom de colonne présent et non NULL)."""
+    for name in names:
+        v = row.get(name)
+        if v is not None:
             try:
-                return float(v) if v is not None else 0.0
+                return float(v)
             except (TypeError, ValueError):
                 return 0.0
     return 0.0
@@ -97,114 +175,24 @@ def get_encours_data(period: str = "month", zone: Optional[str] = None,
     """
     logger.info(f"🔍 get_encours_data appelé avec period={period}, zone={zone}, month={month}, year={year}, date={date}, type={encours_type}")
     
-    # Utiliser le mois et l'année actuels si non fournis
-    if not month or not year:
-        now = datetime.now()
-        month = month or now.month
-        year = year or now.year
-    
-    # Calculer les dates M et M-1
-    if period == "month":
-        # Date de fin du mois M
-        m_end = datetime(year, month, calendar.monthrange(year, month)[1])
-        # Date de fin du mois M-1
-        if month == 1:
-            m1_end = datetime(year - 1, 12, calendar.monthrange(year - 1, 12)[1])
-        else:
-            m1_end = datetime(year, month - 1, calendar.monthrange(year, month - 1)[1])
-    elif period == "year":
-        # Date de fin de l'année M
-        m_end = datetime(year, 12, 31)
-        # Date de fin de l'année M-1
-        m1_end = datetime(year - 1, 12, 31)
-    elif period == "week":
-        # Pour la semaine, utiliser la date fournie ou aujourd'hui
-        if date:
-            try:
-                reference_date = datetime.strptime(date, "%Y-%m-%d")
-            except (ValueError, TypeError):
-                reference_date = datetime.now()
-        else:
-            reference_date = datetime.now()
-        
-        # Trouver le dimanche de la semaine (fin de semaine)
-        from datetime import timedelta
-        days_since_monday = reference_date.weekday()
-        sunday = reference_date + timedelta(days=(6 - days_since_monday))
-        m_end = sunday
-        
-        # Semaine précédente
-        m1_end = sunday - timedelta(days=7)
-    else:
-        # Par défaut, utiliser le mois actuel
-        now = datetime.now()
-        m_end = datetime(now.year, now.month, calendar.monthrange(now.year, now.month)[1])
-        if now.month == 1:
-            m1_end = datetime(now.year - 1, 12, calendar.monthrange(now.year - 1, 12)[1])
-        else:
-            m1_end = datetime(now.year, now.month - 1, calendar.monthrange(now.year, now.month - 1)[1])
-    
-    # Calculer les dates de début du mois M et M-1 pour les dettes rattachées
-    if period == "month":
-        m_start = datetime(year, month, 1)
-        if month == 1:
-            m1_start = datetime(year - 1, 12, 1)
-        else:
-            m1_start = datetime(year, month - 1, 1)
-    elif period == "year":
-        m_start = datetime(year, 1, 1)
-        m1_start = datetime(year - 1, 1, 1)
-    elif period == "week":
-        # Pour la semaine, utiliser la date fournie ou aujourd'hui
-        if date:
-            try:
-                reference_date = datetime.strptime(date, "%Y-%m-%d")
-            except (ValueError, TypeError):
-                reference_date = datetime.now()
-        else:
-            reference_date = datetime.now()
-        
-        # Trouver le lundi de la semaine (début de semaine)
-        from datetime import timedelta
-        days_since_monday = reference_date.weekday()
-        monday = reference_date - timedelta(days=days_since_monday)
-        m_start = monday
-        
-        # Semaine précédente
-        m1_start = monday - timedelta(days=7)
-        m1_end = monday - timedelta(days=1)
-    else:
-        # Par défaut, utiliser le mois actuel
-        now = datetime.now()
-        m_start = datetime(now.year, now.month, 1)
-        if now.month == 1:
-            m1_start = datetime(now.year - 1, 12, 1)
-        else:
-            m1_start = datetime(now.year, now.month - 1, 1)
+    # Fenêtre M / M-1 calculée une fois (bornes de fin pour les soldes, de début pour les dettes rattachées)
+    window = period_window(period, month, year, date)
+    m_end_str = window.m_end.strftime("%d/%m/%Y")
+    m1_end_str = window.m1_end.strftime("%d/%m/%Y")
+    m_start_str = window.m_start.strftime("%d/%m/%Y")
+    m1_start_str = window.m1_start.strftime("%d/%m/%Y")
     
-    # Formater les dates pour Oracle (DD/MM/YYYY)
-    m_end_str = m_end.strftime("%d/%m/%Y")
-    m1_end_str = m1_end.strftime("%d/%m/%Y")
-    m_start_str = m_start.strftime("%d/%m/%Y")
-    m1_start_str = m1_start.strftime("%d/%m/%Y")
-    
-    logger.info(f"📅 Dates calculées: M fin={m_end_str}, M-1 fin={m1_end_str}")
-    logger.info(f"📅 Dates dettes rattachées: M début={m_start_str}, M fin={m_end_str}, M-1 début={m1_start_str}, M-1 fin={m1_end_str}")
+    logger.info(f"📅 Dates calculées: M {m_start_str} → {m_end_str}, M-1 {m1_start_str} → {m1_end_str}")
 
     # Snapshot DASH_ENCOURS_EPARGNE (MM/YYYY) : mois sélectionné, décembre pour l’année, mois de m_end pour la semaine
-    if period == "month":
-        dash_epargne_month_year = f"{month:02d}/{year}"
-    elif period == "year":
-        dash_epargne_month_year = f"12/{year}"
-    else:
-        dash_epargne_month_year = f"{m_end.month:02d}/{m_end.year}"
+    dash_epargne_month_year = window.snapshot_month_year
 
     # Utiliser le pool de connexions et le cache
     from database.oracle_pool import get_pool
     from services.cache_service import get_cache, set_cache, generate_cache_key
     
     # Générer une clé de cache basée sur les paramètres
-    cache_key = f"encours:{encours_type}:{generate_cache_key(period, zone, month, year, date)}"
+    cache_key = f"encours:{encours_type}:{window.cache_key}:{generate_cache_key(zone)}"
     
     # Vérifier le cache
     cached_result = get_cache(cache_key)
@@ -232,9 +220,12 @@ def get_encours_data(period: str = "month", zone: Optional[str] = None,
                     dash_epargne_month_year,
                     period,
                 )
-                cursor.execute(ENCOURS_EPARGNE_DASH_QUERY, {"month_year": dash_epargne_month_year})
-                cols = [desc[0] for desc in cursor.description]
-                raw_rows = [dict(zip(cols, r)) for r in cursor.fetchall()]
+                raw_rows = fetch_records(
+                    cursor,
+                    ENCOURS_EPARGNE_DASH_QUERY,
+                    {"month_year": dash_epargne_month_year},
+                    float_columns=_ENCOURS_EPARGNE_FLOAT_COLUMNS,
+                )
                 data = [_normalize_dash_encours_epargne_row(r, encours_type) for r in raw_rows]
             elif encours_type == "compte-courant":
                 query = f"""
@@ -483,188 +474,10 @@ ORDER BY o.BRANCH_CODE, o.BRANCH_NAME
                     }
                 }
             
-            # Organiser les données par territoire et point de service
-            agencies_by_territory = {
-                'territoire_dakar_ville': [],
-                'territoire_dakar_banlieue': [],
-                'territoire_province_centre_sud': [],
-                'territoire_province_nord': []
-            }
-            
-            grand_compte = None
-            
-            for row in data:
-                branch_code = row.get('BRANCH_CODE') or row.get('branch_code')
-                agency_name = row.get('BRANCH_NAME') or row.get('branch_name') or ''
-                
-                # Créer l'objet agence selon le type d'encours
-                if encours_type == "epargne-simple":
-                    agency = {
-                        'BRANCH_CODE': branch_code,
-                        'BRANCH_NAME': agency_name,
-                        'name': agency_name,
-                        'M1_ENCOURS_COMPTE_EPARGNE': float(row.get('M1_ENCOURS_COMPTE_EPARGNE') or 0),
-                        'M_ENCOURS_COMPTE_EPARGNE': float(row.get('M_ENCOURS_COMPTE_EPARGNE') or 0),
-                        'ENCOURS_TOTAL_M': float(row.get('ENCOURS_TOTAL_M') or 0),
-                        'ENCOURS_TOTAL_M_1': float(row.get('ENCOURS_TOTAL_M_1') or 0),
-                        'DETTE_RATTACHEE': float(row.get('DETTE_RATTACHEE') or 0),
-                        'detteRattachee': float(row.get('DETTE_RATTACHEE') or 0)
-                    }
-                elif encours_type == "epargne-pep-simple":
-                    agency = {
-                        'BRANCH_CODE': branch_code,
-                        'BRANCH_NAME': agency_name,
-                        'name': agency_name,
-                        'M_ENCOURS_COMPTE_COURANT': float(row.get('M_ENCOURS_COMPTE_COURANT') or 0),
-                        'M_ENCOURS_COMPTE_EPARGNE': float(row.get('M_ENCOURS_COMPTE_EPARGNE') or 0),
-                        'M_ENCOURS_COMPTE_EPARGNE_PROJET': float(row.get('M_ENCOURS_COMPTE_EPARGNE_PROJET') or 0),
-                        'M_ENCOURS_DAT': float(row.get('M_ENCOURS_DAT') or 0),
-                        'M_ENCOURS_DEPOT_GARANTIE': float(row.get('M_ENCOURS_DEPOT_GARANTIE') or 0),
-                        'M1_ENCOURS_COMPTE_COURANT': float(row.get('M1_ENCOURS_COMPTE_COURANT') or 0),
-                        'M1_ENCOURS_COMPTE_EPARGNE': float(row.get('M1_ENCOURS_COMPTE_EPARGNE') or 0),
-                        'M1_ENCOURS_COMPTE_EPARGNE_PROJET': float(row.get('M1_ENCOURS_COMPTE_EPARGNE_PROJET') or 0),
-                        'M1_ENCOURS_DAT': float(row.get('M1_ENCOURS_DAT') or 0),
-                        'M1_ENCOURS_DEPOT_GARANTIE': float(row.get('M1_ENCOURS_DEPOT_GARANTIE') or 0),
-                        'ENCOURS_TOTAL_M': float(row.get('ENCOURS_TOTAL_M') or 0),
-                        'ENCOURS_TOTAL_M_1': float(row.get('ENCOURS_TOTAL_M_1') or 0),
-                        'DETTE_RATTACHEE': float(row.get('DETTE_RATTACHEE') or 0),
-                        'detteRattachee': float(row.get('DETTE_RATTACHEE') or 0)
-                    }
-                elif encours_type == "epargne-projet":
-                    agency = {
-                        'BRANCH_CODE': branch_code,
-                        'BRANCH_NAME': agency_name,
-                        'name': agency_name,
-                        'M_ENCOURS_COMPTE_EPARGNE_PROJET': float(row.get('M_ENCOURS_COMPTE_EPARGNE_PROJET') or 0),
-                        'M1_ENCOURS_COMPTE_EPARGNE_PROJET': float(row.get('M1_ENCOURS_COMPTE_EPARGNE_PROJET') or 0),
-                        'ENCOURS_TOTAL_M': float(row.get('ENCOURS_TOTAL_M') or 0),
-                        'ENCOURS_TOTAL_M_1': float(row.get('ENCOURS_TOTAL_M_1') or 0),
-                        'DETTE_RATTACHEE': float(row.get('DETTE_RATTACHEE') or 0),
-                        'detteRattachee': float(row.get('DETTE_RATTACHEE') or 0)
-                    }
-                else:
-                    # Compte courant par défaut
-                    agency = {
-                        'BRANCH_CODE': branch_code,
-                        'BRANCH_NAME': agency_name,
-                        'name': agency_name,
-                        'M1_ENCOURS_COMPTE_COURANT': float(row.get('M1_ENCOURS_COMPTE_COURANT') or 0),
-                        'M_ENCOURS_COMPTE_COURANT': float(row.get('M_ENCOURS_COMPTE_COURANT') or 0),
-                        'ENCOURS_TOTAL_M': float(row.get('ENCOURS_TOTAL_M') or 0),
-                        'ENCOURS_TOTAL_M_1': float(row.get('ENCOURS_TOTAL_M_1') or 0)
-                    }
-                
-                # Territoire : code agence (mapping Oracle), puis nom d'agence — nécessaire pour DASH
-                # (BRANCH_CODE parfois absent ou non présent dans le cache ; BRANCH_NAME toujours exploitable).
-                territory = get_territory_from_branch_code(branch_code)
-                if territory is None:
-                    territory = get_territory_from_agency(agency_name)
-
-                # Vérifier si c'est le grand compte
-                if agency_name and 'GRAND COMPTE' in agency_name.upper():
-                    grand_compte = agency
-                    continue
-                
-                if territory is None or territory == 'POINT SERVICES':
-                    territory_key = 'territoire_dakar_ville'
-                else:
-                    territory_key = get_territory_key(territory)
-                if territory_key in agencies_by_territory:
-                    agencies_by_territory[territory_key].append(agency)
-            
-            # Calculer les totaux pour chaque territoire
-            def calculate_territory_totals(agencies_list):
-                """Calcule les totaux pour un territoire"""
-                totals = {
-                    'm1Enours': 0,
-                    'mEnours': 0,
-                    'encoursTotalM': 0,
-                    'encoursTotalM1': 0
-                }
-                for agency in agencies_list:
-                    if encours_type == "epargne-simple":
-                        totals['m1Enours'] += float(agency.get('M1_ENCOURS_COMPTE_EPARGNE', 0) or 0)
-                        totals['mEnours'] += float(agency.get('M_ENCOURS_COMPTE_EPARGNE', 0) or 0)
-                    elif encours_type == "epargne-pep-simple":
-                        # Pour PEP et SIMPLE, on additionne M1 EPARGNE + M1 EPARGNE PROJET
-                        totals['m1Enours'] += float(agency.get('M1_ENCOURS_COMPTE_EPARGNE', 0) or 0) + float(agency.get('M1_ENCOURS_COMPTE_EPARGNE_PROJET', 0) or 0)
-                        # Pour PEP et SIMPLE, on additionne M EPARGNE + M EPARGNE PROJET
-                        totals['mEnours'] += float(agency.get('M_ENCOURS_COMPTE_EPARGNE', 0) or 0) + float(agency.get('M_ENCOURS_COMPTE_EPARGNE_PROJET', 0) or 0)
-                    elif encours_type == "epargne-projet":
-                        # Pour EPARGNE PROJET, on utilise seulement les valeurs PROJET
-                        totals['m1Enours'] += float(agency.get('M1_ENCOURS_COMPTE_EPARGNE_PROJET', 0) or 0)
-                        totals['mEnours'] += float(agency.get('M_ENCOURS_COMPTE_EPARGNE_PROJET', 0) or 0)
-                    else:
-                        totals['m1Enours'] += float(agency.get('M1_ENCOURS_COMPTE_COURANT', 0) or 0)
-                        totals['mEnours'] += float(agency.get('M_ENCOURS_COMPTE_COURANT', 0) or 0)
-                    totals['encoursTotalM'] += float(agency.get('ENCOURS_TOTAL_M', 0) or 0)
-                    totals['encoursTotalM1'] += float(agency.get('ENCOURS_TOTAL_M_1', 0) or 0)
-                return totals
-            
-            # Construire la structure hiérarchique
-            response_data = {
-                "hierarchicalData": {
-                    "TERRITOIRE": {},
-                    "POINT SERVICES": {}
-                }
-            }
-            
-            # Ajouter les territoires
-            if any(agencies_by_territory.values()):
-                response_data["hierarchicalData"]["TERRITOIRE"] = {
-                    "territoire_dakar_ville": {
-                        "name": "DAKAR CENTRE VILLE",
-                        "agencies": agencies_by_territory['territoire_dakar_ville'],
-                        "totals": calculate_territory_totals(agencies_by_territory['territoire_dakar_ville'])
-                    },
-                    "territoire_dakar_banlieue": {
-                        "name": "DAKAR BANLIEUE",
-                        "agencies": agencies_by_territory['territoire_dakar_banlieue'],
-                        "totals": calculate_territory_totals(agencies_by_territory['territoire_dakar_banlieue'])
-                    },
-                    "province_centre_sud": {
-                        "name": "PROVINCE CENTRE SUD",
-                        "agencies": agencies_by_territory['territoire_province_centre_sud'],
-                        "totals": calculate_territory_totals(agencies_by_territory['territoire_province_centre_sud'])
-                    },
-                    "province_nord": {
-                        "name": "PROVINCE NORD",
-                        "agencies": agencies_by_territory['territoire_province_nord'],
-                        "totals": calculate_territory_totals(agencies_by_territory['territoire_province_nord'])
-                    }
-                }
-                
-                # Ajouter le grand compte dans TERRITOIRE si présent
-                if grand_compte:
-                    if encours_type == "epargne-simple":
-                        grand_compte_totals = {
-                            'm1Enours': grand_compte.get('M1_ENCOURS_COMPTE_EPARGNE', 0),
-                            'mEnours': grand_compte.get('M_ENCOURS_COMPTE_EPARGNE', 0),
-                            'encoursTotalM': grand_compte.get('ENCOURS_TOTAL_M', 0)
-                        }
-                    elif encours_type == "epargne-pep-simple":
-                        grand_compte_totals = {
-                            'm1Enours': grand_compte.get('M1_ENCOURS_COMPTE_EPARGNE', 0) + grand_compte.get('M1_ENCOURS_COMPTE_EPARGNE_PROJET', 0),
-                            'mEnours': grand_compte.get('M_ENCOURS_COMPTE_EPARGNE', 0) + grand_compte.get('M_ENCOURS_COMPTE_EPARGNE_PROJET', 0),
-                            'encoursTotalM': grand_compte.get('ENCOURS_TOTAL_M', 0)
-                        }
-                    elif encours_type == "epargne-projet":
-                        grand_compte_totals = {
-                            'm1Enours': grand_compte.get('M1_ENCOURS_COMPTE_EPARGNE_PROJET', 0),
-                            'mEnours': grand_compte.get('M_ENCOURS_COMPTE_EPARGNE_PROJET', 0),
-                            'encoursTotalM': grand_compte.get('ENCOURS_TOTAL_M', 0)
-                        }
-                    else:
-                        grand_compte_totals = {
-                            'm1Enours': grand_compte.get('M1_ENCOURS_COMPTE_COURANT', 0),
-                            'mEnours': grand_compte.get('M_ENCOURS_COMPTE_COURANT', 0),
-                            'encoursTotalM': grand_compte.get('ENCOURS_TOTAL_M', 0)
-                        }
-                    response_data["hierarchicalData"]["TERRITOIRE"]["grand_compte"] = {
-                        "name": "GRAND COMPTE",
-                        "agencies": [grand_compte],
-                        "totals": grand_compte_totals
-                    }
+            agency_fields = _ENCOURS_AGENCY_FIELDS.get(encours_type, _ENCOURS_AGENCY_FIELDS["compte-courant"])
+            agencies = [_encours_agency(row, agency_fields) for row in data]
+            tree = rollup(agencies, _ENCOURS_ROLLUPS.get(encours_type, _ENCOURS_ROLLUPS["compte-courant"]))
+            response_data = {"hierarchicalData": tree["hierarchy"]}
             
             # Mettre en cache le résultat (TTL de 5 minutes)
             set_cache(cache_key, response_data, ttl=300)
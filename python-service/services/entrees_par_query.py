@@ -43,6 +43,15 @@ PAR_FILTERS = {
     360: "(NVL(DUREE_IMP_A_DATE, 0) = 361)",
 }
 
+# Valeur DUREE_IMP_A_DATE de chaque strate (mêmes égalités que PAR_FILTERS).
+PAR_BUCKET_DUREES = {
+    0: 1,
+    30: 31,
+    90: 91,
+    180: 181,
+    360: 361,
+}
+
 
 def get_query_entrees_par(month_year: str, par_bucket: int) -> Tuple[str, dict]:
     """
@@ -56,3 +65,16 @@ def get_query_entrees_par(month_year: str, par_bucket: int) -> Tuple[str, dict]:
     where_par = PAR_FILTERS[par_bucket]
     sql = ENTREES_PAR_QUERY.replace("__PAR_BUCKET_WHERE__", where_par)
     return sql, {"month_year": month_year}
+
+
+def get_query_entrees_par_all_buckets(month_year: str) -> Tuple[str, dict]:
+    """
+    Retourne la requête Entrées PAR (DASH) couvrant les cinq paliers en une seule lecture du snapshot.
+
+    Le partitionnement par palier se fait ensuite côté Python sur DUREE_IMPAYE_A_DATE.
+    month_year: mois calendaire du snapshot, format MM/YYYY (ex. 04/2026)
+    """
+    durees = ", ".join(str(d) for d in PAR_BUCKET_DUREES.values())
+    where_par = f"(NVL(DUREE_IMP_A_DATE, 0) IN ({durees}))"
+    sql = ENTREES_PAR_QUERY.replace("__PAR_BUCKET_WHERE__", where_par)
+    return sql, {"month_year": month_year}
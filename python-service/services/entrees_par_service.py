@@ -1,5 +1,8 @@
 """
-Service Entrées PAR et Provisions : exécute la requête par palier PAR (0, 30, 90, 180, 360).
+Service Entrées PAR et Provisions : paliers PAR (0, 30, 90, 180, 360).
+
+Le snapshot DASH_ENTREE_PAR du mois est lu une seule fois pour les cinq paliers,
+partitionné en Python sur DUREE_IMPAYE_A_DATE puis mis en cache ensemble.
 """
 import logging
 import calendar
@@ -7,7 +10,8 @@ from typing import List, Dict, Optional
 from datetime import datetime
 
 from database.oracle_pool import get_pool
-from services.entrees_par_query import get_query_entrees_par
+from services.entrees_par_query import PAR_BUCKET_DUREES, get_query_entrees_par_all_buckets
+from services.cache_service import get_cache, set_cache
 
 logger = logging.getLogger(__name__)
 
@@ -30,32 +34,56 @@ def _serialize_row(row: dict) -> dict:
     return out
 
 
-def get_entrees_par_data(
+def _resolve_month_year(month: Optional[int], year: Optional[int]):
+    """Mois / année par défaut (mois courant) et libellé MM/YYYY du snapshot."""
+    now = datetime.now()
+    month = month or now.month
+    year = year or now.year
+    return month, year, f"{month:02d}/{year}"
+
+
+def _partition_by_bucket(rows: List[Dict]) -> Dict[int, List[Dict]]:
+    """Répartit les lignes du snapshot par palier PAR selon DUREE_IMPAYE_A_DATE."""
+    bucket_by_duree = {duree: bucket for bucket, duree in PAR_BUCKET_DUREES.items()}
+    buckets: Dict[int, List[Dict]] = {bucket: [] for bucket in PAR_BUCKET_DUREES}
+    for row in rows:
+        try:
+            duree = int(row.get("DUREE_IMPAYE_A_DATE") or 0)
+        except (TypeError, ValueError):
+            continue
+        bucket = bucket_by_duree.get(duree)
+        if bucket is not None:
+            buckets[bucket].append(row)
+    return buckets
+
+
+def get_entrees_par_all_buckets(
     month: Optional[int] = None,
     year: Optional[int] = None,
-    par_bucket: int = 0,
-) -> List[Dict]:
+) -> Dict[int, List[Dict]]:
     """
-    Récupère les entrées PAR et provisions pour une date (dernier jour du mois) et un palier PAR.
+    Récupère les entrées PAR des cinq paliers en une seule requête sur le snapshot du mois.
 
     Args:
         month: Mois (1-12). Défaut: mois courant.
         year: Année. Défaut: année courante.
-        par_bucket: Palier PAR (0, 30, 90, 180 ou 360).
 
     Returns:
-        Liste de dictionnaires (NO_PRET, BLOC, NOM_CLIENT, AGENCE, ENCOURS_TOTAL, PROVISIONS, etc.)
+        {palier: [lignes]} pour les paliers 0, 30, 90, 180 et 360
     """
-    now = datetime.now()
-    month = month or now.month
-    year = year or now.year
-    month_year = f"{month:02d}/{year}"
+    month, year, month_year = _resolve_month_year(month, year)
+
+    cache_key = f"entrees_par:all_buckets:{month_year}:v1"
+    cached = get_cache(cache_key)
+    if cached is not None:
+        logger.info("✅ Entrées PAR (tous paliers) récupérées depuis le cache pour %s", month_year)
+        return cached
+
     last_day = calendar.monthrange(year, month)[1]
     date_str = datetime(year, month, last_day).strftime("%d/%m/%Y")
+    logger.info("📊 Entrées PAR: mois=%s (fin mois %s), tous paliers", month_year, date_str)
 
-    logger.info("📊 Entrées PAR: mois=%s (fin mois %s), par_bucket=%s", month_year, date_str, par_bucket)
-
-    sql, binds = get_query_entrees_par(month_year, par_bucket)
+    sql, binds = get_query_entrees_par_all_buckets(month_year)
     pool = get_pool()
     with pool.get_connection_context() as conn:
         cursor = conn.cursor()
@@ -64,9 +92,39 @@ def get_entrees_par_data(
             cursor.prefetchrows = 1000
             cursor.execute(sql, binds)
             columns = [desc[0] for desc in cursor.description]
-            rows = cursor.fetchall()
-            result = [_serialize_row(dict(zip(columns, row))) for row in rows]
-            logger.info("✅ Entrées PAR: %d lignes pour PAR%s", len(result), par_bucket)
-            return result
+            rows = [_serialize_row(dict(zip(columns, row))) for row in cursor.fetchall()]
         finally:
             cursor.close()
+
+    buckets = _partition_by_bucket(rows)
+    logger.info(
+        "✅ Entrées PAR: %d lignes (%s)",
+        len(rows),
+        ", ".join(f"PAR{b}={len(v)}" for b, v in buckets.items()),
+    )
+    set_cache(cache_key, buckets, ttl=300)
+    return buckets
+
+
+def get_entrees_par_data(
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    par_bucket: int = 0,
+) -> List[Dict]:
+    """
+    Récupère les entrées PAR et provisions pour une date (dernier jour du mois) et un palier PAR.
+    Servi depuis le résultat partagé de get_entrees_par_all_buckets.
+
+    Args:
+        month: Mois (1-12). Défaut: mois courant.
+        year: Année. Défaut: année courante.
+        par_bucket: Palier PAR (0, 30, 90, 180 ou 360).
+
+    Returns:
+        Liste de dictionnaires (NO_PRET, BLOC, NOM_CLIENT, AGENCE, ENCOURS_TOTAL, PROVISIONS, etc.)
+    """
+    if par_bucket not in PAR_BUCKET_DUREES:
+        raise ValueError("par_bucket doit être 0, 30, 90, 180 ou 360")
+    result = get_entrees_par_all_buckets(month, year)[par_bucket]
+    logger.info("✅ Entrées PAR: %d lignes pour PAR%s", len(result), par_bucket)
+    return result
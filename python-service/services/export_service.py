@@ -0,0 +1,385 @@
+"""
+Exports en flux (NDJSON / CSV / Arrow IPC / Parquet) des extractions volumineuses : requête SQL libre,
+entrées PAR, lignes brutes du snapshot DASH_PAR_GLOBAL.
+
+Les lignes sont lues par lots (fetchmany) et chaque lot est encodé puis envoyé aussitôt : la mémoire
+reste bornée par la taille d'un lot quel que soit le nombre de lignes, et le premier octet part dès le
+premier lot. Si le client se déconnecte, l'appel Oracle en cours est interrompu (connection.cancel())
+et la connexion fermée. Chaque export ouvre sa propre connexion (hors pool) : un téléchargement lent
+ne retient aucune des connexions du pool utilisées par les autres endpoints. Les formats Arrow et Parquet (pyarrow requis) convertissent chaque lot
+en colonnes typées d'après cursor.description (cf. database.arrow).
+"""
+import asyncio
+import csv
+import io
+import logging
+import threading
+import weakref
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from database.arrow import ArrowBatchBuilder, arrow_available, pa
+from database.fetch import Record, iter_record_batches, prepare_records
+from database.oracle import get_oracle_connection
+from routers.responses import dumps
+from services.entrees_par_query import get_query_entrees_par, get_query_entrees_par_all_buckets
+from services.portefeuille_risque_global_query import PORTEFEUILLE_GLOBAL_QUERY
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_ARRAYSIZE = 5000
+
+
+@dataclass(frozen=True)
+class ExportQuery:
+    """Requête d'export : SQL, binds, colonnes NUMBER lues en float, nom du fichier proposé."""
+
+    name: str
+    sql: str
+    binds: Dict[str, Any] = field(default_factory=dict)
+    float_columns: Dict[str, Optional[float]] = field(default_factory=dict)
+
+
+def entrees_par_export(month: int, year: int, par: str = "all") -> ExportQuery:
+    """Entrées PAR du snapshot du mois, un palier (0, 30, 90, 180, 360) ou tous ("all")."""
+    month_year = f"{month:02d}/{year}"
+    if str(par).strip().lower() == "all":
+        sql, binds = get_query_entrees_par_all_buckets(month_year)
+        return ExportQuery(f"entrees_par_{year}{month:02d}", sql, binds)
+    try:
+        par_bucket = int(par)
+    except (TypeError, ValueError):
+        raise ValueError("par doit être 0, 30, 90, 180, 360 ou all")
+    sql, binds = get_query_entrees_par(month_year, par_bucket)
+    return ExportQuery(f"entrees_par{par_bucket}_{year}{month:02d}", sql, binds)
+
+
+def portefeuille_risque_export(month: int, year: int) -> ExportQuery:
+    """Lignes brutes DASH_PAR_GLOBAL du dernier lot du mois (base des agrégats PAR / CAF)."""
+    from services.portefeuille_risque_service import _PAR_GLOBAL_FLOAT_COLUMNS
+
+    return ExportQuery(
+        f"portefeuille_risque_{year}{month:02d}",
+        PORTEFEUILLE_GLOBAL_QUERY,
+        {"month_year": f"{month:02d}/{year}"},
+        _PAR_GLOBAL_FLOAT_COLUMNS,
+    )
+
+
+def sql_export(sql: str) -> ExportQuery:
+    """Requête SQL libre (équivalent en flux de POST /api/oracle/query)."""
+    if not sql or not sql.strip():
+        raise ValueError("La requête SQL est requise")
+    return ExportQuery("query", sql)
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class _NDJSONEncoder:
+    """Une ligne JSON par ligne Oracle."""
+
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+    disposition = "attachment"
+
+    def header(self, stream: "CursorStream") -> bytes:
+        self.fields = stream.fields
+        return b""
+
+    def batch(self, rows: Sequence[Record]) -> bytes:
+        fields = self.fields
+        return b"".join(dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+
+    def error(self, message: str) -> bytes:
+        return dumps({"error": message}) + b"\n"
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class _CSVEncoder:
+    """CSV séparé par « ; » (Excel FR), en-tête = noms de colonnes Oracle."""
+
+    media_type = "text/csv"
+    extension = "csv"
+    disposition = "attachment"
+
+    def __init__(self) -> None:
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, delimiter=";", lineterminator="\r\n")
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def header(self, stream: "CursorStream") -> bytes:
+        self._writer.writerow(stream.fields)
+        return b"\xef\xbb\xbf" + self._drain()
+
+    def batch(self, rows: Sequence[Record]) -> bytes:
+        self._writer.writerows([_csv_value(v) for v in row] for row in rows)
+        return self._drain()
+
+    def error(self, message: str) -> bytes:
+        return b""
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class _ByteSink:
+    """Fichier en écriture seule pour les writers pyarrow : les octets écrits sont repris à chaque lot."""
+
+    closed = False
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class _ArrowStreamEncoder:
+    """
+    Flux Arrow IPC (format « stream ») : schéma puis un RecordBatch par lot, lisible au fil de l'eau
+    (pyarrow.ipc.open_stream, arrow-js, polars). Une erreur en cours de flux le laisse sans marqueur de fin.
+    """
+
+    media_type = "application/vnd.apache.arrow.stream"
+    extension = "arrows"
+    disposition = "inline"
+
+    def header(self, stream: "CursorStream") -> bytes:
+        self._builder = ArrowBatchBuilder(stream.description, stream.query.float_columns)
+        self._sink = _ByteSink()
+        self._writer = pa.ipc.new_stream(self._sink, self._builder.schema)
+        return self._sink.drain()
+
+    def batch(self, rows: Sequence[Record]) -> bytes:
+        self._writer.write_batch(self._builder.batch(rows))
+        return self._sink.drain()
+
+    def error(self, message: str) -> bytes:
+        return b""
+
+    def footer(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+class _ParquetEncoder:
+    """
+    Fichier Parquet à télécharger : un row group par lot, pied de fichier (métadonnées) écrit à la fin.
+    Une erreur en cours de flux donne un fichier sans pied, rejeté par les lecteurs.
+    """
+
+    media_type = "application/vnd.apache.parquet"
+    extension = "parquet"
+    disposition = "attachment"
+
+    def header(self, stream: "CursorStream") -> bytes:
+        self._builder = ArrowBatchBuilder(stream.description, stream.query.float_columns)
+        self._sink = _ByteSink()
+        self._writer = pq.ParquetWriter(self._sink, self._builder.schema, compression="zstd")
+        return self._sink.drain()
+
+    def batch(self, rows: Sequence[Record]) -> bytes:
+        self._writer.write_batch(self._builder.batch(rows))
+        return self._sink.drain()
+
+    def error(self, message: str) -> bytes:
+        return b""
+
+    def footer(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+EXPORT_FORMATS = {
+    "ndjson": _NDJSONEncoder,
+    "csv": _CSVEncoder,
+    "arrow": _ArrowStreamEncoder,
+    "parquet": _ParquetEncoder,
+}
+
+_ARROW_FORMATS = ("arrow", "parquet")
+
+
+def export_encoder(fmt: Optional[str]):
+    """Encodeur du format demandé (ndjson par défaut) ; format inconnu : ValueError."""
+    fmt = (fmt or "ndjson").strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format doit être l'un de: {', '.join(EXPORT_FORMATS)}")
+    if fmt in _ARROW_FORMATS and not (arrow_available() and pq is not None):
+        raise ValueError(f"format {fmt} indisponible : pyarrow n'est pas installé sur le serveur")
+    return EXPORT_FORMATS[fmt]()
+
+
+class CursorStream:
+    """
+    Curseur Oracle ouvert sur une connexion dédiée (hors pool), lu lot par lot depuis des threads.
+
+    ``cancel`` (appelable depuis la boucle asyncio, non bloquant) interrompt l'appel Oracle en cours ;
+    ``close`` attend la fin du lot en cours puis libère curseur et connexion (idempotent).
+    """
+
+    def __init__(self, query: ExportQuery, arraysize: int = EXPORT_ARRAYSIZE) -> None:
+        self.query = query
+        self.arraysize = arraysize
+        self.fields: Tuple[str, ...] = ()
+        self.description: Sequence[Any] = ()
+        self.rows = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._cursor = None
+        self._batches = None
+        self._cancelled = False
+        self._closed = False
+
+    def open(self) -> Tuple[str, ...]:
+        with self._lock:
+            self._conn = get_oracle_connection()
+            try:
+                self._cursor = self._conn.cursor()
+                self.fields = prepare_records(
+                    self._cursor,
+                    self.query.sql,
+                    self.query.binds,
+                    float_columns=self.query.float_columns,
+                    arraysize=self.arraysize,
+                )
+                self.description = self._cursor.description
+            except Exception:
+                self._release()
+                raise
+            self._batches = iter_record_batches(self._cursor)
+            return self.fields
+
+    def fetch(self) -> List[Record]:
+        with self._lock:
+            if self._cancelled or self._batches is None:
+                return []
+            rows = next(self._batches, [])
+            self.rows += len(rows)
+            return rows
+
+    def cancel(self) -> None:
+        if self._closed or self._cancelled:
+            return
+        self._cancelled = True
+        conn = self._conn
+        if conn is not None:
+            try:
+                conn.cancel()
+            except Exception as e:
+                logger.warning(f"⚠️ Annulation Oracle impossible pour l'export {self.query.name}: {e}")
+
+    def _release(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._cursor is not None:
+            try:
+                self._cursor.close()
+            except Exception:
+                pass
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._cursor = self._conn = self._batches = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._release()
+
+    def abandon(self) -> None:
+        """Flux interrompu ou jamais lu : annule l'appel en cours et libère la connexion en arrière-plan."""
+        if self._closed:
+            return
+        self.cancel()
+        threading.Thread(target=self.close, name=f"export-close-{self.query.name}", daemon=True).start()
+
+
+async def open_export(query: ExportQuery) -> CursorStream:
+    """Exécute la requête d'export (erreurs SQL levées ici, avant le début de la réponse)."""
+    stream = CursorStream(query)
+    await run_in_threadpool(stream.open)
+    return stream
+
+
+async def _iter_export(stream: CursorStream, encoder) -> AsyncIterator[bytes]:
+    completed = False
+    try:
+        yield encoder.header(stream)
+        while True:
+            rows = await run_in_threadpool(stream.fetch)
+            if not rows:
+                break
+            yield encoder.batch(rows)
+        if not stream._cancelled:
+            tail = encoder.footer()
+            if tail:
+                yield tail
+            completed = True
+    except asyncio.CancelledError:
+        logger.info(f"⛔ Export {stream.query.name} interrompu par le client après {stream.rows} lignes")
+        raise
+    except Exception as e:
+        logger.error(f"❌ Export {stream.query.name} interrompu après {stream.rows} lignes: {e}", exc_info=True)
+        yield encoder.error(str(e) if str(e) else repr(e))
+        raise
+    finally:
+        if completed:
+            await run_in_threadpool(stream.close)
+            logger.info(f"✅ Export {stream.query.name}: {stream.rows} lignes")
+        else:
+            stream.abandon()
+
+
+def export_body(stream: CursorStream, encoder) -> AsyncIterator[bytes]:
+    """
+    Corps de StreamingResponse pour un export ouvert. Si la réponse est abandonnée avant la fin
+    (déconnexion, y compris avant le premier lot), le curseur est annulé et la connexion fermée.
+    """
+    body = _iter_export(stream, encoder)
+    weakref.finalize(body, stream.abandon)
+    return body
@@ -0,0 +1,295 @@
+"""
+Jobs asynchrones pour les rapports longs (stock de provision, ventes de cartes prépayées, encours).
+
+Un job est soumis (rapport + paramètres), exécuté dans un pool borné de JOB_WORKERS threads, puis son
+résultat est conservé JOB_RESULT_TTL secondes (au plus JOB_MAX_RETAINED jobs terminés) :
+
+- file d'attente bornée : au-delà de JOB_QUEUE_SIZE jobs en attente, la soumission est refusée (JobQueueFull) ;
+- déduplication : un job identique (même rapport, mêmes paramètres) en attente ou en cours est réutilisé ;
+- progression estimée d'après la durée des exécutions précédentes du même rapport ;
+- annulation : job en attente retiré de la file, job en cours interrompu (appel Oracle annulé, cf.
+  database.cancellation).
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from config.settings import JOB_MAX_RETAINED, JOB_QUEUE_SIZE, JOB_RESULT_TTL, JOB_WORKERS
+from database.cancellation import CancelToken, bind
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+_FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Progression estimée plafonnée tant que le job n'est pas terminé
+_MAX_ESTIMATED_PROGRESS = 0.95
+
+
+class JobQueueFull(Exception):
+    """File des jobs pleine : soumission à retenter plus tard."""
+
+
+def _stock_provision(month: Optional[int] = None, year: Optional[int] = None) -> Any:
+    from services.stock_provision_service import get_stock_provision_data
+    return get_stock_provision_data(month=month, year=year)
+
+
+def _prepaid_card_sales(period: str = "month", zone: Optional[str] = None, month: Optional[int] = None,
+                        year: Optional[int] = None, date: Optional[str] = None) -> Any:
+    from services.prepaid_card_service import get_prepaid_card_sales_data
+    return get_prepaid_card_sales_data(period=period, zone=zone, month=month, year=year, date=date)
+
+
+def _encours(period: str = "month", zone: Optional[str] = None, month: Optional[int] = None,
+             year: Optional[int] = None, date: Optional[str] = None, type: str = "compte-courant") -> Any:
+    from services.encours_service import get_encours_data
+    result = get_encours_data(period=period, zone=zone, month=month, year=year, date=date, encours_type=type)
+    # Même contenu que /api/oracle/data/encours
+    return {"data": {"hierarchicalData": result.get("hierarchicalData", {})}}
+
+
+@dataclass(frozen=True)
+class Report:
+    run: Callable[..., Any]
+    params: Tuple[str, ...]
+    int_params: Tuple[str, ...] = ("month", "year")
+
+
+REPORTS: Dict[str, Report] = {
+    "stock-provision": Report(_stock_provision, ("month", "year")),
+    "prepaid-card-sales": Report(_prepaid_card_sales, ("period", "zone", "month", "year", "date")),
+    "encours": Report(_encours, ("period", "zone", "month", "year", "date", "type")),
+}
+
+
+@dataclass
+class Job:
+    id: str
+    report: str
+    params: Dict[str, Any]
+    key: str
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    result: Any = None
+    token: CancelToken = field(default_factory=CancelToken)
+    future: Optional[Future] = None
+
+
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+_inflight: Dict[str, Job] = {}
+_durations: Dict[str, float] = {}
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+    return _executor
+
+
+def _normalize_params(report: Report, params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Paramètres connus du rapport, sans valeurs nulles, entiers convertis. Paramètre invalide : ValueError."""
+    params = params or {}
+    unknown = [name for name in params if name not in report.params]
+    if unknown:
+        raise ValueError(f"Paramètre(s) inconnu(s): {', '.join(unknown)}. Paramètres acceptés: {', '.join(report.params)}")
+    normalized: Dict[str, Any] = {}
+    for name in report.params:
+        value = params.get(name)
+        if value is None or value == "":
+            continue
+        if name in report.int_params:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} doit être un entier: {value!r}")
+        else:
+            value = str(value)
+        normalized[name] = value
+    return normalized
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds") if timestamp is not None else None
+
+
+def _progress(job: Job, now: float) -> Optional[float]:
+    if job.status == SUCCEEDED:
+        return 1.0
+    if job.status != RUNNING or job.started_at is None:
+        return 0.0 if job.status == QUEUED else None
+    expected = _durations.get(job.report)
+    if not expected:
+        return None
+    return round(min(_MAX_ESTIMATED_PROGRESS, (now - job.started_at) / expected), 2)
+
+
+def job_status(job: Job) -> Dict[str, Any]:
+    """État d'un job pour l'API (sans le résultat)."""
+    now = time.time()
+    with _lock:
+        position = None
+        if job.status == QUEUED:
+            position = sum(1 for other in _jobs.values() if other.status == QUEUED and other.created_at <= job.created_at)
+        end = job.finished_at if job.finished_at is not None else now
+        return {
+            "id": job.id,
+            "report": job.report,
+            "params": job.params,
+            "status": job.status,
+            "cancelRequested": job.token.cancelled and job.status == RUNNING,
+            "progress": _progress(job, now),
+            "queuePosition": position,
+            "createdAt": _iso(job.created_at),
+            "startedAt": _iso(job.started_at),
+            "finishedAt": _iso(job.finished_at),
+            "elapsed": round(end - job.started_at, 3) if job.started_at is not None else None,
+            "expiresAt": _iso(job.finished_at + JOB_RESULT_TTL) if job.finished_at is not None else None,
+            "error": job.error,
+            "statusUrl": f"/api/jobs/{job.id}",
+            "resultUrl": f"/api/jobs/{job.id}/result" if job.status == SUCCEEDED else None,
+        }
+
+
+def _purge(now: float) -> None:
+    """Retire les jobs terminés expirés puis les plus anciens au-delà de JOB_MAX_RETAINED (sous _lock)."""
+    finished = [job for job in _jobs.values() if job.status in _FINISHED]
+    expired = {job.id for job in finished if now - job.finished_at > JOB_RESULT_TTL}
+    overflow = len(finished) - len(expired) - JOB_MAX_RETAINED
+    if overflow > 0:
+        remaining = sorted((job for job in finished if job.id not in expired), key=lambda job: job.finished_at)
+        expired.update(job.id for job in remaining[:overflow])
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def _finish(job: Job, status: str, result: Any = None, error: Optional[str] = None) -> None:
+    with _lock:
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        if _inflight.get(job.key) is job:
+            del _inflight[job.key]
+        if status == SUCCEEDED and job.started_at is not None:
+            duration = job.finished_at - job.started_at
+            previous = _durations.get(job.report)
+            _durations[job.report] = duration if previous is None else 0.7 * previous + 0.3 * duration
+
+
+def _run(job: Job) -> None:
+    with _lock:
+        if job.status != QUEUED:
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+    logger.info(f"▶️ Job {job.id} ({job.report} {job.params}) démarré")
+    try:
+        with bind(job.token):
+            job.token.raise_if_cancelled()
+            result = REPORTS[job.report].run(**job.params)
+        job.token.raise_if_cancelled()
+    except Exception as e:
+        if job.token.cancelled:
+            _finish(job, CANCELLED)
+            logger.info(f"⏹️ Job {job.id} annulé")
+            return
+        message = e.detail if isinstance(e, HTTPException) else (str(e) or repr(e))
+        _finish(job, FAILED, error=str(message))
+        logger.error(f"❌ Job {job.id} ({job.report}) en échec: {message}", exc_info=True)
+        return
+    _finish(job, SUCCEEDED, result=result)
+    logger.info(f"✅ Job {job.id} terminé en {job.finished_at - job.started_at:.1f} s")
+
+
+def submit_job(report: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Job, bool]:
+    """
+    Soumet un job ; renvoie (job, dédupliqué). Rapport ou paramètres invalides : ValueError ;
+    file pleine : JobQueueFull.
+    """
+    definition = REPORTS.get(report)
+    if definition is None:
+        raise ValueError(f"Rapport inconnu: {report}. Rapports disponibles: {', '.join(REPORTS)}")
+    params = _normalize_params(definition, params)
+    key = hashlib.sha1(json.dumps([report, params], sort_keys=True).encode("utf-8")).hexdigest()
+    with _lock:
+        _purge(time.time())
+        existing = _inflight.get(key)
+        if existing is not None:
+            return existing, True
+        queued = sum(1 for job in _jobs.values() if job.status == QUEUED)
+        if queued >= JOB_QUEUE_SIZE:
+            raise JobQueueFull(f"{queued} job(s) en attente (JOB_QUEUE_SIZE={JOB_QUEUE_SIZE})")
+        job = Job(id=uuid.uuid4().hex, report=report, params=params, key=key)
+        _jobs[job.id] = job
+        _inflight[key] = job
+        job.future = _get_executor().submit(_run, job)
+    logger.info(f"📥 Job {job.id} ({report} {params}) en file ({queued + 1} en attente)")
+    return job, False
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    """Job par identifiant, None s'il est inconnu ou expiré."""
+    with _lock:
+        _purge(time.time())
+        return _jobs.get(job_id)
+
+
+def list_jobs() -> List[Job]:
+    with _lock:
+        _purge(time.time())
+        return list(_jobs.values())
+
+
+def cancel_job(job_id: str) -> Optional[Job]:
+    """
+    Annule un job en attente (retiré de la file) ou en cours (appel Oracle interrompu) ; un job terminé
+    est supprimé avec son résultat. None si le job est inconnu.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        if job.status in _FINISHED:
+            del _jobs[job_id]
+            return job
+        job.token.cancel()
+        queued = job.status == QUEUED
+        if queued and job.future is not None:
+            job.future.cancel()
+    if queued:
+        _finish(job, CANCELLED)
+        logger.info(f"⏹️ Job {job.id} retiré de la file")
+    return job
+
+
+def shutdown_jobs() -> None:
+    """Annule les jobs en attente / en cours et arrête les threads (arrêt de l'application)."""
+    global _executor
+    with _lock:
+        jobs = [job for job in _jobs.values() if job.status not in _FINISHED]
+    for job in jobs:
+        cancel_job(job.id)
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,292 @@
+"""
+Pagination, tri et filtres côté serveur des endpoints « ligne à ligne » (entrées PAR, lignes CAF du PAR,
+lignes de domiciliation de flux).
+
+Les lignes viennent du résultat déjà en cache du service (snapshot DASH en mémoire) : aucune requête
+Oracle par page. Pour un jeu de lignes, un tri et des filtres donnés, la vue triée est construite une
+fois puis réutilisée. Le curseur (opaque, « keyset ») porte la clé de la dernière ligne de la page
+précédente : valeurs des colonnes triées, clé naturelle et rang dans le snapshot. La page suivante
+part de cette ligne, retrouvée par son rang ; si elle a disparu (nouveau lot), par recherche
+dichotomique sur la clé. Ni décalage (offset) ni re-tri.
+"""
+import base64
+import bisect
+import json
+import logging
+import math
+import numbers
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cmp_to_key
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from services.rollup_service import resolve_territory_key
+from services.utils import get_territory_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_LIMIT = 500
+MAX_PAGE_LIMIT = 5000
+_VIEW_CACHE_SIZE = 32
+
+
+@dataclass(frozen=True)
+class RowSource:
+    """Colonnes d'un jeu de lignes : agence, code agence, CAF, clé naturelle (départage du tri)."""
+
+    name: str
+    agency: str = "AGENCE"
+    branch_code: Optional[str] = None
+    caf: str = "CHARGE_AFFAIRE"
+    key: Tuple[str, ...] = ()
+    service_points: bool = False
+
+
+ENTREES_PAR_ROWS = RowSource("entrees-par", branch_code="CODE_AGENCE", key=("NO_PRET",))
+PAR_CAF_ROWS = RowSource(
+    "portefeuille-risque", branch_code="CODE_AGENCE", key=("AGENCE", "CODE_GESTION_PRET"), service_points=True
+)
+DOMICILIATION_ROWS = RowSource("domiciliation-flux", branch_code="BRANCH_CODE", key=("BRANCH_CODE", "CODE_GESTION_PRET"))
+
+
+@dataclass(frozen=True)
+class RowQuery:
+    """Page demandée : taille, curseur, tri ((colonne, décroissant), ...) et filtres (valeurs normalisées)."""
+
+    limit: int = DEFAULT_PAGE_LIMIT
+    cursor: Optional[str] = None
+    sort: Tuple[Tuple[str, bool], ...] = ()
+    agencies: Tuple[str, ...] = ()
+    cafs: Tuple[str, ...] = ()
+    territories: Tuple[str, ...] = ()
+
+    @property
+    def sort_spec(self) -> str:
+        return ",".join(("-" if descending else "") + column for column, descending in self.sort)
+
+
+def _normalize(value: Any) -> str:
+    return " ".join(str(value or "").upper().split())
+
+
+def _split(value: Optional[str]) -> Tuple[str, ...]:
+    return tuple(dict.fromkeys(v for v in (_normalize(item) for item in (value or "").split(",")) if v))
+
+
+def _territory_filter(value: Optional[str]) -> Tuple[str, ...]:
+    """Territoires par clé (territoire_dakar_ville) ou par nom (DAKAR VILLE, TERRITOIRE PROVINCE NORD)."""
+    keys = []
+    for name in _split(value):
+        key = name.lower() if name.startswith("TERRITOIRE_") else get_territory_key(name)
+        keys.append(key)
+    return tuple(dict.fromkeys(keys))
+
+
+def parse_row_query(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    agency: Optional[str] = None,
+    caf: Optional[str] = None,
+    territory: Optional[str] = None,
+) -> Optional[RowQuery]:
+    """
+    Paramètres de pagination d'un endpoint. None si aucun n'est fourni (réponse complète, inchangée).
+
+    sort : colonnes séparées par des virgules, « - » en tête pour l'ordre décroissant (ex. -ENCOURS_TOTAL,AGENCE).
+    agency / caf / territory : une ou plusieurs valeurs séparées par des virgules.
+    Paramètre invalide : ValueError.
+    """
+    if limit is None and not any((cursor, sort, agency, caf, territory)):
+        return None
+    if limit is None:
+        limit = DEFAULT_PAGE_LIMIT
+    if not 1 <= limit <= MAX_PAGE_LIMIT:
+        raise ValueError(f"limit doit être compris entre 1 et {MAX_PAGE_LIMIT}")
+    columns = []
+    for item in (sort or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        descending = item.startswith("-")
+        column = item.lstrip("+-").strip().upper()
+        if not column:
+            raise ValueError(f"sort invalide: {sort}")
+        columns.append((column, descending))
+    return RowQuery(
+        limit=limit,
+        cursor=cursor or None,
+        sort=tuple(columns),
+        agencies=_split(agency),
+        cafs=_split(caf),
+        territories=_territory_filter(territory),
+    )
+
+
+_NULL_LAST = (1, 0, 0.0)
+_NULL_LAST_REVERSED = (0, 0, 0.0)
+
+
+def _ascending_key(value: Any) -> Tuple:
+    """Clé de tri d'une valeur : nombres, puis textes ; NULL (et NaN) en fin."""
+    kind = type(value)
+    if kind is str:
+        return (0, 1, value)
+    if kind is float or kind is int:
+        return (0, 0, float(value)) if value == value else _NULL_LAST
+    if value is None:
+        return _NULL_LAST
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        return (0, 0, float(value)) if not math.isnan(value) else _NULL_LAST
+    return (0, 1, str(value))
+
+
+def _descending_key(value: Any) -> Tuple:
+    # Trié avec reverse=True : NULL (et NaN) restent en fin comme en ordre croissant
+    key = _ascending_key(value)
+    return _NULL_LAST_REVERSED if key is _NULL_LAST else (1,) + key[1:]
+
+
+def _compare_keys(a: Sequence[Any], b: Sequence[Any], directions: Sequence[bool]) -> int:
+    """Comparaison de deux clés brutes (tri demandé, clé naturelle, rang) dans l'ordre de la vue."""
+    for x, y, descending in zip(a, b, directions):
+        if descending:
+            kx, ky = _descending_key(y), _descending_key(x)
+        else:
+            kx, ky = _ascending_key(x), _ascending_key(y)
+        if kx != ky:
+            return -1 if kx < ky else 1
+    return 0
+
+
+def _raw_key(row: Dict, ordinal: int, sort: Tuple[Tuple[str, bool], ...], source: RowSource) -> List[Any]:
+    return [row.get(column) for column, _ in sort] + [row.get(column) for column in source.key] + [ordinal]
+
+
+def _encode_cursor(sort_spec: str, raw_key: List[Any]) -> str:
+    payload = json.dumps({"s": sort_spec, "k": raw_key}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort_spec: str) -> List[Any]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        raw_key = payload["k"]
+        spec = payload["s"]
+        if not isinstance(raw_key, list) or not raw_key or not isinstance(raw_key[-1], int):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("cursor invalide")
+    if spec != sort_spec:
+        raise ValueError("cursor obtenu avec un autre tri (sort) : reprendre depuis la première page")
+    return raw_key
+
+
+class _View:
+    """Lignes filtrées et triées d'un jeu de lignes : rang (dans le snapshot) des lignes, dans l'ordre de la vue."""
+
+    __slots__ = ("source_rows", "source", "sort", "ordinals", "positions", "directions")
+
+    def __init__(self, source_rows: List[Dict], source: RowSource, query: RowQuery, ordinals: List[int]):
+        self.source_rows = source_rows
+        self.source = source
+        self.sort = query.sort
+        self.ordinals = ordinals
+        self.positions = {ordinal: i for i, ordinal in enumerate(ordinals)}
+        self.directions = [descending for _, descending in query.sort] + [False] * (len(source.key) + 1)
+
+    def __len__(self) -> int:
+        return len(self.ordinals)
+
+    def rows(self, start: int, end: int) -> List[Dict]:
+        return [self.source_rows[ordinal] for ordinal in self.ordinals[start:end]]
+
+    def raw_key(self, position: int) -> List[Any]:
+        ordinal = self.ordinals[position]
+        return _raw_key(self.source_rows[ordinal], ordinal, self.sort, self.source)
+
+    def start_after(self, raw_key: List[Any]) -> int:
+        """Indice de la première ligne après la clé du curseur."""
+        position = self.positions.get(raw_key[-1])
+        if position is not None and self.raw_key(position) == raw_key:
+            return position + 1
+        # Ligne du curseur absente de la vue (filtre, nouveau lot) : recherche par comparaison des clés
+        key = cmp_to_key(lambda a, b: _compare_keys(a, b, self.directions))
+        return bisect.bisect_right(range(len(self)), key(raw_key), key=lambda p: key(self.raw_key(p)))
+
+
+_views: "OrderedDict[Tuple, _View]" = OrderedDict()
+_views_lock = threading.Lock()
+
+
+def _matches(row: Dict, source: RowSource, query: RowQuery) -> bool:
+    if query.agencies:
+        agency = _normalize(row.get(source.agency))
+        branch_code = _normalize(row.get(source.branch_code)) if source.branch_code else ""
+        if agency not in query.agencies and (not branch_code or branch_code not in query.agencies):
+            return False
+    if query.cafs and _normalize(row.get(source.caf)) not in query.cafs:
+        return False
+    if query.territories:
+        branch_code = row.get(source.branch_code) if source.branch_code else None
+        territory = resolve_territory_key(branch_code, row.get(source.agency), source.service_points)
+        if territory not in query.territories:
+            return False
+    return True
+
+
+def _build_view(rows: List[Dict], source: RowSource, query: RowQuery) -> _View:
+    if rows and query.sort:
+        unknown = [column for column, _ in query.sort if column not in rows[0]]
+        if unknown:
+            raise ValueError(
+                f"Colonne(s) de tri inconnue(s): {', '.join(unknown)}. Colonnes disponibles: {', '.join(rows[0])}"
+            )
+    if query.agencies or query.cafs or query.territories:
+        ordinals = [ordinal for ordinal, row in enumerate(rows) if _matches(row, source, query)]
+    else:
+        ordinals = list(range(len(rows)))
+    # Tris successifs stables des rangs, de la dernière colonne à la première (clé naturelle puis tri demandé)
+    columns = list(query.sort) + [(column, False) for column in source.key]
+    for column, descending in reversed(columns):
+        key = _descending_key if descending else _ascending_key
+        keys = [key(row.get(column)) for row in rows]
+        ordinals.sort(key=keys.__getitem__, reverse=descending)
+    return _View(rows, source, query, ordinals)
+
+
+def _get_view(rows: List[Dict], source: RowSource, query: RowQuery) -> _View:
+    """Vue mémorisée par (jeu de lignes en cache, tri, filtres) ; reconstruite si le cache a été renouvelé."""
+    view_key = (source.name, id(rows), len(rows), query.sort, query.agencies, query.cafs, query.territories)
+    with _views_lock:
+        view = _views.get(view_key)
+        if view is not None and view.source_rows is rows:
+            _views.move_to_end(view_key)
+            return view
+    view = _build_view(rows, source, query)
+    with _views_lock:
+        _views[view_key] = view
+        while len(_views) > _VIEW_CACHE_SIZE:
+            _views.popitem(last=False)
+    return view
+
+
+def paginate_rows(rows: List[Dict], source: RowSource, query: RowQuery) -> Tuple[List[Dict], Dict[str, Any]]:
+    """
+    Page de lignes et ses métadonnées :
+    {"limit", "count", "total" (lignes après filtres), "sort", "nextCursor" (None sur la dernière page)}.
+    """
+    view = _get_view(rows, source, query)
+    start = 0
+    if query.cursor:
+        start = view.start_after(_decode_cursor(query.cursor, query.sort_spec))
+    end = min(start + query.limit, len(view))
+    next_cursor = _encode_cursor(query.sort_spec, view.raw_key(end - 1)) if end < len(view) else None
+    return view.rows(start, end), {
+        "limit": query.limit,
+        "count": end - start,
+        "total": len(view),
+        "sort": query.sort_spec or None,
+        "nextCursor": next_cursor,
+    }
@@ -0,0 +1,254 @@
+"""
+Fenêtre de période unique (M / M-1, semaine, année, snapshot DASH) pour tous les services.
+
+Un ``PeriodWindow`` immuable est calculé une fois par combinaison (period, month, year, date, jour courant)
+puis mémorisé : les services le reçoivent (ou le redemandent, ce qui est gratuit) au lieu de recalculer
+chacun leurs bornes de dates, leur mode MIGRATION_DATE_MINUS1 et leurs binds.
+"""
+import calendar
+import logging
+from dataclasses import dataclass, replace
+from datetime import date as dt_date
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ("month", "week", "year")
+
+
+def _normalize_period(period: Optional[str]) -> str:
+    """
+    Période en minuscules ; inconnue ou vide → "month".
+
+    Une période inconnue (ex. ``period=day``) avec month / year donne donc le mois demandé. L'ancien
+    calculate_period_dates (clients, cartes prépayées) renvoyait dans ce cas le mois courant en ignorant
+    month / year ; les autres services lisaient déjà month / year : toutes les fenêtres suivent cette règle.
+    """
+    p = str(period).strip().lower() if period else "month"
+    return p if p in PERIODS else "month"
+
+
+def _as_int(value: Any) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_day(date_str: Optional[str]) -> Optional[dt_date]:
+    """Date YYYY-MM-DD de l'UI, None si absente ou invalide."""
+    if not date_str:
+        return None
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d").date()
+    except (ValueError, TypeError):
+        return None
+
+
+def _month_bounds(year: int, month: int) -> Tuple[dt_date, dt_date]:
+    return dt_date(year, month, 1), dt_date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _previous_month(year: int, month: int) -> Tuple[int, int]:
+    return (year - 1, 12) if month == 1 else (year, month - 1)
+
+
+def _monday_sunday_week(containing: dt_date) -> Tuple[dt_date, dt_date]:
+    """Semaine calendaire lundi → dimanche (containing peut être n’importe quel jour de la semaine)."""
+    monday = containing - timedelta(days=containing.weekday())
+    return monday, monday + timedelta(days=6)
+
+
+def _fmt(d: dt_date) -> str:
+    return d.strftime("%d/%m/%Y")
+
+
+@dataclass(frozen=True)
+class PeriodWindow:
+    """
+    Fenêtre d'analyse résolue.
+
+    Attributes:
+        period: "month", "week" ou "year"
+        month, year: mois / année de référence du filtre UI (mois courant par défaut)
+        m_start, m_end: bornes de la période M (mois, semaine lundi → dimanche ou année)
+        m1_start, m1_end: bornes de la période de comparaison (M-1, S-1 ou N-1)
+        week_start, week_end: semaine DASH (period == "week" uniquement)
+        dash_mode: filtre MIGRATION_DATE_MINUS1 — "day" (veille, mois en cours), "month", "week" ou "year"
+        dash_binds: binds du filtre DASH, en paires (nom, valeur)
+        today: jour de calcul (la fenêtre du mois en cours en dépend)
+    """
+
+    period: str
+    month: int
+    year: int
+    m_start: dt_date
+    m_end: dt_date
+    m1_start: dt_date
+    m1_end: dt_date
+    week_start: Optional[dt_date]
+    week_end: Optional[dt_date]
+    dash_mode: str
+    dash_binds: Tuple[Tuple[str, str], ...]
+    today: dt_date
+
+    @property
+    def month_year(self) -> str:
+        """Mois de référence au format MM/YYYY."""
+        return f"{self.month:02d}/{self.year}"
+
+    @property
+    def snapshot_month_year(self) -> str:
+        """Snapshot DASH mensuel (MM/YYYY) : mois sélectionné, décembre pour l'année, mois du dimanche pour la semaine."""
+        if self.period == "month":
+            return self.month_year
+        return f"{self.m_end.month:02d}/{self.m_end.year}"
+
+    @property
+    def viewing_current_month(self) -> bool:
+        return (self.year, self.month) == (self.today.year, self.today.month)
+
+    @property
+    def snapshot_target(self) -> dt_date:
+        """Ancre calendaire : veille si le mois affiché est le mois en cours, sinon dernier jour du mois."""
+        if self.viewing_current_month:
+            return self.today - timedelta(days=1)
+        return _month_bounds(self.year, self.month)[1]
+
+    @property
+    def week_range(self) -> Optional[Tuple[str, str]]:
+        """(lundi, dimanche) DD/MM/YYYY de la semaine DASH, None hors période semaine."""
+        if self.week_start is None:
+            return None
+        return _fmt(self.week_start), _fmt(self.week_end)
+
+    def dash(self, allow_day: bool = True) -> Tuple[str, Dict[str, str]]:
+        """
+        (mode, binds) du filtre MIGRATION_DATE_MINUS1.
+
+        allow_day=False : le mois en cours reste en mode MM/YYYY (tables DASH sans chargement quotidien).
+        """
+        if self.dash_mode == "day" and not allow_day:
+            return "month", {"month_year": self.month_year}
+        return self.dash_mode, dict(self.dash_binds)
+
+    def period_dates(self) -> Dict[str, str]:
+        """Bornes M / M-1 au format DD/MM/YYYY (clés historiques de calculate_period_dates)."""
+        return {
+            "date_m_debut_str": _fmt(self.m_start),
+            "date_m_fin_str": _fmt(self.m_end),
+            "date_m1_debut_str": _fmt(self.m1_start),
+            "date_m1_fin_str": _fmt(self.m1_end),
+        }
+
+    @property
+    def cache_key(self) -> str:
+        """Fragment de clé de cache identifiant la fenêtre (bornes + filtre DASH)."""
+        return ":".join((
+            self.period,
+            f"{self.m_start:%Y%m%d}-{self.m_end:%Y%m%d}",
+            f"{self.m1_start:%Y%m%d}-{self.m1_end:%Y%m%d}",
+            self.dash_mode,
+            *(value for _, value in self.dash_binds),
+        ))
+
+    def with_reference(self, month: Optional[int], year: Optional[int]) -> "PeriodWindow":
+        """Même fenêtre avec un mois de comparaison explicite (month_ref / year_ref) ; inchangée si incomplet."""
+        if not month or not year:
+            return self
+        m1_start, m1_end = _month_bounds(int(year), int(month))
+        return replace(self, m1_start=m1_start, m1_end=m1_end)
+
+    def with_bounds(self, start: dt_date, end: dt_date) -> "PeriodWindow":
+        """Même fenêtre avec une période M explicite [start, end] (ex. mois en cours « à date »)."""
+        return replace(self, m_start=start, m_end=end)
+
+
+def _ref_month_year(
+    period: str,
+    month: Optional[int],
+    year: Optional[int],
+    date_str: Optional[str],
+    day: Optional[dt_date],
+    today: dt_date,
+) -> Tuple[int, int]:
+    """Mois / année correspondant au filtre UI (défaut : mois courant)."""
+    if period == "week" and date_str:
+        return (day or today).month, (day or today).year
+    if period == "year" and year:
+        return 1, year
+    if month and year:
+        return month, year
+    if day:
+        return day.month, day.year
+    return today.month, today.year
+
+
+@lru_cache(maxsize=512)
+def _period_window(
+    period: str,
+    month: Optional[int],
+    year: Optional[int],
+    date_str: Optional[str],
+    today: dt_date,
+) -> PeriodWindow:
+    day = _parse_day(date_str)
+    ref_m, ref_y = _ref_month_year(period, month, year, date_str, day, today)
+
+    week_start = week_end = None
+    if period == "week":
+        week_start, week_end = _monday_sunday_week(day or today)
+        m_start, m_end = week_start, week_end
+        m1_start, m1_end = week_start - timedelta(days=7), week_start - timedelta(days=1)
+        dash_mode, dash_binds = "week", (("week_start", _fmt(week_start)), ("week_end", _fmt(week_end)))
+    elif period == "year":
+        y = year or today.year
+        m_start, m_end = dt_date(y, 1, 1), dt_date(y, 12, 31)
+        m1_start, m1_end = dt_date(y - 1, 1, 1), dt_date(y - 1, 12, 31)
+        dash_mode, dash_binds = "year", (("year_only", f"{y:04d}"),)
+    else:
+        m_start, m_end = _month_bounds(ref_y, ref_m)
+        m1_start, m1_end = _month_bounds(*_previous_month(ref_y, ref_m))
+        if (ref_y, ref_m) == (today.year, today.month):
+            dash_mode, dash_binds = "day", (("migration_target", _fmt(today - timedelta(days=1))),)
+        else:
+            dash_mode, dash_binds = "month", (("month_year", f"{ref_m:02d}/{ref_y}"),)
+
+    window = PeriodWindow(
+        period=period,
+        month=ref_m,
+        year=ref_y,
+        m_start=m_start,
+        m_end=m_end,
+        m1_start=m1_start,
+        m1_end=m1_end,
+        week_start=week_start,
+        week_end=week_end,
+        dash_mode=dash_mode,
+        dash_binds=dash_binds,
+        today=today,
+    )
+    logger.debug(f"📅 Fenêtre {window.cache_key} (period={period}, month={month}, year={year}, date={date_str})")
+    return window
+
+
+def period_window(
+    period: Optional[str] = "month",
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    date: Optional[str] = None,
+) -> PeriodWindow:
+    """
+    Fenêtre mémorisée pour un filtre UI.
+
+    Args:
+        period: "month", "week" ou "year" (autre valeur → "month" sur month / year, cf. _normalize_period)
+        month: Mois (1-12)
+        year: Année
+        date: Date YYYY-MM-DD (semaine : jour de la semaine voulue ; défaut aujourd'hui)
+    """
+    return _period_window(_normalize_period(period), _as_int(month), _as_int(year), date or None, dt_date.today())
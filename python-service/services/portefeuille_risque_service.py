@@ -2,15 +2,195 @@
 Service pour la gestion des données de portefeuille à risque (PAR)
 """
 import logging
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 from datetime import datetime
 import calendar
+
+import numpy as np
+import pandas as pd
+
+from database.fetch import fetch_records, float_defaults
 from database.oracle import get_oracle_connection
-from services.utils import get_territory_from_agency, get_territory_from_branch_code, get_territory_key, get_all_territories
+from services.cache_service import get_cache, set_cache
+from services.rollup_service import (
+    TERRITORY_LAYOUT,
+    RollupSpec,
+    difference,
+    rollup,
+    total,
+    variation_pct,
+)
 from services.portefeuille_risque_global_query import PORTEFEUILLE_GLOBAL_QUERY
 
 logger = logging.getLogger(__name__)
 
+# Montants / ratios DASH_PAR_GLOBAL lus en float par le driver, NULL → 0
+_PAR_GLOBAL_FLOAT_COLUMNS = float_defaults((
+    "ENCOURS_TOTAL", "ENCOURS_IMPAYE", "NOMBRE_DOSSIER",
+    "RATIO_ENCOURS_IMPAYE", "RATIO_NOMBRE_IMPAYE", "PROVISION_TOTAL",
+    "ENCOURS_PAR_0", "PAR_0", "ENCOURS_PAR_30", "PAR_30", "ENCOURS_PAR_90", "PAR_90",
+    "ENCOURS_PAR_180", "PAR_180", "ENCOURS_PAR_360", "PAR_360",
+))
+
+PAR_BUCKETS = (0, 30, 90, 180, 360)
+
+_PAR_FRAME_AMOUNTS = (
+    "ENCOURS_TOTAL", "ENCOURS_IMPAYE", "NOMBRE_DOSSIER",
+    "RATIO_ENCOURS_IMPAYE", "RATIO_NOMBRE_IMPAYE", "PROVISION_TOTAL",
+) + tuple(f"ENCOURS_PAR_{b}" for b in PAR_BUCKETS)
+
+
+def _par_frame(rows) -> pd.DataFrame:
+    """Lignes DASH_PAR_GLOBAL → DataFrame : clés agence / code gestion normalisées, montants NULL → 0."""
+    columns = list(rows[0].keys()) if rows else ["BRANCH_NAME", "CODE_GESTION_PRET", "CHARGE_AFFAIRE"]
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    for col in ("BRANCH_NAME", "CODE_GESTION_PRET", "CHARGE_AFFAIRE"):
+        if col not in df.columns:
+            df[col] = None
+    for col in _PAR_FRAME_AMOUNTS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0) if col in df.columns else 0.0
+    df["NOMBRE_DOSSIER"] = df["NOMBRE_DOSSIER"].astype("int64")
+    df["BRANCH"] = df["BRANCH_NAME"].fillna("").astype(str).str.strip().replace("", "-")
+    df["CODE"] = df["CODE_GESTION_PRET"].fillna("").astype(str).str.strip()
+    return df
+
+
+def _par_caf_rows(df_m: pd.DataFrame, df_m1: pd.DataFrame) -> List[Dict]:
+    """Une ligne par (agence, code gestion) du mois M, montants PAR M-1 rapprochés par jointure sur la clé."""
+    prev = df_m1.drop_duplicates(["BRANCH", "CODE"], keep="last")[
+        ["BRANCH", "CODE"] + [f"ENCOURS_PAR_{b}" for b in PAR_BUCKETS]
+    ].rename(columns={f"ENCOURS_PAR_{b}": f"PAR_{b}_M_1" for b in PAR_BUCKETS})
+    merged = df_m.merge(prev, on=["BRANCH", "CODE"], how="left", sort=False)
+
+    out = pd.DataFrame({
+        "AGENCE": merged["BRANCH"],
+        "CODE_AGENCE": "",
+        "CHARGE_AFFAIRE": merged["CHARGE_AFFAIRE"].fillna(""),
+        "CODE_GESTION_PRET": merged["CODE"],
+        "ENCOURS_TOTAL": merged["ENCOURS_TOTAL"],
+        "ENCOURS_IMPAYE": merged["ENCOURS_IMPAYE"],
+        "NOMBRE_DOSSIER": merged["NOMBRE_DOSSIER"],
+        "RATIO_ENCOURS_IMPAYE": merged["RATIO_ENCOURS_IMPAYE"],
+        "RATIO_NOMBRE_IMPAYE": merged["RATIO_NOMBRE_IMPAYE"],
+    })
+    for b in PAR_BUCKETS:
+        out[f"PAR_{b}_M_1"] = merged[f"PAR_{b}_M_1"].fillna(0.0)
+        out[f"PAR_{b}_M"] = merged[f"ENCOURS_PAR_{b}"]
+    return out.to_dict("records")
+
+
+def _par_agency_rows(df_m: pd.DataFrame, df_m1: pd.DataFrame) -> List[Dict]:
+    """Agrégat par agence (M et M-1) et PAR de chaque tranche en % de l'encours."""
+    columns = ["ENCOURS_TOTAL", "NOMBRE_DOSSIER", "PROVISION_TOTAL"] + [f"ENCOURS_PAR_{b}" for b in PAR_BUCKETS]
+    agg_m = df_m.groupby("BRANCH", sort=False)[columns].sum()
+    agg_m1 = df_m1.groupby("BRANCH", sort=False)[columns].sum()
+    branches = agg_m.index.append(agg_m1.index.difference(agg_m.index, sort=False))
+    m = agg_m.reindex(branches, fill_value=0)
+    m1 = agg_m1.reindex(branches, fill_value=0)
+
+    enc_m = m["ENCOURS_TOTAL"].to_numpy(dtype=float)
+    enc_m1 = m1["ENCOURS_TOTAL"].to_numpy(dtype=float)
+    out = pd.DataFrame({
+        "AGENCE": branches,
+        "CODE_AGENCE": "",
+        "ENCOURS_M": enc_m,
+        "ENCOURS_M_1": enc_m1,
+        "PROVISIONS": m["PROVISION_TOTAL"].to_numpy(dtype=float),
+        "NBRE_DOSSIERS": m["NOMBRE_DOSSIER"].to_numpy(dtype="int64"),
+    })
+    for b in PAR_BUCKETS:
+        out[f"PAR_{b}_M_1"] = _pct_of(m1[f"ENCOURS_PAR_{b}"].to_numpy(dtype=float), enc_m1)
+        out[f"PAR_{b}_M"] = _pct_of(m[f"ENCOURS_PAR_{b}"].to_numpy(dtype=float), enc_m)
+    return out.to_dict("records")
+
+
+def _pct_of(num: np.ndarray, den: np.ndarray, ndigits: int = 2) -> np.ndarray:
+    """num / den * 100 arrondi, 0 quand le dénominateur est nul."""
+    return np.round(np.divide(num, den, out=np.zeros_like(num), where=den != 0) * 100, ndigits)
+
+
+def _normalize_agency(name: str) -> str:
+    """Clé agence pour le filtre CAF : majuscules, espaces normalisés."""
+    return " ".join(str(name).upper().split())
+
+
+def _caf_metrics(rows: List[Dict], by: List[str]) -> List[Dict]:
+    """
+    Agrège les lignes CAF (sortie de _par_caf_rows) par ``by`` (["CAF"], ["AGENCE_KEY", "CAF"]
+    ou ["AGENCE_NORM", "CAF"]) :
+    encours = somme des tranches PAR du mois, PAR en % de cet encours, ratio nombre impayés pondéré.
+    """
+    if not rows:
+        return []
+    df = pd.DataFrame.from_records(rows)
+    par_m = df[[f"PAR_{b}_M" for b in PAR_BUCKETS]].to_numpy(dtype=float)
+    encours_ligne = par_m.sum(axis=1)
+    work = pd.DataFrame({
+        "AGENCE_KEY": df["AGENCE"].fillna("").astype(str).str.strip().replace("", "-"),
+        "AGENCE_NORM": df["AGENCE"].fillna("").astype(str).map(_normalize_agency),
+        "CAF": df["CHARGE_AFFAIRE"].fillna("").astype(str).str.strip().replace("", "-"),
+        "lignes": 1,
+        "dossiers": df["NOMBRE_DOSSIER"].fillna(0).astype("int64"),
+        "impaye": df["ENCOURS_IMPAYE"].astype(float),
+        "encours": encours_ligne,
+        "ratio_pondere": np.where(encours_ligne > 0, df["RATIO_NOMBRE_IMPAYE"].astype(float) * encours_ligne, 0.0),
+    })
+    for i, b in enumerate(PAR_BUCKETS):
+        work[f"par{b}"] = par_m[:, i]
+    g = work.groupby(by, sort=False).sum(numeric_only=True)
+
+    encours = g["encours"].to_numpy(dtype=float)
+    has_encours = encours > 0
+    impaye = g["impaye"].to_numpy(dtype=float)
+    ratio_encours_impaye = _pct_of(impaye, np.where(has_encours, encours, 0.0))
+    ratio_nbre_impaye = np.round(
+        np.divide(g["ratio_pondere"].to_numpy(dtype=float), encours, out=np.zeros_like(encours), where=has_encours), 2
+    )
+    montants = {b: g[f"par{b}"].to_numpy(dtype=float) for b in PAR_BUCKETS}
+    pcts = {b: _pct_of(montants[b], np.where(has_encours, encours, 0.0)) for b in PAR_BUCKETS}
+    dossiers = np.where(g["dossiers"].to_numpy() != 0, g["dossiers"].to_numpy(), g["lignes"].to_numpy())
+
+    caf_list: List[Dict] = []
+    for i, key in enumerate(g.index):
+        agence, caf_name = key if isinstance(key, tuple) else ("", key)
+        item = {
+            "nom": caf_name,
+            "nbreDossiers": int(dossiers[i]),
+            "encoursCredit": float(encours[i]),
+        }
+        for b in PAR_BUCKETS:
+            item[f"encoursPar{b}"] = round(float(montants[b][i]), 2)
+        item["encoursImpayes"] = round(float(impaye[i]), 2)
+        item["ratioEncoursImpayes"] = float(ratio_encours_impaye[i])
+        item["ratioNbreImpayes"] = float(ratio_nbre_impaye[i]) if has_encours[i] else None
+        for b in PAR_BUCKETS:
+            item[f"par{b}"] = float(pcts[b][i])
+        if agence:
+            item["agence"] = agence
+        caf_list.append(item)
+    return caf_list
+
+
+def _par_periods(
+    month: Optional[int],
+    year: Optional[int],
+    month_ref: Optional[int],
+    year_ref: Optional[int],
+) -> Tuple[int, int, int, int]:
+    """(mois, année, mois M-1, année M-1) : mois courant par défaut, M-1 = mois de référence ou mois précédent."""
+    # Utiliser le mois et l'année courants si non fournis (mois en cours)
+    if month is None or year is None:
+        now = datetime.now()
+        month = month or now.month
+        year = year or now.year
+
+    # Mois de référence : si fournis, les utiliser ; sinon prendre le mois précédent du mois en cours
+    if month_ref is not None and year_ref is not None:
+        return month, year, month_ref, year_ref
+    if month == 1:
+        return month, year, 12, year - 1
+    return month, year, month - 1, year
+
 
 def get_portefeuille_risque_data(
     month: Optional[int] = None,
@@ -32,24 +212,8 @@ def get_portefeuille_risque_data(
     """
     logger.info(f"🔍 get_portefeuille_risque_data appelé avec month={month}, year={year}, month_ref={month_ref}, year_ref={year_ref}")
     
-    # Utiliser le mois et l'année courants si non fournis (mois en cours)
-    if month is None or year is None:
-        now = datetime.now()
-        month = month or now.month
-        year = year or now.year
-    
-    # Mois de référence : si fournis, les utiliser ; sinon prendre le mois précédent du mois en cours
-    if month_ref is not None and year_ref is not None:
-        month_m1 = month_ref
-        year_m1 = year_ref
-    else:
-        if month == 1:
-            month_m1 = 12
-            year_m1 = year - 1
-        else:
-            month_m1 = month - 1
-            year_m1 = year
-    
+    month, year, month_m1, year_m1 = _par_periods(month, year, month_ref, year_ref)
+
     # Snapshots DASH : mois calendaire (MM/YYYY), pas le dernier jour seul (souvent 02/04 au lieu de 30/04)
     month_year_m = f"{month:02d}/{year}"
     month_year_m1 = f"{month_m1:02d}/{year_m1}"
@@ -67,28 +231,26 @@ def get_portefeuille_risque_data(
         date_m1_str,
     )
 
+    cache_key = f"portefeuille_risque:data:{month_year_m}:{month_year_m1}:v1"
+    cached = get_cache(cache_key)
+    if cached is not None:
+        logger.info("✅ Portefeuille PAR récupéré depuis le cache (M=%s, M-1=%s)", month_year_m, month_year_m1)
+        return cached
+
     def _run_query(m_y: str):
         """Exécute la requête Portefeuille global (DASH_PAR_GLOBAL) : dernier lot du mois MM/YYYY."""
         conn = get_oracle_connection()
         cursor = conn.cursor()
-        cursor.execute(
-            PORTEFEUILLE_GLOBAL_QUERY,
-            {"month_year": m_y},
-        )
-        columns = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return [dict(zip(columns, row)) for row in rows]
-
-    def _safe_float(r: dict, *keys) -> float:
-        for k in keys:
-            if k in r and r[k] is not None:
-                try:
-                    return float(r[k])
-                except (TypeError, ValueError):
-                    pass
-        return 0.0
+        try:
+            return fetch_records(
+                cursor,
+                PORTEFEUILLE_GLOBAL_QUERY,
+                {"month_year": m_y},
+                float_columns=_PAR_GLOBAL_FLOAT_COLUMNS,
+            )
+        finally:
+            cursor.close()
+            conn.close()
 
     try:
         logger.info("🔍 Exécution requête Portefeuille global (mois M=%s)...", month_year_m)
@@ -96,93 +258,12 @@ def get_portefeuille_risque_data(
         logger.info("🔍 Exécution requête Portefeuille global (mois M-1=%s)...", month_year_m1)
         rows_m1 = _run_query(month_year_m1)
 
-        # Index M-1 par (BRANCH_NAME, CODE_GESTION_PRET) pour rapprochement des lignes CAF
-        key_m1 = {((r.get("BRANCH_NAME") or "").strip() or "-", (r.get("CODE_GESTION_PRET") or "").strip() or ""): r for r in rows_m1}
-
-        # Lignes par CAF (pour onglet PAR | CAF) : une ligne par (BRANCH_NAME, CODE_GESTION_PRET)
+        df_m = _par_frame(rows_m)
+        df_m1 = _par_frame(rows_m1)
         # raw_data = lignes par CAF avec montants PAR (pour get_portefeuille_risque_caf_data qui agrège par CAF)
-        raw_data = []
-        for r in rows_m:
-            branch = (r.get("BRANCH_NAME") or "").strip() or "-"
-            code = (r.get("CODE_GESTION_PRET") or "").strip() or ""
-            r1 = key_m1.get((branch, code))
-            raw_data.append({
-                "AGENCE": branch,
-                "CODE_AGENCE": "",
-                "CHARGE_AFFAIRE": r.get("CHARGE_AFFAIRE") or "",
-                "CODE_GESTION_PRET": code,
-                "ENCOURS_TOTAL": _safe_float(r, "ENCOURS_TOTAL"),
-                "ENCOURS_IMPAYE": _safe_float(r, "ENCOURS_IMPAYE"),
-                "NOMBRE_DOSSIER": int(_safe_float(r, "NOMBRE_DOSSIER")),
-                "RATIO_ENCOURS_IMPAYE": _safe_float(r, "RATIO_ENCOURS_IMPAYE"),
-                "RATIO_NOMBRE_IMPAYE": _safe_float(r, "RATIO_NOMBRE_IMPAYE"),
-                "PAR_0_M_1": _safe_float(r1, "ENCOURS_PAR_0") if r1 else 0,
-                "PAR_0_M": _safe_float(r, "ENCOURS_PAR_0"),
-                "PAR_30_M_1": _safe_float(r1, "ENCOURS_PAR_30") if r1 else 0,
-                "PAR_30_M": _safe_float(r, "ENCOURS_PAR_30"),
-                "PAR_90_M_1": _safe_float(r1, "ENCOURS_PAR_90") if r1 else 0,
-                "PAR_90_M": _safe_float(r, "ENCOURS_PAR_90"),
-                "PAR_180_M_1": _safe_float(r1, "ENCOURS_PAR_180") if r1 else 0,
-                "PAR_180_M": _safe_float(r, "ENCOURS_PAR_180"),
-                "PAR_360_M_1": _safe_float(r1, "ENCOURS_PAR_360") if r1 else 0,
-                "PAR_360_M": _safe_float(r, "ENCOURS_PAR_360"),
-            })
-
-        # Agréger par BRANCH_NAME pour la hiérarchie (PAR AGENCE / RECAP)
-        agg_m = {}
-        agg_m1 = {}
-        for r in rows_m:
-            branch = (r.get("BRANCH_NAME") or "").strip() or "-"
-            if branch not in agg_m:
-                agg_m[branch] = {"ENCOURS_TOTAL": 0.0, "NOMBRE_DOSSIER": 0, "PROVISION_TOTAL": 0.0,
-                                 "ENCOURS_PAR_0": 0.0, "ENCOURS_PAR_30": 0.0, "ENCOURS_PAR_90": 0.0, "ENCOURS_PAR_180": 0.0, "ENCOURS_PAR_360": 0.0}
-            agg_m[branch]["ENCOURS_TOTAL"] += _safe_float(r, "ENCOURS_TOTAL")
-            agg_m[branch]["NOMBRE_DOSSIER"] += int(_safe_float(r, "NOMBRE_DOSSIER"))
-            agg_m[branch]["PROVISION_TOTAL"] += _safe_float(r, "PROVISION_TOTAL")
-            agg_m[branch]["ENCOURS_PAR_0"] += _safe_float(r, "ENCOURS_PAR_0")
-            agg_m[branch]["ENCOURS_PAR_30"] += _safe_float(r, "ENCOURS_PAR_30")
-            agg_m[branch]["ENCOURS_PAR_90"] += _safe_float(r, "ENCOURS_PAR_90")
-            agg_m[branch]["ENCOURS_PAR_180"] += _safe_float(r, "ENCOURS_PAR_180")
-            agg_m[branch]["ENCOURS_PAR_360"] += _safe_float(r, "ENCOURS_PAR_360")
-        for r in rows_m1:
-            branch = (r.get("BRANCH_NAME") or "").strip() or "-"
-            if branch not in agg_m1:
-                agg_m1[branch] = {"ENCOURS_TOTAL": 0.0, "NOMBRE_DOSSIER": 0, "PROVISION_TOTAL": 0.0,
-                                  "ENCOURS_PAR_0": 0.0, "ENCOURS_PAR_30": 0.0, "ENCOURS_PAR_90": 0.0, "ENCOURS_PAR_180": 0.0, "ENCOURS_PAR_360": 0.0}
-            agg_m1[branch]["ENCOURS_TOTAL"] += _safe_float(r, "ENCOURS_TOTAL")
-            agg_m1[branch]["NOMBRE_DOSSIER"] += int(_safe_float(r, "NOMBRE_DOSSIER"))
-            agg_m1[branch]["PROVISION_TOTAL"] += _safe_float(r, "PROVISION_TOTAL")
-            agg_m1[branch]["ENCOURS_PAR_0"] += _safe_float(r, "ENCOURS_PAR_0")
-            agg_m1[branch]["ENCOURS_PAR_30"] += _safe_float(r, "ENCOURS_PAR_30")
-            agg_m1[branch]["ENCOURS_PAR_90"] += _safe_float(r, "ENCOURS_PAR_90")
-            agg_m1[branch]["ENCOURS_PAR_180"] += _safe_float(r, "ENCOURS_PAR_180")
-            agg_m1[branch]["ENCOURS_PAR_360"] += _safe_float(r, "ENCOURS_PAR_360")
-
-        def _pct(enc, num):
-            return round((num / enc * 100), 2) if enc else 0
-
-        agency_rows = []
-        for branch in set(agg_m.keys()) | set(agg_m1.keys()):
-            m, m1 = agg_m.get(branch) or {}, agg_m1.get(branch) or {}
-            enc_m, enc_m1 = m.get("ENCOURS_TOTAL") or 0, m1.get("ENCOURS_TOTAL") or 0
-            agency_rows.append({
-                "AGENCE": branch,
-                "CODE_AGENCE": "",
-                "ENCOURS_M": enc_m,
-                "ENCOURS_M_1": enc_m1,
-                "PROVISIONS": m.get("PROVISION_TOTAL") or 0,
-                "NBRE_DOSSIERS": int(m.get("NOMBRE_DOSSIER") or 0),
-                "PAR_0_M_1": _pct(enc_m1, m1.get("ENCOURS_PAR_0") or 0),
-                "PAR_0_M": _pct(enc_m, m.get("ENCOURS_PAR_0") or 0),
-                "PAR_30_M_1": _pct(enc_m1, m1.get("ENCOURS_PAR_30") or 0),
-                "PAR_30_M": _pct(enc_m, m.get("ENCOURS_PAR_30") or 0),
-                "PAR_90_M_1": _pct(enc_m1, m1.get("ENCOURS_PAR_90") or 0),
-                "PAR_90_M": _pct(enc_m, m.get("ENCOURS_PAR_90") or 0),
-                "PAR_180_M_1": _pct(enc_m1, m1.get("ENCOURS_PAR_180") or 0),
-                "PAR_180_M": _pct(enc_m, m.get("ENCOURS_PAR_180") or 0),
-                "PAR_360_M_1": _pct(enc_m1, m1.get("ENCOURS_PAR_360") or 0),
-                "PAR_360_M": _pct(enc_m, m.get("ENCOURS_PAR_360") or 0),
-            })
+        raw_data = _par_caf_rows(df_m, df_m1)
+        # Agrégat par BRANCH_NAME pour la hiérarchie (PAR AGENCE / RECAP)
+        agency_rows = _par_agency_rows(df_m, df_m1)
 
         logger.info(f"✅ Portefeuille global: {len(rows_m)} lignes M, {len(rows_m1)} M-1, {len(raw_data)} CAF, {len(agency_rows)} agences")
 
@@ -197,10 +278,12 @@ def get_portefeuille_risque_data(
                 "POINT SERVICES": {}
             }
         
-        return {
+        result = {
             "data": raw_data,
             "hierarchicalData": hierarchical_data
         }
+        set_cache(cache_key, result, ttl=300)
+        return result
         
     except Exception as e:
         import traceback
@@ -209,6 +292,70 @@ def get_portefeuille_risque_data(
         raise
 
 
+def _par_caf_index(month_year_m: str, month_year_m1: str, periods: Tuple[int, int, int, int]) -> Dict:
+    """
+    Index CAF d'une paire de snapshots (M, M-1), construit une fois puis mis en cache :
+    {"all": CAF de toutes les agences, "agencies": {agence normalisée: CAF de l'agence},
+    "rows": lignes PAR (repli flou multi-agences), "fuzzy": {recherche: CAF} (mémo)}.
+    """
+    cache_key = f"portefeuille_risque:caf_index:{month_year_m}:{month_year_m1}:v1"
+    cached = get_cache(cache_key)
+    if cached is not None:
+        logger.info("✅ Index PAR | CAF %s / %s récupéré depuis le cache", month_year_m, month_year_m1)
+        return cached
+
+    month, year, month_m1, year_m1 = periods
+    result = get_portefeuille_risque_data(month=month, year=year, month_ref=month_m1, year_ref=year_m1)
+    rows = result.get("data", []) or []
+
+    agencies: Dict[str, List[Dict]] = {}
+    for item in _caf_metrics(rows, ["AGENCE_NORM", "CAF"]):
+        agence = item.pop("agence")
+        if agence:
+            agencies.setdefault(agence, []).append(item)
+
+    index = {
+        "all": _caf_metrics(rows, ["AGENCE_KEY", "CAF"]),
+        "agencies": agencies,
+        "rows": rows,
+        "fuzzy": {},
+    }
+    logger.info(
+        "📇 Index PAR | CAF %s / %s : %d agences, %d CAF",
+        month_year_m, month_year_m1, len(agencies), len(index["all"]),
+    )
+    set_cache(cache_key, index, ttl=300)
+    return index
+
+
+def _fuzzy_agency_caf(index: Dict, agency_key: str) -> List[Dict]:
+    """
+    Repli quand le nom normalisé n'est pas une clé de l'index : agences dont le nom contient / est contenu
+    dans la recherche, ou de même dernier mot. Résultat mémorisé dans l'index pour la paire de snapshots.
+    """
+    if agency_key in index["fuzzy"]:
+        return index["fuzzy"][agency_key]
+
+    tokens = agency_key.split()
+    last = tokens[-1] if tokens else ""
+    matched = [
+        name for name in index["agencies"]
+        if agency_key in name or name in agency_key or (last and name.split()[-1] == last)
+    ]
+    if len(matched) == 1:
+        caf_list = index["agencies"][matched[0]]
+    elif matched:
+        keys = set(matched)
+        caf_list = _caf_metrics(
+            [row for row in index["rows"] if _normalize_agency(row.get("AGENCE") or "") in keys],
+            ["CAF"],
+        )
+    else:
+        caf_list = []
+    index["fuzzy"][agency_key] = caf_list
+    return caf_list
+
+
 def get_portefeuille_risque_caf_data(
     agency: Optional[str] = None,
     month: Optional[int] = None,
@@ -219,6 +366,8 @@ def get_portefeuille_risque_caf_data(
     """
     Agrège les données PAR par CAF (chargé d'affaires).
     Si agency est fourni, filtre sur cette agence ; sinon retourne tous les CAF de toutes les agences.
+    Les agrégats sont lus dans l'index CAF de la paire de snapshots (M, M-1) : changer d'agence
+    ne relance pas les requêtes Oracle.
     """
     agency_str = (agency or "").strip()
     all_agencies = not agency_str or agency_str.upper() in ("ALL", "TOUTES", "TOUTES LES AGENCES", "")
@@ -227,168 +376,70 @@ def get_portefeuille_risque_caf_data(
         agency_str or "(toutes)", all_agencies, month, year, month_ref, year_ref
     )
 
-    # Récupérer les données PAR complètes pour la période
+    periods = _par_periods(month, year, month_ref, year_ref)
+    month, year, month_m1, year_m1 = periods
     try:
-        result = get_portefeuille_risque_data(
-            month=month,
-            year=year,
-            month_ref=month_ref,
-            year_ref=year_ref
-        )
+        index = _par_caf_index(f"{month:02d}/{year}", f"{month_m1:02d}/{year_m1}", periods)
     except Exception as e:
         logger.error("❌ get_portefeuille_risque_data a échoué (PAR CAF): %s", e, exc_info=True)
         raise
-    raw_data = result.get("data", []) or []
 
-    # Filtrer sur l'agence si une agence est choisie
     if all_agencies:
-        filtered_rows = raw_data
-        logger.info("ℹ️ Mode toutes agences : %d lignes PAR", len(filtered_rows))
+        caf_list = index["all"]
     else:
-        agency_upper = " ".join(agency_str.upper().split())
-        agency_tokens = agency_upper.split()
-        agency_last = agency_tokens[-1] if agency_tokens else ""
-        filtered_rows = []
-        for row in raw_data:
-            agence_name_raw = str(row.get("AGENCE") or "").strip().upper()
-            agence_name = " ".join(agence_name_raw.split())
-            row_tokens = agence_name.split()
-            row_last = row_tokens[-1] if row_tokens else ""
-            if not agence_name:
-                continue
-            if (
-                agence_name == agency_upper
-                or agency_upper in agence_name
-                or agence_name in agency_upper
-                or (agency_last and row_last == agency_last)
-            ):
-                filtered_rows.append(row)
-        if not filtered_rows:
+        agency_key = _normalize_agency(agency_str)
+        caf_list = index["agencies"].get(agency_key)
+        if caf_list is None:
+            caf_list = _fuzzy_agency_caf(index, agency_key)
+        if not caf_list:
             logger.info("ℹ️ Aucune ligne PAR trouvée pour l'agence %s", agency_str)
             return []
 
-    # Agrégation par CHARGE_AFFAIRE
-    # On calcule les montants PAR (PAR_0_M, PAR_30_M, ...) puis le % du portefeuille (encours) pour chaque palier
-    def safe_float(v: object) -> float:
-        try:
-            return float(v or 0)
-        except (TypeError, ValueError):
-            return 0.0
-
-    def row_val(r: dict, *key_variants: str) -> float:
-        """Récupère une valeur dans la ligne en essayant plusieurs clés (casse variable Oracle)."""
-        for k in key_variants:
-            if k in r and r[k] is not None:
-                return safe_float(r[k])
-        target = (key_variants[0] or "").upper()
-        for k in r:
-            if (k or "").upper() == target:
-                return safe_float(r[k])
-        return 0.0
-
-    # En mode "toutes agences", grouper par (agence, CAF) pour avoir une ligne par CAF par agence.
-    # Sinon grouper par CAF uniquement (une agence = un CAF peut n'apparaître qu'une fois).
-    caf_map: Dict = {}  # clé = (agence, caf_name) si all_agencies, sinon caf_name
-
-    for row in filtered_rows:
-        agence_name = str(row.get("AGENCE") or "").strip() or "-"
-        caf_name = row.get("CHARGE_AFFAIRE") or row.get("charge_affaire") or "-"
-        caf_name_str = str(caf_name).strip() or "-"
-
-        if all_agencies:
-            key = (agence_name, caf_name_str)
-        else:
-            key = caf_name_str
-
-        if key not in caf_map:
-            caf_map[key] = {
-                "agence": agence_name if all_agencies else "",
-                "nbre_dossiers": 0,
-                "nombre_dossier_query": 0,
-                "encours_credit": 0.0,
-                "encours_impaye_sum": 0.0,
-                "ratio_nombre_impaye_weighted": 0.0,
-                "par0_montant": 0.0,
-                "par30_montant": 0.0,
-                "par90_montant": 0.0,
-                "par180_montant": 0.0,
-                "par360_montant": 0.0,
-            }
-
-        agg = caf_map[key]
-        agg["nbre_dossiers"] += 1
-        agg["nombre_dossier_query"] += int(row_val(row, "NOMBRE_DOSSIER", "nombre_dossier") or 0)
-        enc_imp = row_val(row, "ENCOURS_IMPAYE", "encours_impaye")
-        ratio_nb = row_val(row, "RATIO_NOMBRE_IMPAYE", "ratio_nombre_impaye")
-        agg["encours_impaye_sum"] += enc_imp
-
-        par0_m = row_val(row, "PAR_0_M", "par_0_m")
-        par30_m = row_val(row, "PAR_30_M", "par_30_m")
-        par90_m = row_val(row, "PAR_90_M", "par_90_m")
-        par180_m = row_val(row, "PAR_180_M", "par_180_m")
-        par360_m = row_val(row, "PAR_360_M", "par_360_m")
-
-        encours_ligne = par0_m + par30_m + par90_m + par180_m + par360_m
-        agg["encours_credit"] += encours_ligne
-        if encours_ligne > 0:
-            agg["ratio_nombre_impaye_weighted"] += ratio_nb * encours_ligne
-        agg["par0_montant"] += par0_m
-        agg["par30_montant"] += par30_m
-        agg["par90_montant"] += par90_m
-        agg["par180_montant"] += par180_m
-        agg["par360_montant"] += par360_m
-
-    # Construire la liste finale : PAR en % de l'encours (niveau de risque, pas variation)
-    caf_list: List[Dict] = []
-    for key, agg in caf_map.items():
-        caf_name = key[1] if isinstance(key, tuple) else key
-        encours = agg["encours_credit"] or 0
-        if encours > 0:
-            par0 = (agg["par0_montant"] / encours) * 100
-            par30 = (agg["par30_montant"] / encours) * 100
-            par90 = (agg["par90_montant"] / encours) * 100
-            par180 = (agg["par180_montant"] / encours) * 100
-            par360 = (agg["par360_montant"] / encours) * 100
-        else:
-            par0 = par30 = par90 = par180 = par360 = 0.0
-
-        encours = agg["encours_credit"] or 0
-        encours_impaye_sum = agg.get("encours_impaye_sum") or 0
-        ratio_encours_impaye = round((encours_impaye_sum / encours * 100), 2) if encours > 0 else 0.0
-        ratio_nombre_impaye = round((agg.get("ratio_nombre_impaye_weighted") or 0) / encours, 2) if encours > 0 else None
-
-        item = {
-            "nom": caf_name,
-            "nbreDossiers": int(agg["nombre_dossier_query"] or agg["nbre_dossiers"]),
-            "encoursCredit": float(encours),
-            "encoursPar0": round(agg["par0_montant"], 2),
-            "encoursPar30": round(agg["par30_montant"], 2),
-            "encoursPar90": round(agg["par90_montant"], 2),
-            "encoursPar180": round(agg["par180_montant"], 2),
-            "encoursPar360": round(agg["par360_montant"], 2),
-            "encoursImpayes": round(encours_impaye_sum, 2),
-            "ratioEncoursImpayes": ratio_encours_impaye,
-            "ratioNbreImpayes": ratio_nombre_impaye,
-            "par0": round(par0, 2),
-            "par30": round(par30, 2),
-            "par90": round(par90, 2),
-            "par180": round(par180, 2),
-            "par360": round(par360, 2),
-        }
-        if all_agencies and agg.get("agence"):
-            item["agence"] = agg["agence"]
-        caf_list.append(item)
-
     logger.info("✅ %d CAF agrégés%s", len(caf_list), f" pour l'agence {agency_str}" if not all_agencies else " (toutes agences)")
     return caf_list
 
 
-def _is_grand_compte_agency_name(agency_name: str) -> bool:
-    """Détecte l’agence « Grand compte » (même logique que les autres services)."""
-    if not agency_name:
-        return False
-    n = " ".join(str(agency_name).upper().split())
-    return "GRAND COMPTE" in n or "GRAND COMPTES" in n or "GRAND_COMPTE" in n
+def _par_measures(from_rows: bool) -> tuple:
+    """
+    Mesures PAR : sommes M / M-1 par tranche, écart et variation % recalculés à chaque niveau.
+    Niveau agence (from_rows) : colonnes des lignes ; niveau territoire : totaux des agences.
+    """
+    def source(name: str, *columns: str) -> tuple:
+        return columns if from_rows else (name,)
+
+    measures = [
+        total("nbreDossiers", *source("nbreDossiers", "NBRE_DOSSIERS", "NOMBRE_DOSSIER"), integer=True),
+        total("encoursM", *source("encoursM", "ENCOURS_M")),
+        total("encoursM1", *source("encoursM1", "ENCOURS_M_1")),
+        total("provisions", *source("provisions", "PROVISIONS")),
+    ]
+    for bucket in PAR_BUCKETS:
+        measures += [
+            total(f"par{bucket}M1", *source(f"par{bucket}M1", f"PAR_{bucket}_M_1")),
+            total(f"par{bucket}M", *source(f"par{bucket}M", f"PAR_{bucket}_M")),
+            difference(f"par{bucket}Ecart", f"par{bucket}M", f"par{bucket}M1"),
+            variation_pct(f"par{bucket}Percent", f"par{bucket}M", f"par{bucket}M1"),
+        ]
+    return tuple(measures)
+
+
+# Agences regroupées par nom (lignes conservées dans "data"), points de service sous DAKAR VILLE,
+# agences sans territoire dans territoire_autre.
+_PAR_ROLLUP = RollupSpec(
+    "par",
+    layout=TERRITORY_LAYOUT,
+    name_field="name",
+    code_field="code",
+    agency_key=lambda row: row.get('AGENCE') or '-',
+    agency_node=lambda row: {"name": row.get('AGENCE') or '-', "code": row.get('CODE_AGENCE') or ''},
+    agency_measures=_par_measures(from_rows=True),
+    agency_totals_key="totals",
+    keep_rows="data",
+    totals=_par_measures(from_rows=False),
+    emit="nonempty",
+    service_points=True,
+    unmapped=("territoire_autre", "AUTRES"),
+)
 
 
 def organize_par_data(raw_data: List[Dict]) -> Dict:
@@ -401,231 +452,4 @@ def organize_par_data(raw_data: List[Dict]) -> Dict:
     Returns:
         Dictionnaire avec la structure hiérarchique
     """
-    hierarchical = {
-        "TERRITOIRE": {},
-        "POINT SERVICES": {}
-    }
-    
-    # Grouper par agence
-    agencies_map = {}
-    
-    for row in raw_data:
-        agency_name = row.get('AGENCE') or '-'
-        code_agency = row.get('CODE_AGENCE') or ''
-        
-        if not agencies_map.get(agency_name):
-            agencies_map[agency_name] = {
-                "name": agency_name,
-                "code": code_agency,
-                "data": [],
-                "totals": {
-                    "par0M1": 0, "par0M": 0, "par0Ecart": 0, "par0Percent": 0,
-                    "par30M1": 0, "par30M": 0, "par30Ecart": 0, "par30Percent": 0,
-                    "par90M1": 0, "par90M": 0, "par90Ecart": 0, "par90Percent": 0,
-                    "par180M1": 0, "par180M": 0, "par180Ecart": 0, "par180Percent": 0,
-                    "par360M1": 0, "par360M": 0, "par360Ecart": 0, "par360Percent": 0,
-                    "nbreDossiers": 0,
-                    "encoursM": 0,
-                    "encoursM1": 0,
-                    "provisions": 0
-                }
-            }
-        
-        agencies_map[agency_name]["data"].append(row)
-        
-        # Agréger les totaux (gérer les valeurs None)
-        try:
-            agencies_map[agency_name]["totals"]["nbreDossiers"] += int(row.get("NBRE_DOSSIERS") or row.get("NOMBRE_DOSSIER") or 0)
-            agencies_map[agency_name]["totals"]["encoursM"] += float(row.get("ENCOURS_M") or 0)
-            agencies_map[agency_name]["totals"]["encoursM1"] += float(row.get("ENCOURS_M_1") or 0)
-            agencies_map[agency_name]["totals"]["provisions"] += float(row.get("PROVISIONS") or 0)
-            agencies_map[agency_name]["totals"]["par0M1"] += float(row.get('PAR_0_M_1') or 0)
-            agencies_map[agency_name]["totals"]["par0M"] += float(row.get('PAR_0_M') or 0)
-            agencies_map[agency_name]["totals"]["par30M1"] += float(row.get('PAR_30_M_1') or 0)
-            agencies_map[agency_name]["totals"]["par30M"] += float(row.get('PAR_30_M') or 0)
-            agencies_map[agency_name]["totals"]["par90M1"] += float(row.get('PAR_90_M_1') or 0)
-            agencies_map[agency_name]["totals"]["par90M"] += float(row.get('PAR_90_M') or 0)
-            agencies_map[agency_name]["totals"]["par180M1"] += float(row.get('PAR_180_M_1') or 0)
-            agencies_map[agency_name]["totals"]["par180M"] += float(row.get('PAR_180_M') or 0)
-            agencies_map[agency_name]["totals"]["par360M1"] += float(row.get('PAR_360_M_1') or 0)
-            agencies_map[agency_name]["totals"]["par360M"] += float(row.get('PAR_360_M') or 0)
-        except (ValueError, TypeError) as e:
-            logger.warning(f"⚠️ Erreur lors de l'agrégation des totaux pour {agency_name}: {e}")
-            continue
-    
-    # Calculer les écarts et pourcentages pour chaque agence
-    for agency in agencies_map.values():
-        agency["totals"]["par0Ecart"] = agency["totals"]["par0M"] - agency["totals"]["par0M1"]
-        agency["totals"]["par30Ecart"] = agency["totals"]["par30M"] - agency["totals"]["par30M1"]
-        agency["totals"]["par90Ecart"] = agency["totals"]["par90M"] - agency["totals"]["par90M1"]
-        agency["totals"]["par180Ecart"] = agency["totals"]["par180M"] - agency["totals"]["par180M1"]
-        agency["totals"]["par360Ecart"] = agency["totals"]["par360M"] - agency["totals"]["par360M1"]
-        
-        # Calculer les pourcentages (variation en pourcentage)
-        if agency["totals"]["par0M1"] != 0:
-            agency["totals"]["par0Percent"] = (agency["totals"]["par0Ecart"] / agency["totals"]["par0M1"]) * 100
-        if agency["totals"]["par30M1"] != 0:
-            agency["totals"]["par30Percent"] = (agency["totals"]["par30Ecart"] / agency["totals"]["par30M1"]) * 100
-        if agency["totals"]["par90M1"] != 0:
-            agency["totals"]["par90Percent"] = (agency["totals"]["par90Ecart"] / agency["totals"]["par90M1"]) * 100
-        if agency["totals"]["par180M1"] != 0:
-            agency["totals"]["par180Percent"] = (agency["totals"]["par180Ecart"] / agency["totals"]["par180M1"]) * 100
-        if agency["totals"]["par360M1"] != 0:
-            agency["totals"]["par360Percent"] = (agency["totals"]["par360Ecart"] / agency["totals"]["par360M1"]) * 100
-    
-    # Organiser par territoire et points de service
-    for agency_name, agency_data in agencies_map.items():
-        if _is_grand_compte_agency_name(agency_name):
-            continue
-
-        # Vérifier d'abord si c'est un point de service
-        from services.utils import SERVICE_POINT_MAPPING
-        
-        is_service_point = False
-        normalized_name = ' '.join(str(agency_name).upper().split())
-        
-        # Vérifier si c'est un point de service en comparant avec SERVICE_POINT_MAPPING
-        for service_point_name in SERVICE_POINT_MAPPING.keys():
-            service_point_str = str(service_point_name) if service_point_name else ''
-            service_point_normalized = ' '.join(service_point_str.upper().split())
-            
-            # Normaliser aussi en supprimant les préfixes comme "C-E" pour comparaison
-            agency_name_without_prefix = normalized_name.replace('C-E ', '').replace('CE ', '').strip()
-            service_point_without_prefix = service_point_normalized.replace('C-E ', '').replace('CE ', '').strip()
-            
-            # Vérifier plusieurs conditions pour une meilleure détection
-            if (service_point_normalized == normalized_name or 
-                service_point_without_prefix == agency_name_without_prefix or
-                service_point_normalized in normalized_name or 
-                normalized_name in service_point_normalized or
-                (service_point_without_prefix in agency_name_without_prefix and len(service_point_without_prefix) > 5) or
-                (agency_name_without_prefix in service_point_without_prefix and len(agency_name_without_prefix) > 5)):
-                is_service_point = True
-                logger.info(f"✅ Point de service identifié (PAR): {agency_name} -> {service_point_name}")
-                break
-        
-        if is_service_point:
-            territory_key = "territoire_dakar_ville"
-            territory_name = get_all_territories()["territoire_dakar_ville"]["name"]
-        else:
-            territory_name = get_territory_from_agency(agency_name)
-            if territory_name:
-                territory_key = get_territory_key(territory_name)
-            else:
-                code = agency_data.get('code', '')
-                if code:
-                    territory_name = get_territory_from_branch_code(code)
-                    if territory_name:
-                        territory_key = get_territory_key(territory_name)
-                    else:
-                        territory_key = "territoire_autre"
-                        territory_name = agency_name
-                else:
-                    territory_key = "territoire_autre"
-                    territory_name = agency_name
-        
-        if not hierarchical["TERRITOIRE"].get(territory_key):
-            hierarchical["TERRITOIRE"][territory_key] = {
-                "name": territory_name,
-                "agencies": [],
-                "totals": {
-                    "par0M1": 0, "par0M": 0, "par0Ecart": 0, "par0Percent": 0,
-                    "par30M1": 0, "par30M": 0, "par30Ecart": 0, "par30Percent": 0,
-                    "par90M1": 0, "par90M": 0, "par90Ecart": 0, "par90Percent": 0,
-                    "par180M1": 0, "par180M": 0, "par180Ecart": 0, "par180Percent": 0,
-                    "par360M1": 0, "par360M": 0, "par360Ecart": 0, "par360Percent": 0,
-                    "nbreDossiers": 0, "encoursM": 0, "encoursM1": 0, "provisions": 0
-                }
-            }
-
-        hierarchical["TERRITOIRE"][territory_key]["agencies"].append(agency_data)
-
-        territory = hierarchical["TERRITOIRE"][territory_key]
-        territory["totals"]["par0M1"] += agency_data["totals"]["par0M1"]
-        territory["totals"]["par0M"] += agency_data["totals"]["par0M"]
-        territory["totals"]["par30M1"] += agency_data["totals"]["par30M1"]
-        territory["totals"]["par30M"] += agency_data["totals"]["par30M"]
-        territory["totals"]["par90M1"] += agency_data["totals"]["par90M1"]
-        territory["totals"]["par90M"] += agency_data["totals"]["par90M"]
-        territory["totals"]["par180M1"] += agency_data["totals"]["par180M1"]
-        territory["totals"]["par180M"] += agency_data["totals"]["par180M"]
-        territory["totals"]["par360M1"] += agency_data["totals"]["par360M1"]
-        territory["totals"]["par360M"] += agency_data["totals"]["par360M"]
-        territory["totals"]["nbreDossiers"] += agency_data["totals"].get("nbreDossiers", 0)
-        territory["totals"]["encoursM"] += agency_data["totals"].get("encoursM", 0)
-        territory["totals"]["encoursM1"] += agency_data["totals"].get("encoursM1", 0)
-        territory["totals"]["provisions"] += agency_data["totals"].get("provisions", 0)
-
-    hierarchical["POINT SERVICES"] = {}
-    
-    # Calculer les écarts et pourcentages pour les territoires
-    for territory in hierarchical["TERRITOIRE"].values():
-        territory["totals"]["par0Ecart"] = territory["totals"]["par0M"] - territory["totals"]["par0M1"]
-        territory["totals"]["par30Ecart"] = territory["totals"]["par30M"] - territory["totals"]["par30M1"]
-        territory["totals"]["par90Ecart"] = territory["totals"]["par90M"] - territory["totals"]["par90M1"]
-        territory["totals"]["par180Ecart"] = territory["totals"]["par180M"] - territory["totals"]["par180M1"]
-        territory["totals"]["par360Ecart"] = territory["totals"]["par360M"] - territory["totals"]["par360M1"]
-        
-        # Calculer les pourcentages (variation en pourcentage)
-        if territory["totals"]["par0M1"] != 0:
-            territory["totals"]["par0Percent"] = (territory["totals"]["par0Ecart"] / territory["totals"]["par0M1"]) * 100
-        if territory["totals"]["par30M1"] != 0:
-            territory["totals"]["par30Percent"] = (territory["totals"]["par30Ecart"] / territory["totals"]["par30M1"]) * 100
-        if territory["totals"]["par90M1"] != 0:
-            territory["totals"]["par90Percent"] = (territory["totals"]["par90Ecart"] / territory["totals"]["par90M1"]) * 100
-        if territory["totals"]["par180M1"] != 0:
-            territory["totals"]["par180Percent"] = (territory["totals"]["par180Ecart"] / territory["totals"]["par180M1"]) * 100
-        if territory["totals"]["par360M1"] != 0:
-            territory["totals"]["par360Percent"] = (territory["totals"]["par360Ecart"] / territory["totals"]["par360M1"]) * 100
-
-    grand_compte_agencies = [
-        agency_data for agency_name, agency_data in agencies_map.items()
-        if _is_grand_compte_agency_name(agency_name)
-    ]
-    if grand_compte_agencies:
-        gc_totals = {
-            "par0M1": 0, "par0M": 0, "par0Ecart": 0, "par0Percent": 0,
-            "par30M1": 0, "par30M": 0, "par30Ecart": 0, "par30Percent": 0,
-            "par90M1": 0, "par90M": 0, "par90Ecart": 0, "par90Percent": 0,
-            "par180M1": 0, "par180M": 0, "par180Ecart": 0, "par180Percent": 0,
-            "par360M1": 0, "par360M": 0, "par360Ecart": 0, "par360Percent": 0,
-            "nbreDossiers": 0, "encoursM": 0, "encoursM1": 0, "provisions": 0,
-        }
-        for agency_data in grand_compte_agencies:
-            t = agency_data["totals"]
-            gc_totals["par0M1"] += t.get("par0M1", 0) or 0
-            gc_totals["par0M"] += t.get("par0M", 0) or 0
-            gc_totals["par30M1"] += t.get("par30M1", 0) or 0
-            gc_totals["par30M"] += t.get("par30M", 0) or 0
-            gc_totals["par90M1"] += t.get("par90M1", 0) or 0
-            gc_totals["par90M"] += t.get("par90M", 0) or 0
-            gc_totals["par180M1"] += t.get("par180M1", 0) or 0
-            gc_totals["par180M"] += t.get("par180M", 0) or 0
-            gc_totals["par360M1"] += t.get("par360M1", 0) or 0
-            gc_totals["par360M"] += t.get("par360M", 0) or 0
-            gc_totals["nbreDossiers"] += t.get("nbreDossiers", 0) or 0
-            gc_totals["encoursM"] += t.get("encoursM", 0) or 0
-            gc_totals["encoursM1"] += t.get("encoursM1", 0) or 0
-            gc_totals["provisions"] += t.get("provisions", 0) or 0
-        gc_totals["par0Ecart"] = gc_totals["par0M"] - gc_totals["par0M1"]
-        gc_totals["par30Ecart"] = gc_totals["par30M"] - gc_totals["par30M1"]
-        gc_totals["par90Ecart"] = gc_totals["par90M"] - gc_totals["par90M1"]
-        gc_totals["par180Ecart"] = gc_totals["par180M"] - gc_totals["par180M1"]
-        gc_totals["par360Ecart"] = gc_totals["par360M"] - gc_totals["par360M1"]
-        if gc_totals["par0M1"] != 0:
-            gc_totals["par0Percent"] = (gc_totals["par0Ecart"] / gc_totals["par0M1"]) * 100
-        if gc_totals["par30M1"] != 0:
-            gc_totals["par30Percent"] = (gc_totals["par30Ecart"] / gc_totals["par30M1"]) * 100
-        if gc_totals["par90M1"] != 0:
-            gc_totals["par90Percent"] = (gc_totals["par90Ecart"] / gc_totals["par90M1"]) * 100
-        if gc_totals["par180M1"] != 0:
-            gc_totals["par180Percent"] = (gc_totals["par180Ecart"] / gc_totals["par180M1"]) * 100
-        if gc_totals["par360M1"] != 0:
-            gc_totals["par360Percent"] = (gc_totals["par360Ecart"] / gc_totals["par360M1"]) * 100
-        hierarchical["TERRITOIRE"]["grand_compte"] = {
-            "name": "GRAND COMPTE",
-            "agencies": grand_compte_agencies,
-            "totals": gc_totals,
-        }
-    
-    return hierarchical
+    return rollup(raw_data, _PAR_ROLLUP)["hierarchy"]
@@ -3,15 +3,41 @@ Données production (nombre / volume) et évolution encours crédit (PTF) depuis
 avec le même filtre MIGRATION_DATE_MINUS1 que Volume DAT (jour / mois / semaine / année).
 """
 import logging
-from datetime import date as dt_date
-from datetime import timedelta
 from typing import Any, Optional
 
+from database.fetch import fetch_records
 from database.oracle import get_oracle_connection_cofina
-from services.volume_dat_service import _ref_month_year, _week_range_dd_mm_yyyy
+from services.period_window import period_window
 
 logger = logging.getLogger(__name__)
 
+# Colonnes numériques lues en float par le driver ({colonne: valeur si NULL}).
+# Les variations restent NULL quand absentes : elles sont alors recalculées à partir de M / M-1.
+_NOMBRE_FLOAT_COLUMNS = {
+    "NB_CRED_DECAISSES_M": 0.0,
+    "NB_CRED_DECAISSES_M_1": 0.0,
+    "VARIATION_POURCENT": None,
+}
+_VOLUME_FLOAT_COLUMNS = {
+    "VOLUME_DEBLOQUE_M": 0.0,
+    "VOLUME_DEBLOQUE_M_1": 0.0,
+    "VARIATION_VOLUME": None,
+    "VARIATION_PCT": None,
+}
+_EVOLUTION_ENCOURS_FLOAT_COLUMNS = {
+    name: 0.0
+    for name in (
+        "PTF_M1",
+        "PTF_M",
+        "VARIATION_PTF",
+        "TAUX_CROISSANCE_PTF",
+        "PRODUIT_INT_M1",
+        "PRODUIT_INT_M",
+        "VARIATION_PRODUIT_INT",
+        "TAUX_CROISSANCE_PRODUIT_INT",
+    )
+}
+
 _SQL_INNER_DAY = "TO_CHAR(d.MIGRATION_DATE_MINUS1, 'DD/MM/YYYY') = :migration_target"
 _SQL_INNER_MONTH = "TO_CHAR(d.MIGRATION_DATE_MINUS1, 'MM/YYYY') = :month_year"
 _SQL_INNER_WEEK = """TRUNC(d.MIGRATION_DATE_MINUS1) BETWEEN TO_DATE(:week_start, 'DD/MM/YYYY')
@@ -26,25 +52,7 @@ def _migration_mode_and_binds(
     date_str: Optional[str],
 ) -> tuple[str, dict[str, Any]]:
     """Retourne (mode, binds) avec mode dans day|month|week|year."""
-    p = (period or "month").strip().lower()
-    today = dt_date.today()
-    ref_m, ref_y = _ref_month_year(p, month, year, date_str)
-    viewing_current_month = ref_y == today.year and ref_m == today.month
-    week_range = _week_range_dd_mm_yyyy(p, date_str)
-
-    year_only_str: Optional[str] = None
-    if p == "year":
-        y = int(year) if year is not None else today.year
-        year_only_str = f"{y:04d}"
-
-    if week_range:
-        ws, we = week_range
-        return "week", {"week_start": ws, "week_end": we}
-    if year_only_str is not None:
-        return "year", {"year_only": year_only_str}
-    if viewing_current_month:
-        return "day", {"migration_target": (today - timedelta(days=1)).strftime("%d/%m/%Y")}
-    return "month", {"month_year": f"{ref_m:02d}/{ref_y}"}
+    return period_window(period, month, year, date_str).dash()
 
 
 def _inner_sql_fragment(mode: str) -> str:
@@ -88,9 +96,7 @@ ORDER BY CODE_AGENCE, AGENCE, CHARGE_AFFAIRE
     conn = get_oracle_connection_cofina()
     try:
         cur = conn.cursor()
-        cur.execute(sql, binds)
-        cols = [d[0] for d in cur.description]
-        rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+        rows = fetch_records(cur, sql, binds, float_columns=_NOMBRE_FLOAT_COLUMNS)
         logger.info(
             "📊 DASH_PRODUCTION_NOMBRE mode=%s lignes=%s",
             mode,
@@ -250,9 +256,7 @@ ORDER BY CODE_AGENCE, AGENCE, CHARGE_AFFAIRE
     conn = get_oracle_connection_cofina()
     try:
         cur = conn.cursor()
-        cur.execute(sql, binds)
-        cols = [d[0] for d in cur.description]
-        rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+        rows = fetch_records(cur, sql, binds, float_columns=_VOLUME_FLOAT_COLUMNS)
         logger.info(
             "📊 DASH_PRODUCTION_VOLUME mode=%s lignes=%s",
             mode,
@@ -436,9 +440,7 @@ ORDER BY CODE_AGENCE, AGENCE
     conn = get_oracle_connection_cofina()
     try:
         cur = conn.cursor()
-        cur.execute(sql, binds)
-        cols = [d[0] for d in cur.description]
-        rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+        rows = fetch_records(cur, sql, binds, float_columns=_EVOLUTION_ENCOURS_FLOAT_COLUMNS)
         logger.info(
             "📊 DASH_EVOLUTION_ENCOURS mode=%s lignes=%s",
             mode,
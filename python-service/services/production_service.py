@@ -2,9 +2,9 @@
 Service pour la gestion des données de production
 """
 import logging
-from datetime import datetime, date, timedelta
-import calendar
+from datetime import datetime, date
 from typing import Optional
+from services.period_window import PeriodWindow, period_window
 from services.utils import get_territory_from_agency, get_territory_key, get_all_territories, SERVICE_POINT_MAPPING
 
 logger = logging.getLogger(__name__)
@@ -17,6 +17,23 @@ def _is_grand_compte_production_row(row: dict) -> bool:
     return "GRAND COMPTE" in n or "GRAND COMPTES" in n or "GRAND_COMPTE" in n
 
 
+def _production_window(
+    month: Optional[int],
+    year: Optional[int],
+    date_m_debut: Optional[str],
+    date_m_fin: Optional[str],
+) -> PeriodWindow:
+    """Fenêtre M / M-1 : mois, année seule, ou intervalle DD/MM/YYYY explicite (défaut : mois en cours à date)."""
+    if month and year:
+        return period_window("month", month, year)
+    if year:
+        return period_window("year", None, year)
+    today = date.today()
+    start = datetime.strptime(date_m_debut, "%d/%m/%Y").date() if date_m_debut else today.replace(day=1)
+    end = datetime.strptime(date_m_fin, "%d/%m/%Y").date() if date_m_fin else today
+    return period_window("month", start.month, start.year).with_bounds(start, end)
+
+
 def get_production_nombre_data(
     date_m_debut: Optional[str] = None,
     date_m_fin: Optional[str] = None,
@@ -38,58 +55,12 @@ def get_production_nombre_data(
     Returns:
         Données de production par agence avec comparaison M vs M-1
     """
-    # Calcul des dates si month et year sont fournis
-    if month and year:
-        date_m_debut_obj = date(year, month, 1)
-        date_m_fin_obj = date(year, month, calendar.monthrange(year, month)[1])
-        
-        # Calcul du mois précédent (M-1)
-        if month == 1:
-            date_m1_debut_obj = date(year - 1, 12, 1)
-            date_m1_fin_obj = date(year - 1, 12, 31)
-        else:
-            date_m1_debut_obj = date(year, month - 1, 1)
-            date_m1_fin_obj = date(year, month - 1, calendar.monthrange(year, month - 1)[1])
-        
-        date_m_debut_str = date_m_debut_obj.strftime("%d/%m/%Y")
-        date_m_fin_str = date_m_fin_obj.strftime("%d/%m/%Y")
-        date_m1_debut_str = date_m1_debut_obj.strftime("%d/%m/%Y")
-        date_m1_fin_str = date_m1_fin_obj.strftime("%d/%m/%Y")
-    elif year and not month:
-        # Si seule l'année est fournie, comparer année complète avec année précédente
-        date_m_debut_obj = date(year, 1, 1)
-        date_m_fin_obj = date(year, 12, 31)
-        
-        date_m1_debut_obj = date(year - 1, 1, 1)
-        date_m1_fin_obj = date(year - 1, 12, 31)
-        
-        date_m_debut_str = date_m_debut_obj.strftime("%d/%m/%Y")
-        date_m_fin_str = date_m_fin_obj.strftime("%d/%m/%Y")
-        date_m1_debut_str = date_m1_debut_obj.strftime("%d/%m/%Y")
-        date_m1_fin_str = date_m1_fin_obj.strftime("%d/%m/%Y")
-    else:
-        # Utiliser les dates fournies ou les dates par défaut
-        if date_m_debut:
-            date_m_debut_obj = datetime.strptime(date_m_debut, "%d/%m/%Y").date()
-        else:
-            today = date.today()
-            date_m_debut_obj = today.replace(day=1)
-        
-        if date_m_fin:
-            date_m_fin_obj = datetime.strptime(date_m_fin, "%d/%m/%Y").date()
-        else:
-            date_m_fin_obj = date.today()
-        
-        # Calcul automatique du mois précédent (M-1)
-        first_day_m = date_m_debut_obj.replace(day=1)
-        last_day_prev_month = first_day_m - timedelta(days=1)
-        date_m1_debut_obj = last_day_prev_month.replace(day=1)
-        date_m1_fin_obj = last_day_prev_month
-        
-        date_m_debut_str = date_m_debut_obj.strftime("%d/%m/%Y")
-        date_m_fin_str = date_m_fin_obj.strftime("%d/%m/%Y")
-        date_m1_debut_str = date_m1_debut_obj.strftime("%d/%m/%Y")
-        date_m1_fin_str = date_m1_fin_obj.strftime("%d/%m/%Y")
+    window = _production_window(month, year, date_m_debut, date_m_fin)
+    dates = window.period_dates()
+    date_m_debut_str = dates["date_m_debut_str"]
+    date_m_fin_str = dates["date_m_fin_str"]
+    date_m1_debut_str = dates["date_m1_debut_str"]
+    date_m1_fin_str = dates["date_m1_fin_str"]
     
     # Données pré-agrégées DASH (snapshot MIGRATION_DATE_MINUS1 aligné Volume DAT)
     from services.production_dash_service import (
@@ -104,30 +75,8 @@ def get_production_nombre_data(
     raw_rows = fetch_dash_production_nombre_rows(period_eff, month, year, ref_date)
     charge_affaire_by_agency = build_production_nombre_charge_details_by_agency(raw_rows)
     raw_rows = aggregate_nombre_dash_rows_by_agency(raw_rows)
-    results = []
-    for row in raw_rows:
-        row_dict = normalize_nombre_row_from_dash(row)
-        for key, value in list(row_dict.items()):
-            if value is None:
-                if key in [
-                    "NOMBRE_DE_CREDITS_DECAISSES_M",
-                    "NOMBRE_DE_CREDITS_DECAISSES_M_1",
-                    "VARIATION_NOMBRE",
-                    "VARIATION_POURCENT",
-                    "TAUX_REALISATION",
-                    "OBJECTIF_PRODUCTION",
-                ]:
-                    row_dict[key] = 0
-                else:
-                    row_dict[key] = None
-            elif hasattr(value, "__float__") and not isinstance(
-                value, (int, float, bool, str, type(None))
-            ):
-                try:
-                    row_dict[key] = float(value)
-                except (ValueError, TypeError):
-                    row_dict[key] = 0
-        results.append(row_dict)
+    # Valeurs déjà typées par le driver (database.fetch) : plus de conversion cellule par cellule
+    results = [normalize_nombre_row_from_dash(row) for row in raw_rows]
 
     # Organiser les données par territoire selon le nouveau zonage
     territories_data = {
@@ -398,58 +347,12 @@ def get_production_volume_data(
     Returns:
         Données de production en volume par agence avec comparaison M vs M-1, incluant les frais de dossier
     """
-    # Calcul des dates si month et year sont fournis
-    if month and year:
-        date_m_debut_obj = date(year, month, 1)
-        date_m_fin_obj = date(year, month, calendar.monthrange(year, month)[1])
-        
-        # Calcul du mois précédent (M-1)
-        if month == 1:
-            date_m1_debut_obj = date(year - 1, 12, 1)
-            date_m1_fin_obj = date(year - 1, 12, 31)
-        else:
-            date_m1_debut_obj = date(year, month - 1, 1)
-            date_m1_fin_obj = date(year, month - 1, calendar.monthrange(year, month - 1)[1])
-        
-        date_m_debut_str = date_m_debut_obj.strftime("%d/%m/%Y")
-        date_m_fin_str = date_m_fin_obj.strftime("%d/%m/%Y")
-        date_m1_debut_str = date_m1_debut_obj.strftime("%d/%m/%Y")
-        date_m1_fin_str = date_m1_fin_obj.strftime("%d/%m/%Y")
-    elif year and not month:
-        # Si seule l'année est fournie, comparer année complète avec année précédente
-        date_m_debut_obj = date(year, 1, 1)
-        date_m_fin_obj = date(year, 12, 31)
-        
-        date_m1_debut_obj = date(year - 1, 1, 1)
-        date_m1_fin_obj = date(year - 1, 12, 31)
-        
-        date_m_debut_str = date_m_debut_obj.strftime("%d/%m/%Y")
-        date_m_fin_str = date_m_fin_obj.strftime("%d/%m/%Y")
-        date_m1_debut_str = date_m1_debut_obj.strftime("%d/%m/%Y")
-        date_m1_fin_str = date_m1_fin_obj.strftime("%d/%m/%Y")
-    else:
-        # Utiliser les dates fournies ou les dates par défaut
-        if date_m_debut:
-            date_m_debut_obj = datetime.strptime(date_m_debut, "%d/%m/%Y").date()
-        else:
-            today = date.today()
-            date_m_debut_obj = today.replace(day=1)
-        
-        if date_m_fin:
-            date_m_fin_obj = datetime.strptime(date_m_fin, "%d/%m/%Y").date()
-        else:
-            date_m_fin_obj = date.today()
-        
-        # Calcul automatique du mois précédent (M-1)
-        first_day_m = date_m_debut_obj.replace(day=1)
-        last_day_prev_month = first_day_m - timedelta(days=1)
-        date_m1_debut_obj = last_day_prev_month.replace(day=1)
-        date_m1_fin_obj = last_day_prev_month
-        
-        date_m_debut_str = date_m_debut_obj.strftime("%d/%m/%Y")
-        date_m_fin_str = date_m_fin_obj.strftime("%d/%m/%Y")
-        date_m1_debut_str = date_m1_debut_obj.strftime("%d/%m/%Y")
-        date_m1_fin_str = date_m1_fin_obj.strftime("%d/%m/%Y")
+    window = _production_window(month, year, date_m_debut, date_m_fin)
+    dates = window.period_dates()
+    date_m_debut_str = dates["date_m_debut_str"]
+    date_m_fin_str = dates["date_m_fin_str"]
+    date_m1_debut_str = dates["date_m1_debut_str"]
+    date_m1_fin_str = dates["date_m1_fin_str"]
     
     # Données DASH_PRODUCTION_VOLUME (snapshot MIGRATION_DATE_MINUS1)
     from services.production_dash_service import (
@@ -464,34 +367,8 @@ def get_production_volume_data(
     raw_vol = fetch_dash_production_volume_rows(period_eff, month, year, ref_date)
     charge_affaire_by_agency = build_production_volume_charge_details_by_agency(raw_vol)
     raw_vol = aggregate_volume_dash_rows_by_agency(raw_vol)
-    results = []
-    for row in raw_vol:
-        row_dict = normalize_volume_row_from_dash(row)
-        for key, value in list(row_dict.items()):
-            if value is None:
-                if key in [
-                    "VOLUME_CREDIT_DECAISSE_M",
-                    "VOLUME_CREDIT_DECAISSE_M_1",
-                    "VARIATION_VOLUME",
-                    "VARIATION_POURCENT",
-                    "TAUX_REALISATION",
-                    "OBJECTIF_PRODUCTION",
-                    "FRAIS_DOSSIER_M",
-                    "FRAIS_DOSSIER_M_1",
-                    "ECART_FRAIS",
-                    "VARIATION_FRAIS",
-                ]:
-                    row_dict[key] = 0
-                else:
-                    row_dict[key] = None
-            elif hasattr(value, "__float__") and not isinstance(
-                value, (int, float, bool, str, type(None))
-            ):
-                try:
-                    row_dict[key] = float(value)
-                except (ValueError, TypeError):
-                    row_dict[key] = 0
-        results.append(row_dict)
+    # Valeurs déjà typées par le driver (database.fetch) : plus de conversion cellule par cellule
+    results = [normalize_volume_row_from_dash(row) for row in raw_vol]
 
     # Organiser les données par territoire (même logique que pour get_production_nombre_data)
     territories_data = {
@@ -755,44 +632,17 @@ def get_encours_credit_data(
     Returns:
         Données d'évolution de l'encours crédit par agence avec PTF et Produit d'intérêt pour M et M-1
     """
-    import calendar
-    
-    # Calcul des dates si month et year sont fournis
     if month_m and year_m:
-        date_m_debut_obj = date(year_m, month_m, 1)
-        date_m_fin_obj = date(year_m, month_m, calendar.monthrange(year_m, month_m)[1])
-        
-        # Calcul du mois précédent (M-1)
-        if month_m1 and year_m1:
-            date_m1_debut_obj = date(year_m1, month_m1, 1)
-            date_m1_fin_obj = date(year_m1, month_m1, calendar.monthrange(year_m1, month_m1)[1])
-        elif month_m == 1:
-            date_m1_debut_obj = date(year_m - 1, 12, 1)
-            date_m1_fin_obj = date(year_m - 1, 12, 31)
-        else:
-            date_m1_debut_obj = date(year_m, month_m - 1, 1)
-            date_m1_fin_obj = date(year_m, month_m - 1, calendar.monthrange(year_m, month_m - 1)[1])
-        
-        date_m_debut_str = date_m_debut_obj.strftime("%d/%m/%Y")
-        date_m_fin_str = date_m_fin_obj.strftime("%d/%m/%Y")
-        date_m1_debut_str = date_m1_debut_obj.strftime("%d/%m/%Y")
-        date_m1_fin_str = date_m1_fin_obj.strftime("%d/%m/%Y")
+        window = period_window("month", month_m, year_m).with_reference(month_m1, year_m1)
     else:
-        # Utiliser le mois et l'année actuels par défaut
+        # Mois en cours à date, M-1 = mois précédent complet
         today = date.today()
-        date_m_debut_obj = today.replace(day=1)
-        date_m_fin_obj = today
-        
-        # Calcul automatique du mois précédent (M-1)
-        first_day_m = date_m_debut_obj.replace(day=1)
-        last_day_prev_month = first_day_m - timedelta(days=1)
-        date_m1_debut_obj = last_day_prev_month.replace(day=1)
-        date_m1_fin_obj = last_day_prev_month
-        
-        date_m_debut_str = date_m_debut_obj.strftime("%d/%m/%Y")
-        date_m_fin_str = date_m_fin_obj.strftime("%d/%m/%Y")
-        date_m1_debut_str = date_m1_debut_obj.strftime("%d/%m/%Y")
-        date_m1_fin_str = date_m1_fin_obj.strftime("%d/%m/%Y")
+        window = period_window("month").with_bounds(today.replace(day=1), today)
+    dates = window.period_dates()
+    date_m_debut_str = dates["date_m_debut_str"]
+    date_m_fin_str = dates["date_m_fin_str"]
+    date_m1_debut_str = dates["date_m1_debut_str"]
+    date_m1_fin_str = dates["date_m1_fin_str"]
     
     # Données DASH_EVOLUTION_ENCOURS (snapshot MIGRATION_DATE_MINUS1, aligné Volume DAT)
     from services.production_dash_service import (
@@ -803,32 +653,8 @@ def get_encours_credit_data(
 
     period_eff = resolve_production_period(period, month_m, year_m, None, None)
     raw_rows = fetch_dash_evolution_encours_rows(period_eff, month_m, year_m, ref_date)
-    results = []
-    for row in raw_rows:
-        row_dict = normalize_encours_row_from_dash(row)
-        for key, value in list(row_dict.items()):
-            if value is None:
-                if key in (
-                    "PTF_M1",
-                    "PTF_M",
-                    "VARIATION_PTF",
-                    "TAUX_CROISSANCE_PTF",
-                    "PRODUIT_INT_M1",
-                    "PRODUIT_INT_M",
-                    "VARIATION_PRODUIT_INT",
-                    "TAUX_CROISSANCE_PRODUIT_INT",
-                ):
-                    row_dict[key] = 0
-                else:
-                    row_dict[key] = None
-            elif hasattr(value, "__float__") and not isinstance(
-                value, (int, float, bool, str, type(None))
-            ):
-                try:
-                    row_dict[key] = float(value)
-                except (ValueError, TypeError):
-                    row_dict[key] = 0
-        results.append(row_dict)
+    # Valeurs déjà typées par le driver (database.fetch) : plus de conversion cellule par cellule
+    results = [normalize_encours_row_from_dash(row) for row in raw_rows]
 
     # Organiser les données par territoire (même logique que pour production)
 
@@ -975,14 +801,14 @@ def get_encours_credit_data(
             "m": {
                 "debut": date_m_debut_str,
                 "fin": date_m_fin_str,
-                "month": month_m or date_m_debut_obj.month,
-                "year": year_m or date_m_debut_obj.year
+                "month": month_m or window.m_start.month,
+                "year": year_m or window.m_start.year
             },
             "m1": {
                 "debut": date_m1_debut_str,
                 "fin": date_m1_fin_str,
-                "month": month_m1 or date_m1_debut_obj.month,
-                "year": year_m1 or date_m1_debut_obj.year
+                "month": month_m1 or window.m1_start.month,
+                "year": year_m1 or window.m1_start.year
             }
         },
         "hierarchicalData": hierarchical_data,
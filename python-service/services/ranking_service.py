@@ -0,0 +1,261 @@
+"""
+Classements des agences par métrique (top / flop N, percentile, évolution du rang vs M-1).
+
+Pour une période donnée, tous les classements d'un type de données sont calculés en une passe
+(tri numpy par métrique) puis mis en cache : top / flop N sont des tranches de l'ordre pré-calculé
+et le rang d'une agence une lecture de dictionnaire, quel que soit N.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.cache_service import get_cache, set_cache
+from services.clients_service import get_clients_data
+from services.collection_service import get_collection_data
+from services.production_service import get_production_nombre_data, get_production_volume_data
+
+logger = logging.getLogger(__name__)
+
+
+def _load_clients(period: str, month: int, year: int) -> Dict:
+    return get_clients_data(period=period, month=month, year=year)
+
+
+def _load_collection(period: str, month: int, year: int) -> Dict:
+    return get_collection_data(period=period, month=month, year=year)
+
+
+def _load_production_nombre(period: str, month: int, year: int) -> Dict:
+    return get_production_nombre_data(month=month, year=year)
+
+
+def _load_production_volume(period: str, month: int, year: int) -> Dict:
+    return get_production_volume_data(month=month, year=year)
+
+
+# data_type -> (métrique par défaut, {métrique: (chargement des données, champs agence candidats)})
+_RANKING_SOURCES: Dict[str, Tuple[str, Dict[str, Tuple[Callable[[str, int, int], Dict], Tuple[str, ...]]]]] = {
+    "client": ("nombre", {
+        "nombre": (_load_clients, ("nouveauxClientsM",)),
+        "frais": (_load_clients, ("fraisM",)),
+    }),
+    "collection": ("collecte", {
+        "collecte": (_load_collection, ("collecteM", "COLLECTE_M")),
+        "echeance": (_load_collection, ("mtEcheance", "MT_ECHEANCE")),
+        "solde": (_load_collection, ("sldM", "SLD_M")),
+    }),
+    "credit": ("nombre", {
+        "nombre": (_load_production_nombre, ("NOMBRE_DE_CREDITS_DECAISSES_M", "nombreCredits")),
+        "volume": (_load_production_volume, ("VOLUME_CREDIT_DECAISSE_M", "montantCredits")),
+    }),
+}
+
+_EXCLUDED_AGENCIES = ("INCONNU", "UNKNOWN")
+
+
+def _normalize_agency(name: str) -> str:
+    return " ".join(str(name).upper().split())
+
+
+def _agency_nodes(data: Dict) -> List[Dict]:
+    """Agences (listes "agencies" ou "data") des territoires et points de service d'une réponse dashboard."""
+    hierarchical_data = None
+    if data and isinstance(data, dict):
+        if isinstance(data.get("data"), dict) and "hierarchicalData" in data["data"]:
+            hierarchical_data = data["data"]["hierarchicalData"]
+        elif "hierarchicalData" in data:
+            hierarchical_data = data["hierarchicalData"]
+    groups = []
+    if hierarchical_data:
+        for section in ("TERRITOIRE", "POINT SERVICES"):
+            groups.extend((hierarchical_data.get(section) or {}).values())
+    if not groups and isinstance(data, dict):
+        groups = list((data.get("territories") or {}).values())
+
+    nodes = []
+    for group in groups:
+        agencies = group.get("agencies") if isinstance(group.get("agencies"), list) else group.get("data")
+        if isinstance(agencies, list):
+            nodes.extend(a for a in agencies if isinstance(a, dict))
+    return nodes
+
+
+def _metric_values(data: Dict, fields: Tuple[str, ...]) -> Dict[str, Tuple[str, float]]:
+    """{agence normalisée: (nom affiché, valeur)} — première occurrence d'une agence retenue."""
+    values: Dict[str, Tuple[str, float]] = {}
+    for node in _agency_nodes(data):
+        name = node.get("name") or node.get("AGENCE") or node.get("agency") or ""
+        key = _normalize_agency(name)
+        if not key or key in _EXCLUDED_AGENCIES or key in values:
+            continue
+        value = next((node[f] for f in fields if node.get(f) is not None), 0)
+        try:
+            values[key] = (name, float(value or 0))
+        except (TypeError, ValueError):
+            values[key] = (name, 0.0)
+    return values
+
+
+def _rank_metric(values: Dict[str, Tuple[str, float]], previous: Optional[Dict] = None) -> Dict:
+    """
+    Classement d'une métrique : agences de valeur > 0 triées par valeur décroissante (ordre d'origine
+    conservé à égalité), rang « 1224 » en cas d'égalité, percentile = part des agences classées de valeur ≤.
+    """
+    keys = list(values)
+    amounts = np.fromiter((values[k][1] for k in keys), dtype=float, count=len(keys))
+    positive = np.flatnonzero(amounts > 0)
+    order = positive[np.argsort(-amounts[positive], kind="stable")]
+    ascending = -amounts[order]
+    greater = np.searchsorted(ascending, ascending, side="left")
+    ranked = len(order)
+    prev_entries = (previous or {}).get("entries", {})
+
+    entries: Dict[str, Dict] = {}
+    for position, i in enumerate(order):
+        key = keys[i]
+        rank = int(greater[position]) + 1
+        previous_rank = prev_entries.get(key, {}).get("rank")
+        entries[key] = {
+            "name": values[key][0],
+            "value": float(amounts[i]),
+            "rank": rank,
+            "percentile": round((ranked - int(greater[position])) * 100 / ranked, 2),
+            "previousRank": previous_rank,
+            "rankChange": previous_rank - rank if previous_rank is not None else None,
+        }
+    for key in keys:
+        if key not in entries:
+            previous_rank = prev_entries.get(key, {}).get("rank")
+            entries[key] = {
+                "name": values[key][0],
+                "value": values[key][1],
+                "rank": None,
+                "percentile": None,
+                "previousRank": previous_rank,
+                "rankChange": None,
+            }
+    return {"order": [keys[i] for i in order], "entries": entries}
+
+
+def _previous_period(period: str, month: int, year: int) -> Tuple[int, int]:
+    if period == "year":
+        return month, year - 1
+    return (12, year - 1) if month == 1 else (month - 1, year)
+
+
+def _ranking_snapshot(data_type: str, period: str, month: int, year: int, with_previous: bool = True) -> Dict:
+    """
+    Classements de toutes les métriques d'un type de données pour une période, mis en cache.
+    Avec with_previous, les rangs de la période précédente (même calcul, sans évolution) alimentent rankChange.
+    """
+    cache_key = f"ranking:{data_type}:{period}:{month:02d}/{year}:{'full' if with_previous else 'base'}:v1"
+    cached = get_cache(cache_key)
+    if cached is not None:
+        return cached
+
+    previous = None
+    if with_previous:
+        prev_month, prev_year = _previous_period(period, month, year)
+        try:
+            previous = _ranking_snapshot(data_type, period, prev_month, prev_year, with_previous=False)
+        except Exception as e:
+            logger.warning(f"⚠️ Classement {data_type} {prev_month:02d}/{prev_year} indisponible (pas d'évolution de rang): {e}")
+
+    loaded: Dict[Callable, Dict] = {}
+    snapshot: Dict[str, Dict] = {}
+    for metric, (loader, fields) in _RANKING_SOURCES[data_type][1].items():
+        if loader not in loaded:
+            loaded[loader] = loader(period, month, year)
+        snapshot[metric] = _rank_metric(
+            _metric_values(loaded[loader], fields),
+            previous.get(metric) if previous else None,
+        )
+
+    logger.info(
+        f"🏆 Classements {data_type} {month:02d}/{year} ({period}): "
+        + ", ".join(f"{metric}={len(r['order'])}" for metric, r in snapshot.items())
+    )
+    set_cache(cache_key, snapshot, ttl=300)
+    return snapshot
+
+
+def _resolve_request(
+    data_type: str,
+    metric: Optional[str],
+    month: Optional[int],
+    year: Optional[int],
+) -> Tuple[str, int, int]:
+    if data_type not in _RANKING_SOURCES:
+        raise ValueError(f"data_type doit être l'un de: {', '.join(_RANKING_SOURCES)}")
+    default_metric, metrics = _RANKING_SOURCES[data_type]
+    metric = metric or default_metric
+    if metric not in metrics:
+        raise ValueError(f"metric pour {data_type} doit être l'une de: {', '.join(metrics)}")
+    if month is None or year is None:
+        now = datetime.now()
+        month = month or now.month
+        year = year or now.year
+    return metric, month, year
+
+
+def get_metric_ranking(
+    data_type: str,
+    metric: Optional[str] = None,
+    period: str = "month",
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+) -> Dict:
+    """
+    Classement pré-calculé d'une métrique : {"order": [clés agence du meilleur au moins bon],
+    "entries": {agence normalisée: {name, value, rank, percentile, previousRank, rankChange}}}.
+    """
+    metric, month, year = _resolve_request(data_type, metric, month, year)
+    return _ranking_snapshot(data_type, period or "month", month, year)[metric]
+
+
+def top_flop(ranking: Dict, n: int) -> Tuple[List[Dict], List[Dict]]:
+    """(top N du meilleur au moins bon, flop N du pire au moins mauvais) d'un classement."""
+    order, entries = ranking["order"], ranking["entries"]
+    return [entries[k] for k in order[:n]], [entries[k] for k in order[:-n - 1:-1]]
+
+
+def get_agency_ranking(
+    data_type: str,
+    metric: Optional[str] = None,
+    n: int = 5,
+    agency: Optional[str] = None,
+    period: str = "month",
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+) -> Dict:
+    """
+    Top / flop N d'une métrique et, si agency est fourni, son rang, percentile et évolution vs M-1.
+
+    Args:
+        data_type: "client", "collection" ou "credit"
+        metric: métrique du type (défaut: nombre / collecte), cf. _RANKING_SOURCES
+        n: nombre d'agences en top et en flop (≥ 1)
+        agency: nom d'agence (casse et espaces ignorés)
+        period: période d'analyse ("month", "year", "week")
+        month: mois (1-12), mois courant par défaut
+        year: année, année courante par défaut
+    """
+    if n < 1:
+        raise ValueError("n doit être supérieur ou égal à 1")
+    metric, month, year = _resolve_request(data_type, metric, month, year)
+    ranking = _ranking_snapshot(data_type, period or "month", month, year)[metric]
+    top, flop = top_flop(ranking, n)
+    return {
+        "dataType": data_type,
+        "metric": metric,
+        "metrics": list(_RANKING_SOURCES[data_type][1]),
+        "period": period,
+        "month": month,
+        "year": year,
+        "count": len(ranking["order"]),
+        "top": top,
+        "flop": flop,
+        "agency": ranking["entries"].get(_normalize_agency(agency)) if agency else None,
+    }
@@ -0,0 +1,425 @@
+"""
+Consolidation hiérarchique TERRITOIRE → agence → CAF.
+
+Les services déclarent leurs mesures (somme, écart, variation %, ratio pondéré) et la disposition
+des territoires dans un ``RollupSpec`` ; ``rollup`` répartit les agences via le référentiel
+(code agence puis nom, points de service rattachés à DAKAR VILLE, grand compte à part), agrège
+les sommes en numpy (``bincount``, dans l'ordre des lignes) et renvoie un arbre déterministe :
+territoires dans l'ordre de la disposition, agences dans l'ordre des lignes.
+"""
+import logging
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.utils import (
+    SERVICE_POINT_MAPPING,
+    get_territory_from_agency,
+    get_territory_from_branch_code,
+    get_territory_key,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TERRITORY = "territoire_dakar_ville"
+GRAND_COMPTE_KEY = "grand_compte"
+
+# (clé canonique, clé de sortie, libellé) — disposition des écrans DASH (encours, volume DAT, dépôt de garantie)
+DASH_LAYOUT: Tuple[Tuple[str, str, str], ...] = (
+    ("territoire_dakar_ville", "territoire_dakar_ville", "DAKAR CENTRE VILLE"),
+    ("territoire_dakar_banlieue", "territoire_dakar_banlieue", "DAKAR BANLIEUE"),
+    ("territoire_province_centre_sud", "province_centre_sud", "PROVINCE CENTRE SUD"),
+    ("territoire_province_nord", "province_nord", "PROVINCE NORD"),
+)
+
+# Disposition « référentiel » : clés canoniques et libellés de get_all_territories()
+TERRITORY_LAYOUT: Tuple[Tuple[str, str, str], ...] = (
+    ("territoire_dakar_ville", "territoire_dakar_ville", "TERRITOIRE DAKAR VILLE"),
+    ("territoire_dakar_banlieue", "territoire_dakar_banlieue", "TERRITOIRE DAKAR BANLIEUE"),
+    ("territoire_province_centre_sud", "territoire_province_centre_sud", "TERRITOIRE PROVINCE CENTRE SUD"),
+    ("territoire_province_nord", "territoire_province_nord", "TERRITOIRE PROVINCE NORD"),
+)
+
+
+class Measure:
+    """Mesure déclarative (voir les constructeurs total, combined, difference, ...)."""
+
+    __slots__ = ("name", "kind", "fields", "param", "ndigits")
+
+    def __init__(self, name: str, kind: str, fields: Tuple[str, ...] = (), param: Any = None,
+                 ndigits: Optional[int] = None):
+        self.name = name
+        self.kind = kind
+        self.fields = fields
+        self.param = param
+        self.ndigits = ndigits
+
+
+def total(name: str, *fields: str, integer: bool = False) -> Measure:
+    """Somme du premier champ non NULL parmi ``fields`` (défaut : ``name``)."""
+    return Measure(name, "sum", fields or (name,), param=integer)
+
+
+def combined(name: str, *fields: str) -> Measure:
+    """Somme de plusieurs champs par ligne (ex. épargne simple + épargne projet)."""
+    return Measure(name, "add", fields)
+
+
+def difference(name: str, a: str, b: str) -> Measure:
+    """Écart a - b entre deux mesures déjà calculées."""
+    return Measure(name, "diff", (a, b))
+
+
+def variation_pct(name: str, a: str, b: str, ndigits: Optional[int] = None) -> Measure:
+    """Variation (a - b) / b * 100, 0 si b est nul."""
+    return Measure(name, "pct", (a, b), ndigits=ndigits)
+
+
+def weighted_ratio(name: str, num: str, den: str, scale: float = 100.0,
+                   ndigits: Optional[int] = None) -> Measure:
+    """Ratio pondéré sum(num) / sum(den) * scale, 0 si le dénominateur est nul."""
+    return Measure(name, "ratio", (num, den), param=scale, ndigits=ndigits)
+
+
+def alias(name: str, of: str) -> Measure:
+    """Copie d'une mesure sous un autre nom (clés doublées MAJUSCULES / camelCase)."""
+    return Measure(name, "alias", (of,))
+
+
+def constant(name: str, value: Any = 0.0) -> Measure:
+    """Valeur fixe (colonnes pas encore alimentées)."""
+    return Measure(name, "const", param=value)
+
+
+def first_of(name: str, *fields: str) -> Measure:
+    """Première valeur non vide (niveau agence / CAF uniquement)."""
+    return Measure(name, "first", fields or (name,))
+
+
+def distinct(name: str, *fields: str) -> Measure:
+    """Valeurs non vides distinctes, dans l'ordre des lignes (niveau agence / CAF uniquement)."""
+    return Measure(name, "distinct", fields or (name,))
+
+
+class RollupSpec:
+    """
+    Déclaration d'une consolidation.
+
+    Args:
+        name: Nom (logs)
+        totals: Mesures des totaux territoire / grand compte / global, calculées sur les agences
+        layout: Disposition (clé canonique, clé de sortie, libellé) des territoires
+        name_field / code_field: Champs de l'agence utilisés pour le référentiel (code_field=None : nom seul)
+        agency_key: Regroupe les lignes en agences (None : une ligne = une agence)
+        agency_node: Construit le nœud agence à partir de sa première ligne (défaut : copie de la ligne)
+        agency_measures: Mesures agrégées des lignes vers l'agence
+        agency_totals_key: Sous-clé du nœud agence qui reçoit ces mesures (None : fusion à plat)
+        keep_rows: Sous-clé du nœud agence qui reçoit ses lignes brutes
+        caf_key / caf_node / caf_measures: Niveau CAF (chargé d'affaires) sous chaque agence
+        emit: "all" (tous les territoires), "any" (tous si au moins une agence), "nonempty"
+        grand_compte: "territory" (TERRITOIRE.grand_compte) ou "separate" (rendu à part)
+        service_points: Rattache les points de service à DAKAR VILLE avant le référentiel
+        unmapped: (clé, libellé) des agences sans territoire ; None → DAKAR VILLE
+    """
+
+    def __init__(
+        self,
+        name: str,
+        totals: Sequence[Measure],
+        layout: Sequence[Tuple[str, str, str]] = DASH_LAYOUT,
+        name_field: str = "AGENCE",
+        code_field: Optional[str] = "BRANCH_CODE",
+        agency_key: Optional[Callable[[Any], str]] = None,
+        agency_node: Optional[Callable[[Any], Dict[str, Any]]] = None,
+        agency_measures: Sequence[Measure] = (),
+        agency_totals_key: Optional[str] = None,
+        keep_rows: Optional[str] = None,
+        caf_key: Optional[Callable[[Any, str], str]] = None,
+        caf_node: Optional[Callable[[Any], Dict[str, Any]]] = None,
+        caf_measures: Sequence[Measure] = (),
+        emit: str = "any",
+        grand_compte: str = "territory",
+        service_points: bool = False,
+        unmapped: Optional[Tuple[str, str]] = None,
+    ):
+        self.name = name
+        self.totals = tuple(totals)
+        self.layout = tuple(layout)
+        self.name_field = name_field
+        self.code_field = code_field
+        self.agency_key = agency_key
+        self.agency_node = agency_node
+        self.agency_measures = tuple(agency_measures)
+        self.agency_totals_key = agency_totals_key
+        self.keep_rows = keep_rows
+        self.caf_key = caf_key
+        self.caf_node = caf_node
+        self.caf_measures = tuple(caf_measures)
+        self.emit = emit
+        self.grand_compte = grand_compte
+        self.service_points = service_points
+        self.unmapped = unmapped
+
+
+# --- Référentiel agences -------------------------------------------------------------------------
+
+def _normalize_name(agency_name: Any) -> str:
+    return " ".join(str(agency_name or "").upper().split())
+
+
+def is_grand_compte(agency_name: Any) -> bool:
+    """Agence « Grand compte » (GRAND COMPTE, GRAND COMPTES, GRAND_COMPTE, AGENCE GRAND COMPTE)."""
+    n = _normalize_name(agency_name)
+    return "GRAND COMPTE" in n or "GRAND_COMPTE" in n
+
+
+def _strip_prefix(name: str) -> str:
+    return name.replace("C-E ", "").replace("CE ", "").replace("COFINA EXPRESS ", "").strip()
+
+
+_SERVICE_POINTS: Tuple[Tuple[str, str], ...] = tuple(
+    (sp, _strip_prefix(sp)) for sp in (_normalize_name(k) for k in SERVICE_POINT_MAPPING if k)
+)
+
+
+@lru_cache(maxsize=2048)
+def _is_service_point(normalized_name: str) -> bool:
+    without_prefix = _strip_prefix(normalized_name)
+    for sp, sp_without_prefix in _SERVICE_POINTS:
+        if (sp == normalized_name
+                or sp_without_prefix == without_prefix
+                or sp in normalized_name
+                or normalized_name in sp
+                or (sp_without_prefix in without_prefix and len(sp_without_prefix) > 5)
+                or (without_prefix in sp_without_prefix and len(without_prefix) > 5)):
+            return True
+    return False
+
+
+def is_service_point(agency_name: Any) -> bool:
+    """Point de service (SERVICE_POINT_MAPPING), comparaison tolérante aux préfixes C-E / CE."""
+    return _is_service_point(_normalize_name(agency_name))
+
+
+def resolve_territory_key(branch_code: Any, agency_name: Any, service_points: bool = False) -> Optional[str]:
+    """
+    Clé canonique du territoire d'une agence : point de service → DAKAR VILLE (si demandé),
+    puis mapping code agence, puis nom d'agence. None si aucun territoire.
+    """
+    if service_points and is_service_point(agency_name):
+        return DEFAULT_TERRITORY
+    territory = get_territory_from_branch_code(branch_code) if branch_code not in (None, "") else None
+    if territory is None:
+        territory = get_territory_from_agency(agency_name)
+    if territory is None or territory == "POINT SERVICES":
+        return None
+    return get_territory_key(territory)
+
+
+# --- Agrégation ----------------------------------------------------------------------------------
+
+def _number(row: Any, fields: Tuple[str, ...]) -> float:
+    for f in fields:
+        v = row.get(f)
+        if v is not None:
+            try:
+                return float(v)
+            except (TypeError, ValueError):
+                return 0.0
+    return 0.0
+
+
+def _evaluate(
+    rows: Sequence[Any],
+    group_ids: Sequence[int],
+    n_groups: int,
+    measures: Sequence[Measure],
+    source: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Calcule les mesures par groupe ; les sommes sont faites par bincount dans l'ordre des lignes."""
+    if source is not None:
+        rows = [r.get(source) or {} for r in rows]
+    ids = np.asarray(group_ids, dtype=np.intp)
+    n_rows = len(rows)
+    columns: Dict[str, Any] = {}
+    for m in measures:
+        if m.kind == "sum":
+            col = np.fromiter((_number(r, m.fields) for r in rows), dtype=float, count=n_rows)
+            columns[m.name] = np.bincount(ids, weights=col, minlength=n_groups)
+        elif m.kind == "add":
+            col = np.fromiter(
+                (sum(_number(r, (f,)) for f in m.fields) for r in rows), dtype=float, count=n_rows
+            )
+            columns[m.name] = np.bincount(ids, weights=col, minlength=n_groups)
+        elif m.kind == "diff":
+            columns[m.name] = columns[m.fields[0]] - columns[m.fields[1]]
+        elif m.kind == "pct":
+            a, b = columns[m.fields[0]], columns[m.fields[1]]
+            columns[m.name] = np.divide(a - b, b, out=np.zeros(n_groups), where=b != 0) * 100
+        elif m.kind == "ratio":
+            num, den = columns[m.fields[0]], columns[m.fields[1]]
+            columns[m.name] = np.divide(num, den, out=np.zeros(n_groups), where=den != 0) * m.param
+        elif m.kind == "alias":
+            columns[m.name] = columns[m.fields[0]]
+        elif m.kind == "const":
+            columns[m.name] = [m.param] * n_groups
+        elif m.kind in ("first", "distinct"):
+            values: List[Any] = [None if m.kind == "first" else [] for _ in range(n_groups)]
+            for g, r in zip(group_ids, rows):
+                for f in m.fields:
+                    v = r.get(f)
+                    if v in (None, ""):
+                        continue
+                    if m.kind == "first":
+                        if values[g] is None:
+                            values[g] = v
+                    elif v not in values[g]:
+                        values[g].append(v)
+                    break
+            columns[m.name] = [("" if v is None else v) for v in values] if m.kind == "first" else values
+        else:
+            raise ValueError(f"Mesure inconnue: {m.kind}")
+
+    out: Dict[str, list] = {}
+    for m in measures:
+        col = columns[m.name]
+        col = col.tolist() if isinstance(col, np.ndarray) else list(col)
+        if m.kind == "sum" and m.param:
+            col = [int(round(v)) for v in col]
+        elif m.ndigits is not None:
+            col = [round(v, m.ndigits) for v in col]
+        out[m.name] = col
+    return [{name: out[name][g] for name in out} for g in range(n_groups)]
+
+
+def _group(rows: Iterable[Any], key: Callable[[Any], Any]) -> Tuple[List[Any], List[int], List[Any]]:
+    """(clés dans l'ordre d'apparition, indice de groupe par ligne, première ligne de chaque groupe)."""
+    index: Dict[Any, int] = {}
+    ids: List[int] = []
+    firsts: List[Any] = []
+    for r in rows:
+        k = key(r)
+        g = index.get(k)
+        if g is None:
+            g = index[k] = len(firsts)
+            firsts.append(r)
+        ids.append(g)
+    return list(index), ids, firsts
+
+
+def _build_agencies(rows: Sequence[Any], spec: RollupSpec) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Nœuds agence (et leurs clés) à partir des lignes."""
+    if spec.agency_key is None:
+        build = spec.agency_node or (lambda r: dict(r.items()))
+        nodes = [build(r) for r in rows]
+        return nodes, [str(i) for i in range(len(nodes))]
+
+    keys, ids, firsts = _group(rows, spec.agency_key)
+    build = spec.agency_node or (lambda r: dict(r.items()))
+    nodes = [build(r) for r in firsts]
+    if spec.agency_measures:
+        for node, values in zip(nodes, _evaluate(rows, ids, len(nodes), spec.agency_measures)):
+            if spec.agency_totals_key:
+                node[spec.agency_totals_key] = values
+            else:
+                node.update(values)
+    if spec.keep_rows:
+        for node in nodes:
+            node[spec.keep_rows] = []
+        for g, r in zip(ids, rows):
+            nodes[g][spec.keep_rows].append(r)
+    return nodes, keys
+
+
+def _build_cafs(rows: Sequence[Any], spec: RollupSpec, excluded: set) -> Dict[str, List[Dict[str, Any]]]:
+    """Niveau CAF : {clé agence: [nœuds CAF]} (agences exclues : grand compte)."""
+    kept = [(spec.agency_key(r), r) for r in rows]
+    kept = [(ak, r) for ak, r in kept if ak not in excluded]
+    keys, ids, firsts = _group(kept, lambda item: (item[0], spec.caf_key(item[1], item[0])))
+    build = spec.caf_node or (lambda r: dict(r.items()))
+    nodes = [build(r) for _, r in firsts]
+    caf_rows = [r for _, r in kept]
+    for node, values in zip(nodes, _evaluate(caf_rows, ids, len(nodes), spec.caf_measures)):
+        node.update(values)
+    by_agency: Dict[str, List[Dict[str, Any]]] = {}
+    for (agency_key, _), node in zip(keys, nodes):
+        by_agency.setdefault(agency_key, []).append(node)
+    return by_agency
+
+
+def rollup(rows: Sequence[Any], spec: RollupSpec) -> Dict[str, Any]:
+    """
+    Consolide des lignes à plat en arbre TERRITOIRE → agence (→ CAF).
+
+    Args:
+        rows: Lignes (dict ou Record) dans l'ordre souhaité pour les agences
+        spec: Déclaration de la consolidation
+
+    Returns:
+        {
+          "hierarchy": {"TERRITOIRE": {clé: {name, agencies, totals}}, "POINT SERVICES": {}},
+          "agencies_by_territory": {clé canonique: [agences]},
+          "grand_compte": agences grand compte (liste),
+          "grand_total": totals sur toutes les agences (grand compte inclus),
+          "cafs": {clé agence: [CAF]} si spec.caf_key,
+        }
+    """
+    agencies, agency_keys = _build_agencies(rows, spec)
+
+    layout_keys = [canonical for canonical, _, _ in spec.layout]
+    slots = {canonical: i for i, canonical in enumerate(layout_keys)}
+    unmapped_slot = len(layout_keys) if spec.unmapped else slots.get(DEFAULT_TERRITORY, 0)
+    n_slots = len(layout_keys) + (1 if spec.unmapped else 0)
+
+    by_slot: List[List[Dict[str, Any]]] = [[] for _ in range(n_slots)]
+    grand_compte: List[Dict[str, Any]] = []
+    gc_keys = set()
+    for node, key in zip(agencies, agency_keys):
+        agency_name = node.get(spec.name_field)
+        if is_grand_compte(agency_name):
+            grand_compte.append(node)
+            gc_keys.add(key)
+            continue
+        code = node.get(spec.code_field) if spec.code_field else None
+        territory_key = resolve_territory_key(code, agency_name, spec.service_points)
+        by_slot[slots.get(territory_key, unmapped_slot)].append(node)
+
+    members = [node for slot in by_slot for node in slot]
+    member_ids = [i for i, slot in enumerate(by_slot) for _ in slot]
+    territory_totals = _evaluate(members, member_ids, n_slots, spec.totals, spec.agency_totals_key)
+
+    territoire: Dict[str, Any] = {}
+    has_agencies = any(by_slot)
+    entries = list(spec.layout)
+    if spec.unmapped:
+        entries.append((spec.unmapped[0], spec.unmapped[0], spec.unmapped[1]))
+    for i, (_, out_key, label) in enumerate(entries):
+        if not by_slot[i]:
+            is_unmapped_slot = spec.unmapped is not None and i == len(layout_keys)
+            if is_unmapped_slot or spec.emit == "nonempty" or (spec.emit == "any" and not has_agencies):
+                continue
+        territoire[out_key] = {"name": label, "agencies": by_slot[i], "totals": territory_totals[i]}
+
+    # « any » : structure vide (grand compte compris) tant qu'aucune agence n'est rattachée
+    if grand_compte and spec.grand_compte == "territory" and (has_agencies or spec.emit != "any"):
+        territoire[GRAND_COMPTE_KEY] = {
+            "name": "GRAND COMPTE",
+            "agencies": grand_compte,
+            "totals": _evaluate(grand_compte, [0] * len(grand_compte), 1, spec.totals, spec.agency_totals_key)[0],
+        }
+
+    result = {
+        "hierarchy": {"TERRITOIRE": territoire, "POINT SERVICES": {}},
+        "agencies_by_territory": {canonical: by_slot[i] for i, canonical in enumerate(layout_keys)},
+        "grand_compte": grand_compte,
+        "grand_total": _evaluate(agencies, [0] * len(agencies), 1, spec.totals, spec.agency_totals_key)[0],
+    }
+    if spec.caf_key is not None:
+        result["cafs"] = _build_cafs(rows, spec, gc_keys)
+
+    logger.debug(
+        "📊 Rollup %s: %s agences, %s territoires, %s grand compte",
+        spec.name, len(agencies), len(territoire), len(grand_compte),
+    )
+    return result
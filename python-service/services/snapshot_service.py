@@ -0,0 +1,319 @@
+"""
+Identifiants de snapshot des tables DASH (dernier MIGRATION_DATETIME chargé) par endpoint.
+
+Sert aux requêtes conditionnelles (ETag / Last-Modified) : tant qu'aucun nouveau lot DASH n'est chargé,
+la réponse d'un endpoint pour les mêmes paramètres ne change pas. Les MAX(MIGRATION_DATETIME) des tables
+demandées sont lus en une requête (UNION ALL) puis gardés SNAPSHOT_PROBE_TTL secondes. Lorsqu'un nouveau
+lot est détecté, le cache des services (5 min) est vidé pour ne pas servir les données de l'ancien lot
+et les abonnés (add_snapshot_listener, cf. routers.events) reçoivent un événement par table. Tant qu'il y a
+des abonnés, un thread relit les snapshots de toutes les tables DASH toutes les SNAPSHOT_WATCH_INTERVAL
+secondes, même sans requête.
+"""
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from config.settings import (
+    ORACLE_DASH_ETAT_CPT_TABLE,
+    ORACLE_DASH_EXIGIBLE_TABLE,
+    ORACLE_DASH_TOMBE_MOIS_TABLE,
+    SNAPSHOT_PROBE_TTL,
+    SNAPSHOT_WATCH_INTERVAL,
+)
+from database.oracle_pool import get_pool
+from services.cache_service import clear_cache
+
+logger = logging.getLogger(__name__)
+
+_DOMICILIATION_TABLES = (ORACLE_DASH_ETAT_CPT_TABLE, ORACLE_DASH_TOMBE_MOIS_TABLE, ORACLE_DASH_EXIGIBLE_TABLE)
+_PRODUCTION_TABLES = ("DASH_PRODUCTION_NOMBRE", "DASH_PRODUCTION_VOLUME")
+_PAR_TABLES = ("DASH_PAR_GLOBAL", "DASH_DEPOT_GARANTIE")
+
+# service (paramètre "service" de /data/transfers) -> tables envoi / paiement
+_TRANSFER_TABLES: Dict[str, Tuple[str, ...]] = {
+    "om": ("DASH_ENVOIE_ORANGE_MONEY", "DASH_PAIEMENT_ORANGE_MONEY"),
+    "wave": ("DASH_ENVOIE_WAVE", "DASH_PAIEMENT_WAVE"),
+    "ria": ("DASH_ENVOIE_RIA", "DASH_PAIEMENT_RIA"),
+    "wu": ("DASH_ENVOI_WIZ", "DASH_PAIEMENT_WIZ"),
+    "moneygram": ("DASH_ENVOIE_MONEYGRAM", "DASH_PAIEMENT_MONEYGRAM"),
+    "wizzal": ("DASH_ENVOIE_WIZZAL", "DASH_PAIEMENT_WIZZAL"),
+    "free_money": ("DASH_ENVOIE_FREE_MONEY", "DASH_PAIEMENT_FREE_MONEY"),
+}
+
+_RANGE_TABLES: Dict[str, Tuple[str, ...]] = {
+    "clients": ("DASH_RELATION",),
+    "volume_dat": ("DASH_ENCOURS_DAT",),
+    "par": ("DASH_PAR_GLOBAL",),
+    "production": _PRODUCTION_TABLES,
+}
+
+_RANKING_TABLES: Dict[str, Tuple[str, ...]] = {
+    "client": ("DASH_RELATION",),
+    "collection": _DOMICILIATION_TABLES,
+    "credit": _PRODUCTION_TABLES,
+}
+
+# Endpoint /api/oracle/data/<chemin> -> tables DASH lues (None : source non DASH, lue en direct)
+_ENDPOINT_TABLES: Dict[str, Optional[Tuple[str, ...]]] = {
+    "clients": ("DASH_RELATION",),
+    "agencies-from-dash": ("DASH_RELATION",),
+    "production/nombre": ("DASH_PRODUCTION_NOMBRE",),
+    "production": ("DASH_PRODUCTION_NOMBRE",),
+    "production-volume": ("DASH_PRODUCTION_VOLUME",),
+    "encours-credit": ("DASH_EVOLUTION_ENCOURS",),
+    "collection": _DOMICILIATION_TABLES,
+    "domiciliation-flux": _DOMICILIATION_TABLES,
+    "volume-dat": ("DASH_ENCOURS_DAT",),
+    "depot-garantie": ("DASH_DEPOT_GARANTIE",),
+    "portefeuille-risque": _PAR_TABLES,
+    "portefeuille-risque-caf": _PAR_TABLES,
+    "portefeuille-risque/export": _PAR_TABLES,
+    "entrees-par": ("DASH_ENTREE_PAR",),
+    "entrees-par/export": ("DASH_ENTREE_PAR",),
+    "gl-lookup": ("DASH_CR_PAR_AGENCE",),
+    "prepaid-card-sales": None,
+    "stock-provision": None,
+}
+
+# Sections de /data/dashboard -> chemin de l'endpoint équivalent
+_DASHBOARD_SECTION_PATHS = {
+    "production-nombre": "production/nombre",
+}
+
+_SQL_SNAPSHOT = "SELECT {index} AS I, MAX(MIGRATION_DATETIME) AS SNAPSHOT FROM {table}"
+
+_SQL_BATCH_DATES = (
+    "SELECT DISTINCT TO_CHAR(MIGRATION_DATE_MINUS1, 'YYYY-MM-DD') FROM {table} WHERE MIGRATION_DATETIME = :snapshot"
+)
+
+_snapshots: Dict[str, Tuple[float, Optional[datetime]]] = {}
+_snapshots_lock = threading.Lock()
+
+SnapshotListener = Callable[[List[Dict[str, Any]]], None]
+_listeners: List[SnapshotListener] = []
+_listeners_lock = threading.Lock()
+_watcher_thread: Optional[threading.Thread] = None
+_watcher_stop = threading.Event()
+
+
+def endpoint_tables(path: str, params: Mapping[str, str]) -> Optional[Tuple[str, ...]]:
+    """
+    Tables DASH dont dépend la réponse de /api/oracle/data/<path> pour ces paramètres,
+    None si l'endpoint lit des tables hors DASH (pas d'identifiant de snapshot).
+    """
+    path = path.strip("/")
+    if path == "encours":
+        encours_type = params.get("type") or "compte-courant"
+        return ("DASH_ENCOURS_EPARGNE",) if encours_type.startswith("epargne") else None
+    if path == "transfers":
+        service = params.get("service") or "om"
+        if service == "all":
+            return tuple(t for tables in _TRANSFER_TABLES.values() for t in tables)
+        return _TRANSFER_TABLES.get(service, _TRANSFER_TABLES["om"])
+    if path in ("agency-performance", "agency-ranking"):
+        return _RANKING_TABLES.get(params.get("data_type") or "client")
+    if path.startswith("range/"):
+        return _RANGE_TABLES.get(path[len("range/"):])
+    if path == "dashboard":
+        from services.dashboard_service import resolve_sections
+        try:
+            sections = resolve_sections([params["sections"]] if params.get("sections") else None)
+        except ValueError:
+            return None
+        tables: Dict[str, None] = {}
+        for section in sections:
+            section_tables = endpoint_tables(_DASHBOARD_SECTION_PATHS.get(section, section), params)
+            if section_tables is None:
+                return None
+            tables.update(dict.fromkeys(section_tables))
+        return tuple(tables)
+    return _ENDPOINT_TABLES.get(path)
+
+
+def watched_tables() -> Tuple[str, ...]:
+    """Toutes les tables DASH lues par les endpoints (surveillées pour les notifications)."""
+    tables: Dict[str, None] = {"DASH_ENCOURS_EPARGNE": None}
+    for group in (_ENDPOINT_TABLES, _TRANSFER_TABLES, _RANGE_TABLES, _RANKING_TABLES):
+        for endpoint_group in group.values():
+            tables.update(dict.fromkeys(endpoint_group or ()))
+    return tuple(tables)
+
+
+def table_endpoints(table: str) -> List[str]:
+    """Chemins /api/oracle/data/<chemin> dont la réponse dépend de la table (hors paramètres)."""
+    paths = [path for path, tables in _ENDPOINT_TABLES.items() if tables and table in tables]
+    if table == "DASH_ENCOURS_EPARGNE":
+        paths.append("encours")
+    if any(table in tables for tables in _TRANSFER_TABLES.values()):
+        paths.append("transfers")
+    if any(table in tables for tables in _RANKING_TABLES.values()):
+        paths.extend(("agency-performance", "agency-ranking"))
+    paths.extend(f"range/{name}" for name, tables in _RANGE_TABLES.items() if table in tables)
+    return paths
+
+
+def snapshot_id(snapshots: Mapping[str, Optional[datetime]]) -> str:
+    """
+    Identifiant court et stable d'un ensemble de snapshots (ex. 20261018023000-1f3a9c2b) :
+    date du plus récent lot, suivie d'une empreinte de tous les lots (tables x MIGRATION_DATETIME).
+    """
+    digest = hashlib.sha1(
+        "|".join(f"{t}={s.isoformat() if s else '-'}" for t, s in sorted(snapshots.items())).encode("utf-8")
+    ).hexdigest()[:8]
+    known = [s for s in snapshots.values() if s is not None]
+    return f"{max(known):%Y%m%d%H%M%S}-{digest}" if known else f"none-{digest}"
+
+
+def _probe(tables: Tuple[str, ...]) -> Dict[str, Optional[datetime]]:
+    """MAX(MIGRATION_DATETIME) des tables en une requête ; table par table si l'une est inaccessible."""
+    with get_pool().get_connection_context() as conn:
+        cursor = conn.cursor()
+        try:
+            sql = " UNION ALL ".join(_SQL_SNAPSHOT.format(index=i, table=t) for i, t in enumerate(tables))
+            try:
+                cursor.execute(sql)
+                return {tables[i]: snapshot for i, snapshot in cursor.fetchall()}
+            except Exception as e:
+                if len(tables) == 1:
+                    raise
+                logger.warning(f"⚠️ Lecture groupée des snapshots DASH impossible ({e}), lecture table par table")
+            found: Dict[str, Optional[datetime]] = {}
+            for table in tables:
+                try:
+                    cursor.execute(_SQL_SNAPSHOT.format(index=0, table=table))
+                    found[table] = cursor.fetchone()[1]
+                except Exception as e:
+                    logger.warning(f"⚠️ Snapshot {table} illisible: {e}")
+                    found[table] = None
+            return found
+        finally:
+            cursor.close()
+
+
+def cached_snapshot_ids(tables: Iterable[str]) -> Optional[Dict[str, Optional[datetime]]]:
+    """Snapshots encore frais pour toutes les tables, None s'il faut interroger Oracle."""
+    now = time.monotonic()
+    with _snapshots_lock:
+        entries = {t: _snapshots.get(t) for t in tables}
+    if any(entry is None or now - entry[0] > SNAPSHOT_PROBE_TTL for entry in entries.values()):
+        return None
+    return {t: entry[1] for t, entry in entries.items()}
+
+
+def get_snapshot_ids(tables: Iterable[str]) -> Dict[str, Optional[datetime]]:
+    """
+    Dernier MIGRATION_DATETIME de chaque table (None si table vide ou illisible), relu au plus
+    toutes les SNAPSHOT_PROBE_TTL secondes. Un nouveau lot vide le cache des services.
+    """
+    tables = tuple(dict.fromkeys(tables))
+    cached = cached_snapshot_ids(tables)
+    if cached is not None:
+        return cached
+
+    now = time.monotonic()
+    with _snapshots_lock:
+        stale = tuple(t for t in tables if t not in _snapshots or now - _snapshots[t][0] > SNAPSHOT_PROBE_TTL)
+    found = _probe(stale) if stale else {}
+
+    changed = []
+    with _snapshots_lock:
+        for table in stale:
+            previous = _snapshots.get(table)
+            snapshot = found.get(table)
+            if previous is not None and previous[1] != snapshot:
+                changed.append(table)
+            _snapshots[table] = (now, snapshot)
+        result = {t: _snapshots[t][1] for t in tables}
+    if changed:
+        count = clear_cache()
+        logger.info(f"🆕 Nouveau lot DASH ({', '.join(changed)}) : {count} entrée(s) de cache invalidée(s)")
+        with _listeners_lock:
+            notify = bool(_listeners)
+        if notify:
+            # Lecture des périodes du lot hors de la requête en cours
+            threading.Thread(target=_notify, args=(changed, result), name="dash-batch-notify", daemon=True).start()
+    return result
+
+
+def _batch_dates(table: str, snapshot: datetime) -> Optional[List[str]]:
+    """Dates d'arrêté (MIGRATION_DATE_MINUS1) chargées par le lot, None si illisibles."""
+    try:
+        with get_pool().get_connection_context() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(_SQL_BATCH_DATES.format(table=table), {"snapshot": snapshot})
+                return sorted(row[0] for row in cursor.fetchall() if row[0])
+            finally:
+                cursor.close()
+    except Exception as e:
+        logger.warning(f"⚠️ Périodes du lot {table} illisibles: {e}")
+        return None
+
+
+def _notify(tables: List[str], snapshots: Mapping[str, Optional[datetime]]) -> None:
+    """Un événement par table au nouveau lot : snapshot, périodes chargées, endpoints concernés."""
+    with _listeners_lock:
+        listeners = list(_listeners)
+    if not listeners:
+        return
+    events = []
+    for table in tables:
+        snapshot = snapshots.get(table)
+        dates = _batch_dates(table, snapshot) if snapshot is not None else None
+        events.append({
+            "table": table,
+            "snapshot": snapshot.isoformat() if snapshot else None,
+            "snapshotId": snapshot_id({table: snapshot}),
+            "dates": dates,
+            "months": sorted({d[:7] for d in dates}) if dates else dates,
+            "endpoints": table_endpoints(table),
+        })
+    for listener in listeners:
+        try:
+            listener(events)
+        except Exception as e:
+            logger.warning(f"⚠️ Notification de nouveau lot DASH impossible: {e}")
+
+
+def add_snapshot_listener(listener: SnapshotListener) -> None:
+    """Abonne ``listener`` aux nouveaux lots DASH (appelé hors de la boucle asyncio, depuis un thread)."""
+    with _listeners_lock:
+        _listeners.append(listener)
+    start_snapshot_watcher()
+
+
+def remove_snapshot_listener(listener: SnapshotListener) -> None:
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def _snapshot_watcher() -> None:
+    tables = watched_tables()
+    while not _watcher_stop.wait(SNAPSHOT_WATCH_INTERVAL):
+        with _listeners_lock:
+            if not _listeners:
+                continue
+        try:
+            get_snapshot_ids(tables)
+        except Exception as e:
+            logger.warning(f"⚠️ Surveillance des lots DASH: {e}")
+
+
+def start_snapshot_watcher() -> None:
+    """Démarre (une seule fois) la relecture périodique des snapshots, active tant qu'il y a des abonnés."""
+    global _watcher_thread
+    if SNAPSHOT_WATCH_INTERVAL <= 0 or (_watcher_thread is not None and _watcher_thread.is_alive()):
+        return
+    _watcher_stop.clear()
+    _watcher_thread = threading.Thread(target=_snapshot_watcher, name="dash-snapshot-watcher", daemon=True)
+    _watcher_thread.start()
+    logger.info(f"🚀 Surveillance des lots DASH démarrée (toutes les {SNAPSHOT_WATCH_INTERVAL} s)")
+
+
+def stop_snapshot_watcher() -> None:
+    """Arrête le thread de surveillance (arrêt de l'application)."""
+    _watcher_stop.set()
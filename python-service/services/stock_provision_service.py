@@ -5,11 +5,39 @@ import logging
 from typing import List, Dict, Optional
 from datetime import datetime
 import calendar
+from database.fetch import fetch_records, float_defaults
 from database.oracle import get_oracle_connection
-from services.utils import AGENCY_TERRITORY_MAPPING, SERVICE_POINT_MAPPING
+from services.rollup_service import RollupSpec, rollup, total
 
 logger = logging.getLogger(__name__)
 
+# Montants lus en float par le driver, NULL → 0
+_STOCK_PROVISION_FLOAT_COLUMNS = float_defaults(("STOCK_PROVISION", "PROVISION_COMPTABILISEE"))
+
+# Libellés historiques de l'écran Stock provision ; seuls les territoires non vides sont rendus
+_STOCK_PROVISION_ROLLUP = RollupSpec(
+    "stock_provision",
+    layout=(
+        ("territoire_dakar_ville", "territoire_dakar_ville", "TERRITOIRE DAKAR VILLE"),
+        ("territoire_dakar_banlieue", "territoire_dakar_banlieue", "TERRITOIRE DAKAR BANLIEUE"),
+        ("territoire_province_centre_sud", "territoire_province_centre_sud", "TERRITOIRE PROVINCE CENTRE-SUD"),
+        ("territoire_province_nord", "territoire_province_nord", "TERRITOIRE PROVINCE NORD"),
+    ),
+    name_field="BRANCH_NAME",
+    agency_node=lambda row: {
+        'BRANCH_CODE': row.get('BRANCH_CODE'),
+        'BRANCH_NAME': row.get('BRANCH_NAME'),
+        'STOCK_PROVISION': row.get('STOCK_PROVISION', 0),
+        'PROVISION_COMPTABILISEE': row.get('PROVISION_COMPTABILISEE', 0),
+    },
+    totals=(
+        total("stockProvision", "STOCK_PROVISION"),
+        total("provisionComptabilisee", "PROVISION_COMPTABILISEE"),
+    ),
+    emit="nonempty",
+    service_points=True,
+)
+
 
 def get_stock_provision_data(month: Optional[int] = None, year: Optional[int] = None):
     """
@@ -205,31 +233,12 @@ def get_stock_provision_data(month: Optional[int] = None, year: Optional[int] =
         logger.info(f"📝 Date utilisée dans la requête: date_end_str={date_end_str}, date_end_sql={date_end_sql}")
         logger.debug(f"📝 Requête SQL (premiers 1000 caractères): {query[:1000]}...")
         try:
-            cursor.execute(query)
+            result = fetch_records(cursor, query, float_columns=_STOCK_PROVISION_FLOAT_COLUMNS)
         except Exception as sql_error:
             logger.error(f"❌ Erreur SQL détaillée: {str(sql_error)}")
             logger.error(f"❌ Requête SQL complète:\n{query}")
             raise
         
-        # Récupérer les noms de colonnes
-        columns = [desc[0] for desc in cursor.description]
-        
-        # Récupérer toutes les lignes
-        rows = cursor.fetchall()
-        
-        # Convertir en liste de dictionnaires
-        result = []
-        for row in rows:
-            row_dict = {}
-            for i, col in enumerate(columns):
-                value = row[i]
-                # Convertir les nombres en float si nécessaire
-                if isinstance(value, (int, float)):
-                    row_dict[col] = float(value) if value is not None else 0
-                else:
-                    row_dict[col] = value
-            result.append(row_dict)
-        
         cursor.close()
         connection.close()
         
@@ -262,133 +271,10 @@ def organize_stock_data_by_territory(data: List[Dict]) -> Dict:
     Returns:
         Dictionnaire avec la structure hiérarchique organisée par territoire
     """
-    hierarchical = {
-        "TERRITOIRE": {},
-        "POINT SERVICES": {}
-    }
-    
-    # Mapping des noms de territoires vers les clés
-    territory_key_map = {
-        'DAKAR VILLE': 'territoire_dakar_ville',
-        'DAKAR CENTRE VILLE': 'territoire_dakar_ville',
-        'DAKAR BANLIEUE': 'territoire_dakar_banlieue',
-        'PROVINCE CENTRE SUD': 'territoire_province_centre_sud',
-        'PROVINCE NORD': 'territoire_province_nord'
-    }
-    
-    # Noms complets des territoires
-    territory_names = {
-        'territoire_dakar_ville': 'TERRITOIRE DAKAR VILLE',
-        'territoire_dakar_banlieue': 'TERRITOIRE DAKAR BANLIEUE',
-        'territoire_province_centre_sud': 'TERRITOIRE PROVINCE CENTRE-SUD',
-        'territoire_province_nord': 'TERRITOIRE PROVINCE NORD'
-    }
-    
-    # Organiser les agences par territoire
-    agencies_by_territory = {
-        'territoire_dakar_ville': [],
-        'territoire_dakar_banlieue': [],
-        'territoire_province_centre_sud': [],
-        'territoire_province_nord': []
-    }
-    
-    grand_compte_agency = None
-    
-    for row in data:
-        branch_name = row.get('BRANCH_NAME', '').upper()
-        branch_code = str(row.get('BRANCH_CODE', ''))
-        agency_data = {
-            'BRANCH_CODE': row.get('BRANCH_CODE'),
-            'BRANCH_NAME': row.get('BRANCH_NAME'),
-            'STOCK_PROVISION': row.get('STOCK_PROVISION', 0),
-            'PROVISION_COMPTABILISEE': row.get('PROVISION_COMPTABILISEE', 0)
-        }
-        
-        # Vérifier si c'est le grand compte
-        if 'GRAND COMPTE' in branch_name:
-            grand_compte_agency = agency_data
-            continue
-        
-        # Vérifier si c'est un point de service
-        is_service_point = False
-        normalized_name = ' '.join(branch_name.split())
-        agency_name_without_prefix = normalized_name.replace('C-E ', '').replace('CE ', '').replace('COFINA EXPRESS ', '').strip()
-        
-        for service_point_name in SERVICE_POINT_MAPPING.keys():
-            service_point_str = str(service_point_name) if service_point_name else ''
-            service_point_normalized = ' '.join(service_point_str.upper().split())
-            service_point_without_prefix = service_point_normalized.replace('C-E ', '').replace('CE ', '').strip()
-            
-            if (service_point_normalized == normalized_name or 
-                service_point_without_prefix == agency_name_without_prefix or
-                service_point_normalized in normalized_name or 
-                normalized_name in service_point_normalized or
-                (service_point_without_prefix in agency_name_without_prefix and len(service_point_without_prefix) > 5) or
-                (agency_name_without_prefix in service_point_without_prefix and len(agency_name_without_prefix) > 5)):
-                is_service_point = True
-                logger.info(f"✅ Point de service identifié (Stock): {row.get('BRANCH_NAME')} -> {service_point_name}")
-                break
-        
-        if is_service_point:
-            agencies_by_territory['territoire_dakar_ville'].append(agency_data)
-            continue
-        
-        # Trouver le territoire correspondant
-        territory_name = None
-        
-        # Chercher dans le mapping par nom d'agence
-        for key, territory in AGENCY_TERRITORY_MAPPING.items():
-            if key.upper() in branch_name:
-                territory_name = territory
-                break
-        
-        # Si aucun territoire trouvé, utiliser DAKAR CENTRE VILLE par défaut
-        if not territory_name:
-            territory_name = 'DAKAR CENTRE VILLE'
-            logger.warning(f"⚠️ Territoire non trouvé pour {branch_name}, assigné à DAKAR CENTRE VILLE")
-        
-        # Obtenir la clé du territoire
-        territory_key = territory_key_map.get(territory_name, 'territoire_dakar_ville')
-        
-        # Ajouter l'agence au territoire
-        agencies_by_territory[territory_key].append(agency_data)
-    
-    # Construire la structure hiérarchique avec les totaux
-    for territory_key in ['territoire_dakar_ville', 'territoire_dakar_banlieue', 
-                          'territoire_province_centre_sud', 'territoire_province_nord']:
-        agencies = agencies_by_territory[territory_key]
-        
-        if agencies:
-            # Calculer les totaux du territoire
-            total_stock_provision = sum(ag.get('STOCK_PROVISION', 0) for ag in agencies)
-            total_provision_comptabilisee = sum(ag.get('PROVISION_COMPTABILISEE', 0) for ag in agencies)
-            
-            hierarchical["TERRITOIRE"][territory_key] = {
-                "name": territory_names[territory_key],
-                "agencies": agencies,
-                "totals": {
-                    "stockProvision": total_stock_provision,
-                    "provisionComptabilisee": total_provision_comptabilisee
-                }
-            }
-    
-    # Ajouter le grand compte dans TERRITOIRE si présent
-    if grand_compte_agency:
-        hierarchical["TERRITOIRE"]["grand_compte"] = {
-            "name": "GRAND COMPTE",
-            "agencies": [grand_compte_agency],
-            "totals": {
-                "stockProvision": grand_compte_agency.get('STOCK_PROVISION', 0),
-                "provisionComptabilisee": grand_compte_agency.get('PROVISION_COMPTABILISEE', 0)
-            }
-        }
-    
-    hierarchical["POINT SERVICES"] = {}
-
-    logger.info(f"📊 Structure hiérarchique créée: {len(agencies_by_territory['territoire_dakar_ville'])} agences DAKAR VILLE, "
-               f"{len(agencies_by_territory['territoire_dakar_banlieue'])} DAKAR BANLIEUE, "
-               f"{len(agencies_by_territory['territoire_province_centre_sud'])} PROVINCE CENTRE-SUD, "
-               f"{len(agencies_by_territory['territoire_province_nord'])} PROVINCE NORD, "
-               f"{'1' if grand_compte_agency else '0'} grand compte")
-    
-    return hierarchical
+    tree = rollup(data, _STOCK_PROVISION_ROLLUP)
+    logger.info(
+        "📊 Structure hiérarchique créée: %s",
+        ", ".join(f"{key}={len(agencies)}" for key, agencies in tree["agencies_by_territory"].items())
+        + f", grand compte={len(tree['grand_compte'])}",
+    )
+    return tree["hierarchy"]
@@ -2,10 +2,11 @@
 Service pour la gestion des données de transferts d'argent
 """
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
-import calendar
-from database.oracle import get_oracle_connection
+from database.oracle_pool import POOL_PREFILL, get_pool
+from services.cache_service import get_cache, set_cache, generate_cache_key
 
 from services.orange_money_dash_query import (
     sql_dash_envoi_orange_money,
@@ -36,7 +37,7 @@ from services.free_money_dash_query import (
     sql_dash_paiement_free_money,
 )
 from services.production_dash_service import _inner_sql_fragment
-from services.volume_dat_service import _ref_month_year, _week_range_dd_mm_yyyy
+from services.period_window import period_window
 
 logger = logging.getLogger(__name__)
 
@@ -54,24 +55,7 @@ def _migration_mode_and_binds_transfers_dash(
     Les tables DASH transferts n’ont souvent pas de chargement quotidien :
     le mode jour renvoie alors 0 ligne alors que le mois est peuplé.
     """
-    from datetime import date as dt_date
-
-    p = (period or "month").strip().lower()
-    today = dt_date.today()
-    ref_m, ref_y = _ref_month_year(p, month, year, date_str)
-    week_range = _week_range_dd_mm_yyyy(p, date_str)
-
-    year_only_str: Optional[str] = None
-    if p == "year":
-        y = int(year) if year is not None else today.year
-        year_only_str = f"{y:04d}"
-
-    if week_range:
-        ws, we = week_range
-        return "week", {"week_start": ws, "week_end": we}
-    if year_only_str is not None:
-        return "year", {"year_only": year_only_str}
-    return "month", {"month_year": f"{ref_m:02d}/{ref_y}"}
+    return period_window(period, month, year, date_str).dash(allow_day=False)
 
 
 def _float_cell(row: dict, *keys: str) -> float:
@@ -118,9 +102,13 @@ def _get_dash_transfer_envoi_paiement_merged(
     pay_m1_key: str,
     log_label: str,
     mode: str,
+    conn,
 ) -> List[Dict]:
-    """Exécute deux requêtes DASH (envoi + paiement) et fusionne les volumes par CODE_AGENCE."""
-    conn = get_oracle_connection()
+    """
+    Exécute deux requêtes DASH (envoi + paiement) et fusionne les volumes par CODE_AGENCE.
+
+    ``conn`` (connexion du pool) est réutilisé et n'est pas fermé ici.
+    """
     cursor = conn.cursor()
     try:
         cursor.execute(sql_env, binds)
@@ -174,214 +162,153 @@ def _get_dash_transfer_envoi_paiement_merged(
         raise
     finally:
         cursor.close()
-        conn.close()
 
 
-def get_orange_money_data(
+# Fournisseurs DASH transferts : (libellé, SQL envoi, SQL paiement, préfixe des colonnes VOLUME_*).
+_TRANSFER_PROVIDERS: Dict[str, Tuple[str, Any, Any, str]] = {
+    "om": ("Orange Money", sql_dash_envoi_orange_money, sql_dash_paiement_orange_money, "OM"),
+    "wave": ("Wave", sql_dash_envoi_wave, sql_dash_paiement_wave, "WAV"),
+    "ria": ("Ria", sql_dash_envoi_ria, sql_dash_paiement_ria, "RIA"),
+    "wu": ("Western Union", sql_dash_envoi_wiz, sql_dash_paiement_wiz, "WIZ"),
+    "moneygram": ("MoneyGram", sql_dash_envoi_moneygram, sql_dash_paiement_moneygram, "MONEYGRAM"),
+    "wizzal": ("Wizzal", sql_dash_envoi_wizzal, sql_dash_paiement_wizzal, "WIZZAL"),
+    "free_money": ("FREE Money", sql_dash_envoi_free_money, sql_dash_paiement_free_money, "FREE_MONEY"),
+}
+
+
+def _fetch_provider_on_pool(service: str, binds: Dict, inner: str, mode: str) -> List[Dict]:
+    """Envoi + paiement d'un fournisseur sur une connexion du pool (pas de logon dédié)."""
+    label, sql_env_fn, sql_pay_fn, prefix = _TRANSFER_PROVIDERS[service]
+    with get_pool().get_connection_context() as conn:
+        return _get_dash_transfer_envoi_paiement_merged(
+            binds,
+            sql_env_fn(inner),
+            sql_pay_fn(inner),
+            f"VOLUME_ENVOIE_{prefix}_M",
+            f"VOLUME_ENVOIE_{prefix}_M_1",
+            f"VOLUME_PAIEMENT_{prefix}_M",
+            f"VOLUME_PAIEMENT_{prefix}_M_1",
+            label,
+            mode,
+            conn=conn,
+        )
+
+
+def get_provider_transfer_data(
+    service: str,
     month: Optional[int] = None,
     year: Optional[int] = None,
     period: str = "month",
     date_str: Optional[str] = None,
 ) -> List[Dict]:
     """
-    Données Orange Money depuis DASH_ENVOIE_ORANGE_MONEY et DASH_PAIEMENT_ORANGE_MONEY
+    Données d'un fournisseur de _TRANSFER_PROVIDERS depuis ses tables DASH envoi / paiement
     (snapshot MAX(MIGRATION_DATETIME) comme les autres DASH).
 
     Envois + paiements sont fusionnés par CODE_AGENCE (volume M / M-1 et variations globales).
     """
     logger.info(
-        f"📅 get_orange_money_data (DASH) period={period}, month={month}, year={year}, date={date_str}"
+        f"📅 Transferts {_TRANSFER_PROVIDERS[service][0]} (DASH) period={period}, month={month}, year={year}, date={date_str}"
     )
     now = datetime.now()
     m = int(month) if month is not None else now.month
     y = int(year) if year is not None else now.year
     mode, binds = _migration_mode_and_binds_transfers_dash(period or "month", m, y, date_str)
-    inner = _inner_sql_fragment(mode)
-    return _get_dash_transfer_envoi_paiement_merged(
-        binds,
-        sql_dash_envoi_orange_money(inner),
-        sql_dash_paiement_orange_money(inner),
-        "VOLUME_ENVOIE_OM_M",
-        "VOLUME_ENVOIE_OM_M_1",
-        "VOLUME_PAIEMENT_OM_M",
-        "VOLUME_PAIEMENT_OM_M_1",
-        "Orange Money",
-        mode,
-    )
+    return _fetch_provider_on_pool(service, binds, _inner_sql_fragment(mode), mode)
 
 
-def get_wave_data(
-    month: Optional[int] = None,
-    year: Optional[int] = None,
-    period: str = "month",
-    date_str: Optional[str] = None,
-) -> List[Dict]:
-    """
-    Données Wave depuis DASH_ENVOIE_WAVE et DASH_PAIEMENT_WAVE (même logique qu’Orange Money DASH).
-    """
-    logger.info(
-        f"📅 get_wave_data (DASH) period={period}, month={month}, year={year}, date={date_str}"
-    )
-    now = datetime.now()
-    m = int(month) if month is not None else now.month
-    y = int(year) if year is not None else now.year
-    mode, binds = _migration_mode_and_binds_transfers_dash(period or "month", m, y, date_str)
-    inner = _inner_sql_fragment(mode)
-    return _get_dash_transfer_envoi_paiement_merged(
-        binds,
-        sql_dash_envoi_wave(inner),
-        sql_dash_paiement_wave(inner),
-        "VOLUME_ENVOIE_WAV_M",
-        "VOLUME_ENVOIE_WAV_M_1",
-        "VOLUME_PAIEMENT_WAV_M",
-        "VOLUME_PAIEMENT_WAV_M_1",
-        "Wave",
-        mode,
-    )
+def _volume_block(vm: float, vm1: float) -> Dict[str, float]:
+    var_vol = vm - vm1
+    return {
+        "volume_m": round(vm, 2),
+        "volume_m1": round(vm1, 2),
+        "variation_volume": round(var_vol, 2),
+        "variation_pct": round((var_vol / vm1 * 100), 2) if vm1 else 0.0,
+    }
 
 
-def get_ria_data(
-    month: Optional[int] = None,
-    year: Optional[int] = None,
+def get_all_transfers_data(
     period: str = "month",
-    date_str: Optional[str] = None,
-) -> List[Dict]:
-    """
-    Données Ria depuis DASH_ENVOIE_RIA et DASH_PAIEMENT_RIA (même logique qu’Orange Money / Wave DASH).
-    """
-    logger.info(
-        f"📅 get_ria_data (DASH) period={period}, month={month}, year={year}, date={date_str}"
-    )
-    now = datetime.now()
-    m = int(month) if month is not None else now.month
-    y = int(year) if year is not None else now.year
-    mode, binds = _migration_mode_and_binds_transfers_dash(period or "month", m, y, date_str)
-    inner = _inner_sql_fragment(mode)
-    return _get_dash_transfer_envoi_paiement_merged(
-        binds,
-        sql_dash_envoi_ria(inner),
-        sql_dash_paiement_ria(inner),
-        "VOLUME_ENVOIE_RIA_M",
-        "VOLUME_ENVOIE_RIA_M_1",
-        "VOLUME_PAIEMENT_RIA_M",
-        "VOLUME_PAIEMENT_RIA_M_1",
-        "Ria",
-        mode,
-    )
-
-
-def get_wu_data(
     month: Optional[int] = None,
     year: Optional[int] = None,
-    period: str = "month",
-    date_str: Optional[str] = None,
-) -> List[Dict]:
+    date: Optional[str] = None,
+) -> Dict:
     """
-    Western Union (WIZ) : DASH_ENVOI_WIZ + DASH_PAIEMENT_WIZ (même logique que les autres transferts DASH).
-    """
-    logger.info(
-        f"📅 get_wu_data (DASH) period={period}, month={month}, year={year}, date={date_str}"
-    )
-    now = datetime.now()
-    m = int(month) if month is not None else now.month
-    y = int(year) if year is not None else now.year
-    mode, binds = _migration_mode_and_binds_transfers_dash(period or "month", m, y, date_str)
-    inner = _inner_sql_fragment(mode)
-    return _get_dash_transfer_envoi_paiement_merged(
-        binds,
-        sql_dash_envoi_wiz(inner),
-        sql_dash_paiement_wiz(inner),
-        "VOLUME_ENVOIE_WIZ_M",
-        "VOLUME_ENVOIE_WIZ_M_1",
-        "VOLUME_PAIEMENT_WIZ_M",
-        "VOLUME_PAIEMENT_WIZ_M_1",
-        "Western Union",
-        mode,
-    )
+    Tous les fournisseurs de transferts en une réponse (service=all).
 
+    Les 14 requêtes DASH (envoi + paiement × 7 fournisseurs) sont exécutées en parallèle sur les
+    connexions du pool : au plus POOL_PREFILL fournisseurs à la fois, le pool n'ayant que ses
+    connexions pré-créées (get_connection sans délai ne passe pas en overflow). Le résultat est mis
+    en cache comme un tout.
 
-def get_moneygram_data(
-    month: Optional[int] = None,
-    year: Optional[int] = None,
-    period: str = "month",
-    date_str: Optional[str] = None,
-) -> List[Dict]:
-    """MoneyGram : DASH_ENVOIE_MONEYGRAM + DASH_PAIEMENT_MONEYGRAM."""
-    logger.info(
-        f"📅 get_moneygram_data (DASH) period={period}, month={month}, year={year}, date={date_str}"
-    )
+    Returns:
+        {"agencies": [...], "services": [...], "totals": {...}} — chaque agence porte le détail
+        par fournisseur dans "providers" et les volumes cumulés tous fournisseurs.
+    """
     now = datetime.now()
     m = int(month) if month is not None else now.month
     y = int(year) if year is not None else now.year
-    mode, binds = _migration_mode_and_binds_transfers_dash(period or "month", m, y, date_str)
-    inner = _inner_sql_fragment(mode)
-    return _get_dash_transfer_envoi_paiement_merged(
-        binds,
-        sql_dash_envoi_moneygram(inner),
-        sql_dash_paiement_moneygram(inner),
-        "VOLUME_ENVOIE_MONEYGRAM_M",
-        "VOLUME_ENVOIE_MONEYGRAM_M_1",
-        "VOLUME_PAIEMENT_MONEYGRAM_M",
-        "VOLUME_PAIEMENT_MONEYGRAM_M_1",
-        "MoneyGram",
-        mode,
-    )
 
+    cache_key = f"transfers:all:{generate_cache_key(period, m, y, date)}:v1"
+    cached = get_cache(cache_key)
+    if cached is not None:
+        logger.info("✅ Transferts (tous fournisseurs) récupérés depuis le cache")
+        return cached
 
-def get_wizzal_data(
-    month: Optional[int] = None,
-    year: Optional[int] = None,
-    period: str = "month",
-    date_str: Optional[str] = None,
-) -> List[Dict]:
-    """Wizzal : DASH_ENVOIE_WIZZAL + DASH_PAIEMENT_WIZZAL."""
-    logger.info(
-        f"📅 get_wizzal_data (DASH) period={period}, month={month}, year={year}, date={date_str}"
-    )
-    now = datetime.now()
-    m = int(month) if month is not None else now.month
-    y = int(year) if year is not None else now.year
-    mode, binds = _migration_mode_and_binds_transfers_dash(period or "month", m, y, date_str)
+    mode, binds = _migration_mode_and_binds_transfers_dash(period or "month", m, y, date)
     inner = _inner_sql_fragment(mode)
-    return _get_dash_transfer_envoi_paiement_merged(
-        binds,
-        sql_dash_envoi_wizzal(inner),
-        sql_dash_paiement_wizzal(inner),
-        "VOLUME_ENVOIE_WIZZAL_M",
-        "VOLUME_ENVOIE_WIZZAL_M_1",
-        "VOLUME_PAIEMENT_WIZZAL_M",
-        "VOLUME_PAIEMENT_WIZZAL_M_1",
-        "Wizzal",
-        mode,
-    )
-
+    logger.info(f"📊 Transferts tous fournisseurs (DASH, mode={mode}) en parallèle")
 
-def get_free_money_data(
-    month: Optional[int] = None,
-    year: Optional[int] = None,
-    period: str = "month",
-    date_str: Optional[str] = None,
-) -> List[Dict]:
-    """FREE Money : DASH_ENVOIE_FREE_MONEY + DASH_PAIEMENT_FREE_MONEY."""
-    logger.info(
-        f"📅 get_free_money_data (DASH) period={period}, month={month}, year={year}, date={date_str}"
-    )
-    now = datetime.now()
-    m = int(month) if month is not None else now.month
-    y = int(year) if year is not None else now.year
-    mode, binds = _migration_mode_and_binds_transfers_dash(period or "month", m, y, date_str)
-    inner = _inner_sql_fragment(mode)
-    return _get_dash_transfer_envoi_paiement_merged(
-        binds,
-        sql_dash_envoi_free_money(inner),
-        sql_dash_paiement_free_money(inner),
-        "VOLUME_ENVOIE_FREE_MONEY_M",
-        "VOLUME_ENVOIE_FREE_MONEY_M_1",
-        "VOLUME_PAIEMENT_FREE_MONEY_M",
-        "VOLUME_PAIEMENT_FREE_MONEY_M_1",
-        "FREE Money",
-        mode,
-    )
+    with ThreadPoolExecutor(max_workers=min(len(_TRANSFER_PROVIDERS), POOL_PREFILL)) as executor:
+        futures = {
+            service: executor.submit(_fetch_provider_on_pool, service, binds, inner, mode)
+            for service in _TRANSFER_PROVIDERS
+        }
+        rows_by_service = {service: future.result() for service, future in futures.items()}
+
+    agencies_by_code: Dict[str, Dict] = {}
+    services: List[Dict] = []
+    total_m = 0.0
+    total_m1 = 0.0
+    for service, rows in rows_by_service.items():
+        service_m = 0.0
+        service_m1 = 0.0
+        for row in rows:
+            code = row["code_agence"]
+            agency = agencies_by_code.setdefault(
+                code, {"agence": row.get("agence") or "", "code_agence": code, "providers": {}, "vm": 0.0, "vm1": 0.0}
+            )
+            if not agency["agence"] and row.get("agence"):
+                agency["agence"] = row["agence"]
+            agency["providers"][service] = _volume_block(row["volume_m"], row["volume_m1"])
+            agency["vm"] += row["volume_m"]
+            agency["vm1"] += row["volume_m1"]
+            service_m += row["volume_m"]
+            service_m1 += row["volume_m1"]
+        services.append({"service": service, "label": _TRANSFER_PROVIDERS[service][0], **_volume_block(service_m, service_m1)})
+        total_m += service_m
+        total_m1 += service_m1
+
+    agencies: List[Dict] = []
+    for code in sorted(agencies_by_code):
+        agency = agencies_by_code[code]
+        entry = {"agence": agency["agence"], "code_agence": code, "objectif": 0, "tro": 0, "commission": 0}
+        entry.update(_volume_block(agency["vm"], agency["vm1"]))
+        entry["contribution"] = round((agency["vm"] / total_m) * 100, 2) if total_m > 0 else 0
+        entry["providers"] = agency["providers"]
+        agencies.append(entry)
+
+    for service_entry in services:
+        service_entry["contribution"] = round((service_entry["volume_m"] / total_m) * 100, 2) if total_m > 0 else 0
+
+    result_data = {
+        "agencies": agencies,
+        "services": services,
+        "totals": _volume_block(total_m, total_m1),
+    }
+    logger.info(f"✅ Transferts tous fournisseurs: {len(agencies)} agences, {len(services)} fournisseurs")
+    set_cache(cache_key, result_data, ttl=300)
+    return result_data
 
 
 def calculate_month_dates(month: int, year: int) -> Dict[str, str]:
@@ -395,38 +322,17 @@ def calculate_month_dates(month: int, year: int) -> Dict[str, str]:
     Returns:
         Dictionnaire avec les dates au format DD/MM/YYYY et YYYY-MM-DD
     """
-    # S'assurer que month et year sont des entiers
-    month = int(month)
-    year = int(year)
-    
-    logger.info(f"📅 calculate_month_dates appelé avec month={month}, year={year}")
-    
-    # Premier jour du mois M
-    first_day = datetime(year, month, 1)
-    # Dernier jour du mois M
-    last_day = datetime(year, month, calendar.monthrange(year, month)[1])
-    
-    # Mois précédent (M-1)
-    if month == 1:
-        prev_month = 12
-        prev_year = year - 1
-    else:
-        prev_month = month - 1
-        prev_year = year
-    
-    prev_last_day = datetime(prev_year, prev_month, calendar.monthrange(prev_year, prev_month)[1])
-    prev_first_day = datetime(prev_year, prev_month, 1)
-    
+    window = period_window("month", month, year)
     return {
-        'm_debut': first_day.strftime("%d/%m/%Y"),
-        'm_fin': last_day.strftime("%d/%m/%Y"),
-        'm1_debut': prev_first_day.strftime("%d/%m/%Y"),
-        'm1_fin': prev_last_day.strftime("%d/%m/%Y"),
+        'm_debut': window.m_start.strftime("%d/%m/%Y"),
+        'm_fin': window.m_end.strftime("%d/%m/%Y"),
+        'm1_debut': window.m1_start.strftime("%d/%m/%Y"),
+        'm1_fin': window.m1_end.strftime("%d/%m/%Y"),
         # Format DATE pour Oracle (YYYY-MM-DD)
-        'm_debut_date': first_day.strftime("%Y-%m-%d"),
-        'm_fin_date': last_day.strftime("%Y-%m-%d"),
-        'm1_debut_date': prev_first_day.strftime("%Y-%m-%d"),
-        'm1_fin_date': prev_last_day.strftime("%Y-%m-%d"),
+        'm_debut_date': window.m_start.strftime("%Y-%m-%d"),
+        'm_fin_date': window.m_end.strftime("%Y-%m-%d"),
+        'm1_debut_date': window.m1_start.strftime("%Y-%m-%d"),
+        'm1_fin_date': window.m1_end.strftime("%Y-%m-%d"),
     }
 
 
@@ -439,11 +345,14 @@ def get_transfer_data(period: str = "month", month: Optional[int] = None, year:
         month: Mois à analyser (1-12)
         year: Année à analyser
         date: Date au format YYYY-MM-DD pour period="week"
-        service: Service de transfert ("om", "wave", "ria", "wu", "moneygram", "wizzal", "free_money")
+        service: Service de transfert ("om", "wave", "ria", "wu", "moneygram", "wizzal", "free_money", "all")
     
     Returns:
         Dictionnaire avec les données de transferts organisées par agences et services
     """
+    if service == "all":
+        return get_all_transfers_data(period=period, month=month, year=year, date=date)
+
     logger.info(f"🔍 get_transfer_data appelé avec period={period}, month={month} (type: {type(month)}), year={year} (type: {type(year)}), date={date}, service={service}")
     
     # S'assurer que month et year sont des entiers
@@ -460,54 +369,21 @@ def get_transfer_data(period: str = "month", month: Optional[int] = None, year:
     
     logger.info(f"📅 Paramètres de date finaux (après conversion): month={month} (type: {type(month)}), year={year} (type: {type(year)})")
     
-    # Calculer les dates - IMPORTANT: recalculer à chaque appel pour éviter le cache
+    # Fenêtre M / M-1 (mémorisée par services.period_window)
     dates = calculate_month_dates(month, year)
     
     logger.info(f"📅 Dates calculées: M={dates['m_debut']} à {dates['m_fin']}, M-1={dates['m1_debut']} à {dates['m1_fin']}")
     
     try:
-        # Récupérer les données selon le service sélectionné
-        if service == "om":
-            logger.info("📊 Récupération des données Orange Money (DASH) depuis Oracle")
-            om_data = get_orange_money_data(
-                month=month, year=year, period=period or "month", date_str=date
-            )
-        elif service == "wave":
-            logger.info("📊 Récupération des données Wave (DASH) depuis Oracle")
-            om_data = get_wave_data(
-                month=month, year=year, period=period or "month", date_str=date
-            )
-        elif service == "ria":
-            logger.info("📊 Récupération des données Ria (DASH) depuis Oracle")
-            om_data = get_ria_data(
-                month=month, year=year, period=period or "month", date_str=date
-            )
-        elif service == "wu":
-            logger.info("📊 Récupération des données Western Union / WIZ (DASH) depuis Oracle")
-            om_data = get_wu_data(
-                month=month, year=year, period=period or "month", date_str=date
-            )
-        elif service == "moneygram":
-            logger.info("📊 Récupération des données MoneyGram (DASH) depuis Oracle")
-            om_data = get_moneygram_data(
-                month=month, year=year, period=period or "month", date_str=date
-            )
-        elif service == "wizzal":
-            logger.info("📊 Récupération des données Wizzal (DASH) depuis Oracle")
-            om_data = get_wizzal_data(
-                month=month, year=year, period=period or "month", date_str=date
-            )
-        elif service == "free_money":
-            logger.info("📊 Récupération des données FREE Money (DASH) depuis Oracle")
-            om_data = get_free_money_data(
-                month=month, year=year, period=period or "month", date_str=date
-            )
-        else:
+        # Récupérer les données du service sélectionné
+        if service not in _TRANSFER_PROVIDERS:
             logger.warning(f"⚠️ Service '{service}' non reconnu. Utilisation d'Orange Money par défaut.")
-            om_data = get_orange_money_data(
-                month=month, year=year, period=period or "month", date_str=date
-            )
-        
+            service = "om"
+        logger.info(f"📊 Récupération des données {_TRANSFER_PROVIDERS[service][0]} (DASH) depuis Oracle")
+        om_data = get_provider_transfer_data(
+            service, month=month, year=year, period=period or "month", date_str=date
+        )
+
         # Formater les données pour correspondre au format attendu
         agencies = []
         for om_item in om_data:
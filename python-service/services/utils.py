@@ -1,134 +1,25 @@
 """
 Fonctions utilitaires partagées entre les services
 """
+from bisect import bisect_right
+from collections import deque
 from datetime import datetime
-import calendar
+from functools import lru_cache
+import threading
 from typing import Optional, Dict, Tuple
 import logging
 
+from services.period_window import period_window
+
 logger = logging.getLogger(__name__)
 
 
 def calculate_period_dates(period: str, month: Optional[int] = None, year: Optional[int] = None, date: Optional[str] = None) -> Dict[str, str]:
-    """Calcule les dates de début et fin pour une période donnée"""
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.info(f"🔍 calculate_period_dates appelé avec period='{period}' (type: {type(period)}), month={month}, year={year}, date={date}")
-    # Convertir month et year en entiers si nécessaire
-    if month is not None:
-        try:
-            month = int(month) if not isinstance(month, int) else month
-        except (ValueError, TypeError):
-            month = None
-    if year is not None:
-        try:
-            year = int(year) if not isinstance(year, int) else year
-        except (ValueError, TypeError):
-            year = None
-    
-    # Normaliser le paramètre period (minuscules, sans espaces)
-    period_normalized = str(period).strip().lower() if period else "month"
-    logger.info(f"📅 Période normalisée: '{period_normalized}' (original: '{period}')")
-    
-    if period_normalized == "month":
-        if month and year:
-            current_date = datetime(year, month, 1)
-            # Mois précédent
-            if month == 1:
-                prev_date = datetime(year - 1, 12, 1)
-            else:
-                prev_date = datetime(year, month - 1, 1)
-        else:
-            current_date = datetime.now().replace(day=1)
-            if current_date.month == 1:
-                prev_date = datetime(current_date.year - 1, 12, 1)
-            else:
-                prev_date = datetime(current_date.year, current_date.month - 1, 1)
-        
-        # Dates de début et fin pour le mois actuel
-        current_start = current_date
-        current_end = current_date.replace(day=calendar.monthrange(current_date.year, current_date.month)[1])
-        
-        # Dates de début et fin pour le mois précédent
-        prev_start = prev_date
-        prev_end = prev_date.replace(day=calendar.monthrange(prev_date.year, prev_date.month)[1])
-    elif period_normalized == "year":
-        # Pour l'année, comparer l'année complète avec l'année précédente
-        if year:
-            current_start = datetime(year, 1, 1)
-            current_end = datetime(year, 12, 31)
-            prev_start = datetime(year - 1, 1, 1)
-            prev_end = datetime(year - 1, 12, 31)
-        else:
-            now = datetime.now()
-            current_start = datetime(now.year, 1, 1)
-            current_end = datetime(now.year, 12, 31)
-            prev_start = datetime(now.year - 1, 1, 1)
-            prev_end = datetime(now.year - 1, 12, 31)
-    elif period_normalized == "week":
-        # Pour la semaine, calculer les dates de début et fin de la semaine sélectionnée
-        # Si une date est fournie (format YYYY-MM-DD), l'utiliser, sinon utiliser aujourd'hui
-        from datetime import timedelta
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"📅 Calcul des dates pour période WEEK - date reçue: {date}, month: {month}, year: {year}")
-        
-        if date:
-            # Parser la date au format YYYY-MM-DD
-            try:
-                reference_date = datetime.strptime(date, "%Y-%m-%d")
-                logger.info(f"📅 Date parsée avec succès: {reference_date}")
-            except (ValueError, TypeError) as e:
-                # Si le parsing échoue, utiliser aujourd'hui
-                logger.warning(f"⚠️ Erreur lors du parsing de la date '{date}': {e}. Utilisation de la date actuelle.")
-                reference_date = datetime.now()
-        elif month and year:
-            # Si month et year sont fournis, utiliser le 1er du mois comme date de référence
-            # (pour compatibilité avec l'ancien code)
-            reference_date = datetime(year, month, 1)
-            logger.info(f"📅 Utilisation de month/year: {reference_date}")
-        else:
-            reference_date = datetime.now()
-            logger.info(f"📅 Utilisation de la date actuelle: {reference_date}")
-        
-        # Trouver le lundi de la semaine contenant la date de référence
-        # En Python, lundi = 0, dimanche = 6
-        days_since_monday = reference_date.weekday()
-        monday = reference_date - timedelta(days=days_since_monday)
-        sunday = monday + timedelta(days=6)
-        
-        # Semaine précédente (S-1)
-        prev_monday = monday - timedelta(days=7)
-        prev_sunday = prev_monday + timedelta(days=6)
-        
-        logger.info(f"📅 Semaine calculée - Lundi: {monday.strftime('%d/%m/%Y')}, Dimanche: {sunday.strftime('%d/%m/%Y')}")
-        logger.info(f"📅 Semaine précédente - Lundi: {prev_monday.strftime('%d/%m/%Y')}, Dimanche: {prev_sunday.strftime('%d/%m/%Y')}")
-        
-        current_start = monday
-        current_end = sunday
-        prev_start = prev_monday
-        prev_end = prev_sunday
-    else:
-        # Par défaut, utiliser le mois actuel
-        current_date = datetime.now().replace(day=1)
-        if current_date.month == 1:
-            prev_date = datetime(current_date.year - 1, 12, 1)
-        else:
-            prev_date = datetime(current_date.year, current_date.month - 1, 1)
-        
-        current_start = current_date
-        current_end = current_date.replace(day=calendar.monthrange(current_date.year, current_date.month)[1])
-        prev_start = prev_date
-        prev_end = prev_date.replace(day=calendar.monthrange(prev_date.year, prev_date.month)[1])
-    
-    # Format des dates pour Oracle (DD/MM/YYYY)
-    return {
-        'date_m_debut_str': current_start.strftime("%d/%m/%Y"),
-        'date_m_fin_str': current_end.strftime("%d/%m/%Y"),
-        'date_m1_debut_str': prev_start.strftime("%d/%m/%Y"),
-        'date_m1_fin_str': prev_end.strftime("%d/%m/%Y")
-    }
+    """
+    Calcule les dates de début et fin pour une période donnée (fenêtre mémorisée, cf. services.period_window).
+    Période inconnue : mois ``month`` / ``year`` s'ils sont fournis (et non plus le mois courant).
+    """
+    return period_window(period, month, year, date).period_dates()
 
 
 # Mapping des agences vers les territoires (zonage officiel : DAKAR VILLE, BANLIEUE, CENTRE-SUD, NORD)
@@ -247,52 +138,187 @@ AGENCY_TERRITORY_MAPPING = {
 # Format: 'CODE_AGENCE': 'NOM_TERRITOIRE'
 # Exemple: '001': 'DAKAR CENTRE VILLE', '002': 'DAKAR BANLIEUE', etc.
 # 
-# Ce mapping est généré automatiquement depuis la base de données
-# lors du premier appel. Vous pouvez aussi l'initialiser manuellement
-# en ajoutant les codes agence ci-dessous.
+# Ce mapping est généré depuis la base de données en arrière-plan
+# (démarrage de l'application, puis rafraîchissement périodique).
+# Vous pouvez aussi l'initialiser manuellement en ajoutant les codes agence ci-dessous.
 
-# Initialiser le mapping vide - sera rempli dynamiquement
+# Mapping courant, remplacé d'un bloc (affectation atomique) par le rafraîchissement en arrière-plan.
+# Tant que le premier chargement n'est pas terminé, seul le mapping manuel est utilisé :
+# la résolution d'un territoire n'attend jamais Oracle.
 _BRANCH_CODE_MAPPING_CACHE = None
 
-def get_branch_code_territory_mapping(force_regenerate: bool = False) -> Dict[str, str]:
+# Rafraîchissement : à intervalle fixe, ou dès qu'un nouveau lot DASH_RELATION apparaît.
+BRANCH_CODE_MAPPING_REFRESH_INTERVAL = 6 * 3600
+BRANCH_CODE_MAPPING_BATCH_CHECK_INTERVAL = 300
+
+_branch_mapping_lock = threading.Lock()
+_branch_mapping_stop = threading.Event()
+_branch_mapping_thread: Optional[threading.Thread] = None
+
+
+class _BranchCodeMappingSnapshot:
+    """Version immuable du mapping code agence → territoire."""
+
+    __slots__ = ("mapping", "version", "loaded_at", "dash_relation_batch")
+
+    def __init__(self, mapping: Dict[str, str], version: int, loaded_at: datetime,
+                 dash_relation_batch: Optional[str]):
+        self.mapping = mapping
+        self.version = version
+        self.loaded_at = loaded_at
+        self.dash_relation_batch = dash_relation_batch
+
+
+def _fetch_dash_relation_batch() -> Optional[str]:
+    """Dernier MIGRATION_DATETIME de DASH_RELATION (détection d'un nouveau lot), None si indisponible."""
+    try:
+        from database.oracle import get_oracle_connection
+        connection = get_oracle_connection()
+    except Exception as e:
+        logger.warning(f"⚠️ Lot DASH_RELATION indisponible: {e}")
+        return None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT MAX(MIGRATION_DATETIME) FROM DASH_RELATION")
+        row = cursor.fetchone()
+        cursor.close()
+        return str(row[0]) if row and row[0] is not None else None
+    except Exception as e:
+        logger.warning(f"⚠️ Lot DASH_RELATION indisponible: {e}")
+        return None
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def refresh_branch_code_mapping(dash_relation_batch: Optional[str] = None) -> Dict[str, str]:
     """
-    Retourne le mapping des codes agence vers les territoires.
-    Génère automatiquement le mapping depuis la base de données si nécessaire.
-    
-    Args:
-        force_regenerate: Si True, force la régénération du mapping même s'il existe déjà
-    
+    Régénère le mapping depuis Oracle et le publie d'un bloc (nouvelle version).
+    En cas d'échec (mapping vide), la version courante est conservée.
+
     Returns:
-        Dictionnaire avec le mapping code agence -> territoire
+        Le mapping publié
     """
     global _BRANCH_CODE_MAPPING_CACHE
-    
-    # Si le cache est vide ou si on force la régénération
-    if _BRANCH_CODE_MAPPING_CACHE is None or force_regenerate:
+
+    with _branch_mapping_lock:
         logger.info("🔄 Génération du mapping des codes agence depuis la base de données...")
-        _BRANCH_CODE_MAPPING_CACHE = generate_branch_code_mapping_from_db()
-        
+        mapping = generate_branch_code_mapping_from_db()
+        current = _BRANCH_CODE_MAPPING_CACHE
+        if not mapping and current is not None:
+            logger.warning("⚠️ Mapping des codes agence vide, conservation de la version "
+                           f"{current.version}")
+            return current.mapping
+
         # Fusionner avec le mapping manuel (le mapping manuel a la priorité)
         if BRANCH_CODE_TERRITORY_MAPPING_MANUAL:
-            _BRANCH_CODE_MAPPING_CACHE.update(BRANCH_CODE_TERRITORY_MAPPING_MANUAL)
-            logger.info(f"✅ Mapping fusionné: {len(_BRANCH_CODE_MAPPING_CACHE)} codes agence au total")
-        
-        # Si le mapping généré est vide, utiliser un mapping par défaut vide
-        if not _BRANCH_CODE_MAPPING_CACHE:
-            _BRANCH_CODE_MAPPING_CACHE = {}
+            mapping.update(BRANCH_CODE_TERRITORY_MAPPING_MANUAL)
+            logger.info(f"✅ Mapping fusionné: {len(mapping)} codes agence au total")
+        if not mapping:
             logger.warning("⚠️ Aucun mapping de code agence généré. Utilisation d'un mapping vide.")
+
+        version = (current.version + 1) if current is not None else 1
+        _BRANCH_CODE_MAPPING_CACHE = _BranchCodeMappingSnapshot(
+            mapping, version, datetime.now(), dash_relation_batch
+        )
+        logger.info(f"✅ Mapping des codes agence v{version} publié ({len(mapping)} codes)")
+        return mapping
+
+
+def _branch_code_mapping_refresher() -> None:
+    """Boucle du thread de rafraîchissement (chargement initial puis surveillance des lots)."""
+    refresh_branch_code_mapping(_fetch_dash_relation_batch())
+    while not _branch_mapping_stop.wait(BRANCH_CODE_MAPPING_BATCH_CHECK_INTERVAL):
+        try:
+            current = _BRANCH_CODE_MAPPING_CACHE
+            batch = _fetch_dash_relation_batch()
+            age = (datetime.now() - current.loaded_at).total_seconds() if current else None
+            if current is None or not current.mapping or age >= BRANCH_CODE_MAPPING_REFRESH_INTERVAL:
+                refresh_branch_code_mapping(batch)
+            elif batch is not None and batch != current.dash_relation_batch:
+                logger.info(f"🆕 Nouveau lot DASH_RELATION ({batch}), rafraîchissement du mapping")
+                refresh_branch_code_mapping(batch)
+        except Exception as e:
+            logger.error(f"❌ Erreur lors du rafraîchissement du mapping des codes agence: {e}", exc_info=True)
+
+
+def start_branch_code_mapping_refresher() -> None:
+    """Démarre (une seule fois) le chargement et le rafraîchissement du mapping en arrière-plan."""
+    global _branch_mapping_thread
+    if _branch_mapping_thread is not None and _branch_mapping_thread.is_alive():
+        return
+    _branch_mapping_stop.clear()
+    _branch_mapping_thread = threading.Thread(
+        target=_branch_code_mapping_refresher, name="branch-code-mapping", daemon=True
+    )
+    _branch_mapping_thread.start()
+    logger.info("🚀 Rafraîchissement du mapping des codes agence démarré en arrière-plan")
+
+
+def stop_branch_code_mapping_refresher() -> None:
+    """Arrête le thread de rafraîchissement (arrêt de l'application)."""
+    _branch_mapping_stop.set()
+
+
+def get_branch_code_territory_mapping(force_regenerate: bool = False) -> Dict[str, str]:
+    """
+    Retourne le mapping des codes agence vers les territoires.
+    Ne bloque jamais sur Oracle : renvoie la dernière version publiée (ou le mapping manuel
+    tant que le premier chargement n'est pas terminé, qui est alors lancé en arrière-plan).
+    
+    Args:
+        force_regenerate: Si True, régénère le mapping de façon synchrone depuis Oracle
     
-    return _BRANCH_CODE_MAPPING_CACHE
+    Returns:
+        Dictionnaire avec le mapping code agence -> territoire
+    """
+    if force_regenerate:
+        return refresh_branch_code_mapping(_fetch_dash_relation_batch())
+
+    current = _BRANCH_CODE_MAPPING_CACHE
+    if current is None:
+        start_branch_code_mapping_refresher()
+        return dict(BRANCH_CODE_TERRITORY_MAPPING_MANUAL)
+    return current.mapping
+
+
+def get_branch_code_mapping_version() -> int:
+    """Version du mapping des codes agence publié (0 : mapping manuel, premier chargement non terminé)."""
+    current = _BRANCH_CODE_MAPPING_CACHE
+    return current.version if current is not None else 0
+
+
+def get_branch_code_mapping_info() -> Dict:
+    """Version, âge et taille du mapping des codes agence publié."""
+    current = _BRANCH_CODE_MAPPING_CACHE
+    refreshing = _branch_mapping_thread is not None and _branch_mapping_thread.is_alive()
+    if current is None:
+        return {"loaded": False, "version": 0, "size": 0, "loaded_at": None,
+                "age_seconds": None, "dash_relation_batch": None, "refresher_running": refreshing}
+    return {
+        "loaded": True,
+        "version": current.version,
+        "size": len(current.mapping),
+        "loaded_at": current.loaded_at.isoformat(),
+        "age_seconds": round((datetime.now() - current.loaded_at).total_seconds(), 1),
+        "dash_relation_batch": current.dash_relation_batch,
+        "refresher_running": refreshing,
+    }
 
 
 def reset_branch_code_mapping_cache():
     """
     Réinitialise le cache du mapping des codes agence.
-    Utile pour forcer la régénération du mapping.
+    Le rechargement est relancé en arrière-plan (sans bloquer l'appelant).
     """
     global _BRANCH_CODE_MAPPING_CACHE
     _BRANCH_CODE_MAPPING_CACHE = None
     logger.info("🔄 Cache du mapping des codes agence réinitialisé")
+    threading.Thread(
+        target=refresh_branch_code_mapping, name="branch-code-mapping-reset", daemon=True
+    ).start()
 
 # Mapping manuel (optionnel) - sera fusionné avec le mapping généré
 BRANCH_CODE_TERRITORY_MAPPING_MANUAL = {
@@ -379,46 +405,168 @@ def get_territory_from_branch_code(branch_code: str) -> Optional[str]:
     return None
 
 
+class _AhoCorasick:
+    """Automate Aho-Corasick minimal : toutes les occurrences de motifs dans un texte en un seul passage."""
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(pattern_id)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def matches(self, text: str):
+        """Identifiants des motifs présents dans ``text`` (avec répétitions possibles)."""
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            yield from self._out[state]
+
+
+class _TerritoryResolver:
+    """
+    Résolveur nom d'agence → territoire compilé une fois à partir d'AGENCY_TERRITORY_MAPPING.
+
+    Reproduit exactement les règles historiques de get_territory_from_agency :
+    1) correspondance exacte ; 2) clé la plus longue contenue dans le nom, ou contenant le nom
+    (ordre : longueur décroissante puis ordre du mapping) ; 3) repli par mots-clés (> 2 lettres).
+    La détection « point de service » finale renvoyait toujours None : elle n'est pas rejouée.
+    """
+
+    _SEPARATOR = "\x00"
+
+    def __init__(self, mapping: Dict[str, str]):
+        keys = list(mapping.keys())
+        self._exact = dict(mapping)
+        self._territories = [mapping[k] for k in keys]
+
+        # 2a) clé contenue dans le nom : automate sur les clés, rang = (longueur desc, ordre du mapping)
+        self._sorted_keys = sorted(keys, key=len, reverse=True)
+        self._sorted_territories = [mapping[k] for k in self._sorted_keys]
+        self._key_automaton = _AhoCorasick(self._sorted_keys)
+
+        # 2b) nom contenu dans une clé : recherche dans la concaténation des clés triées
+        self._joined_keys = self._SEPARATOR.join(self._sorted_keys)
+        self._key_offsets = []
+        offset = 0
+        for key in self._sorted_keys:
+            self._key_offsets.append(offset)
+            offset += len(key) + len(self._SEPARATOR)
+
+        # 3) index des mots-clés : mot → premier index de clé (ordre du mapping) qui le contient
+        self._token_index: Dict[str, int] = {}
+        for key_index, key in enumerate(keys):
+            for word in key.split():
+                if len(word) > 2:
+                    self._token_index.setdefault(word, key_index)
+        self._keywords = list(self._token_index.keys())
+        self._keyword_automaton = _AhoCorasick(self._keywords)
+
+    def _key_containing(self, name: str) -> Optional[str]:
+        if self._SEPARATOR in name:
+            for i, key in enumerate(self._sorted_keys):
+                if name in key:
+                    return self._sorted_territories[i]
+            return None
+        pos = self._joined_keys.find(name)
+        if pos < 0:
+            return None
+        return self._sorted_territories[bisect_right(self._key_offsets, pos) - 1]
+
+    def _key_contained(self, name: str) -> Optional[str]:
+        best = None
+        for pattern_id in self._key_automaton.matches(name):
+            if best is None or pattern_id < best:
+                best = pattern_id
+        return None if best is None else self._sorted_territories[best]
+
+    def resolve(self, normalized_name: str) -> Optional[str]:
+        # 1) Mapping explicite (prioritaire)
+        territory = self._exact.get(normalized_name)
+        if territory is not None:
+            return territory
+
+        # 2) Correspondance partielle — une clé contenant le nom est toujours au moins aussi longue
+        #    que les clés contenues dans le nom, elle passe donc en premier dans l'ordre historique.
+        territory = self._key_containing(normalized_name)
+        if territory is not None:
+            return territory
+        territory = self._key_contained(normalized_name)
+        if territory is not None:
+            return territory
+
+        # 3) Mots-clés (fallback) : pour le premier mot, une clé dont un mot-clé figure dans le nom
+        #    est aussi retenue ; les mots suivants ne testent plus que l'appartenance exacte.
+        agency_words = [word for word in normalized_name.split() if len(word) > 2]
+        if not agency_words:
+            return None
+        candidates = [self._token_index[self._keywords[i]] for i in self._keyword_automaton.matches(normalized_name)]
+        first_word_index = self._token_index.get(agency_words[0])
+        if first_word_index is not None:
+            candidates.append(first_word_index)
+        if candidates:
+            return self._territories[min(candidates)]
+        for word in agency_words[1:]:
+            key_index = self._token_index.get(word)
+            if key_index is not None:
+                return self._territories[key_index]
+        return None
+
+
+_TERRITORY_RESOLVER = _TerritoryResolver(AGENCY_TERRITORY_MAPPING)
+
+
+@lru_cache(maxsize=4096)
+def _resolve_territory(normalized_name: str) -> Optional[str]:
+    return _TERRITORY_RESOLVER.resolve(normalized_name)
+
+
+def rebuild_territory_resolver() -> None:
+    """Recompile le résolveur après une modification d'AGENCY_TERRITORY_MAPPING et vide le mémo."""
+    global _TERRITORY_RESOLVER
+    _TERRITORY_RESOLVER = _TerritoryResolver(AGENCY_TERRITORY_MAPPING)
+    _resolve_territory.cache_clear()
+    logger.info(f"🔄 Résolveur de territoires recompilé ({len(AGENCY_TERRITORY_MAPPING)} clés)")
+
+
 def get_territory_from_agency(agency_name: str) -> Optional[str]:
     """
     Retourne le territoire d'une agence selon le zonage officiel.
     Le mapping par nom a la priorité sur la détection « point de service »
     (ex. SCAT URBAM, NIARRY TALLY → DAKAR VILLE).
+
+    Résolution via le résolveur compilé à l'import (dictionnaire exact, automate
+    Aho-Corasick, index de mots-clés), mémoïsée par nom normalisé.
     """
     if not agency_name or agency_name is None:
         return None
 
     agency_name_str = str(agency_name) if agency_name else ''
     normalized_name = ' '.join(agency_name_str.upper().split())
-
-    # 1) Mapping explicite (prioritaire)
-    if normalized_name in AGENCY_TERRITORY_MAPPING:
-        return AGENCY_TERRITORY_MAPPING[normalized_name]
-
-    # 2) Correspondance partielle — clés les plus longues d'abord (évite ex. TAMBA vs TAMBACOUNDA)
-    sorted_keys = sorted(AGENCY_TERRITORY_MAPPING.keys(), key=len, reverse=True)
-    for key in sorted_keys:
-        if key in normalized_name or normalized_name in key:
-            return AGENCY_TERRITORY_MAPPING[key]
-
-    # 3) Mots-clés (fallback)
-    agency_words = [word for word in normalized_name.split() if len(word) > 2]
-    for word in agency_words:
-        for key, territory in AGENCY_TERRITORY_MAPPING.items():
-            key_words = [w for w in key.split() if len(w) > 2]
-            if word in key_words or any(kw in normalized_name for kw in key_words):
-                return territory
-
-    # 4) Point de service sans entrée dans le mapping : pas de territoire autonome
-    for service_point_name in SERVICE_POINT_MAPPING.keys():
-        service_point_str = str(service_point_name) if service_point_name else ''
-        service_point_normalized = ' '.join(service_point_str.upper().split())
-        if service_point_normalized == normalized_name:
-            return None
-        if service_point_normalized in normalized_name or normalized_name in service_point_normalized:
-            return None
-
-    return None
+    return _resolve_territory(normalized_name)
 
 
 def get_territory_key(territory_name: str) -> str:
@@ -498,9 +646,12 @@ def generate_branch_code_mapping_from_db() -> Dict[str, str]:
             ORDER BY b.BRANCH_CODE
         """
         
-        cursor.execute(query)
-        results = cursor.fetchall()
-        cursor.close()
+        try:
+            cursor.execute(query)
+            results = cursor.fetchall()
+        finally:
+            cursor.close()
+            connection.close()
         
         mapping = {}
         mapped_count = 0